@@ -5,15 +5,19 @@ import time
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from typing import Optional, Dict, Tuple
+from starlette.concurrency import run_in_threadpool
+from dataclasses import dataclass
+from sqlalchemy.orm import Session, make_transient_to_detached
+from typing import Optional
 from jose import JWTError, jwt
 
-from .db import SessionLocal
+from .db import get_db
 from .models import User
+from .cache import MISSING, get_cache
+from .google_jwks import verify_google_id_token
 from config.settings import (
     AUTH_ENABLED, GOOGLE_CLIENT_ID, SECRET_KEY, ALGORITHM,
-    TOKEN_CACHE_TTL, TOKEN_CACHE_MAX_SIZE, JWT_ACCESS_TOKEN_EXPIRE_DAYS,
+    TOKEN_CACHE_TTL, TOKEN_CACHE_MAX_SIZE, AUTH_PRINCIPAL_CACHE_TTL, JWT_ACCESS_TOKEN_EXPIRE_DAYS,
     BETA_EMAIL_RESTRICTION_ENABLED, ALLOWED_BETA_EMAILS
 )
 
@@ -21,46 +25,28 @@ logger = logging.getLogger(__name__)
 
 security = HTTPBearer(auto_error=False)  # 認証がなくてもエラーにしない
 
-# トークン検証結果のキャッシュ（インメモリ）
-# キー: トークンのハッシュ、値: (google_info, 有効期限のタイムスタンプ)
-_token_cache: Dict[str, Tuple[dict, float]] = {}
+# トークン検証結果のキャッシュ（app.cache: LRU+TTL、CACHE_BACKEND=sqlite ならワーカー間で共有）
+# キー: トークンのハッシュ、値: google_info
+_token_cache = get_cache("google_token", max_size=TOKEN_CACHE_MAX_SIZE, ttl=TOKEN_CACHE_TTL)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# 認証済みユーザーの最小情報（プリンシパル）のキャッシュ
+# キー: user_id、値: {"id", "email", "is_active", "is_admin"}
+# 無効化: invalidate_user_principal（ユーザー情報・権限の更新時）
+_principal_cache = get_cache("auth_principal", max_size=TOKEN_CACHE_MAX_SIZE, ttl=AUTH_PRINCIPAL_CACHE_TTL)
+
+
+@dataclass(frozen=True)
+class AuthPrincipal:
+    """認証判定に必要な最小限のユーザー情報（イミュータブル）"""
+    id: int
+    email: str
+    is_active: bool
+    is_admin: bool
 
 def _get_token_hash(token: str) -> str:
     """トークンのハッシュ値を取得（キャッシュキー用）"""
     return hashlib.sha256(token.encode()).hexdigest()
 
-def _cleanup_expired_cache():
-    """期限切れのキャッシュエントリを削除"""
-    current_time = time.time()
-    expired_keys = [
-        key for key, (_, expiry) in _token_cache.items()
-        if expiry < current_time
-    ]
-    for key in expired_keys:
-        del _token_cache[key]
-    
-    # キャッシュサイズが大きすぎる場合は、古いエントリを削除
-    if len(_token_cache) > TOKEN_CACHE_MAX_SIZE:
-        # 有効期限が近い順にソートして、古いものを削除
-        sorted_items = sorted(
-            _token_cache.items(),
-            key=lambda x: x[1][1]  # expiry timeでソート
-        )
-        # 半分を削除
-        for key, _ in sorted_items[:len(sorted_items) // 2]:
-            del _token_cache[key]
-        logger.warning(
-            f"Token cache size exceeded limit ({TOKEN_CACHE_MAX_SIZE}), "
-            f"cleaned up to {len(_token_cache)} entries"
-        )
-
 async def verify_google_token(token: str) -> dict:
     """
     Google IDトークンを検証（キャッシュ付き）
@@ -69,6 +55,7 @@ async def verify_google_token(token: str) -> dict:
     - 検証済みトークンの情報をキャッシュして再検証を回避
     - 詳細なエラーハンドリングとログ
     - トークンの有効期限に基づいたキャッシュTTL
+    - 署名はキャッシュした Google の公開鍵でローカル検証（google_jwks）
     """
     if not AUTH_ENABLED or not GOOGLE_CLIENT_ID:
         logger.warning("Authentication attempt but AUTH_ENABLED is False or GOOGLE_CLIENT_ID is not set")
@@ -81,31 +68,18 @@ async def verify_google_token(token: str) -> dict:
     cache_key = _get_token_hash(token)
     current_time = time.time()
     
-    # キャッシュから取得を試みる
-    if cache_key in _token_cache:
-        cached_info, expiry_time = _token_cache[cache_key]
-        if expiry_time > current_time:
-            logger.debug(f"Token verification cache hit for key: {cache_key[:16]}...")
-            return cached_info
-        else:
-            # 期限切れのキャッシュエントリを削除
-            del _token_cache[cache_key]
-            logger.debug(f"Token verification cache expired for key: {cache_key[:16]}...")
+    # キャッシュから取得を試みる（期限切れ・サイズ超過の追い出しはキャッシュ側で行う）
+    cached_info = _token_cache.get(cache_key)
+    if cached_info is not MISSING:
+        logger.debug(f"Token verification cache hit for key: {cache_key[:16]}...")
+        return cached_info
     
     # キャッシュにない、または期限切れの場合は検証を実行
     try:
-        from google.oauth2 import id_token
-        from google.auth.transport import requests
-        
-        logger.debug("Verifying Google ID token with Google API")
-        idinfo = id_token.verify_oauth2_token(
-            token, requests.Request(), GOOGLE_CLIENT_ID
-        )
-        
-        # 発行者の確認
-        if idinfo.get('iss') not in ['accounts.google.com', 'https://accounts.google.com']:
-            logger.warning(f"Invalid token issuer: {idinfo.get('iss')}")
-            raise ValueError('Wrong issuer.')
+        # 署名検証はキャッシュ済みの鍵でローカルに行う（発行者の確認を含む）。
+        # 鍵の取得が発生し得るためイベントループ外で実行する
+        logger.debug("Verifying Google ID token with cached JWKS")
+        idinfo = await run_in_threadpool(verify_google_id_token, token, GOOGLE_CLIENT_ID)
         
         # 有効期限の確認とキャッシュTTLの設定
         exp = idinfo.get('exp')
@@ -117,8 +91,7 @@ async def verify_google_token(token: str) -> dict:
             cache_expiry = current_time + TOKEN_CACHE_TTL
         
         # キャッシュに保存
-        _cleanup_expired_cache()  # 定期的にクリーンアップ
-        _token_cache[cache_key] = (idinfo, cache_expiry)
+        _token_cache.set(cache_key, idinfo, ttl=cache_expiry - current_time)
         logger.debug(f"Token verified and cached for key: {cache_key[:16]}... (expires at {cache_expiry})")
         
         return idinfo
@@ -184,6 +157,7 @@ def get_or_create_user(google_info: dict, db: Session) -> User:
     
     db.commit()
     db.refresh(user)
+    invalidate_user_principal(user.id)
     return user
 
 def create_access_token(user_id: int, email: str) -> str:
@@ -208,6 +182,41 @@ def create_access_token(user_id: int, email: str) -> str:
     logger.debug(f"JWT token created for user_id: {user_id}, expires at: {expire}")
     return encoded_jwt
 
+def get_user_principal(db: Session, user_id: int) -> Optional[AuthPrincipal]:
+    """user_id のプリンシパルを返す（キャッシュになければ DB から1回だけ取得）"""
+    cached = _principal_cache.get(user_id)
+    if cached is MISSING:
+        row = db.query(User.id, User.email, User.is_active, User.is_admin).filter(User.id == user_id).first()
+        cached = (
+            {"id": row.id, "email": row.email, "is_active": bool(row.is_active), "is_admin": bool(row.is_admin)}
+            if row else None
+        )
+        # 存在しないユーザーはキャッシュしない（直後の作成に備える）
+        if cached is not None:
+            _principal_cache.set(user_id, cached)
+    return AuthPrincipal(**cached) if cached else None
+
+
+def invalidate_user_principal(user_id: int) -> None:
+    """ユーザーのメールアドレス・有効/無効・管理者権限を変更したら呼ぶ"""
+    _principal_cache.delete(user_id)
+
+
+def _user_from_principal(db: Session, principal: AuthPrincipal) -> User:
+    """
+    プリンシパルから User を組み立ててリクエストのセッションに載せる（SELECTは発行しない）。
+    id/email/is_active/is_admin 以外の列は、参照されたときに初めて読み込まれる。
+    """
+    user = User(
+        id=principal.id,
+        email=principal.email,
+        is_active=principal.is_active,
+        is_admin=principal.is_admin,
+    )
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
 def verify_jwt_token(token: str) -> dict:
     """
     JWTトークンを検証
@@ -273,22 +282,22 @@ async def get_current_user(
             token_payload = verify_jwt_token(token)
             user_id = token_payload["user_id"]
             
-            # データベースからユーザーを取得
-            user = db.query(User).filter(User.id == user_id).first()
+            # プリンシパル（キャッシュ）でユーザーの存在と有効性を確認
+            principal = get_user_principal(db, user_id)
             
-            if not user:
+            if not principal:
                 logger.warning(f"JWT token valid but user not found: user_id={user_id}")
                 return None
             
-            if not user.is_active:
-                logger.warning(f"Authentication attempt by disabled user: {user.email}")
+            if not principal.is_active:
+                logger.warning(f"Authentication attempt by disabled user: {principal.email}")
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="User account is disabled"
                 )
             
-            logger.debug(f"User authenticated via JWT: {user.email} (user_id: {user.id})")
-            return user
+            logger.debug(f"User authenticated via JWT: {principal.email} (user_id: {principal.id})")
+            return _user_from_principal(db, principal)
             
         except HTTPException:
             # HTTPExceptionはそのまま再スロー
@@ -359,25 +368,25 @@ async def get_current_user_required(
             token_payload = verify_jwt_token(token)
             user_id = token_payload["user_id"]
             
-            # データベースからユーザーを取得
-            user = db.query(User).filter(User.id == user_id).first()
+            # プリンシパル（キャッシュ）でユーザーの存在と有効性を確認
+            principal = get_user_principal(db, user_id)
             
-            if not user:
+            if not principal:
                 logger.warning(f"JWT token valid but user not found: user_id={user_id}")
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="User not found"
                 )
             
-            if not user.is_active:
-                logger.warning(f"Authentication attempt by disabled user: {user.email} (user_id: {user.id})")
+            if not principal.is_active:
+                logger.warning(f"Authentication attempt by disabled user: {principal.email} (user_id: {principal.id})")
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="User account is disabled"
                 )
             
-            logger.debug(f"User authenticated via JWT: {user.email} (user_id: {user.id})")
-            return user
+            logger.debug(f"User authenticated via JWT: {principal.email} (user_id: {principal.id})")
+            return _user_from_principal(db, principal)
             
         except HTTPException:
             # HTTPExceptionはそのまま再スロー
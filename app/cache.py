@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+プロセス横断キャッシュ（認証・プラン・参照データ用）
+
+2段構成:
+- ローカル層: プロセス内の LRU + TTL（OrderedDict、追い出しは O(1)）
+- 共有層（任意）: CACHE_BACKEND=sqlite のとき SQLite ファイルを複数ワーカーで共有（Redis の代替）
+
+名前空間（namespace）ごとにキャッシュを分け、invalidate_namespace で名前空間単位に無効化できる。
+共有層ではネームスペースのバージョンを上げることで、他ワーカーのローカル層も
+CACHE_NAMESPACE_CHECK_SECONDS 以内に無効化を検知する。
+キー単位の削除は他ワーカーのローカル層には届かないため、共有層があるときのローカル層の寿命は
+CACHE_LOCAL_TTL_SECONDS までに抑える。
+
+値は共有層に JSON で保存するため、JSON にできる値（dict / list / str / 数値 / None）のみを入れること。
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config.settings import (
+    CACHE_BACKEND,
+    CACHE_LOCAL_TTL_SECONDS,
+    CACHE_NAMESPACE_CHECK_SECONDS,
+    CACHE_SHARED_SQLITE_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# 未ヒットを表す番兵（None もキャッシュ値として扱えるようにする）
+MISSING = object()
+
+
+class LruTtlCache:
+    """プロセス内の LRU + TTL キャッシュ（スレッドセーフ）"""
+
+    def __init__(self, max_size: int, default_ttl: float):
+        self.max_size = max(int(max_size), 1)
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteSharedStore:
+    """
+    複数ワーカーで共有する SQLite キャッシュ。
+    - cache_entries: (namespace, key) -> JSON値, 有効期限
+    - cache_namespaces: namespace -> version（名前空間単位の無効化用）
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_namespaces ("
+            " namespace TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> Any:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (namespace, key),
+        ).fetchone()
+        if not row:
+            return MISSING, 0.0
+        value, expires_at = row
+        if expires_at <= time.time():
+            return MISSING, 0.0
+        return json.loads(value), expires_at
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value, ensure_ascii=False, default=str), time.time() + ttl),
+        )
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def get_version(self, namespace: str) -> int:
+        row = self._conn().execute(
+            "SELECT version FROM cache_namespaces WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    def invalidate_namespace(self, namespace: str) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+        conn.execute(
+            "INSERT INTO cache_namespaces (namespace, version) VALUES (?, 1) "
+            "ON CONFLICT(namespace) DO UPDATE SET version = version + 1",
+            (namespace,),
+        )
+
+    def purge_expired(self) -> int:
+        cur = self._conn().execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+        return cur.rowcount or 0
+
+
+_shared_store: Optional[SqliteSharedStore] = None
+_shared_lock = threading.Lock()
+
+
+def _get_shared_store() -> Optional[SqliteSharedStore]:
+    global _shared_store
+    if CACHE_BACKEND != "sqlite":
+        return None
+    if _shared_store is None:
+        with _shared_lock:
+            if _shared_store is None:
+                _shared_store = SqliteSharedStore(CACHE_SHARED_SQLITE_PATH)
+    return _shared_store
+
+
+class NamespacedCache:
+    """名前空間ごとのキャッシュ（ローカル層 + 任意の共有層）"""
+
+    def __init__(self, namespace: str, *, max_size: int, ttl: float, shared: bool = True):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.shared = shared
+        self._local = LruTtlCache(max_size=max_size, default_ttl=ttl)
+        self._version = 0
+        self._version_checked_at = 0.0
+
+    def _store(self) -> Optional[SqliteSharedStore]:
+        return _get_shared_store() if self.shared else None
+
+    def _sync_version(self, store: SqliteSharedStore) -> None:
+        """他ワーカーによる名前空間の無効化を検知したらローカル層を捨てる"""
+        now = time.time()
+        if now - self._version_checked_at < CACHE_NAMESPACE_CHECK_SECONDS:
+            return
+        self._version_checked_at = now
+        try:
+            version = store.get_version(self.namespace)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache version check failed ({self.namespace}): {e}")
+            return
+        if version != self._version:
+            self._version = version
+            self._local.clear()
+
+    def get(self, key: Any) -> Any:
+        k = str(key)
+        store = self._store()
+        if store is not None:
+            self._sync_version(store)
+        value = self._local.get(k)
+        if value is not MISSING or store is None:
+            return value
+        try:
+            value, expires_at = store.get(self.namespace, k)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Shared cache read failed ({self.namespace}): {e}")
+            return MISSING
+        if value is not MISSING:
+            self._local.set(k, value, ttl=min(max(expires_at - time.time(), 0), CACHE_LOCAL_TTL_SECONDS))
+        return value
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        k = str(key)
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        store = self._store()
+        self._local.set(k, value, ttl=ttl if store is None else min(ttl, CACHE_LOCAL_TTL_SECONDS))
+        if store is not None:
+            try:
+                store.set(self.namespace, k, value, ttl)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.warning(f"Shared cache write failed ({self.namespace}): {e}")
+
+    def delete(self, key: Any) -> None:
+        k = str(key)
+        self._local.delete(k)
+        store = self._store()
+        if store is not None:
+            try:
+                store.delete(self.namespace, k)
+            except sqlite3.Error as e:
+                logger.warning(f"Shared cache delete failed ({self.namespace}): {e}")
+
+    def clear(self) -> None:
+        """名前空間全体を無効化（共有層では他ワーカーにも伝わる）"""
+        self._local.clear()
+        store = self._store()
+        if store is not None:
+            try:
+                store.invalidate_namespace(self.namespace)
+                self._version = store.get_version(self.namespace)
+            except sqlite3.Error as e:
+                logger.warning(f"Shared cache invalidation failed ({self.namespace}): {e}")
+
+    def get_or_load(self, key: Any, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        value = self.get(key)
+        if value is MISSING:
+            value = loader()
+            self.set(key, value, ttl=ttl)
+        return value
+
+
+_registry: Dict[str, NamespacedCache] = {}
+_registry_lock = threading.Lock()
+
+
+def get_cache(namespace: str, *, max_size: int = 1000, ttl: float = 300, shared: bool = True) -> NamespacedCache:
+    """名前空間のキャッシュを取得（初回呼び出しの設定で作成）"""
+    cache = _registry.get(namespace)
+    if cache is None:
+        with _registry_lock:
+            cache = _registry.get(namespace)
+            if cache is None:
+                cache = NamespacedCache(namespace, max_size=max_size, ttl=ttl, shared=shared)
+                _registry[namespace] = cache
+    return cache
+
+
+def invalidate_namespace(namespace: str) -> None:
+    """名前空間を無効化（未作成の名前空間でも共有層には反映する）"""
+    cache = _registry.get(namespace)
+    if cache is not None:
+        cache.clear()
+        return
+    store = _get_shared_store()
+    if store is not None:
+        try:
+            store.invalidate_namespace(namespace)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache invalidation failed ({namespace}): {e}")
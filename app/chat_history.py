@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+チャット履歴の部分取得（LLMコンテキスト用）
+
+- スレッドの全メッセージを読まず、必要なターン範囲だけを取得する
+- ターン t（1-indexed）は user/assistant メッセージの 2(t-1), 2(t-1)+1 番目
+- 履歴の末尾はトークン予算（token_budget.count_tokens）で打ち切る
+"""
+from typing import Dict, List
+
+from sqlalchemy.orm import Session
+
+from .models import Message
+from .token_budget import count_message_tokens, take_tail_within_budget
+
+CHAT_ROLES = ("user", "assistant")
+
+# 末尾から読むときの1回あたりの件数（1ターン = 2件）
+HISTORY_PAGE_SIZE = 20
+
+
+def _chat_query(db: Session, thread_id: int):
+    return (
+        db.query(Message.role, Message.content)
+        .filter(Message.thread_id == thread_id, Message.role.in_(CHAT_ROLES))
+        .order_by(Message.created_at.asc(), Message.id.asc())
+    )
+
+
+def count_chat_messages(db: Session, thread_id: int) -> int:
+    """user/assistant メッセージ数"""
+    return (
+        db.query(Message.id)
+        .filter(Message.thread_id == thread_id, Message.role.in_(CHAT_ROLES))
+        .count()
+    )
+
+
+def fetch_message_range(db: Session, thread_id: int, start: int, end: int) -> List[Dict[str, str]]:
+    """user/assistant メッセージの [start, end) 番目（0-indexed）を取得"""
+    if end <= start:
+        return []
+    rows = _chat_query(db, thread_id).offset(start).limit(end - start).all()
+    return [{"role": r.role, "content": r.content or ""} for r in rows]
+
+
+def fetch_turn_range(db: Session, thread_id: int, from_turn: int, to_turn: int) -> List[Dict[str, str]]:
+    """ターン範囲（from_turn < t <= to_turn）のメッセージを取得"""
+    return fetch_message_range(db, thread_id, 2 * from_turn, 2 * to_turn)
+
+
+def build_history_for_llm(
+    db: Session,
+    thread_id: int,
+    *,
+    history_count: int,
+    summary_up_to_turn: int,
+    has_summary: bool,
+    token_budget: int,
+) -> List[Dict[str, str]]:
+    """
+    LLMに渡す会話履歴（今回の user 発話を除く）を組み立てる。
+
+    - 要約あり: 要約済みの最後の1ラリー＋それ以降
+    - 要約なし: 全履歴
+    いずれも末尾から token_budget に収まる分だけを取得する。
+
+    Args:
+        history_count: 今回の user 発話を除いた user/assistant メッセージ数
+    """
+    if history_count <= 0:
+        return []
+    start = 0
+    if has_summary and summary_up_to_turn > 0:
+        start = max(2 * (summary_up_to_turn - 1), 0)
+        if start >= history_count:
+            start = max(history_count - 2, 0)
+
+    # 新しい側からページ単位で読み、予算を超えたら以降（古い側）は読まない
+    collected: List[Dict[str, str]] = []
+    used = 0
+    end = history_count
+    while end > start:
+        page_start = max(start, end - HISTORY_PAGE_SIZE)
+        page = fetch_message_range(db, thread_id, page_start, end)
+        collected = page + collected
+        used += count_message_tokens(page)
+        end = page_start
+        if used > token_budget:
+            break
+    return take_tail_within_budget(collected, token_budget)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+レスポンス圧縮ミドルウェア（ASGI）
+
+- Accept-Encoding に応じて br（brotli がインストールされている場合）→ gzip の順で選ぶ
+- 本文が RESPONSE_COMPRESSION_MIN_BYTES 以上の JSON / テキスト応答のみ圧縮する
+- 1メッセージで完結する応答だけを対象にし、ストリーミング応答（SSE 等）はそのまま流す
+  （途中まで溜めると逐次表示が止まるため）
+- 既に Content-Encoding が付いている応答は触らない
+"""
+import gzip
+import logging
+from typing import List, Optional, Tuple
+
+from config.settings import (
+    RESPONSE_COMPRESSION_BROTLI_QUALITY,
+    RESPONSE_COMPRESSION_GZIP_LEVEL,
+    RESPONSE_COMPRESSION_MIN_BYTES,
+)
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Accept-Encoding から使う圧縮方式を選ぶ（q=0 は拒否として扱う）"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name] = q
+    wildcard = accepted.get("*", 0.0)
+    for encoding in (("br",) if brotli is not None else ()) + ("gzip",):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_COMPRESSION_GZIP_LEVEL)
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for k, v in headers:
+        if k.lower() == name:
+            return v
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = RESPONSE_COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # 本文を見るまで判断できないため保留する
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = list(start.get("headers") or [])
+            body = message.get("body", b"")
+            content_type = (_header(headers, b"content-type") or b"").decode("latin-1").lower()
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or _header(headers, b"content-encoding") is not None
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(start)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            headers = [(k, v) for k, v in headers if k.lower() not in (b"content-length", b"vary")]
+            vary = _header(list(start.get("headers") or []), b"vary")
+            vary_value = b"Accept-Encoding" if not vary else vary + b", Accept-Encoding"
+            headers += [
+                (b"content-encoding", encoding.encode("latin-1")),
+                (b"content-length", str(len(compressed)).encode("latin-1")),
+                (b"vary", vary_value),
+            ]
+            logger.debug(f"Compressed {scope.get('path')}: {len(body)} -> {len(compressed)} bytes ({encoding})")
+            await send({**start, "headers": headers})
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
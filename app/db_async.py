@@ -0,0 +1,166 @@
+"""
+非同期DBセッション（async def のエンドポイント用）
+
+同期の SessionLocal を async def の中で使うと、クエリの間イベントループが止まり
+同じワーカーの他のリクエスト（軽いものも含む）が待たされる。ここでは AsyncSession を用意し、
+読み取りの多い経路から順に get_async_db に移す。
+
+- ドライバ: SQLite は aiosqlite、PostgreSQL は asyncpg（DATABASE_URL から自動で切り替え）
+- ドライバが入っていない・ASYNC_DB_ENABLED=false のときは ThreadedSession（互換レイヤ）を返す。
+  同期 Session をスレッドプールで動かすだけなので、エンドポイント側のコードは同じまま動く
+- 未移行の同期処理（既存のヘルパー関数など）は await db.run_sync(fn, ...) で呼べる
+  （fn の第1引数に同期 Session が渡る）
+"""
+import logging
+from typing import Any, AsyncGenerator, Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from config.settings import ASYNC_DB_ENABLED
+from .db import DATABASE_URL, SessionLocal, _redact, engine_options, is_postgres_url, is_sqlite_url
+
+logger = logging.getLogger(__name__)
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+except ImportError:  # pragma: no cover - greenlet が無い環境
+    AsyncSession = None
+    async_sessionmaker = None
+    create_async_engine = None
+
+
+def _driver_available(module_name: str) -> bool:
+    try:
+        __import__(module_name)
+        return True
+    except ImportError:
+        return False
+
+
+def async_database_url(database_url: str) -> Optional[str]:
+    """
+    同期用URLを非同期ドライバのURLに変換する（ドライバが無ければ None）
+
+    sqlite:///./data/dev.db          -> sqlite+aiosqlite:///./data/dev.db
+    postgresql+psycopg2://...        -> postgresql+asyncpg://...（normalize_database_url が psycopg2 を付ける）
+    """
+    scheme, sep, rest = (database_url or "").partition("://")
+    if not sep or scheme not in ("sqlite", "postgresql", "postgresql+psycopg2"):
+        return None
+    if is_sqlite_url(database_url) and _driver_available("aiosqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    if is_postgres_url(database_url) and _driver_available("asyncpg"):
+        return f"postgresql+asyncpg://{rest}"
+    return None
+
+
+def _create_async_engine():
+    if not ASYNC_DB_ENABLED or create_async_engine is None:
+        return None
+    url = async_database_url(DATABASE_URL)
+    if url is None:
+        logger.info("Async DB driver not installed; async endpoints run the sync session in a threadpool")
+        return None
+    try:
+        return create_async_engine(url, **engine_options(DATABASE_URL))
+    except Exception as e:
+        logger.warning(f"Failed to create async engine for {_redact(url)}: {e}; falling back to threadpool")
+        return None
+
+
+async_engine = _create_async_engine()
+AsyncSessionLocal = (
+    # commit 後に属性を読み直さない（非同期では暗黙の遅延ロードができないため）
+    async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    if async_engine is not None
+    else None
+)
+
+
+class ThreadedSession:
+    """
+    AsyncSession と同じ呼び出し方で同期 Session を使う互換レイヤ
+
+    I/O を伴うメソッドはスレッドプールで実行するため、イベントループは止まらない。
+    非同期ドライバが無い環境でも get_async_db に移したエンドポイントがそのまま動く。
+    """
+
+    def __init__(self, session_factory: Callable = SessionLocal):
+        self.sync_session = session_factory()
+
+    def add(self, instance: Any) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances) -> None:
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, **kwargs):
+        # Result は取得済みの行を持つ形にして返す（呼び出し側の .scalars().all() 等でI/Oしない）
+        def _execute():
+            result = self.sync_session.execute(statement, params, **kwargs)
+            # ORM の結果は常に行を返す。UPDATE/DELETE（CursorResult）は行が無ければそのまま返す
+            return result.freeze()() if getattr(result, "returns_rows", True) else result
+        return await run_in_threadpool(_execute)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        result = await self.execute(statement, params, **kwargs)
+        return result.scalars()
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def delete(self, instance) -> None:
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self) -> None:
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def refresh(self, instance, attribute_names=None) -> None:
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+    async def run_sync(self, fn: Callable, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+
+if AsyncSession is None:
+    # 型注釈用（greenlet が無く sqlalchemy.ext.asyncio を読み込めない環境）
+    AsyncSession = ThreadedSession
+
+
+def new_async_session():
+    """AsyncSession（非同期ドライバが無ければ ThreadedSession）を作る"""
+    if AsyncSessionLocal is not None:
+        return AsyncSessionLocal()
+    return ThreadedSession()
+
+
+async def get_async_db() -> AsyncGenerator:
+    """
+    非同期DBセッションを取得する依存関数（get_db の非同期版）
+
+    クエリは select() で組み立てて await db.execute(...) / await db.scalars(...) で実行する。
+    db.query(...) は使えない（必要なら await db.run_sync(lambda s: s.query(...).all())）。
+    """
+    db = new_async_session()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+async def dispose_async_engine() -> None:
+    """シャットダウン時に非同期エンジンの接続を閉じる"""
+    if async_engine is not None:
+        await async_engine.dispose()
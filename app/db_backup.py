@@ -0,0 +1,525 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite のオンライン・差分・圧縮バックアップ
+
+取得:
+1. sqlite3 のオンラインバックアップAPIで DB_BACKUP_STEP_PAGES ページずつ一時ファイルへ複製する
+   （ステップの合間にロックを手放すため、API の書き込みを止めない。途中で書き込みがあっても整合した複製になる）
+2. 複製を DB_BACKUP_CHUNK_PAGES ページ単位のチャンクに分け、内容の SHA-256 で chunks/ に保存する
+   - 前回以前と同じ内容のチャンクは保存済みなので書かない（＝ページ単位の差分だけが増える）
+   - チャンクは1つずつ読み・圧縮・書き込みするため、DBの大きさによらずメモリは一定
+   - 圧縮は zstandard があれば zstd、無ければ gzip
+3. チャンクの並びを snapshots/<DB名>_<日時>.json（スナップショット）に書き、一時ファイルを消す
+
+配置:
+    <DB_BACKUP_DIR>/<DB名>/snapshots/<DB名>_YYYYmmdd_HHMMSS.json
+    <DB_BACKUP_DIR>/<DB名>/chunks/<ハッシュ先頭2文字>/<ハッシュ>.zst|.gz
+
+複数ワーカー:
+- 取得・保持は <DB_BACKUP_DIR>/<DB名>/.backup.lock を排他ロック（fcntl.flock）してから実行する
+  （取得中に prune が書いたばかりのチャンクを消さないため。prune はロック無しでは実行できない）
+- run_scheduled_backup はロックを取れなかったら（別のワーカーが取得中）何もしない。
+  ロック後に最新スナップショットの時刻を見直すため、同じ間隔内に2回取得しない
+- CLI（backup / prune）と scripts/backup_db.py はロックが空くまで待ってから実行する
+
+保持（prune）:
+- 直近 DB_BACKUP_KEEP_DAILY 日は1日1世代、それ以前は DB_BACKUP_KEEP_WEEKLY 週まで1週1世代
+- どのスナップショットからも参照されなくなったチャンクを削除
+
+CLI:
+    python -m app.db_backup backup [--prune]
+    python -m app.db_backup list
+    python -m app.db_backup verify [SNAPSHOT] [--deep]
+    python -m app.db_backup restore SNAPSHOT DEST [--force]
+    python -m app.db_backup prune
+対象DBは DATABASE_URL（--database-url で指定可）、保存先は DB_BACKUP_DIR（--backup-dir で指定可）。
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from config.settings import (
+    DB_BACKUP_CHUNK_PAGES,
+    DB_BACKUP_DIR,
+    DB_BACKUP_KEEP_DAILY,
+    DB_BACKUP_KEEP_WEEKLY,
+    DB_BACKUP_STEP_PAGES,
+)
+
+try:
+    import zstandard
+except Exception:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+STEP_SLEEP_SECONDS = 0.005
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+
+def sqlite_path_from_url(database_url: str) -> Optional[Path]:
+    """sqlite:///./data/dev.db / sqlite:////data/dev.db からファイルパスを取り出す（SQLite 以外は None）"""
+    url = (database_url or "").strip()
+    if not url.startswith("sqlite") or ":///" not in url:
+        return None
+    raw = url.split(":///", 1)[1].split("?", 1)[0]
+    return Path(raw) if raw else None
+
+
+# ---------- 圧縮 ----------
+
+
+def _compression() -> str:
+    return "zst" if zstandard is not None else "gz"
+
+
+def _compress(data: bytes, ext: str) -> bytes:
+    if ext == "zst":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data: bytes, ext: str) -> bytes:
+    if ext == "zst":
+        if zstandard is None:
+            raise RuntimeError("zstd で圧縮されたバックアップの展開には zstandard が必要です")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+# ---------- 保存先 ----------
+
+
+@dataclass
+class BackupStore:
+    root: Path  # <DB_BACKUP_DIR>/<DB名>
+    db_name: str
+
+    @classmethod
+    def for_db(cls, backup_dir: Path, db_path: Path) -> "BackupStore":
+        return cls(Path(backup_dir) / db_path.stem, db_path.stem)
+
+    @property
+    def snapshots_dir(self) -> Path:
+        return self.root / "snapshots"
+
+    @property
+    def chunks_dir(self) -> Path:
+        return self.root / "chunks"
+
+    def chunk_path(self, digest: str, ext: str) -> Path:
+        return self.chunks_dir / digest[:2] / f"{digest}.{ext}"
+
+    def find_chunk(self, digest: str) -> Optional[Path]:
+        for ext in ("zst", "gz"):
+            p = self.chunk_path(digest, ext)
+            if p.exists():
+                return p
+        return None
+
+    def snapshots(self) -> List[Path]:
+        """スナップショット（古い順）"""
+        if not self.snapshots_dir.exists():
+            return []
+        return sorted(self.snapshots_dir.glob(f"{self.db_name}_*.json"))
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def load_manifest(path: Path) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ---------- 取得 ----------
+
+
+def _online_copy(db_path: Path, dest: Path) -> None:
+    """オンラインバックアップAPIで DB_BACKUP_STEP_PAGES ページずつ複製"""
+    src = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    dst = sqlite3.connect(str(dest))
+    try:
+        src.backup(dst, pages=max(DB_BACKUP_STEP_PAGES, 1), sleep=STEP_SLEEP_SECONDS)
+    finally:
+        dst.close()
+        src.close()
+
+
+def _page_size(path: Path) -> int:
+    with open(path, "rb") as f:
+        header = f.read(100)
+    size = int.from_bytes(header[16:18], "big")
+    return 65536 if size == 1 else size
+
+
+def backup(db_path: Path, backup_dir: Optional[Path] = None, now: Optional[datetime] = None) -> Path:
+    """スナップショットを1つ作成し、そのパスを返す"""
+    db_path = Path(db_path)
+    if not db_path.exists():
+        raise FileNotFoundError(f"対象DBファイルが見つかりません: {db_path}")
+    store = BackupStore.for_db(Path(backup_dir or DB_BACKUP_DIR), db_path)
+    now = now or datetime.now()
+    store.snapshots_dir.mkdir(parents=True, exist_ok=True)
+    copy_path = store.root / f".{store.db_name}_{now.strftime(TIMESTAMP_FORMAT)}.db"
+
+    started = datetime.now()
+    try:
+        _online_copy(db_path, copy_path)
+        page_size = _page_size(copy_path)
+        chunk_size = page_size * max(DB_BACKUP_CHUNK_PAGES, 1)
+        ext = _compression()
+        whole = hashlib.sha256()
+        chunks: List[str] = []
+        new_chunks = 0
+        stored_bytes = 0
+        size = 0
+        with open(copy_path, "rb") as f:
+            for data in iter(lambda: f.read(chunk_size), b""):
+                size += len(data)
+                whole.update(data)
+                digest = hashlib.sha256(data).hexdigest()
+                chunks.append(digest)
+                if store.find_chunk(digest) is None:
+                    compressed = _compress(data, ext)
+                    _atomic_write(store.chunk_path(digest, ext), compressed)
+                    new_chunks += 1
+                    stored_bytes += len(compressed)
+    finally:
+        copy_path.unlink(missing_ok=True)
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "db_name": store.db_name,
+        "source": str(db_path),
+        "created_at": now.isoformat(timespec="seconds"),
+        "page_size": page_size,
+        "page_count": size // page_size,
+        "size": size,
+        "sha256": whole.hexdigest(),
+        "chunk_size": chunk_size,
+        "chunks": chunks,
+        "new_chunks": new_chunks,
+        "stored_bytes": stored_bytes,
+    }
+    path = store.snapshots_dir / f"{store.db_name}_{now.strftime(TIMESTAMP_FORMAT)}.json"
+    _atomic_write(path, json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+    logger.info(
+        f"DB backup created: {path.name} size={size} chunks={len(chunks)} new_chunks={new_chunks} "
+        f"stored_bytes={stored_bytes} ({(datetime.now() - started).total_seconds():.1f}s)"
+    )
+    return path
+
+
+# ---------- 検証・復元 ----------
+
+
+def _iter_chunks(store: BackupStore, manifest: dict) -> Iterable[bytes]:
+    for digest in manifest["chunks"]:
+        path = store.find_chunk(digest)
+        if path is None:
+            raise ValueError(f"チャンクがありません: {digest}")
+        data = _decompress(path.read_bytes(), path.suffix.lstrip("."))
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"チャンクの内容がハッシュと一致しません: {path}")
+        yield data
+
+
+def _write_snapshot(store: BackupStore, manifest: dict, dest: Path) -> None:
+    """チャンクを連結して dest に書き出し、全体のハッシュを確認"""
+    whole = hashlib.sha256()
+    with open(dest, "wb") as f:
+        for data in _iter_chunks(store, manifest):
+            whole.update(data)
+            f.write(data)
+    if whole.hexdigest() != manifest["sha256"]:
+        raise ValueError("復元したDBのハッシュがスナップショットと一致しません")
+
+
+def _integrity_check(path: Path) -> None:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conn.close()
+    if [r[0] for r in rows] != ["ok"]:
+        raise ValueError(f"integrity_check に失敗しました: {rows[:5]}")
+
+
+def verify(snapshot_path: Path, deep: bool = False) -> dict:
+    """
+    スナップショットを検証する（全チャンクの存在・ハッシュ・全体のハッシュ）
+
+    deep=True の場合は一時ファイルに復元して PRAGMA integrity_check も行う。
+    """
+    snapshot_path = Path(snapshot_path)
+    manifest = load_manifest(snapshot_path)
+    store = BackupStore(snapshot_path.parent.parent, manifest["db_name"])
+    if deep:
+        tmp = store.root / f".verify_{snapshot_path.stem}.db"
+        try:
+            _write_snapshot(store, manifest, tmp)
+            _integrity_check(tmp)
+        finally:
+            tmp.unlink(missing_ok=True)
+    else:
+        whole = hashlib.sha256()
+        for data in _iter_chunks(store, manifest):
+            whole.update(data)
+        if whole.hexdigest() != manifest["sha256"]:
+            raise ValueError("スナップショット全体のハッシュが一致しません")
+    return manifest
+
+
+def restore(snapshot_path: Path, dest: Path, force: bool = False) -> None:
+    """スナップショットを dest に復元する（検証してから置き換える。アプリは停止しておくこと）"""
+    snapshot_path = Path(snapshot_path)
+    dest = Path(dest)
+    if dest.exists() and not force:
+        raise FileExistsError(f"復元先が既に存在します（上書きする場合は --force）: {dest}")
+    manifest = load_manifest(snapshot_path)
+    store = BackupStore(snapshot_path.parent.parent, manifest["db_name"])
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(dest.name + ".restore")
+    try:
+        _write_snapshot(store, manifest, tmp)
+        _integrity_check(tmp)
+        # 古い WAL/SHM が残っていると復元後のDBに適用されてしまう
+        for suffix in ("-wal", "-shm"):
+            Path(str(dest) + suffix).unlink(missing_ok=True)
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+    logger.info(f"DB restored: {snapshot_path.name} -> {dest}")
+
+
+# ---------- 保持 ----------
+
+
+def _snapshot_time(path: Path, db_name: str) -> datetime:
+    return datetime.strptime(path.stem[len(db_name) + 1:], TIMESTAMP_FORMAT)
+
+
+def select_retained(times: List[datetime], now: datetime, keep_daily: int, keep_weekly: int) -> Set[datetime]:
+    """保持する世代（直近 keep_daily 日は各日の最新、それ以前は keep_weekly 週まで各週の最新。最新は常に保持）"""
+    if not times:
+        return set()
+    keep = {max(times)}
+    daily_from = (now - timedelta(days=keep_daily - 1)).date() if keep_daily > 0 else now.date() + timedelta(days=1)
+    weekly_from = now - timedelta(weeks=keep_weekly)
+    latest_by_day: Dict[object, datetime] = {}
+    latest_by_week: Dict[object, datetime] = {}
+    for t in times:
+        if t.date() >= daily_from:
+            latest_by_day[t.date()] = max(t, latest_by_day.get(t.date(), t))
+        elif t >= weekly_from:
+            week = t.isocalendar()[:2]
+            latest_by_week[week] = max(t, latest_by_week.get(week, t))
+    keep.update(latest_by_day.values())
+    keep.update(latest_by_week.values())
+    return keep
+
+
+def prune(
+    db_path: Path,
+    backup_dir: Optional[Path] = None,
+    *,
+    keep_daily: int = DB_BACKUP_KEEP_DAILY,
+    keep_weekly: int = DB_BACKUP_KEEP_WEEKLY,
+    now: Optional[datetime] = None,
+) -> Dict[str, int]:
+    """
+    保持期間を過ぎたスナップショットと、参照されなくなったチャンクを削除
+
+    取得中の backup が書いた（再利用した）チャンクを消さないよう、backup_lock を取った中で呼ぶ。
+    """
+    store = BackupStore.for_db(Path(backup_dir or DB_BACKUP_DIR), Path(db_path))
+    if _lock_path(store).resolve() not in _held_locks:
+        raise RuntimeError(f"prune requires backup_lock: {_lock_path(store)}")
+    now = now or datetime.now()
+    snapshots = {}
+    for p in store.snapshots():
+        try:
+            snapshots[_snapshot_time(p, store.db_name)] = p
+        except ValueError:
+            continue
+    keep = select_retained(list(snapshots), now, keep_daily, keep_weekly)
+    removed = 0
+    for t, p in snapshots.items():
+        if t not in keep:
+            p.unlink()
+            removed += 1
+
+    referenced: Set[str] = set()
+    for p in store.snapshots():
+        referenced.update(load_manifest(p)["chunks"])
+    removed_chunks = 0
+    if store.chunks_dir.exists():
+        for chunk in store.chunks_dir.glob("*/*"):
+            if chunk.name.split(".", 1)[0] not in referenced:
+                chunk.unlink()
+                removed_chunks += 1
+    logger.info(f"DB backup pruned: snapshots={removed} chunks={removed_chunks}")
+    return {"snapshots": removed, "chunks": removed_chunks}
+
+
+# このプロセスが保持中のロックファイル（prune がロック下で呼ばれたかの確認用）
+_held_locks: Set[Path] = set()
+
+
+def _lock_path(store: BackupStore) -> Path:
+    return store.root / ".backup.lock"
+
+
+@contextmanager
+def _exclusive_lock(path: Path, blocking: bool = False):
+    """
+    ロックファイルを排他ロックする（取れなければ False。fcntl が無い環境では常に True）
+
+    blocking=True なら取れるまで待つ。
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    key = path.resolve()
+    if fcntl is None:
+        _held_locks.add(key)
+        try:
+            yield True
+        finally:
+            _held_locks.discard(key)
+        return
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        _held_locks.add(key)
+        try:
+            yield True
+        finally:
+            _held_locks.discard(key)
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def backup_lock(db_path: Path, backup_dir: Optional[Path] = None, blocking: bool = True):
+    """DBごとのバックアップ用ロック（backup / prune を他のプロセスと同時に走らせない）"""
+    store = BackupStore.for_db(Path(backup_dir or DB_BACKUP_DIR), Path(db_path))
+    with _exclusive_lock(_lock_path(store), blocking=blocking) as locked:
+        yield locked
+
+
+def run_scheduled_backup(
+    database_url: str,
+    backup_dir: Optional[Path] = None,
+    min_interval_hours: Optional[float] = None,
+) -> Optional[Path]:
+    """
+    バックアップして保持期間外を削除（SQLite 以外は何もしない）
+
+    min_interval_hours を指定した場合、最新のスナップショットがそれより新しければ何もしない
+    （再起動のたびに取得しないため）。
+    他のワーカー・プロセスが取得中（ロック中）の場合も何もしない。
+    """
+    db_path = sqlite_path_from_url(database_url)
+    if db_path is None or not db_path.exists():
+        return None
+    store = BackupStore.for_db(Path(backup_dir or DB_BACKUP_DIR), db_path)
+    with backup_lock(db_path, backup_dir, blocking=False) as locked:
+        if not locked:
+            logger.info(f"DB backup skipped: another process is backing up {db_path.name}")
+            return None
+        if min_interval_hours:
+            snapshots = store.snapshots()
+            if snapshots:
+                try:
+                    latest = _snapshot_time(snapshots[-1], store.db_name)
+                except ValueError:
+                    latest = None
+                if latest is not None and datetime.now() - latest < timedelta(hours=min_interval_hours):
+                    return None
+        path = backup(db_path, backup_dir)
+        prune(db_path, backup_dir)
+        return path
+
+
+def _main(argv: List[str]) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SQLite のオンライン・差分・圧縮バックアップ")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL", "sqlite:///./data/dev.db"))
+    parser.add_argument("--backup-dir", default=DB_BACKUP_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_backup = sub.add_parser("backup", help="スナップショットを作成")
+    p_backup.add_argument("--prune", action="store_true", help="作成後に保持期間外を削除")
+    sub.add_parser("list", help="スナップショットの一覧")
+    p_verify = sub.add_parser("verify", help="スナップショットを検証（省略時は最新）")
+    p_verify.add_argument("snapshot", nargs="?")
+    p_verify.add_argument("--deep", action="store_true", help="復元して integrity_check も行う")
+    p_restore = sub.add_parser("restore", help="スナップショットを復元（アプリ停止中に実行）")
+    p_restore.add_argument("snapshot")
+    p_restore.add_argument("dest")
+    p_restore.add_argument("--force", action="store_true", help="復元先が存在する場合も置き換える")
+    sub.add_parser("prune", help="保持期間外のスナップショットと不要なチャンクを削除")
+    args = parser.parse_args(argv)
+
+    db_path = sqlite_path_from_url(args.database_url)
+    if db_path is None:
+        print(f"SQLite 以外のDBには対応していません: {args.database_url}")
+        return 1
+    store = BackupStore.for_db(Path(args.backup_dir), db_path)
+
+    def _resolve(name: Optional[str]) -> Path:
+        if not name:
+            snapshots = store.snapshots()
+            if not snapshots:
+                raise SystemExit("スナップショットがありません")
+            return snapshots[-1]
+        p = Path(name)
+        return p if p.exists() else store.snapshots_dir / (name if name.endswith(".json") else f"{name}.json")
+
+    if args.command == "backup":
+        with backup_lock(db_path, Path(args.backup_dir)):
+            print(backup(db_path, Path(args.backup_dir)))
+            if args.prune:
+                print(prune(db_path, Path(args.backup_dir)))
+    elif args.command == "list":
+        for p in store.snapshots():
+            m = load_manifest(p)
+            print(f"{p.stem}\tsize={m['size']}\tchunks={len(m['chunks'])}\tnew={m['new_chunks']}\tstored={m['stored_bytes']}")
+    elif args.command == "verify":
+        path = _resolve(args.snapshot)
+        m = verify(path, deep=args.deep)
+        print(f"OK: {path.stem} size={m['size']} sha256={m['sha256']}")
+    elif args.command == "restore":
+        restore(_resolve(args.snapshot), Path(args.dest), force=args.force)
+        print(f"restored: {args.dest}")
+    elif args.command == "prune":
+        with backup_lock(db_path, Path(args.backup_dir)):
+            print(prune(db_path, Path(args.backup_dir)))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Google IDトークンのローカル検証（署名鍵 JWKS をキャッシュ）
+
+- Google の公開鍵（JWKS）をプロセス内に保持し、署名検証はローカルで行う
+- 鍵の有効期間は応答の Cache-Control: max-age に従う（取得できなければ GOOGLE_JWKS_DEFAULT_TTL_SECONDS）
+- 期限が近づいたらバックグラウンドで再取得（run_refresh_loop）。取得に失敗しても手元の鍵で検証を続ける
+- 未知の kid（鍵のローテーション直後）のときだけ同期的に再取得する（GOOGLE_JWKS_MIN_REFRESH_SECONDS 間隔で制限）
+
+GOOGLE_JWKS_URL を差し替えると、ローカルで鍵を配信するサーバ（開発・検証用）に向けられる。
+"""
+import json
+import logging
+import re
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, Optional
+
+from jose import JWTError, jwt
+
+from config.settings import (
+    GOOGLE_JWKS_DEFAULT_TTL_SECONDS,
+    GOOGLE_JWKS_MIN_REFRESH_SECONDS,
+    GOOGLE_JWKS_TIMEOUT_SECONDS,
+    GOOGLE_JWKS_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class JwksUnavailableError(Exception):
+    """署名鍵を取得できない（Google 側の障害・タイムアウトなど）"""
+
+
+class GoogleJwksCache:
+    """kid -> JWK のキャッシュ"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._keys: Dict[str, Dict[str, Any]] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fetch(self) -> None:
+        req = urllib.request.Request(self.url, headers={"Accept": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=GOOGLE_JWKS_TIMEOUT_SECONDS) as resp:
+                body = resp.read()
+                cache_control = resp.headers.get("Cache-Control") or ""
+        except Exception as e:
+            raise JwksUnavailableError(f"Failed to fetch Google JWKS: {e}") from e
+        try:
+            keys = {k["kid"]: k for k in json.loads(body).get("keys", []) if k.get("kid")}
+        except Exception as e:
+            raise JwksUnavailableError(f"Invalid Google JWKS response: {e}") from e
+        if not keys:
+            raise JwksUnavailableError("Google JWKS response has no keys")
+
+        m = _MAX_AGE_RE.search(cache_control)
+        ttl = int(m.group(1)) if m else GOOGLE_JWKS_DEFAULT_TTL_SECONDS
+        now = time.time()
+        self._keys = keys
+        self._fetched_at = now
+        self._expires_at = now + ttl
+        logger.info(f"Google JWKS refreshed: {len(keys)} keys, ttl={ttl}s")
+
+    def _refresh_at(self) -> float:
+        """期限の1割手前の時刻（バックグラウンドの再取得はここから行う）"""
+        return self._expires_at - (self._expires_at - self._fetched_at) * 0.1
+
+    def refresh(self, force: bool = False, early: bool = False) -> None:
+        """
+        鍵を再取得（force=False なら期限内は何もしない）
+
+        early=True なら期限の1割手前から再取得する（run_refresh_loop 用。期限切れの前に鍵を入れ替える）。
+        """
+        with self._lock:
+            now = time.time()
+            threshold = self._refresh_at() if early else self._expires_at
+            if not force and self._keys and now < threshold:
+                return
+            # 連続した再取得を抑える（未知の kid を大量に送られた場合など）
+            if force and self._keys and now - self._fetched_at < GOOGLE_JWKS_MIN_REFRESH_SECONDS:
+                return
+            self._fetch()
+
+    def get_key(self, kid: str) -> Optional[Dict[str, Any]]:
+        if not self._keys:
+            self.refresh()
+        key = self._keys.get(kid)
+        if key is None:
+            self.refresh(force=True)
+            key = self._keys.get(kid)
+        return key
+
+    def seconds_until_refresh(self) -> float:
+        """次の再取得までの秒数（期限の1割手前で再取得）"""
+        if not self._keys:
+            return 0.0
+        return max(self._refresh_at() - time.time(), 0.0)
+
+    def load_keys(self, keys: Dict[str, Dict[str, Any]], ttl: int) -> None:
+        """鍵を直接設定する（ローカル鍵での検証用）"""
+        with self._lock:
+            now = time.time()
+            self._keys = dict(keys)
+            self._fetched_at = now
+            self._expires_at = now + ttl
+
+
+_jwks_cache = GoogleJwksCache(GOOGLE_JWKS_URL)
+
+
+def get_jwks_cache() -> GoogleJwksCache:
+    return _jwks_cache
+
+
+def verify_google_id_token(token: str, audience: str) -> Dict[str, Any]:
+    """
+    Google IDトークンをローカルで検証してクレームを返す（同期・ブロッキング。イベントループ外で呼ぶこと）
+
+    Raises:
+        ValueError: トークンが不正（署名・期限・aud・iss）
+        JwksUnavailableError: 署名鍵を取得できない
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError as e:
+        raise ValueError(f"Malformed token: {e}")
+    kid = header.get("kid")
+    if not kid:
+        raise ValueError("Token has no kid")
+    key = _jwks_cache.get_key(kid)
+    if key is None:
+        raise ValueError(f"Unknown signing key: {kid}")
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=[key.get("alg") or "RS256"],
+            audience=audience,
+            options={"verify_at_hash": False},
+        )
+    except JWTError as e:
+        raise ValueError(str(e))
+    if claims.get("iss") not in GOOGLE_ISSUERS:
+        raise ValueError("Wrong issuer.")
+    return claims
+
+
+async def run_refresh_loop() -> None:
+    """期限の手前で鍵を再取得し続ける（API起動時に開始）"""
+    import asyncio
+    from starlette.concurrency import run_in_threadpool
+
+    while True:
+        try:
+            await run_in_threadpool(_jwks_cache.refresh, early=True)
+            delay = _jwks_cache.seconds_until_refresh()
+        except JwksUnavailableError as e:
+            # 手元の鍵は期限切れでも使い続け、少し待って再試行
+            logger.warning(f"Google JWKS refresh failed: {e}")
+            delay = GOOGLE_JWKS_MIN_REFRESH_SECONDS
+        except Exception as e:
+            logger.warning(f"Google JWKS refresh loop error: {e}")
+            delay = GOOGLE_JWKS_MIN_REFRESH_SECONDS
+        await asyncio.sleep(max(delay, GOOGLE_JWKS_MIN_REFRESH_SECONDS))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP キャッシュ（ETag / If-None-Match / Cache-Control）
+
+- ETag は本文ではなく「内容の版」（行の id・updated_at、問題バンクのシグネチャ、クエリ条件など）から作る
+  強い ETag。版はプロセス内キャッシュやインデックスだけで分かるため、一致すれば
+  本文の組み立て・直列化をせず（多くは DB にも触れず）304 を返せる
+- Cache-Control
+  - 公開の参照データ（公式問題・科目・問題一覧・短答問題）: public, max-age=HTTP_CACHE_MAX_AGE_SECONDS
+    （BFF / ブラウザは期限内は再取得せず、期限後は If-None-Match で再検証する）
+  - 本人だけが見るデータ（講評）: private, no-cache（毎回再検証。共有キャッシュには載せない）
+"""
+import hashlib
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from config.settings import HTTP_CACHE_MAX_AGE_SECONDS, HTTP_CACHE_STALE_WHILE_REVALIDATE_SECONDS
+
+PUBLIC_CACHE_CONTROL = (
+    f"public, max-age={HTTP_CACHE_MAX_AGE_SECONDS}, "
+    f"stale-while-revalidate={HTTP_CACHE_STALE_WHILE_REVALIDATE_SECONDS}"
+)
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    """内容の版を表す値から強い ETag を作る"""
+    key = "\x1f".join(repr(p) for p in parts)
+    return f'"{hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def _opaque(tag: str) -> str:
+    # If-None-Match は弱い比較（W/ の有無を無視）
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match が etag に一致するか（* を含む）"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    target = _opaque(etag)
+    return any(t.strip() == "*" or _opaque(t) == target for t in header.split(","))
+
+
+def cache_headers(etag: str, cache_control: str = PUBLIC_CACHE_CONTROL) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+def not_modified(etag: str, cache_control: str = PUBLIC_CACHE_CONTROL) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, cache_control))
+
+
+def check_not_modified(
+    request: Request, etag: str, cache_control: str = PUBLIC_CACHE_CONTROL
+) -> Optional[Response]:
+    """一致すれば 304 応答、しなければ None"""
+    if is_not_modified(request, etag):
+        return not_modified(etag, cache_control)
+    return None
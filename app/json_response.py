@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+JSON レスポンスの高速化
+
+- FastJSONResponse: orjson があれば orjson で直列化する JSONResponse（アプリのデフォルト）
+  - 標準の json より数倍速く、日本語を \\uXXXX にしないためバイト数も小さい
+- 直列化済みキャッシュ: 内容が変わらないペイロード（完了済みの講評・公開中の公式問題）は
+  直列化したバイト列をプロセス内に保持し、2回目以降は Pydantic の検証・直列化を省く
+  - キーには内容の版（updated_at・id 等）を含め、変わったら別キーになるようにする
+  - バイト列は JSON にできないため共有層（app.cache の SQLite）には置かない
+"""
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from .cache import MISSING, LruTtlCache
+from config.settings import RESPONSE_PAYLOAD_CACHE_MAX_ITEMS, RESPONSE_PAYLOAD_CACHE_TTL_SECONDS
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+_payload_cache = LruTtlCache(RESPONSE_PAYLOAD_CACHE_MAX_ITEMS, RESPONSE_PAYLOAD_CACHE_TTL_SECONDS)
+
+
+def dumps(content: Any) -> bytes:
+    """JSON バイト列に直列化（orjson が無い場合は標準の json）"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """orjson で直列化する JSONResponse"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        try:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjson が扱えない型（Decimal 等）は jsonable_encoder で変換してから
+            return orjson.dumps(jsonable_encoder(content), option=orjson.OPT_NON_STR_KEYS)
+
+
+def cached_json_response(
+    key: str, build: Callable[[], Any], headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    直列化済みのバイト列をキャッシュして返す
+
+    build は Pydantic モデルまたは JSON にできる値を返す（未ヒット時のみ呼ぶ）。
+    HTTPException 等の例外はキャッシュせずそのまま送出する。
+    """
+    body = _payload_cache.get(key)
+    if body is MISSING:
+        started = time.perf_counter()
+        body = dumps(jsonable_encoder(build()))
+        _payload_cache.set(key, body)
+        logger.debug(f"Payload cached: {key} bytes={len(body)} ({(time.perf_counter() - started) * 1000:.1f}ms)")
+    return Response(content=body, media_type="application/json", headers=headers)
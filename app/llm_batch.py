@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+"""
+Message Batches による非対話LLM処理
+
+対象（対話レイテンシが不要なもの）:
+- 会話要約（Thread.conversation_summary）
+- 講評の再生成（Review。プロンプト変更後のバックフィル等）
+
+復習問題生成（RecentReviewProblemSession）はダッシュボードでユーザーが生成を押して結果を待つ
+対話的な処理のため、同期の messages.create のまま（セッションの status も success / failed のみ）。
+
+流れ:
+1. build_*_item で BatchItem を作る（messages.create と同じパラメータは llm_service の build_*_request_params を共用）
+2. submit_batch で送信し、llm_batch_jobs / llm_batch_items に記録
+3. poll_pending_batches で状態を確認し、終了したバッチの結果を custom_id で対象へ反映
+   （API の各ワーカーがポーリングしてもよい。結果の反映はジョブを条件付き UPDATE で取得した1ワーカーだけが行う）
+
+ローカルの代替サーバー（scripts/anthropic_batch_stub.py）で検証する場合は
+ANTHROPIC_BASE_URL=http://127.0.0.1:8765 を指定する（config/llm_config.py）。
+
+CLI:
+    python -m app.llm_batch poll [--watch]
+    python -m app.llm_batch regrade --review-ids 1,2,3
+    python -m app.llm_batch summaries [--min-new-turns 5]
+"""
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from .models import (
+    LlmBatchJob,
+    LlmBatchItem,
+    LlmRequest,
+    Message,
+    OfficialQuestion,
+    Review,
+    Thread,
+    UserReviewHistory,
+)
+from .llm_usage import build_llm_request_row
+from .chat_history import fetch_turn_range
+from . import llm_service
+from . import review_chat_context
+from . import study_analytics
+from config.settings import LLM_BATCH_MAX_REQUESTS, LLM_BATCH_POLL_INTERVAL_SECONDS
+from config.subjects import get_subject_name
+
+logger = logging.getLogger(__name__)
+
+TARGET_THREAD_SUMMARY = "thread_summary"
+TARGET_REVIEW = "review"
+
+REVIEW_PROMPT_VERSION = "evaluation_v1"
+
+# 結果の反映中に落ちたワーカーのジョブは、この秒数が経てば他のワーカーが取り直す
+LOCK_TIMEOUT_SECONDS = 600
+
+
+@dataclass
+class BatchItem:
+    """バッチ内の1リクエスト（custom_id は submit_batch で採番）"""
+    target_type: str
+    target_id: int
+    user_id: Optional[int]
+    params: Dict[str, Any]
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _get_batches_api():
+    """SDKのバージョン差を吸収して batches API を返す（未対応なら例外）"""
+    llm_config = llm_service.get_llm_config()
+    if not llm_config.is_available():
+        raise RuntimeError("ANTHROPIC_API_KEY が設定されていないため、バッチ処理を実行できません")
+    client = llm_config.get_client()
+    batches = getattr(client.messages, "batches", None)
+    if batches is None:
+        beta = getattr(client, "beta", None)
+        batches = getattr(getattr(beta, "messages", None), "batches", None)
+    if batches is None:
+        raise RuntimeError("インストールされている anthropic SDK は Message Batches に対応していません")
+    return batches
+
+
+# ---------- リクエスト構築 ----------
+
+
+def build_thread_summary_item(db: Session, thread: Thread, to_turn: int) -> Optional[BatchItem]:
+    """summary_up_to_turn の次のターンから to_turn までを要約する"""
+    from_turn = thread.summary_up_to_turn or 0
+    if to_turn <= from_turn:
+        return None
+    segment = fetch_turn_range(db, thread.id, from_turn, to_turn)
+    if not segment:
+        return None
+    prompt_name = "free_chat_summarize" if thread.type == "free_chat" else "review_chat_summarize"
+    return BatchItem(
+        target_type=TARGET_THREAD_SUMMARY,
+        target_id=thread.id,
+        user_id=thread.user_id,
+        params=llm_service.build_summary_request_params(segment, prompt_name=prompt_name),
+        meta={"from_turn": from_turn, "to_turn": to_turn},
+    )
+
+
+def build_review_regrade_item(db: Session, review: Review) -> BatchItem:
+    """既存の講評を現在の評価プロンプトで再生成する"""
+    question_text = review.custom_question_text or ""
+    purpose_text = None
+    grading_impression_text = None
+    subject_id = None
+    if review.official_question_id:
+        official_q = db.query(OfficialQuestion).filter(OfficialQuestion.id == review.official_question_id).first()
+        if official_q:
+            question_text = official_q.text
+            purpose_text = official_q.syutudaisyusi
+            subject_id = official_q.subject_id
+            if official_q.shiken_type == "shihou":
+                grading_impression_text = official_q.grading_impression_text
+    if subject_id is None:
+        history = db.query(UserReviewHistory).filter(UserReviewHistory.review_id == review.id).first()
+        if history and history.subject:
+            subject_id = history.subject
+    subject_name = get_subject_name(subject_id) if subject_id is not None else "不明"
+    return BatchItem(
+        target_type=TARGET_REVIEW,
+        target_id=review.id,
+        user_id=review.user_id,
+        params=llm_service.build_review_request_params(
+            subject_name,
+            question_text,
+            review.answer_text or "",
+            purpose_text,
+            grading_impression_text,
+        ),
+    )
+
+
+# ---------- 送信 ----------
+
+
+def submit_batch(db: Session, items: List[BatchItem]) -> List[LlmBatchJob]:
+    """BatchItem を LLM_BATCH_MAX_REQUESTS 件ずつ送信し、ジョブを記録する"""
+    if not items:
+        return []
+    batches = _get_batches_api()
+    jobs: List[LlmBatchJob] = []
+    for start in range(0, len(items), LLM_BATCH_MAX_REQUESTS):
+        chunk = items[start:start + LLM_BATCH_MAX_REQUESTS]
+        job = LlmBatchJob(status="submitted", request_count=len(chunk))
+        db.add(job)
+        db.flush()
+
+        requests = []
+        for seq, it in enumerate(chunk, start=1):
+            custom_id = f"{it.target_type}-{it.target_id}-{job.id}-{seq}"[:64]
+            db.add(LlmBatchItem(
+                job_id=job.id,
+                custom_id=custom_id,
+                target_type=it.target_type,
+                target_id=it.target_id,
+                user_id=it.user_id,
+                meta_json=json.dumps(it.meta, ensure_ascii=False) if it.meta else None,
+                status="pending",
+            ))
+            requests.append({"custom_id": custom_id, "params": it.params})
+
+        try:
+            batch = batches.create(requests=requests)
+            job.batch_id = batch.id
+            db.commit()
+            logger.info(f"LLM batch submitted: job={job.id} batch_id={batch.id} requests={len(chunk)}")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"LLM batch submit failed: {e}", exc_info=True)
+            raise
+        jobs.append(job)
+    return jobs
+
+
+# ---------- 結果の反映 ----------
+
+
+def _message_text(message) -> str:
+    if not message or not getattr(message, "content", None):
+        return ""
+    return getattr(message.content[0], "text", "") or ""
+
+
+def _usage(message) -> tuple[Optional[int], Optional[int]]:
+    usage = getattr(message, "usage", None)
+    if not usage:
+        return None, None
+    return getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None)
+
+
+def _add_llm_request(db: Session, item: LlmBatchItem, message, *, feature_type: str, prompt_version: str, **refs) -> None:
+    if not item.user_id:
+        return
+    in_tok, out_tok = _usage(message)
+    db.add(LlmRequest(**build_llm_request_row(
+        user_id=item.user_id,
+        feature_type=feature_type,
+        model=getattr(message, "model", None),
+        prompt_version=prompt_version,
+        input_tokens=in_tok,
+        output_tokens=out_tok,
+        request_id=getattr(message, "id", None),
+        latency_ms=None,
+        is_batch=True,
+        **refs,
+    )))
+
+
+def _apply_thread_summary(db: Session, item: LlmBatchItem, message) -> bool:
+    thread = db.query(Thread).filter(Thread.id == item.target_id).first()
+    if not thread:
+        return False
+    meta = json.loads(item.meta_json or "{}")
+    from_turn = int(meta.get("from_turn") or 0)
+    to_turn = int(meta.get("to_turn") or 0)
+    # 送信後に対話側で要約が進んでいたら反映しない（二重要約を避ける）
+    if (thread.summary_up_to_turn or 0) != from_turn:
+        return False
+    summary = _message_text(message).strip()
+    if not summary:
+        return False
+    header = f"【{from_turn + 1}～{to_turn}ターンの要約】\n"
+    if thread.conversation_summary and thread.conversation_summary.strip():
+        thread.conversation_summary = thread.conversation_summary.rstrip() + "\n\n" + header + summary
+    else:
+        thread.conversation_summary = header + summary
+    thread.summary_up_to_turn = to_turn
+    _add_llm_request(
+        db, item, message,
+        feature_type=thread.type,
+        prompt_version="free_chat_summarize_v1" if thread.type == "free_chat" else "review_chat_summarize_v1",
+        thread_id=thread.id,
+    )
+    return True
+
+
+def _apply_review(db: Session, item: LlmBatchItem, message) -> bool:
+    review = db.query(Review).filter(Review.id == item.target_id).first()
+    if not review:
+        return False
+    content = llm_service._extract_json_from_response(_message_text(message))
+    content = llm_service._try_repair_json(content)
+    evaluation = json.loads(content)
+    review_json = {"evaluation": evaluation}
+    review.kouhyo_kekka = json.dumps(review_json, ensure_ascii=False)
+    review_chat_context.invalidate_review(review.id)
+
+    # 点数を履歴へ反映（create_review と同じ evaluation.overall_review.score）
+    score = None
+    overall = evaluation.get("overall_review") if isinstance(evaluation, dict) else None
+    if isinstance(overall, dict) and "score" in overall:
+        try:
+            score = float(overall["score"])
+        except (ValueError, TypeError):
+            score = None
+    if score is not None:
+        for history in db.query(UserReviewHistory).filter(UserReviewHistory.review_id == review.id).all():
+            analytics = study_analytics.AnalyticsDeltas(history.user_id)
+            analytics.change_score(history.subject, history.created_at, history.score, score)
+            analytics.apply(db)
+            history.score = score
+    _add_llm_request(
+        db, item, message,
+        feature_type="review", prompt_version=REVIEW_PROMPT_VERSION, review_id=review.id,
+    )
+    return True
+
+
+_RESULT_HANDLERS: Dict[str, Callable[[Session, LlmBatchItem, Any], bool]] = {
+    TARGET_THREAD_SUMMARY: _apply_thread_summary,
+    TARGET_REVIEW: _apply_review,
+}
+
+
+def _process_results(db: Session, job: LlmBatchJob, batches) -> None:
+    items_by_custom_id = {
+        it.custom_id: it
+        for it in db.query(LlmBatchItem).filter(LlmBatchItem.job_id == job.id, LlmBatchItem.status == "pending").all()
+    }
+    for entry in batches.results(job.batch_id):
+        item = items_by_custom_id.get(entry.custom_id)
+        if item is None:
+            continue
+        # 処理中であることを示し続ける（大きなバッチで LOCK_TIMEOUT_SECONDS を超えても取り直されない）
+        job.locked_at = _utcnow()
+        result = entry.result
+        if getattr(result, "type", None) != "succeeded":
+            item.status = "errored"
+            item.error_message = f"{getattr(result, 'type', 'unknown')}: {getattr(result, 'error', '')}"[:2000]
+            db.commit()
+            continue
+        handler = _RESULT_HANDLERS.get(item.target_type)
+        try:
+            applied = handler(db, item, result.message) if handler else False
+            item.status = "applied" if applied else "skipped"
+            item.applied_at = _utcnow()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            item.status = "errored"
+            item.error_message = str(e)[:2000]
+            db.commit()
+            logger.warning(f"LLM batch result apply failed: custom_id={item.custom_id} error={e}")
+
+    # 取り直したジョブでは前のワーカーが反映済みの項目もあるため、件数は項目の status から数え直す
+    counts = dict(
+        db.query(LlmBatchItem.status, func.count(LlmBatchItem.id))
+        .filter(LlmBatchItem.job_id == job.id)
+        .group_by(LlmBatchItem.status)
+        .all()
+    )
+    job.succeeded_count = counts.get("applied", 0) + counts.get("skipped", 0)
+    job.errored_count = counts.get("errored", 0)
+    job.status = "processed"
+    job.processed_at = _utcnow()
+    job.locked_at = None
+    db.commit()
+
+
+def claim_job(db: Session, job_id: int, now: Optional[datetime] = None) -> bool:
+    """
+    終了したジョブの結果反映を取得する（stripe_webhooks.claim_next と同じ条件付き UPDATE）
+
+    status='ended' かつ未取得（または取得から LOCK_TIMEOUT_SECONDS 経過）の場合だけ locked_at を更新する。
+    更新できたワーカーだけが反映するため、複数ワーカーが同時にポーリングしても二重に反映しない。
+    """
+    now = now or _utcnow()
+    stale = now - timedelta(seconds=LOCK_TIMEOUT_SECONDS)
+    claimed = db.query(LlmBatchJob).filter(
+        LlmBatchJob.id == job_id,
+        LlmBatchJob.status == "ended",
+        or_(LlmBatchJob.locked_at.is_(None), LlmBatchJob.locked_at <= stale),
+    ).update({"locked_at": now}, synchronize_session=False)
+    db.commit()
+    return bool(claimed)
+
+
+def poll_batch_job(db: Session, job: LlmBatchJob) -> str:
+    """1ジョブの状態を確認し、終了していれば結果を反映する。戻り値は job.status。"""
+    if not job.batch_id or job.status in ("processed", "failed"):
+        return job.status
+    batches = _get_batches_api()
+    if job.status == "submitted":
+        batch = batches.retrieve(job.batch_id)
+        if getattr(batch, "processing_status", None) != "ended":
+            return job.status
+        db.query(LlmBatchJob).filter(
+            LlmBatchJob.id == job.id,
+            LlmBatchJob.status == "submitted",
+        ).update({"status": "ended", "ended_at": _utcnow()}, synchronize_session=False)
+        db.commit()
+    if not claim_job(db, job.id):
+        # 他のワーカーが反映中（または反映済み）
+        db.refresh(job)
+        return job.status
+    db.refresh(job)
+    _process_results(db, job, batches)
+    logger.info(
+        f"LLM batch processed: job={job.id} batch_id={job.batch_id} "
+        f"succeeded={job.succeeded_count} errored={job.errored_count}"
+    )
+    return job.status
+
+
+def poll_pending_batches(db: Session) -> int:
+    """未処理の全ジョブを確認する。戻り値は処理完了したジョブ数。"""
+    jobs = (
+        db.query(LlmBatchJob)
+        .filter(LlmBatchJob.status.in_(("submitted", "ended")))
+        .order_by(LlmBatchJob.id.asc())
+        .all()
+    )
+    done = 0
+    for job in jobs:
+        try:
+            if poll_batch_job(db, job) == "processed":
+                done += 1
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"LLM batch poll failed: job={job.id} error={e}")
+    return done
+
+
+# ---------- まとめて投入 ----------
+
+
+def submit_review_regrades(db: Session, review_ids: List[int]) -> List[LlmBatchJob]:
+    reviews = db.query(Review).filter(Review.id.in_(review_ids)).all()
+    return submit_batch(db, [build_review_regrade_item(db, r) for r in reviews])
+
+
+def submit_thread_summaries(db: Session, min_new_turns: int = 5) -> List[LlmBatchJob]:
+    """未要約のターンが min_new_turns 以上溜まったスレッドを要約する（対象ターンは完了済みのもののみ）"""
+    counts = (
+        db.query(Message.thread_id, func.count(Message.id).label("n"))
+        .filter(Message.role.in_(("user", "assistant")))
+        .group_by(Message.thread_id)
+        .subquery()
+    )
+    rows = (
+        db.query(Thread, counts.c.n)
+        .join(counts, counts.c.thread_id == Thread.id)
+        .filter(Thread.type.in_(("review_chat", "free_chat")))
+        .all()
+    )
+    pending_thread_ids = {
+        it.target_id
+        for it in db.query(LlmBatchItem.target_id).filter(
+            LlmBatchItem.target_type == TARGET_THREAD_SUMMARY,
+            LlmBatchItem.status == "pending",
+        ).all()
+    }
+    items: List[BatchItem] = []
+    for thread, n in rows:
+        if thread.id in pending_thread_ids:
+            continue
+        completed_turns = int(n or 0) // 2
+        if completed_turns - (thread.summary_up_to_turn or 0) < min_new_turns:
+            continue
+        item = build_thread_summary_item(db, thread, completed_turns)
+        if item:
+            items.append(item)
+    return submit_batch(db, items)
+
+
+def run_poll_loop(stop_after: Optional[int] = None) -> None:
+    """LLM_BATCH_POLL_INTERVAL_SECONDS ごとにポーリング（stop_after 回で終了。None なら無限）"""
+    from .db import SessionLocal
+
+    n = 0
+    while stop_after is None or n < stop_after:
+        db = SessionLocal()
+        try:
+            poll_pending_batches(db)
+        finally:
+            db.close()
+        n += 1
+        if stop_after is None or n < stop_after:
+            time.sleep(LLM_BATCH_POLL_INTERVAL_SECONDS)
+
+
+def _main(argv: List[str]) -> int:
+    import argparse
+    from .db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Message Batches による非対話LLM処理")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_poll = sub.add_parser("poll", help="送信済みバッチの結果を反映")
+    p_poll.add_argument("--watch", action="store_true", help="終了せず定期的にポーリング")
+    p_regrade = sub.add_parser("regrade", help="講評を現在のプロンプトで再生成")
+    p_regrade.add_argument("--review-ids", required=True, help="カンマ区切りの review_id")
+    p_sum = sub.add_parser("summaries", help="未要約ターンが溜まったスレッドを要約")
+    p_sum.add_argument("--min-new-turns", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "poll" and args.watch:
+        run_poll_loop()
+        return 0
+
+    db = SessionLocal()
+    try:
+        if args.command == "poll":
+            print(f"processed jobs: {poll_pending_batches(db)}")
+        elif args.command == "regrade":
+            ids = [int(x) for x in args.review_ids.split(",") if x.strip()]
+            jobs = submit_review_regrades(db, ids)
+            print(f"submitted jobs: {[j.batch_id for j in jobs]}")
+        elif args.command == "summaries":
+            jobs = submit_thread_summaries(db, min_new_turns=args.min_new_turns)
+            print(f"submitted jobs: {[j.batch_id for j in jobs]}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    sys.exit(_main(sys.argv[1:]))
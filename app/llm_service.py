@@ -169,46 +169,19 @@ def _evaluate_answer(
                 "future_considerations": []
             }, {"input_tokens": None, "output_tokens": None, "request_id": None, "latency_ms": None})
         
-        # 科目別の留意事項を読み込む
-        subject_guidelines = _load_subject_guidelines(subject)
-        
-        # 答案に段落番号が既に付与されているかチェック
-        import re
-        has_markers = bool(re.search(r'\$\$\[\d+\]', answer_text))
-        
-        # 段落番号がまだ付与されていない場合のみ付与
-        if has_markers:
-            marked_answer = answer_text
-        else:
-            marked_answer = add_paragraph_markers(answer_text)
-        
-        prompt = template.replace("{SUBJECT_SPECIFIC_GUIDELINES}", subject_guidelines)
-        prompt = prompt.replace("{PURPOSE_TEXT}", purpose_text or "（出題趣旨なし）")
-        prompt = prompt.replace("{GRADING_IMPRESSION_TEXT}", grading_impression_text or "（採点実感なし）")
-        prompt = prompt.replace("{QUESTION_TEXT}", question_text or "（問題文なし）")
-        prompt = prompt.replace("{ANSWER_TEXT}", marked_answer)
-        
-        # プロンプトの構築
-        system_prompt = "あなたは司法試験・予備試験の法律答案講評の品質を評価する専門家です。"
-        
-        # モデル名を取得（引数が指定されていない場合はデフォルト）
-        if model_name is None:
-            model_name = get_llm_model(USE_CASE_REVIEW)
+        params = build_review_request_params(
+            subject,
+            question_text,
+            answer_text,
+            purpose_text,
+            grading_impression_text,
+            model_name,
+            template=template,
+        )
         
         # Claude APIにリクエスト
         start_time = time.time()
-        message = client.messages.create(
-            model=model_name,
-            max_tokens=16384,  # 長い評価に対応するためさらに増加（16Kトークン）
-            temperature=0.3,
-            system=system_prompt,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt + "\n\n重要: レスポンスは必ず有効なJSON形式で返してください。文字列内の改行や特殊文字は適切にエスケープしてください。"
-                }
-            ]
-        )
+        message = client.messages.create(**params)
         latency_ms = int((time.time() - start_time) * 1000)
         
         # レスポンスをパース
@@ -264,6 +237,53 @@ def _evaluate_answer(
         raise Exception(f"答案の評価に失敗しました [{error_type}]: {str(e)}") from e
 
 
+def build_review_request_params(
+    subject: str,
+    question_text: Optional[str],
+    answer_text: str,
+    purpose_text: Optional[str] = None,
+    grading_impression_text: Optional[str] = None,
+    model_name: Optional[str] = None,
+    template: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    講評（evaluation.txt）の messages.create パラメータを構築する。
+    同期呼び出し（_evaluate_answer）とバッチ実行（llm_batch）で共通。
+    """
+    if template is None:
+        template = _load_prompt_template("evaluation")
+
+    # 科目別の留意事項を読み込む
+    subject_guidelines = _load_subject_guidelines(subject)
+
+    # 段落番号がまだ付与されていない場合のみ付与
+    has_markers = bool(re.search(r'\$\$\[\d+\]', answer_text))
+    marked_answer = answer_text if has_markers else add_paragraph_markers(answer_text)
+
+    prompt = template.replace("{SUBJECT_SPECIFIC_GUIDELINES}", subject_guidelines)
+    prompt = prompt.replace("{PURPOSE_TEXT}", purpose_text or "（出題趣旨なし）")
+    prompt = prompt.replace("{GRADING_IMPRESSION_TEXT}", grading_impression_text or "（採点実感なし）")
+    prompt = prompt.replace("{QUESTION_TEXT}", question_text or "（問題文なし）")
+    prompt = prompt.replace("{ANSWER_TEXT}", marked_answer)
+
+    # モデル名を取得（引数が指定されていない場合はデフォルト）
+    if model_name is None:
+        model_name = get_llm_model(USE_CASE_REVIEW)
+
+    return {
+        "model": model_name,
+        "max_tokens": 16384,  # 長い評価に対応するためさらに増加（16Kトークン）
+        "temperature": 0.3,
+        "system": "あなたは司法試験・予備試験の法律答案講評の品質を評価する専門家です。",
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt + "\n\n重要: レスポンスは必ず有効なJSON形式で返してください。文字列内の改行や特殊文字は適切にエスケープしてください。"
+            }
+        ],
+    }
+
+
 def _try_repair_json(json_str: str) -> str:
     """JSONの簡単な修復を試みる"""
     import re
@@ -546,40 +566,55 @@ def generate_recent_review_problems(
         return dummy, json.dumps(dummy, ensure_ascii=False), "dummy", None, None, None, None
 
     client = llm_config.get_client()
-    model_name = llm_config.get_model(USE_CASE_REVISIT_PROBLEMS)
+    params = build_recent_review_request_params(prompt, max_tokens=max_tokens, temperature=temperature)
+    model_name = params["model"]
+
+    start_time = time.time()
+    message = client.messages.create(**params)
+
+    raw_output = message.content[0].text if message.content and len(message.content) > 0 else ""
+    latency_ms = int((time.time() - start_time) * 1000)
+
+    input_tokens = None
+    output_tokens = None
+    if hasattr(message, "usage") and message.usage:
+        input_tokens = getattr(message.usage, "input_tokens", None)
+        output_tokens = getattr(message.usage, "output_tokens", None)
+    request_id = getattr(message, "id", None)
+
+    items = parse_recent_review_items(raw_output)
+    return items, raw_output, model_name, input_tokens, output_tokens, request_id, latency_ms
+
 
+def build_recent_review_request_params(
+    prompt: str,
+    max_tokens: int = 4096,
+    temperature: float = 0.4,
+) -> Dict[str, Any]:
+    """復習問題生成の messages.create パラメータを構築する（同期・バッチ共通）"""
     system_prompt = (
         "あなたは司法試験・予備試験の学習支援者です。"
         "与えられた学習履歴に基づき、復習問題を作成してください。"
         "出力は必ずJSONのみで、余計な文章を付けないでください。"
     )
-
-    start_time = time.time()
-    message = client.messages.create(
-        model=model_name,
-        max_tokens=max_tokens,
-        temperature=temperature,
-        system=system_prompt,
-        messages=[
+    return {
+        "model": get_llm_model(USE_CASE_REVISIT_PROBLEMS),
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "system": system_prompt,
+        "messages": [
             {
                 "role": "user",
                 "content": (prompt or "").strip()
                 + "\n\n重要: レスポンスは必ず有効なJSON配列のみで返してください。文字列内の改行や特殊文字は適切にエスケープしてください。",
             }
         ],
-    )
-
-    raw_output = message.content[0].text if message.content and len(message.content) > 0 else ""
-    latency_ms = int((time.time() - start_time) * 1000)
+    }
 
-    input_tokens = None
-    output_tokens = None
-    if hasattr(message, "usage") and message.usage:
-        input_tokens = getattr(message.usage, "input_tokens", None)
-        output_tokens = getattr(message.usage, "output_tokens", None)
-    request_id = getattr(message, "id", None)
 
-    content = _extract_json_from_response(raw_output)
+def parse_recent_review_items(raw_output: str) -> list[Dict[str, Any]]:
+    """復習問題生成の出力（JSON配列）を検証して最大5件に正規化する"""
+    content = _extract_json_from_response(raw_output or "")
     content = _try_repair_json(content)
 
     data = json.loads(content)
@@ -613,7 +648,7 @@ def generate_recent_review_problems(
             }
         )
 
-    return items, raw_output, model_name, input_tokens, output_tokens, request_id, latency_ms
+    return items
 
 
 # _build_final_review関数は削除（1段階処理では不要）
@@ -1229,6 +1264,26 @@ def summarize_conversation_segment(
     llm_config = get_llm_config()
     if not llm_config.is_available():
         return "", "dummy", None, None, None, None
+    params = build_summary_request_params(messages, max_tokens=max_tokens, prompt_name=prompt_name)
+    client = llm_config.get_client()
+    model_name = params["model"]
+    import time
+    start = time.time()
+    message = client.messages.create(**params)
+    latency_ms = int((time.time() - start) * 1000)
+    summary = (message.content[0].text if message.content else "").strip()
+    input_tokens = getattr(message.usage, "input_tokens", None) if hasattr(message, "usage") and message.usage else None
+    output_tokens = getattr(message.usage, "output_tokens", None) if hasattr(message, "usage") and message.usage else None
+    request_id = getattr(message, "id", None)
+    return summary, model_name, input_tokens, output_tokens, request_id, latency_ms
+
+
+def build_summary_request_params(
+    messages: List[Dict[str, str]],
+    max_tokens: int = 2048,
+    prompt_name: str = "review_chat_summarize",
+) -> Dict[str, Any]:
+    """会話セグメント要約の messages.create パラメータを構築する（同期・バッチ共通）"""
     lines = []
     for m in messages:
         role = (m.get("role") or "user").strip()
@@ -1244,22 +1299,12 @@ def summarize_conversation_segment(
             "【会話】\n{CONVERSATION}"
         )
     prompt = template.replace("{CONVERSATION}", conversation_text)
-    client = llm_config.get_client()
-    model_name = llm_config.get_model(USE_CASE_REVIEW_CHAT)
-    import time
-    start = time.time()
-    message = client.messages.create(
-        model=model_name,
-        max_tokens=max_tokens,
-        temperature=0.3,
-        messages=[{"role": "user", "content": prompt}],
-    )
-    latency_ms = int((time.time() - start) * 1000)
-    summary = (message.content[0].text if message.content else "").strip()
-    input_tokens = getattr(message.usage, "input_tokens", None) if hasattr(message, "usage") and message.usage else None
-    output_tokens = getattr(message.usage, "output_tokens", None) if hasattr(message, "usage") and message.usage else None
-    request_id = getattr(message, "id", None)
-    return summary, model_name, input_tokens, output_tokens, request_id, latency_ms
+    return {
+        "model": get_llm_model(USE_CASE_REVIEW_CHAT),
+        "max_tokens": max_tokens,
+        "temperature": 0.3,
+        "messages": [{"role": "user", "content": prompt}],
+    }
 
 
 def review_chat(
@@ -19,6 +19,9 @@ _PRICING_MAP: Dict[str, Dict[str, Decimal]] = {
     "haiku": {"input": Decimal("160"), "output": Decimal("800")},
 }
 
+# Message Batches API の料金倍率（通常料金の50%）
+BATCH_COST_RATE = Decimal("0.5")
+
 
 def _get_model_type(model: Optional[str]) -> Optional[str]:
     """
@@ -235,17 +238,21 @@ def build_llm_request_row(
     output_tokens: Optional[int] = None,
     request_id: Optional[str] = None,
     latency_ms: Optional[int] = None,
+    is_batch: bool = False,
 ) -> Dict[str, Any]:
     """
     LLMリクエスト行を構築（データベース保存用）
     
     注意: この関数はデータベースに保存するためのデータを返します。
     入力/出力コストの詳細はデータベースには保存せず、APIレスポンス時に計算します。
+    is_batch=True の場合は Message Batches の割引率（BATCH_COST_RATE）を適用します。
     
     Returns:
         LLMリクエスト行の辞書（cost_yenのみを含む、input_cost_yen/output_cost_yenは含まない）
     """
     cost = calculate_cost_yen(model, input_tokens, output_tokens)
+    if is_batch and cost is not None:
+        cost = (cost * BATCH_COST_RATE).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
     return {
         "user_id": user_id,
         "feature_type": feature_type,
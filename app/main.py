@@ -2,14 +2,15 @@ import json
 import logging
 import calendar
 import pyotp
-from fastapi import FastAPI, Depends, HTTPException, Query, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Header
+from fastapi.responses import JSONResponse, Response
 from fastapi import Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import or_, cast, String, func
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import or_, cast, String, func, case, select
 from sqlalchemy.exc import OperationalError as SQLAlchemyOperationalError
 from sqlalchemy.orm import Session
-from typing import Any, Optional, List, Tuple
+from typing import Any, Dict, Optional, List, Tuple
 from datetime import datetime, timedelta, timezone
 from dataclasses import dataclass
 import uuid
@@ -17,7 +18,13 @@ from zoneinfo import ZoneInfo
 
 logger = logging.getLogger(__name__)
 
-from .db import SessionLocal, engine, Base, get_db_session_for_url
+# get_db は auth と同じ関数を使う（同一リクエスト内で認証とエンドポイントが1つのセッションを共有する）
+from .db import (
+    SessionLocal, engine, Base, get_db, get_readonly_db_session_for_url,
+    admin_postgres_urls, dispose_readonly_engines, is_supported_database_url,
+    normalize_database_url as normalize_pg_url,
+)
+from .db_async import AsyncSession, dispose_async_engine, get_async_db
 from .models import (
     Submission, Review, Problem,
     ShortAnswerProblem, ShortAnswerSession, ShortAnswerAnswer,
@@ -30,6 +37,7 @@ from .models import (
     TimerSession, TimerDailyChunk, TimerDailyStats,
     StudyTag, StudyItem as StudyItemModel,
     UserMonthlyGoal,
+    json_path,
 )
 from config.constants import FIXED_SUBJECTS
 from config.subjects import SUBJECT_MAP, SUBJECT_NAME_TO_ID, get_subject_name, get_subject_id
@@ -50,7 +58,7 @@ from .schemas import (
     ThreadCreate, ThreadResponse, ThreadListResponse,
     MessageCreate, MessageResponse, MessageListResponse, ThreadMessageCreate,
     UserUpdate, UserResponse,
-    DashboardItemCreate, DashboardItemUpdate, DashboardItemResponse, DashboardItemListResponse,
+    DashboardItemCreate, DashboardItemUpdate, DashboardItemResponse, DashboardItemListResponse, DashboardItemReorderRequest,
     RecentReviewProblemResponse, RecentReviewProblemSessionResponse, RecentReviewProblemSessionsResponse,
     RecentReviewProblemGenerateRequest, SaveReviewProblemResponse,
     TimerSessionResponse, TimerDailyStatsResponse, TimerStartResponse, TimerStopResponse,
@@ -62,14 +70,43 @@ from .schemas import (
     AdminUserUpdateRequest, AdminDatabaseInfoResponse,
     AdminSubscriptionPlanItem, AdminSubscriptionPlanListResponse,
     PlanLimitUsageResponse, ReviewTicketCheckoutRequest, ReviewTicketCheckoutResponse, ReviewTicketUsageResponse,
-    SubscriptionCheckoutRequest, SubscriptionCheckoutResponse
+    SubscriptionCheckoutRequest, SubscriptionCheckoutResponse,
+    StudyAnalyticsResponse, ShortAnswerBulkAnswerRequest, ShortAnswerBulkAnswerResponse,
+    ReviewQueueItemResponse, ReviewQueueDueResponse, ReviewQueueGradeRequest,
+    SearchResponse, SearchResultItem,
 )
 from pydantic import BaseModel
 from .llm_service import generate_review, chat_about_review, free_chat, generate_recent_review_problems, generate_chat_title, add_paragraph_markers
 from .llm_usage import build_llm_request_row
-from .auth import get_current_user, get_current_user_required, get_current_admin, verify_google_token, get_or_create_user, create_access_token
+from .auth import get_current_user, get_current_user_required, get_current_admin, verify_google_token, get_or_create_user, create_access_token, invalidate_user_principal
 from . import plan_limits as plan_limits_module
-from config.settings import AUTH_ENABLED
+from . import review_cache as review_cache_module
+from . import chat_history as chat_history_module
+from . import review_chat_context as review_chat_context_module
+from . import token_budget as token_budget_module
+from .cache import MISSING, get_cache
+from .official_question_import import OFFICIAL_QUESTION_CACHE_NAMESPACE
+from . import rank_keys as rank_keys_module
+from . import study_analytics as study_analytics_module
+from . import short_answer_bank as short_answer_bank_module
+from . import spaced_repetition as spaced_repetition_module
+from . import search_index as search_index_module
+from . import semantic_index as semantic_index_module
+from . import stripe_webhooks as stripe_webhooks_module
+from . import db_backup as db_backup_module
+from .json_response import FastJSONResponse, cached_json_response
+from .compression import CompressionMiddleware
+from . import http_cache
+from config.settings import (
+    AUTH_ENABLED,
+    CHAT_HISTORY_TOKEN_BUDGET,
+    CHAT_PROMPT_TOKEN_BUDGET,
+    REVIEW_CHAT_CONTEXT_TOKEN_BUDGET,
+    FREE_CHAT_RETRIEVAL_TOKEN_BUDGET,
+    REVIEW_CHAT_RETRIEVAL_TOKEN_BUDGET,
+    REFERENCE_CACHE_TTL_SECONDS,
+    RESPONSE_COMPRESSION_ENABLED,
+)
 from config.settings import (
     ADMIN_2FA_ENABLED,
     ADMIN_2FA_EMAIL,
@@ -82,6 +119,7 @@ from config.settings import (
     STRIPE_BASIC_PLAN_PRICE_ID,
     STRIPE_HIGH_PLAN_PRICE_ID,
     STRIPE_FIRST_MONTH_FM_DM_PRICE_ID,
+    STRIPE_API_BASE,
 )
 from .timer_api import register_timer_routes
 from .timer_utils import get_study_date as get_study_date_4am
@@ -91,6 +129,10 @@ try:
 except Exception:
     stripe = None
 
+if stripe is not None and STRIPE_API_BASE:
+    # ローカルの代替サーバー（stripe-mock 等）へ向ける
+    stripe.api_base = STRIPE_API_BASE
+
 
 def _add_one_month_jst(base_utc: datetime) -> datetime:
     """
@@ -166,6 +208,7 @@ def _upsert_user_subscription(
         existing.cancelled_at = datetime.now(timezone.utc) if cancel_at_period_end else None
         existing.payment_method = "stripe_subscription"
         db.commit()
+        plan_limits_module.invalidate_user_plan(user_id)
         return
 
     # 新規または過去行しかない場合は、現在アクティブを停止してから作成
@@ -187,6 +230,7 @@ def _upsert_user_subscription(
     )
     db.add(sub)
     db.commit()
+    plan_limits_module.invalidate_user_plan(user_id)
 
 
 def _normalize_subject_id(subject_value) -> Optional[int]:
@@ -213,10 +257,14 @@ def _normalize_subject_id(subject_value) -> Optional[int]:
         return mapped if (mapped is not None and 1 <= mapped <= 18) else None
     return None
 
+# 管理者の database_url 指定で、許可していない接続先を指定した場合のエラー
+UNSUPPORTED_DATABASE_URL_DETAIL = "SQLiteファイル、または許可されたPostgreSQLデータベースのみ指定できます"
+
 # テーブル作成（起動時に新しいテーブルのみ追加、既存テーブルはスキップ）
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="法律答案講評システム API", version="1.0.0")
+# JSON は orjson で直列化（app/json_response.py）
+app = FastAPI(title="法律答案講評システム API", version="1.0.0", default_response_class=FastJSONResponse)
 
 # CORS設定（Next.jsフロントエンドからのリクエストを許可）
 import os
@@ -244,6 +292,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 大きな JSON 応答を Accept-Encoding に応じて br / gzip で圧縮（app/compression.py）
+if RESPONSE_COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
 # タイマー関連のルートを登録
 register_timer_routes(app)
 
@@ -269,6 +321,15 @@ def _startup_migrate_reviews():
     except Exception as e:
         logger.warning(f"Startup official_questions index migration skipped/failed: {str(e)}")
 
+    # short_answer_answers のインデックス（セッション単位の集計用）
+    try:
+        from .migrate_short_answer_indexes import migrate_short_answer_indexes
+
+        migrate_short_answer_indexes()
+        logger.info("✓ Startup short_answer_answers index migration completed")
+    except Exception as e:
+        logger.warning(f"Startup short_answer_answers index migration skipped/failed: {str(e)}")
+
     # official_questions.id の自動採番（SQLite: INTEGER PRIMARY KEY）を保証
     try:
         from .migrate_official_questions_table import migrate_official_questions_table
@@ -341,6 +402,69 @@ def _startup_migrate_reviews():
     except Exception as e:
         logger.warning(f"Startup llm_requests migration skipped/failed: {str(e)}")
 
+    # 講評結果キャッシュ用テーブルを作成
+    try:
+        from .migrate_review_result_cache import migrate_review_result_cache
+
+        migrate_review_result_cache()
+        logger.info("✓ Startup review_result_cache migration completed")
+    except Exception as e:
+        logger.warning(f"Startup review_result_cache migration skipped/failed: {str(e)}")
+
+    # dashboard_items / study_items に rank_key（並び順キー）を追加
+    try:
+        from .migrate_rank_keys import migrate_rank_keys
+
+        migrate_rank_keys()
+        logger.info("✓ Startup rank_key migration completed")
+    except Exception as e:
+        logger.warning(f"Startup rank_key migration skipped/failed: {str(e)}")
+
+    # 学習分析の週次集計（user_weekly_stats）を作成・初回集計
+    try:
+        from .migrate_study_analytics import migrate_study_analytics
+
+        migrate_study_analytics()
+        logger.info("✓ Startup study analytics migration completed")
+    except Exception as e:
+        logger.warning(f"Startup study analytics migration skipped/failed: {str(e)}")
+
+    # 復習スケジュール（review_schedule_items）を作成・初期化
+    try:
+        from .migrate_review_schedule import migrate_review_schedule
+
+        migrate_review_schedule()
+        logger.info("✓ Startup review schedule migration completed")
+    except Exception as e:
+        logger.warning(f"Startup review schedule migration skipped/failed: {str(e)}")
+
+    # 全文検索（FTS5）の索引と同期トリガーを作成
+    try:
+        from .migrate_search_index import migrate_search_index
+
+        migrate_search_index()
+        logger.info("✓ Startup search index migration completed")
+    except Exception as e:
+        logger.warning(f"Startup search index migration skipped/failed: {str(e)}")
+
+    # Stripe Webhook の受信箱（stripe_webhook_events）を作成
+    try:
+        from .migrate_stripe_webhook_events import migrate_stripe_webhook_events
+
+        migrate_stripe_webhook_events()
+        logger.info("✓ Startup stripe webhook events migration completed")
+    except Exception as e:
+        logger.warning(f"Startup stripe webhook events migration skipped/failed: {str(e)}")
+
+    # Message Batches 用テーブルを作成
+    try:
+        from .migrate_llm_batches import migrate_llm_batches
+
+        migrate_llm_batches()
+        logger.info("✓ Startup llm_batches migration completed")
+    except Exception as e:
+        logger.warning(f"Startup llm_batches migration skipped/failed: {str(e)}")
+
     # review追加チケット付与テーブルを作成
     try:
         from .migrate_review_ticket_grants import migrate_review_ticket_grants
@@ -368,6 +492,118 @@ def _startup_migrate_reviews():
     except Exception as e:
         logger.warning(f"Startup subscription plans seed skipped/failed: {str(e)}")
 
+@app.on_event("startup")
+async def _startup_google_jwks_refresher():
+    """Google IDトークン検証用の公開鍵をバックグラウンドで取得・更新（認証有効時のみ）"""
+    from config.settings import GOOGLE_CLIENT_ID
+    if not AUTH_ENABLED or not GOOGLE_CLIENT_ID:
+        return
+    import asyncio
+    from .google_jwks import run_refresh_loop
+
+    asyncio.create_task(run_refresh_loop())
+    logger.info("✓ Google JWKS refresher started")
+
+@app.on_event("startup")
+async def _startup_semantic_index_warmup():
+    """公式問題の関連箇所検索用の索引を読み込む（未作成なら作成。最初のチャットを待たせない）"""
+    if not semantic_index_module.is_available():
+        logger.info("numpy not installed. Semantic retrieval disabled")
+        return
+    import asyncio
+
+    def _warmup():
+        db = SessionLocal()
+        try:
+            semantic_index_module.get_official_index(db)
+        except Exception as e:
+            logger.warning(f"Semantic index warmup failed: {str(e)}")
+        finally:
+            db.close()
+
+    asyncio.get_running_loop().run_in_executor(None, _warmup)
+    logger.info("✓ Semantic index warmup started")
+
+@app.on_event("startup")
+async def _startup_stripe_webhook_worker():
+    """Stripe Webhook の受信箱を受信順に反映する worker（Stripe 設定時のみ）"""
+    from config.settings import STRIPE_WEBHOOK_WORKER_ENABLED
+    if stripe is None or not STRIPE_SECRET_KEY or not STRIPE_WEBHOOK_WORKER_ENABLED:
+        return
+    import asyncio
+
+    def _process_once():
+        db = SessionLocal()
+        try:
+            stripe_webhooks_module.process_pending(db, _handle_stripe_event)
+        finally:
+            db.close()
+
+    asyncio.create_task(stripe_webhooks_module.run_worker_loop(_process_once))
+    logger.info("✓ Stripe webhook worker started")
+
+@app.on_event("startup")
+async def _startup_llm_batch_poller():
+    """Message Batches の結果ポーリング（LLM_BATCH_POLL_ENABLED=true の場合のみ）"""
+    from config.settings import LLM_BATCH_POLL_ENABLED, LLM_BATCH_POLL_INTERVAL_SECONDS
+    if not LLM_BATCH_POLL_ENABLED:
+        return
+    import asyncio
+    from .llm_batch import poll_pending_batches
+
+    def _poll_once():
+        db = SessionLocal()
+        try:
+            poll_pending_batches(db)
+        finally:
+            db.close()
+
+    async def _loop():
+        while True:
+            try:
+                await run_in_threadpool(_poll_once)
+            except Exception as e:
+                logger.warning(f"LLM batch poller error: {e}")
+            await asyncio.sleep(LLM_BATCH_POLL_INTERVAL_SECONDS)
+
+    asyncio.create_task(_loop())
+    logger.info("✓ LLM batch poller started")
+
+@app.on_event("startup")
+async def _startup_db_backup():
+    """
+    SQLite の定期バックアップ（DB_BACKUP_ENABLED=true の場合のみ。app/db_backup.py）
+
+    各ワーカーでループが動くが、取得はバックアップ先のファイルロックを取れた1プロセスだけが行う
+    """
+    from config.settings import DB_BACKUP_ENABLED, DB_BACKUP_INTERVAL_HOURS
+    database_url = os.getenv("DATABASE_URL", "sqlite:///./data/dev.db")
+    if not DB_BACKUP_ENABLED or db_backup_module.sqlite_path_from_url(database_url) is None:
+        return
+    import asyncio
+
+    async def _loop():
+        while True:
+            try:
+                await run_in_threadpool(
+                    db_backup_module.run_scheduled_backup,
+                    database_url,
+                    None,
+                    DB_BACKUP_INTERVAL_HOURS,
+                )
+            except Exception as e:
+                logger.warning(f"DB backup error: {e}")
+            # 最新のスナップショットが新しければ何もしないため、短めの間隔で確認する
+            await asyncio.sleep(min(DB_BACKUP_INTERVAL_HOURS * 3600, 3600))
+
+    asyncio.create_task(_loop())
+    logger.info("✓ DB backup scheduler started")
+
+@app.on_event("shutdown")
+async def _shutdown_db_engines():
+    await dispose_async_engine()
+    dispose_readonly_engines()
+
 # DBロックなど（複数ユーザー同時アクセス時）→ ユーザー向けメッセージで表示
 @app.exception_handler(SQLAlchemyOperationalError)
 async def db_operational_error_handler(request: Request, exc: SQLAlchemyOperationalError):
@@ -396,14 +632,6 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"detail": f"予期しないエラーが発生しました: {str(exc)}"}
     )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 def _truncate_text(text: str, limit: int = 12000) -> str:
     if not text:
         return ""
@@ -436,56 +664,131 @@ def _build_review_chat_context_text(
     review_json_obj: dict,
     answer_text: str,
     paragraph_numbers_override: list | None = None,
+    bundle: "review_chat_context_module.ReviewChatContextBundle | None" = None,
 ) -> str:
     """
     講評チャット用コンテキストを組み立てる。
     - 常時: 問題文、講評JSONの overall_review。
     - ユーザー入力に「出題趣旨」が含まれる場合: PURPOSE_TEXT を追加。
     - ユーザー入力に「採点実感」が含まれる場合: GRADING_IMPRESSION_TEXT を追加。
+    - 含まれない場合: 出題趣旨・採点実感のうち発話に近い抜粋だけを追加（REVIEW_CHAT_RETRIEVAL_TOKEN_BUDGET 以内）。
     - paragraph_numbers_override が渡された場合、またはユーザー入力に「§N」「第N段落」が含まれる場合: Specified と Related を追加。
     （§N を含んだ発話の次回・次々回は呼び出し側で paragraph_numbers_override を渡す想定）
+    bundle が渡された場合は、キャッシュ済みの overall_review・段落索引・関連講評索引を使う。
     """
     from .llm_service import (
         extract_paragraph_numbers_from_user_input,
         extract_specified_text_from_answer,
         get_related_review_json_items,
     )
+    # (見出し, 本文, 優先度, 上限トークン, 最低限残すトークン)。優先度は小さいほど削られにくい
     sections = []
 
     # 常時: 問題文
-    sections.append("【問題文】\n" + _truncate_text(question_text or "（問題文なし）"))
+    sections.append(("【問題文】", question_text or "（問題文なし）", 0, 12000, 2000))
 
     # 条件付き: 出題趣旨／参考文章
     if user_input and "出題趣旨" in user_input:
-        sections.append("【出題趣旨／参考文章】\n" + _truncate_text(purpose_text or "（出題趣旨／参考文章なし）"))
+        sections.append(("【出題趣旨／参考文章】", purpose_text or "（出題趣旨／参考文章なし）", 3, 12000, 1000))
 
     # 条件付き: 採点実感
     if user_input and "採点実感" in user_input:
-        sections.append("【採点実感】\n" + _truncate_text(grading_impression_text or "（採点実感なし）"))
+        sections.append(("【採点実感】", grading_impression_text or "（採点実感なし）", 3, 12000, 1000))
+
+    # 明示されていない出題趣旨・採点実感は、発話に近い抜粋だけを入れる
+    excerpt_sources = []
+    if purpose_text and not (user_input and "出題趣旨" in user_input):
+        excerpt_sources.append(("出題趣旨／参考文章", purpose_text))
+    if grading_impression_text and not (user_input and "採点実感" in user_input):
+        excerpt_sources.append(("採点実感", grading_impression_text))
+    if excerpt_sources and user_input:
+        hits = semantic_index_module.rank_texts(user_input, excerpt_sources, REVIEW_CHAT_RETRIEVAL_TOKEN_BUDGET)
+        if hits:
+            sections.append((
+                "【発話に関連する出題趣旨・採点実感（抜粋）】",
+                semantic_index_module.format_passages(hits),
+                3,
+                REVIEW_CHAT_RETRIEVAL_TOKEN_BUDGET,
+                0,
+            ))
 
     # 常時: 講評（全体）＝ overall_review のみ
-    overall = (review_json_obj or {}).get("overall_review") or {}
-    try:
-        overall_str = json.dumps(overall, ensure_ascii=False, indent=2)
-    except Exception:
-        overall_str = "{}"
-    sections.append("【講評（全体）】\n" + _truncate_text(overall_str, limit=8000))
+    if bundle is not None:
+        overall_str = bundle.overall_review_json
+    else:
+        overall = (review_json_obj or {}).get("overall_review") or {}
+        try:
+            overall_str = json.dumps(overall, ensure_ascii=False, indent=2)
+        except Exception:
+            overall_str = "{}"
+    sections.append(("【講評（全体）】", overall_str, 2, 8000, 1000))
 
     # 条件付き: §N / 第N段落（今回の入力 or 次回・次々回用の override）→ Specified と Related
     para_nums = paragraph_numbers_override if paragraph_numbers_override is not None else extract_paragraph_numbers_from_user_input(user_input or "")
     if para_nums and answer_text:
-        specified = extract_specified_text_from_answer(answer_text, para_nums)
+        if bundle is not None:
+            specified = bundle.specified_text(para_nums)
+        else:
+            specified = extract_specified_text_from_answer(answer_text, para_nums)
         if specified:
-            sections.append("【指定段落付き答案（Specified）】\n" + _truncate_text(specified, limit=12000))
-        related = get_related_review_json_items(review_json_obj or {}, para_nums)
+            sections.append(("【指定段落付き答案（Specified）】", specified, 1, 12000, 2000))
+        if bundle is not None:
+            related = bundle.related_items(para_nums)
+        else:
+            related = get_related_review_json_items(review_json_obj or {}, para_nums)
         if related:
             try:
                 related_str = json.dumps(related, ensure_ascii=False, indent=2)
             except Exception:
                 related_str = "[]"
-            sections.append("【指定段落に関連する講評（Related）】\n" + _truncate_text(related_str, limit=10000))
+            sections.append(("【指定段落に関連する講評（Related）】", related_str, 4, 10000, 0))
+
+    # 文字数ではなくトークン数で、合計 REVIEW_CHAT_CONTEXT_TOKEN_BUDGET に収まるよう優先度順に削る
+    allocated = token_budget_module.allocate_sections(
+        [
+            token_budget_module.PromptSection(name=header, text=text, priority=priority, max_tokens=max_tokens, min_tokens=min_tokens)
+            for header, text, priority, max_tokens, min_tokens in sections
+        ],
+        REVIEW_CHAT_CONTEXT_TOKEN_BUDGET,
+    )
+    return "\n\n".join(header + "\n" + allocated[header] for header, _, _, _, _ in sections)
+
+
+def _chat_history_token_budget(system_prompt: str, messages: list, user_prompt: str) -> int:
+    """入力全体の予算（CHAT_PROMPT_TOKEN_BUDGET）から、コンテキスト等を除いた残りを履歴に割り当てる"""
+    rest = token_budget_module.remaining_budget(
+        CHAT_PROMPT_TOKEN_BUDGET,
+        system_prompt,
+        user_prompt,
+        *[m.get("content") or "" for m in messages],
+    )
+    return min(CHAT_HISTORY_TOKEN_BUDGET, rest)
+
+
+def _check_chat_cost_preflight(
+    db: Session,
+    current_user: User,
+    *,
+    use_case: str,
+    system_prompt: str,
+    messages: list,
+    max_output_tokens: int = 4096,
+) -> None:
+    """LLM呼び出し前に見積もりコストを加えてもプラン上限以内かを確認（超える場合は429）"""
+    if not plan_limits_module.is_plan_limits_enabled():
+        return
+    from config.llm_config import get_llm_config
 
-    return "\n\n".join(sections)
+    llm_config = get_llm_config()
+    if not llm_config.is_available():
+        return
+    estimated = token_budget_module.predict_cost_yen(
+        llm_config.get_model(use_case),
+        system_prompt,
+        messages,
+        max_output_tokens,
+    )
+    plan_limits_module.check_non_review_cost_limit(db, current_user, estimated_cost_yen=estimated)
 
 
 def _build_review_chat_user_prompt_text(question: str) -> str:
@@ -519,31 +822,8 @@ def _get_review_chat_context_by_review_id(
     if review.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    # review_json
-    try:
-        review_json_obj = json.loads(review.kouhyo_kekka) if isinstance(review.kouhyo_kekka, str) else (review.kouhyo_kekka or {})
-    except Exception:
-        review_json_obj = {}
-
-    question_text = review.custom_question_text or ""
-    purpose_text = ""
-    grading_impression_text = ""
-    answer_text = review.answer_text or ""
-
-    if review.official_question_id:
-        official_q = db.query(OfficialQuestion).filter(OfficialQuestion.id == review.official_question_id).first()
-        if official_q:
-            question_text = official_q.text or ""
-            purpose_text = official_q.syutudaisyusi or ""
-            if official_q.shiken_type == "shihou":
-                grading_impression_text = official_q.grading_impression_text or ""
-    else:
-        # custom: UserReviewHistory.reference_text を「参考文章」として使う
-        history = db.query(UserReviewHistory).filter(UserReviewHistory.review_id == review_id).first()
-        if history and history.reference_text:
-            purpose_text = history.reference_text
-
-    return question_text, purpose_text, grading_impression_text, review_json_obj, answer_text
+    b = review_chat_context_module.get_context_bundle(db, review)
+    return b.question_text, b.purpose_text, b.grading_impression_text, b.review_json_obj, b.answer_text
 
 @app.get("/health")
 def health():
@@ -589,25 +869,61 @@ def debug_llm_config():
 
 @app.get("/v1/official-questions/years", response_model=OfficialQuestionYearsResponse)
 def list_official_question_years(
+    request: Request,
     shiken_type: Optional[str] = Query(None, description="shihou/yobi（省略可）"),
     db: Session = Depends(get_db),
 ):
-    q = db.query(OfficialQuestion.nendo).distinct()
-    if shiken_type:
-        q = q.filter(OfficialQuestion.shiken_type == shiken_type)
-    # UIは基本activeを選ぶので active の年度のみ返す
-    q = q.filter(OfficialQuestion.status == "active").order_by(OfficialQuestion.nendo.desc())
-    years = [r[0] for r in q.all()]
-    return OfficialQuestionYearsResponse(years=years)
+    def _load_years():
+        q = db.query(OfficialQuestion.nendo).distinct()
+        if shiken_type:
+            q = q.filter(OfficialQuestion.shiken_type == shiken_type)
+        # UIは基本activeを選ぶので active の年度のみ返す
+        q = q.filter(OfficialQuestion.status == "active").order_by(OfficialQuestion.nendo.desc())
+        return [r[0] for r in q.all()]
+
+    # 公式問題と同じ名前空間に置き、取込のコミット後に一緒に無効化されるようにする
+    # （official_question_import.import_official_questions。反映までの時間は _official_question_cache を参照）
+    years = _official_question_cache.get_or_load(f"years:{shiken_type or ''}", _load_years)
+    etag = http_cache.make_etag("official_question_years", shiken_type, years)
+    return (
+        http_cache.check_not_modified(request, etag)
+        or FastJSONResponse({"years": years}, headers=http_cache.cache_headers(etag))
+    )
+
+
+# 参照データのキャッシュ（app.cache。CACHE_BACKEND=sqlite ならワーカー間で共有）
+# 公式問題は取込（official_question_import）のコミット後に名前空間ごと無効化される。
+# 古い内容が見える期間: CACHE_BACKEND=sqlite なら CACHE_NAMESPACE_CHECK_SECONDS（既定1秒）以内。
+# memory では取込を別プロセス（init_db / CLI）で行うと届かないため、最大 REFERENCE_CACHE_TTL_SECONDS（既定600秒）
+_official_question_cache = get_cache(OFFICIAL_QUESTION_CACHE_NAMESPACE, max_size=2000, ttl=REFERENCE_CACHE_TTL_SECONDS)
+_reference_cache = get_cache("reference", max_size=100, ttl=REFERENCE_CACHE_TTL_SECONDS)
+
+
+def _official_question_payload(request: Request, data: dict):
+    # 行の内容は id ごとに不変（取込時は新しい id の行が追加される）ため、
+    # id を ETag の版にし、直列化済みのバイト列を使い回す
+    etag = http_cache.make_etag("official_question", data["id"])
+    return http_cache.check_not_modified(request, etag) or cached_json_response(
+        f"official_question:{data['id']}",
+        lambda: OfficialQuestionActiveResponse(**data),
+        headers=http_cache.cache_headers(etag),
+    )
 
 
 @app.get("/v1/official-questions/active", response_model=OfficialQuestionActiveResponse)
 def get_active_official_question(
+    request: Request,
     shiken_type: str = Query(..., description="shihou/yobi"),
     nendo: int = Query(..., ge=2000),
     subject_id: int = Query(..., ge=1, le=18),
     db: Session = Depends(get_db),
 ):
+    # 公開中の問題は取込時以外変わらないため、参照データとしてキャッシュ（取込後の反映時間は _official_question_cache を参照）
+    cache_key = f"{shiken_type}:{nendo}:{subject_id}"
+    cached = _official_question_cache.get(cache_key)
+    if cached is not MISSING:
+        return _official_question_payload(request, cached)
+
     oq = db.query(OfficialQuestion).filter(
         OfficialQuestion.shiken_type == shiken_type,
         OfficialQuestion.nendo == nendo,
@@ -620,17 +936,19 @@ def get_active_official_question(
 
     grading_text = oq.grading_impression_text if oq.shiken_type == "shihou" else None
 
-    return OfficialQuestionActiveResponse(
-        id=oq.id,
-        shiken_type=oq.shiken_type,
-        nendo=oq.nendo,
-        subject_id=oq.subject_id,
-        version=oq.version,
-        status=oq.status,
-        text=oq.text,
-        syutudaisyusi=oq.syutudaisyusi,
-        grading_impression_text=grading_text,
-    )
+    data = {
+        "id": oq.id,
+        "shiken_type": oq.shiken_type,
+        "nendo": oq.nendo,
+        "subject_id": oq.subject_id,
+        "version": oq.version,
+        "status": oq.status,
+        "text": oq.text,
+        "syutudaisyusi": oq.syutudaisyusi,
+        "grading_impression_text": grading_text,
+    }
+    _official_question_cache.set(cache_key, data)
+    return _official_question_payload(request, data)
 
 # 認証関連のエンドポイント（認証がOFFの場合は動作しない）
 class GoogleAuthRequest(BaseModel):
@@ -923,6 +1241,7 @@ async def cancel_my_subscription(
         sub.expires_at = _add_one_month_jst(base)
     sub.cancelled_at = now_utc
     db.commit()
+    plan_limits_module.invalidate_user_plan(current_user.id)
     db.refresh(sub)
     return {
         "message": "次回更新を停止しました。現在の期間終了までは利用できます。",
@@ -1108,24 +1427,15 @@ def _get_subscription_period(stripe_sub_id: str) -> Tuple[datetime, datetime, bo
     return current_start, current_end, cancel_at_period_end
 
 
-@app.post("/v1/webhooks/stripe")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
-    """Stripe Webhook（review追加チケットの付与）。"""
-    if stripe is None:
-        raise HTTPException(status_code=503, detail="Stripe SDK is not installed")
-    if not STRIPE_SECRET_KEY or not STRIPE_WEBHOOK_SECRET:
-        raise HTTPException(status_code=503, detail="Stripe webhook is not configured")
-
-    payload = await request.body()
-    sig_header = request.headers.get("stripe-signature")
-    if not sig_header:
-        raise HTTPException(status_code=400, detail="Missing stripe-signature header")
+def _handle_stripe_event(db: Session, event: dict) -> None:
+    """
+    受信箱から取り出した Stripe イベントを反映する（worker がスレッドプールで呼ぶ。同期）
 
-    try:
-        stripe.api_key = STRIPE_SECRET_KEY
-        event = stripe.Webhook.construct_event(payload, sig_header, STRIPE_WEBHOOK_SECRET)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid webhook signature: {str(e)}")
+    同じイベントが再試行で複数回渡されても結果が変わらないこと:
+    - チケット付与は payment_id で重複を防ぐ
+    - サブスクリプションは Stripe 上の最新の期間で上書きする
+    """
+    stripe.api_key = STRIPE_SECRET_KEY
 
     if event.get("type") == "checkout.session.completed":
         obj = event["data"]["object"]
@@ -1215,6 +1525,28 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
                 )
                 logger.info(f"Successfully processed invoice.paid for user {user_id}, plan {renewal_plan_code}")
 
+
+@app.post("/v1/webhooks/stripe")
+async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
+    """Stripe Webhook。署名を検証して受信箱に保存し、すぐに応答する（反映は worker が行う）。"""
+    if stripe is None:
+        raise HTTPException(status_code=503, detail="Stripe SDK is not installed")
+    if not STRIPE_SECRET_KEY or not STRIPE_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Stripe webhook is not configured")
+
+    payload = await request.body()
+    sig_header = request.headers.get("stripe-signature")
+    if not sig_header:
+        raise HTTPException(status_code=400, detail="Missing stripe-signature header")
+
+    try:
+        event = stripe.Webhook.construct_event(payload, sig_header, STRIPE_WEBHOOK_SECRET)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid webhook signature: {str(e)}")
+
+    # 再送（同じ event_id）は保存されないので、二重に反映されない
+    if stripe_webhooks_module.store_event(db, event, payload.decode("utf-8")):
+        stripe_webhooks_module.notify()
     return {"received": True}
 
 @app.put("/v1/users/me", response_model=UserResponse)
@@ -1243,6 +1575,7 @@ async def update_current_user_info(
         current_user.email = user_update.email
     
     db.commit()
+    invalidate_user_principal(current_user.id)
     db.refresh(current_user)
     
     return UserResponse(
@@ -1280,12 +1613,19 @@ def problem_to_response(problem: Problem) -> ProblemResponse:
 # Problem関連のエンドポイント
 @app.get("/v1/problems", response_model=ProblemListResponse)
 def list_problems(
+    request: Request,
     exam_type: Optional[str] = Query(None, description="試験種別（司法試験/予備試験）"),
     year: Optional[int] = Query(None, description="年度"),
     subject: Optional[int] = Query(None, description="科目ID（1-18）"),
     db: Session = Depends(get_db)
 ):
-    """問題一覧を取得"""
+    """問題一覧を取得（件数と最終更新日時が変わっていなければ 304）"""
+    count, last_updated = db.query(func.count(Problem.id), func.max(Problem.updated_at)).one()
+    etag = http_cache.make_etag("problems", count, str(last_updated), exam_type, year, subject)
+    not_modified = http_cache.check_not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
     query = db.query(Problem)
     
     if exam_type:
@@ -1297,10 +1637,11 @@ def list_problems(
     
     problems = query.order_by(Problem.year.desc(), Problem.subject).all()
     
-    return ProblemListResponse(
+    payload = ProblemListResponse(
         problems=[problem_to_response(p) for p in problems],
         total=len(problems)
     )
+    return FastJSONResponse(payload.model_dump(mode="json"), headers=http_cache.cache_headers(etag))
 
 @app.get("/v1/problems/subjects", response_model=ProblemSubjectsResponse)
 def get_problem_subjects(db: Session = Depends(get_db)):
@@ -1409,12 +1750,106 @@ def create_problems_bulk(problems: List[ProblemCreate], db: Session = Depends(ge
     )
 
 
+def _review_to_response(db: Session, review: Review) -> ReviewResponse:
+    """Review を ReviewResponse に組み立てる（問題文・出題趣旨・科目は関連テーブルから補う）"""
+    try:
+        if isinstance(review.kouhyo_kekka, str):
+            review_json = json.loads(review.kouhyo_kekka)
+        else:
+            review_json = review.kouhyo_kekka
+    except (json.JSONDecodeError, TypeError):
+        raise HTTPException(status_code=500, detail="Review JSON is invalid")
+
+    # 問題情報を取得
+    question_text = review.custom_question_text or ""
+    purpose_text = None
+    grading_impression_text = None
+    subject_id = None
+    subject_name = None
+    question_title = None
+    reference_text = None
+
+    # 既存問題の場合：OfficialQuestionから全情報を取得
+    if review.official_question_id:
+        official_q = db.query(OfficialQuestion).filter(OfficialQuestion.id == review.official_question_id).first()
+        if official_q:
+            question_text = official_q.text
+            purpose_text = official_q.syutudaisyusi
+            if official_q.subject_id:
+                subject_id = official_q.subject_id  # 科目ID（1-18）
+                subject_name = get_subject_name(subject_id)
+            # 司法試験のみ採点実感を返す（存在する場合）
+            if official_q.shiken_type == "shihou":
+                grading_impression_text = official_q.grading_impression_text
+
+    # 新規問題の場合：UserReviewHistoryからタイトルと参照文章を取得
+    history = db.query(UserReviewHistory).filter(UserReviewHistory.review_id == review.id).first()
+    if history:
+        if subject_id is None and history.subject:
+            subject_id = history.subject  # 科目ID（1-18）
+            subject_name = get_subject_name(subject_id)
+        # 新規問題（custom）の場合、question_titleとreference_textを取得
+        if review.source_type == "custom":
+            if history.question_title:
+                question_title = history.question_title
+            if history.reference_text:
+                purpose_text = history.reference_text
+                reference_text = history.reference_text
+
+    # review_markdownを生成（JSONから）
+    from .llm_service import _format_markdown
+    review_markdown = _format_markdown(subject_name or "不明", review_json)
+
+    return ReviewResponse(
+        review_id=review.id,
+        submission_id=0,  # review_idベースの場合は使用しない
+        review_markdown=review_markdown,
+        review_json=review_json,
+        answer_text=review.answer_text,
+        question_text=question_text,
+        subject=subject_id,  # 科目ID（1-18）
+        subject_name=subject_name,  # 科目名（表示用）
+        purpose=purpose_text,
+        question_title=question_title,
+        source_type=review.source_type,
+        reference_text=reference_text if review.source_type == "custom" else None,
+        grading_impression_text=grading_impression_text,
+    )
+
+
+async def _cached_review_response(
+    *,
+    review_id: int,
+    submission_id: Optional[int],
+    answer_text: str,
+    current_user: User,
+    db: Session,
+) -> ReviewResponse:
+    """キャッシュ済み（または同時重複リクエストで生成された）講評をレスポンス形式で返す"""
+    review = db.query(Review).filter(Review.id == review_id).first()
+    if not review:
+        raise HTTPException(status_code=404, detail="Review not found")
+    if review.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    resp = _review_to_response(db, review)
+    if submission_id:
+        resp.submission_id = submission_id
+    # 新規生成時と同じく、区切りなしの答案を返す
+    resp.answer_text = answer_text
+    return resp
+
+
 @app.post("/v1/review", response_model=ReviewResponse)
 async def create_review(
     req: ReviewRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", description="再送識別用キー（同じキーなら同じ講評を返す）"),
     current_user: User = Depends(get_current_user_required),
     db: Session = Depends(get_db)
 ):
+    coalesce_key = None
+    is_inflight_leader = False
+    inflight_review_id = None
+    inflight_submission_id = None
     try:
         # 1) 問題情報の取得（新しい構造を優先、既存構造は後方互換性のため）
         question_text = req.question_text
@@ -1466,11 +1901,70 @@ async def create_review(
         # 科目IDが未設定の場合も許可（NULL可）
         # subject_idがNoneの場合はそのままNULLとして保存
 
-        # プラン制限: 講評の合計回数
-        plan_limits_module.check_review_limit(db, current_user)
-
         # 区切り付き答案（$$[1], $$[2], ...）をDBに保存する
         marked_answer = add_paragraph_markers(req.answer_text)
+        # subject_idがNoneの場合は"不明"を使用
+        subject_name = get_subject_name(subject_id) if subject_id is not None else "不明"
+
+        # 講評結果キャッシュ: 同一内容（モデル・プロンプト・問題・答案）の再提出はLLMを再実行しない
+        idempotency_key = (idempotency_key or "").strip()[:255] or None
+        cache_model = review_cache_module.get_review_model_for_cache()
+        cache_key = None
+        if cache_model:
+            cache_key = review_cache_module.build_review_cache_key(
+                model=cache_model,
+                subject_name=subject_name,
+                question_text=question_text,
+                purpose_text=purpose_text,
+                grading_impression_text=grading_impression_text,
+                marked_answer=marked_answer,
+            )
+
+        # Idempotency-Key の再送は、内容にかかわらず同じ講評を返す（回数は消費しない）
+        if idempotency_key:
+            idem_entry = review_cache_module.find_idempotent_review(
+                db, user_id=current_user.id, idempotency_key=idempotency_key, cache_key=cache_key
+            )
+            if idem_entry:
+                return await _cached_review_response(
+                    review_id=idem_entry.review_id,
+                    submission_id=idem_entry.submission_id,
+                    answer_text=req.answer_text,
+                    current_user=current_user,
+                    db=db,
+                )
+
+        cached_entry = None
+        if cache_key:
+            cached_entry = review_cache_module.find_cached_review(db, user_id=current_user.id, cache_key=cache_key)
+        if cached_entry and review_cache_module.get_hit_policy() == review_cache_module.HIT_POLICY_REUSE:
+            review_cache_module.mark_hit(db, cached_entry)
+            logger.info(f"Review cache hit (reuse): user={current_user.id} review_id={cached_entry.review_id}")
+            return await _cached_review_response(
+                review_id=cached_entry.review_id,
+                submission_id=cached_entry.submission_id,
+                answer_text=req.answer_text,
+                current_user=current_user,
+                db=db,
+            )
+
+        # 同時に届いた同一リクエストは1回の生成にまとめる
+        coalesce_key = review_cache_module.build_coalesce_key(
+            current_user.id, idempotency_key=idempotency_key, cache_key=cache_key
+        )
+        is_inflight_leader, inflight = review_cache_module.begin_inflight(coalesce_key)
+        if not is_inflight_leader:
+            inflight_review_id, inflight_submission_id = await review_cache_module.wait_inflight(inflight)
+            return await _cached_review_response(
+                review_id=inflight_review_id,
+                submission_id=inflight_submission_id,
+                answer_text=req.answer_text,
+                current_user=current_user,
+                db=db,
+            )
+
+        # プラン制限: 講評の合計回数
+        plan_limits_module.check_review_limit(db, current_user)
 
         # 2) Submission保存（認証されている場合はuser_idを設定）
         sub = Submission(
@@ -1485,16 +1979,27 @@ async def create_review(
         db.refresh(sub)
 
         # 3) LLMで講評を生成（科目名が必要）
-        # subject_idがNoneの場合は"不明"を使用
-        subject_name = get_subject_name(subject_id) if subject_id is not None else "不明"
         try:
-            review_markdown, review_json, model_name, in_tok, out_tok, request_id, latency_ms = generate_review(
-                subject=subject_name,  # LLMには科目名を渡す
-                question_text=question_text,
-                answer_text=marked_answer,  # 段落番号付き答案をLLMに渡す
-                purpose_text=purpose_text,  # 出題趣旨を渡す
-                grading_impression_text=grading_impression_text,  # 司法試験のみ
-            )
+            if cached_entry is not None:
+                # キャッシュヒット（count方針）: 既存の講評を複製する（LLM費用は発生しない）
+                cached_review = db.query(Review).filter(Review.id == cached_entry.review_id).first()
+                review_json = review_cache_module.load_cached_review_json(cached_review)
+                from .llm_service import _format_markdown
+                review_markdown = _format_markdown(subject_name, review_json)
+                model_name = cached_entry.model
+                in_tok = out_tok = request_id = latency_ms = None
+                review_cache_module.mark_hit(db, cached_entry)
+                logger.info(f"Review cache hit (count): user={current_user.id} review_id={cached_entry.review_id}")
+            else:
+                # 同期のLLM呼び出しはスレッドで実行（同時重複リクエストの待機をブロックしない）
+                review_markdown, review_json, model_name, in_tok, out_tok, request_id, latency_ms = await run_in_threadpool(
+                    generate_review,
+                    subject=subject_name,  # LLMには科目名を渡す
+                    question_text=question_text,
+                    answer_text=marked_answer,  # 段落番号付き答案をLLMに渡す
+                    purpose_text=purpose_text,  # 出題趣旨を渡す
+                    grading_impression_text=grading_impression_text,  # 司法試験のみ
+                )
         except FileNotFoundError as e:
             import traceback
             error_detail = traceback.format_exc()
@@ -1559,6 +2064,20 @@ async def create_review(
         db.add(rev)
         db.commit()
         db.refresh(rev)
+        inflight_review_id = rev.id
+        inflight_submission_id = sub.id
+
+        # 講評結果キャッシュに登録
+        if cache_key:
+            review_cache_module.store_review_cache(
+                db,
+                user_id=current_user.id,
+                cache_key=cache_key,
+                review_id=rev.id,
+                submission_id=sub.id,
+                model=model_name,
+                idempotency_key=idempotency_key,
+            )
 
         # LLM使用量を保存（共通ログ）
         if in_tok is not None or out_tok is not None or request_id:
@@ -1568,7 +2087,7 @@ async def create_review(
                     feature_type="review",
                     review_id=rev.id,
                     model=model_name,
-                    prompt_version="evaluation_v1",
+                    prompt_version=review_cache_module.REVIEW_PROMPT_VERSION,
                     input_tokens=in_tok,
                     output_tokens=out_tok,
                     request_id=request_id,
@@ -1641,6 +2160,9 @@ async def create_review(
             reference_text=reference_text
         )
         db.add(history)
+        analytics = study_analytics_module.AnalyticsDeltas(current_user.id)
+        analytics.add_review(subject_id, datetime.now(timezone.utc), score)
+        analytics.apply(db)
         db.commit()
 
         # 6) レスポンスを返す
@@ -1668,10 +2190,19 @@ async def create_review(
             status_code=500,
             detail=f"予期しないエラーが発生しました: {str(e)}"
         )
+    finally:
+        # 同時重複リクエストの待機者へ結果を通知（失敗時は待機者にもエラーを返す）
+        if is_inflight_leader:
+            review_cache_module.finish_inflight(
+                coalesce_key,
+                review_id=inflight_review_id,
+                submission_id=inflight_submission_id,
+            )
 
 @app.get("/v1/review/{review_id}", response_model=ReviewResponse)
 async def get_review_legacy(
     review_id: int,
+    request: Request,
     current_user: User = Depends(get_current_user_required),
     db: Session = Depends(get_db),
 ):
@@ -1680,11 +2211,12 @@ async def get_review_legacy(
 
     現在は review_id ベースのため、/v1/reviews/{review_id} のエイリアスとして扱う。
     """
-    return await get_review_by_id(review_id=review_id, current_user=current_user, db=db)
+    return await get_review_by_id(review_id=review_id, request=request, current_user=current_user, db=db)
 
 @app.get("/v1/reviews/{review_id}", response_model=ReviewResponse)
 async def get_review_by_id(
     review_id: int,
+    request: Request = None,
     database_url: Optional[str] = Query(None, description="管理者用: データベースURL（指定時はそのDBから取得、管理者のみ）"),
     current_user: User = Depends(get_current_user_required),
     db: Session = Depends(get_db)
@@ -1696,9 +2228,9 @@ async def get_review_by_id(
     if database_url:
         if not current_user.is_admin:
             raise HTTPException(status_code=403, detail="管理者のみデータベースを指定できます")
-        if not database_url.startswith("sqlite:///"):
-            raise HTTPException(status_code=400, detail="現在はSQLiteデータベースのみサポートしています")
-        db_gen = get_db_session_for_url(database_url)
+        if not is_supported_database_url(database_url):
+            raise HTTPException(status_code=400, detail=UNSUPPORTED_DATABASE_URL_DETAIL)
+        db_gen = get_readonly_db_session_for_url(database_url)
         use_db = next(db_gen)
 
     try:
@@ -1710,68 +2242,22 @@ async def get_review_by_id(
         if not database_url and review.user_id != current_user.id:
             raise HTTPException(status_code=403, detail="Access denied")
 
-        try:
-            if isinstance(review.kouhyo_kekka, str):
-                review_json = json.loads(review.kouhyo_kekka)
-            else:
-                review_json = review.kouhyo_kekka
-        except (json.JSONDecodeError, TypeError):
-            raise HTTPException(status_code=500, detail="Review JSON is invalid")
-
-        # 問題情報を取得
-        question_text = review.custom_question_text or ""
-        purpose_text = None
-        grading_impression_text = None
-        subject_id = None
-        subject_name = None
-        question_title = None
-        reference_text = None
-
-        # 既存問題の場合：OfficialQuestionから全情報を取得
-        if review.official_question_id:
-            official_q = use_db.query(OfficialQuestion).filter(OfficialQuestion.id == review.official_question_id).first()
-            if official_q:
-                question_text = official_q.text
-                purpose_text = official_q.syutudaisyusi
-                if official_q.subject_id:
-                    subject_id = official_q.subject_id  # 科目ID（1-18）
-                    subject_name = get_subject_name(subject_id)
-                # 司法試験のみ採点実感を返す（存在する場合）
-                if official_q.shiken_type == "shihou":
-                    grading_impression_text = official_q.grading_impression_text
-
-        # 新規問題の場合：UserReviewHistoryからタイトルと参照文章を取得
-        history = use_db.query(UserReviewHistory).filter(UserReviewHistory.review_id == review_id).first()
-        if history:
-            if subject_id is None and history.subject:
-                subject_id = history.subject  # 科目ID（1-18）
-                subject_name = get_subject_name(subject_id)
-            # 新規問題（custom）の場合、question_titleとreference_textを取得
-            if review.source_type == "custom":
-                if history.question_title:
-                    question_title = history.question_title
-                if history.reference_text:
-                    purpose_text = history.reference_text
-                    reference_text = history.reference_text
-
-        # review_markdownを生成（JSONから）
-        from .llm_service import _format_markdown
-        review_markdown = _format_markdown(subject_name or "不明", review_json)
-
-        return ReviewResponse(
-            review_id=review.id,
-            submission_id=0,  # review_idベースの場合は使用しない
-            review_markdown=review_markdown,
-            review_json=review_json,
-            answer_text=review.answer_text,
-            question_text=question_text,
-            subject=subject_id,  # 科目ID（1-18）
-            subject_name=subject_name,  # 科目名（表示用）
-            purpose=purpose_text,
-            question_title=question_title,
-            source_type=review.source_type,
-            reference_text=reference_text if review.source_type == "custom" else None,
-            grading_impression_text=grading_impression_text,
+        def _build_response() -> ReviewResponse:
+            return _review_to_response(use_db, review)
+
+        # 完了済みの講評は updated_at が変わらない限り同じ内容のため、
+        # updated_at を ETag の版にし、直列化済みのバイト列を使い回す
+        # （GET のみ。POST /v1/review の再送・キャッシュヒットは _cached_review_response でモデルを返す）
+        if database_url or review.updated_at is None:
+            return _build_response()
+        version = f"{review.id}:{review.updated_at.isoformat()}"
+        etag = http_cache.make_etag("review", version)
+        if request is not None and http_cache.is_not_modified(request, etag):
+            return http_cache.not_modified(etag, http_cache.PRIVATE_CACHE_CONTROL)
+        return cached_json_response(
+            f"review:{version}",
+            _build_response,
+            headers=http_cache.cache_headers(etag, http_cache.PRIVATE_CACHE_CONTROL),
         )
     finally:
         if db_gen is not None:
@@ -1955,6 +2441,22 @@ async def chat_review(
         subject_name = get_subject_name(subject_id) if subject_id is not None else "不明"
         review_markdown = _format_markdown(subject_name, review_json)
 
+        # 呼び出し前の見積もり（プロンプトは chat_about_review 内で組み立てるため、主要な入力の合計で近似）
+        from config.llm_config import USE_CASE_REVIEW_CHAT
+        _check_chat_cost_preflight(
+            db,
+            current_user,
+            use_case=USE_CASE_REVIEW_CHAT,
+            system_prompt="",
+            messages=[
+                {"role": "user", "content": question_text},
+                {"role": "user", "content": review.answer_text or ""},
+                {"role": "user", "content": review_markdown},
+                *[{"role": "user", "content": (m or {}).get("content") or ""} for m in (req.chat_history or [])],
+                {"role": "user", "content": req.question or ""},
+            ],
+        )
+
         answer, model_name, in_tok, out_tok, request_id, latency_ms = chat_about_review(
             submission_id=req.review_id,  # 互換のため引数名はそのまま
             question=req.question,
@@ -1987,77 +2489,56 @@ async def chat_review(
 # 短答式問題関連のエンドポイント
 @app.get("/v1/short-answer/problems", response_model=ShortAnswerProblemListResponse)
 def list_short_answer_problems(
+    request: Request,
     exam_type: Optional[str] = Query(None, description="試験種別（司法試験/予備試験）"),
     year: Optional[str] = Query(None, description="年度（R7, H30など）"),
     subject: Optional[int] = Query(None, description="科目ID（1-18）"),
     subject_name: Optional[str] = Query(None, description="科目名（subjectが指定されていない場合に使用）"),
     db: Session = Depends(get_db)
-):
-    """短答式問題一覧を取得"""
-    query = db.query(ShortAnswerProblem)
-    
-    if exam_type:
-        query = query.filter(ShortAnswerProblem.exam_type == exam_type)
-    if year:
-        query = query.filter(ShortAnswerProblem.year == year)
-    if subject:
-        query = query.filter(ShortAnswerProblem.subject == subject)
-    elif subject_name:
-        # 科目名からIDに変換
-        subject_id = get_subject_id(subject_name)
-        if subject_id:
-            query = query.filter(ShortAnswerProblem.subject == subject_id)
-        else:
+):
+    """短答式問題一覧を取得（プロセス内の問題バンクから。DB問い合わせなし）"""
+    if not subject and subject_name:
+        # 科目名からIDに変換
+        subject = get_subject_id(subject_name)
+        if not subject:
             raise HTTPException(status_code=400, detail=f"無効な科目名: {subject_name}")
     
-    problems = query.order_by(ShortAnswerProblem.year.desc(), ShortAnswerProblem.question_number).all()
-    
+    bank = short_answer_bank_module.get_bank(db)
+    # 問題バンクのシグネチャ（取込で変わる）を版にする
+    etag = http_cache.make_etag("short_answer_problems", bank.signature, exam_type, year, subject)
+    not_modified = http_cache.check_not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    positions = bank.filter(exam_type=exam_type or None, year=year or None, subject=subject or None)
+    return FastJSONResponse(
+        {"problems": [bank.problem_dict(pos) for pos in positions], "total": len(positions)},
+        headers=http_cache.cache_headers(etag),
+    )
+
+@app.get("/v1/short-answer/problems/random", response_model=ShortAnswerProblemListResponse)
+def get_random_short_answer_problems(
+    exam_type: Optional[str] = Query(None, description="試験種別（司法試験/予備試験）"),
+    year: Optional[str] = Query(None, description="年度（R7, H30など）"),
+    subject: Optional[int] = Query(None, description="科目ID（1-18）"),
+    count: int = Query(20, ge=1, le=100, description="出題数"),
+    db: Session = Depends(get_db)
+):
+    """条件に合う問題からランダムに出題セットを作る（重複なし）"""
+    bank = short_answer_bank_module.get_bank(db)
+    positions = bank.random_positions(count, exam_type=exam_type or None, year=year or None, subject=subject or None)
     return ShortAnswerProblemListResponse(
-        problems=[ShortAnswerProblemResponse(
-            id=p.id,
-            exam_type=p.exam_type,
-            year=p.year,
-            subject=p.subject,  # 科目ID（1-18）
-            subject_name=get_subject_name(p.subject),  # 科目名（表示用）
-            question_number=p.question_number,
-            question_text=p.question_text,
-            choice_1=p.choice_1,
-            choice_2=p.choice_2,
-            choice_3=p.choice_3,
-            choice_4=p.choice_4,
-            correct_answer=p.correct_answer,
-            correctness_pattern=p.correctness_pattern,
-            source_pdf=p.source_pdf,
-            created_at=p.created_at,
-            updated_at=p.updated_at,
-        ) for p in problems],
-        total=len(problems)
+        problems=[bank.problem_dict(pos) for pos in positions],
+        total=len(positions)
     )
 
 @app.get("/v1/short-answer/problems/{problem_id}", response_model=ShortAnswerProblemResponse)
 def get_short_answer_problem(problem_id: int, db: Session = Depends(get_db)):
     """短答式問題詳細を取得"""
-    problem = db.query(ShortAnswerProblem).filter(ShortAnswerProblem.id == problem_id).first()
-    if not problem:
+    bank = short_answer_bank_module.get_bank(db)
+    pos = bank.position(problem_id)
+    if pos is None:
         raise HTTPException(status_code=404, detail="ShortAnswerProblem not found")
-    return ShortAnswerProblemResponse(
-        id=problem.id,
-        exam_type=problem.exam_type,
-        year=problem.year,
-        subject=problem.subject,  # 科目ID（1-18）
-        subject_name=get_subject_name(problem.subject),  # 科目名（表示用）
-        question_number=problem.question_number,
-        question_text=problem.question_text,
-        choice_1=problem.choice_1,
-        choice_2=problem.choice_2,
-        choice_3=problem.choice_3,
-        choice_4=problem.choice_4,
-        correct_answer=problem.correct_answer,
-        correctness_pattern=problem.correctness_pattern,
-        source_pdf=problem.source_pdf,
-        created_at=problem.created_at,
-        updated_at=problem.updated_at,
-    )
+    return bank.problem_dict(pos)
 
 @app.post("/v1/short-answer/sessions", response_model=ShortAnswerSessionResponse)
 async def create_short_answer_session(
@@ -2129,6 +2610,23 @@ async def get_short_answer_session(
         completed_at=session.completed_at,
     )
 
+def _short_answer_session_results(db: Session, session_ids: List[int]) -> dict:
+    """セッションごとの (解答数, 正答数) を1回の GROUP BY で集計"""
+    if not session_ids:
+        return {}
+    rows = (
+        db.query(
+            ShortAnswerAnswer.session_id,
+            func.count(ShortAnswerAnswer.id),
+            func.sum(case((ShortAnswerAnswer.is_correct == True, 1), else_=0)),  # noqa: E712
+        )
+        .filter(ShortAnswerAnswer.session_id.in_(session_ids))
+        .group_by(ShortAnswerAnswer.session_id)
+        .all()
+    )
+    return {session_id: (int(total or 0), int(correct or 0)) for session_id, total, correct in rows}
+
+
 @app.post("/v1/short-answer/answers", response_model=ShortAnswerAnswerResponse)
 async def create_short_answer_answer(
     answer_data: ShortAnswerAnswerCreate,
@@ -2143,15 +2641,12 @@ async def create_short_answer_answer(
     if session.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # 問題を取得して正誤を判定
-    problem = db.query(ShortAnswerProblem).filter(ShortAnswerProblem.id == answer_data.problem_id).first()
-    if not problem:
+    # 問題バンクで正誤を判定（選択肢の順序は問わない）
+    bank = short_answer_bank_module.get_bank(db)
+    pos = bank.position(answer_data.problem_id)
+    if pos is None:
         raise HTTPException(status_code=404, detail="ShortAnswerProblem not found")
-    
-    # 正誤判定（選択肢の順序を正規化して比較）
-    selected_set = set(answer_data.selected_answer.split(","))
-    correct_set = set(problem.correct_answer.split(","))
-    is_correct = selected_set == correct_set
+    is_correct = bank.grade(pos, answer_data.selected_answer)
     
     # 既存の解答があるか確認
     existing_answer = db.query(ShortAnswerAnswer).filter(
@@ -2159,8 +2654,21 @@ async def create_short_answer_answer(
         ShortAnswerAnswer.problem_id == answer_data.problem_id
     ).first()
     
+    # 新しい解答・解答の変更は復習スケジュールに反映
+    if not existing_answer or existing_answer.selected_answer != answer_data.selected_answer:
+        spaced_repetition_module.record_reviews(db, current_user.id, spaced_repetition_module.ITEM_SHORT_ANSWER, [(
+            answer_data.problem_id,
+            spaced_repetition_module.QUALITY_CORRECT if is_correct else spaced_repetition_module.QUALITY_INCORRECT,
+            session.subject,
+        )])
+    
+    analytics = study_analytics_module.AnalyticsDeltas(current_user.id)
     if existing_answer:
-        # 更新
+        # 更新（正誤が変わった分だけ週次集計を補正）
+        correct_delta = int(is_correct) - int(bool(existing_answer.is_correct))
+        if correct_delta:
+            analytics.add_short_answer(session.subject, existing_answer.answered_at, 0, correct_delta)
+            analytics.apply(db)
         existing_answer.selected_answer = answer_data.selected_answer
         existing_answer.is_correct = is_correct
         db.commit()
@@ -2182,6 +2690,8 @@ async def create_short_answer_answer(
             is_correct=is_correct,
         )
         db.add(db_answer)
+        analytics.add_short_answer(session.subject, datetime.now(timezone.utc), 1, int(is_correct))
+        analytics.apply(db)
         db.commit()
         db.refresh(db_answer)
         return ShortAnswerAnswerResponse(
@@ -2193,6 +2703,104 @@ async def create_short_answer_answer(
             answered_at=db_answer.answered_at,
         )
 
+@app.post("/v1/short-answer/sessions/{session_id}/answers", response_model=ShortAnswerBulkAnswerResponse)
+async def submit_short_answer_answers(
+    session_id: int,
+    req: ShortAnswerBulkAnswerRequest,
+    current_user: User = Depends(get_current_user_required),
+    db: Session = Depends(get_db)
+):
+    """
+    セッションの解答をまとめて送信・採点（認証必須）
+
+    - 採点は問題バンク（プロセス内）で行い、既存解答は1回の問い合わせで取得して1トランザクションで保存する
+    - 同じ問題への解答が既にあれば上書き
+    - complete=True ならセッションを完了にする
+    """
+    session = db.query(ShortAnswerSession).filter(ShortAnswerSession.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="ShortAnswerSession not found")
+    if session.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    if len(req.answers) > 200:
+        raise HTTPException(status_code=400, detail="一度に送信できる解答は200件までです")
+    
+    # 同じ問題が複数あれば後のものを採用
+    selected_by_problem = {a.problem_id: a.selected_answer for a in req.answers}
+    problem_ids = list(selected_by_problem.keys())
+    
+    bank = short_answer_bank_module.get_bank(db)
+    grades = dict(zip(problem_ids, bank.grade_many(selected_by_problem.items())))
+    missing = [pid for pid, graded in grades.items() if graded is None]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"ShortAnswerProblem not found: {missing}")
+    
+    existing = {
+        a.problem_id: a
+        for a in db.query(ShortAnswerAnswer).filter(
+            ShortAnswerAnswer.session_id == session_id,
+            ShortAnswerAnswer.problem_id.in_(problem_ids)
+        ).all()
+    } if problem_ids else {}
+    
+    now_utc = datetime.now(timezone.utc)
+    analytics = study_analytics_module.AnalyticsDeltas(current_user.id)
+    reviewed = []
+    saved = []
+    for problem_id, selected_answer in selected_by_problem.items():
+        is_correct = grades[problem_id]
+        answer = existing.get(problem_id)
+        if not answer or answer.selected_answer != selected_answer:
+            quality = spaced_repetition_module.QUALITY_CORRECT if is_correct else spaced_repetition_module.QUALITY_INCORRECT
+            reviewed.append((problem_id, quality, session.subject))
+        if answer:
+            correct_delta = int(is_correct) - int(bool(answer.is_correct))
+            if correct_delta:
+                analytics.add_short_answer(session.subject, answer.answered_at, 0, correct_delta)
+            answer.selected_answer = selected_answer
+            answer.is_correct = is_correct
+        else:
+            answer = ShortAnswerAnswer(
+                session_id=session_id,
+                problem_id=problem_id,
+                selected_answer=selected_answer,
+                is_correct=is_correct,
+                answered_at=now_utc,
+            )
+            db.add(answer)
+            analytics.add_short_answer(session.subject, now_utc, 1, int(is_correct))
+        saved.append(answer)
+    
+    if req.complete and session.completed_at is None:
+        session.completed_at = now_utc
+    analytics.apply(db)
+    spaced_repetition_module.record_reviews(
+        db, current_user.id, spaced_repetition_module.ITEM_SHORT_ANSWER, reviewed, now=now_utc
+    )
+    db.flush()
+    
+    # コミット前に応答を組み立てる（コミット後の行ごとの再読み込みを避ける）
+    answers = [ShortAnswerAnswerResponse(
+        id=a.id,
+        session_id=a.session_id,
+        problem_id=a.problem_id,
+        selected_answer=a.selected_answer,
+        is_correct=a.is_correct,
+        answered_at=a.answered_at,
+    ) for a in saved]
+    total, correct_count = _short_answer_session_results(db, [session_id]).get(session_id, (0, 0))
+    completed_at = session.completed_at
+    db.commit()
+    
+    return ShortAnswerBulkAnswerResponse(
+        session_id=session_id,
+        answers=answers,
+        total_problems=total,
+        correct_count=correct_count,
+        accuracy=round((correct_count / total * 100) if total > 0 else 0.0, 1),
+        completed_at=completed_at,
+    )
+
 @app.get("/v1/short-answer/sessions/{session_id}/answers", response_model=List[ShortAnswerAnswerResponse])
 async def get_short_answer_session_answers(
     session_id: int,
@@ -2270,9 +2878,9 @@ def get_all_submissions_dev(
     use_db = db
     db_gen = None
     if database_url:
-        if not database_url.startswith("sqlite:///"):
-            raise HTTPException(status_code=400, detail="現在はSQLiteデータベースのみサポートしています")
-        db_gen = get_db_session_for_url(database_url)
+        if not is_supported_database_url(database_url):
+            raise HTTPException(status_code=400, detail=UNSUPPORTED_DATABASE_URL_DETAIL)
+        db_gen = get_readonly_db_session_for_url(database_url)
         use_db = next(db_gen)
 
     try:
@@ -2318,15 +2926,12 @@ async def get_my_short_answer_sessions(
     
     sessions = query.order_by(ShortAnswerSession.started_at.desc()).offset(offset).limit(limit).all()
     
+    # 正答数はセッションまとめて1回の GROUP BY で集計
+    results = _short_answer_session_results(db, [session.id for session in sessions])
+    
     result = []
     for session in sessions:
-        # 回答を取得して正答数をカウント
-        answers = db.query(ShortAnswerAnswer).filter(
-            ShortAnswerAnswer.session_id == session.id
-        ).all()
-        
-        total = len(answers)
-        correct_count = sum(1 for a in answers if a.is_correct)
+        total, correct_count = results.get(session.id, (0, 0))
         accuracy = (correct_count / total * 100) if total > 0 else 0.0
         
         result.append(ShortAnswerHistoryResponse(
@@ -2344,10 +2949,70 @@ async def get_my_short_answer_sessions(
     
     return result
 
+@app.get("/v1/search", response_model=SearchResponse)
+def search_documents(
+    q: str = Query(..., min_length=1, max_length=200, description="検索語（空白区切りでAND）"),
+    types: Optional[str] = Query(None, description="対象の種別（カンマ区切り: note_page, message, review, official_question）"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user_required),
+    db: Session = Depends(get_db),
+):
+    """
+    ノート・チャット・講評・公式問題を全文検索（認証必須）
+
+    自分の文書と公式問題のみが対象。関連度順で、一致箇所は snippet 内で [ ] で囲む。
+    """
+    if not search_index_module.is_available(db):
+        raise HTTPException(status_code=503, detail="全文検索は現在利用できません")
+    doc_types = [t.strip() for t in types.split(",") if t.strip()] if types else None
+    if doc_types:
+        invalid = [t for t in doc_types if t not in search_index_module.DOC_TYPES]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"無効な種別: {', '.join(invalid)}")
+    results, has_more = search_index_module.search(
+        db, current_user.id, q, doc_types=doc_types, limit=limit, offset=offset
+    )
+    return SearchResponse(
+        results=[SearchResultItem(**r) for r in results],
+        has_more=has_more,
+        next_offset=offset + limit if has_more else None,
+    )
+
+
+@app.get("/v1/users/me/analytics", response_model=StudyAnalyticsResponse)
+async def get_my_study_analytics(
+    request: Request,
+    current_user: User = Depends(get_current_user_required),
+    db: Session = Depends(get_db),
+    weeks: int = Query(26, ge=1, le=260, description="取得する週数（今週を含む）"),
+    subject: Optional[int] = Query(None, ge=0, le=18, description="科目ID（1-18）でフィルタ。0は科目なし"),
+):
+    """
+    学習分析（講評数・平均点・最高点・短答正答率・学習時間を科目×週で集計）を取得（認証必須）
+
+    集計済みの user_weekly_stats を1回読むだけ。内容が変わっていなければ 304 を返す（ETag / If-None-Match）。
+    """
+    from_week = study_analytics_module.week_start_of(
+        (datetime.fromisoformat(get_study_date_4am()) - timedelta(weeks=weeks - 1)).date().isoformat()
+    )
+    items = study_analytics_module.get_weekly_stats(db, current_user.id, since_week=from_week, subject=subject)
+    for item in items:
+        item["subject_name"] = get_subject_name(item["subject"]) if item["subject"] else None
+    payload = {"from_week": from_week, "items": items}
+
+    etag = study_analytics_module.compute_etag(payload)
+    if http_cache.is_not_modified(request, etag):
+        return http_cache.not_modified(etag, http_cache.PRIVATE_CACHE_CONTROL)
+    return JSONResponse(
+        content=StudyAnalyticsResponse(**payload).model_dump(),
+        headers=http_cache.cache_headers(etag, http_cache.PRIVATE_CACHE_CONTROL),
+    )
+
 @app.get("/v1/users/me/review-history", response_model=List[UserReviewHistoryResponse])
 async def get_my_review_history(
     current_user: User = Depends(get_current_user_required),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     subject: Optional[int] = Query(None, description="科目ID（1-18）でフィルタ"),
     subject_name: Optional[str] = Query(None, description="科目名でフィルタ（subjectが指定されていない場合に使用）"),
     exam_type: Optional[str] = Query(None, description="試験種別でフィルタ（司法試験 or 予備試験）"),
@@ -2355,23 +3020,25 @@ async def get_my_review_history(
     offset: int = Query(0, ge=0)
 ):
     """自分の講評履歴一覧を取得（認証必須）"""
-    query = db.query(UserReviewHistory).filter(
+    query = select(UserReviewHistory).where(
         UserReviewHistory.user_id == current_user.id
     )
     
     if subject:
-        query = query.filter(UserReviewHistory.subject == subject)
+        query = query.where(UserReviewHistory.subject == subject)
     elif subject_name:
         # 科目名からIDに変換
         subject_id = get_subject_id(subject_name)
         if subject_id:
-            query = query.filter(UserReviewHistory.subject == subject_id)
+            query = query.where(UserReviewHistory.subject == subject_id)
         else:
             raise HTTPException(status_code=400, detail=f"無効な科目名: {subject_name}")
     if exam_type:
-        query = query.filter(UserReviewHistory.exam_type == exam_type)
+        query = query.where(UserReviewHistory.exam_type == exam_type)
     
-    histories = query.order_by(UserReviewHistory.created_at.desc()).offset(offset).limit(limit).all()
+    histories = (
+        await db.scalars(query.order_by(UserReviewHistory.created_at.desc()).offset(offset).limit(limit))
+    ).all()
     
     # レスポンスにsubject_nameを追加（subjectはDBに文字列が混入し得るため正規化）
     result = []
@@ -2409,9 +3076,9 @@ async def get_admin_review_history(
     use_db = db
     db_gen = None
     if database_url:
-        if not database_url.startswith("sqlite:///"):
-            raise HTTPException(status_code=400, detail="現在はSQLiteデータベースのみサポートしています")
-        db_gen = get_db_session_for_url(database_url)
+        if not is_supported_database_url(database_url):
+            raise HTTPException(status_code=400, detail=UNSUPPORTED_DATABASE_URL_DETAIL)
+        db_gen = get_readonly_db_session_for_url(database_url)
         use_db = next(db_gen)
 
     try:
@@ -2586,14 +3253,14 @@ async def list_admin_llm_requests(
     try:
         # データベースURLが指定されている場合は、そのDBを使用
         if database_url:
-            # セキュリティチェック: SQLiteファイルのみ許可
-            if not database_url.startswith("sqlite:///"):
+            # セキュリティチェック: SQLiteファイルと許可済みのPostgreSQLのみ
+            if not is_supported_database_url(database_url):
                 raise HTTPException(
                     status_code=400,
-                    detail="現在はSQLiteデータベースのみサポートしています"
+                    detail=UNSUPPORTED_DATABASE_URL_DETAIL
                 )
             # 一時的なセッションを作成
-            db_gen = get_db_session_for_url(database_url)
+            db_gen = get_readonly_db_session_for_url(database_url)
             db = next(db_gen)
             try:
                 return await _list_admin_llm_requests_internal(
@@ -2740,16 +3407,16 @@ async def _list_admin_llm_requests_internal(
 async def list_notebooks(
     subject_id: Optional[int] = Query(None, ge=1, le=18),
     current_user: User = Depends(get_current_user_required),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """ノートブック一覧を取得（認証必須）"""
-    query = db.query(Notebook).filter(Notebook.user_id == current_user.id)
+    query = select(Notebook).where(Notebook.user_id == current_user.id)
 
     # 科目で絞り込み（各科目ページのノート用）
     if subject_id is not None:
-        query = query.filter(Notebook.subject_id == subject_id)
+        query = query.where(Notebook.subject_id == subject_id)
     
-    notebooks = query.order_by(Notebook.created_at.desc()).all()
+    notebooks = (await db.scalars(query.order_by(Notebook.created_at.desc()))).all()
     return [
         NotebookResponse(
             id=nb.id,
@@ -3086,7 +3753,7 @@ async def create_thread(
 @app.get("/v1/threads", response_model=ThreadListResponse)
 async def list_threads(
     current_user: User = Depends(get_current_user_required),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     limit: int = Query(10, ge=1, le=100),
     offset: int = Query(0, ge=0),
     type: Optional[str] = Query(None, description="スレッドタイプ（指定しない場合は全タイプ）")
@@ -3094,61 +3761,59 @@ async def list_threads(
     """スレッド一覧を取得（直近N件）（認証必須）"""
     user_id = current_user.id
     
-    query = db.query(Thread).filter(
-        Thread.user_id == user_id
-    )
-    
+    filters = [Thread.user_id == user_id]
     if type:
-        query = query.filter(Thread.type == type)
+        filters.append(Thread.type == type)
     
-    total = query.count()
-    threads = query.order_by(
-        Thread.pinned.desc(),
-        Thread.last_message_at.desc().nullslast(),
-        Thread.created_at.desc()
-    ).offset(offset).limit(limit).all()
+    total = await db.scalar(select(func.count(Thread.id)).where(*filters))
+    threads = (await db.scalars(
+        select(Thread).where(*filters).order_by(
+            Thread.pinned.desc(),
+            Thread.last_message_at.desc().nullslast(),
+            Thread.created_at.desc()
+        ).offset(offset).limit(limit)
+    )).all()
     
-    # 講評チャットの場合、review_idを取得してレスポンスに含める
+    return ThreadListResponse(
+        threads=await _thread_responses_async(db, threads),
+        total=total or 0
+    )
+
+async def _thread_responses_async(db: AsyncSession, threads: List[Thread]) -> List[ThreadResponse]:
+    """スレッド一覧のレスポンスを作る（講評チャットは review_id をまとめて1回で取得して含める）"""
+    review_chat_ids = [t.id for t in threads if t.type == "review_chat"]
+    review_ids: Dict[int, int] = {}
+    if review_chat_ids:
+        rows = await db.execute(
+            select(Review.thread_id, Review.id)
+            .where(Review.thread_id.in_(review_chat_ids))
+            .order_by(Review.id.asc())
+        )
+        for thread_id, review_id in rows:
+            review_ids.setdefault(thread_id, review_id)
+
     thread_responses = []
     for t in threads:
         thread_response = ThreadResponse.model_validate(t)
-        if t.type == "review_chat":
-            review = db.query(Review).filter(Review.thread_id == t.id).first()
-            if review:
-                # review_idを追加
-                thread_response.review_id = review.id
+        if t.id in review_ids:
+            thread_response.review_id = review_ids[t.id]
         thread_responses.append(thread_response)
-    
-    return ThreadListResponse(
-        threads=thread_responses,
-        total=total
-    )
+    return thread_responses
 
 @app.get("/v1/threads/all", response_model=ThreadListResponse)
 async def get_all_threads(
     current_user: User = Depends(get_current_user_required),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """全スレッドを取得（勉強管理ページ用）"""
     user_id = current_user.id
     
-    threads = db.query(Thread).filter(
-        Thread.user_id == user_id
-    ).order_by(Thread.created_at.desc()).all()
-    
-    # 講評チャットの場合、review_idを取得してレスポンスに含める
-    thread_responses = []
-    for t in threads:
-        thread_response = ThreadResponse.model_validate(t)
-        if t.type == "review_chat":
-            review = db.query(Review).filter(Review.thread_id == t.id).first()
-            if review:
-                # review_idを追加
-                thread_response.review_id = review.id
-        thread_responses.append(thread_response)
+    threads = (await db.scalars(
+        select(Thread).where(Thread.user_id == user_id).order_by(Thread.created_at.desc())
+    )).all()
     
     return ThreadListResponse(
-        threads=thread_responses,
+        threads=await _thread_responses_async(db, threads),
         total=len(threads)
     )
 
@@ -3206,21 +3871,23 @@ async def get_thread_review_id(
 async def list_messages(
     thread_id: int,
     current_user: User = Depends(get_current_user_required),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     limit: int = Query(200, ge=1, le=500),
     offset: int = Query(0, ge=0)
 ):
     """スレッドのメッセージ一覧を取得（認証必須）"""
-    thread = db.query(Thread).filter(Thread.id == thread_id).first()
-    if not thread:
+    thread_user_id = await db.scalar(select(Thread.user_id).where(Thread.id == thread_id))
+    if thread_user_id is None:
         raise HTTPException(status_code=404, detail="Thread not found")
     
-    if thread.user_id != current_user.id:
+    if thread_user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    query = db.query(Message).filter(Message.thread_id == thread_id)
-    total = query.count()
-    messages = query.order_by(Message.created_at.asc()).offset(offset).limit(limit).all()
+    total = await db.scalar(select(func.count(Message.id)).where(Message.thread_id == thread_id))
+    messages = (await db.scalars(
+        select(Message).where(Message.thread_id == thread_id)
+        .order_by(Message.created_at.asc()).offset(offset).limit(limit)
+    )).all()
     
     return MessageListResponse(
         messages=[MessageResponse.model_validate(m) for m in messages],
@@ -3258,20 +3925,9 @@ async def create_message(
     db.add(user_message)
     db.commit()
     
-    # 2. 既存のメッセージ履歴を取得（LLM用）
-    existing_messages = db.query(Message).filter(
-        Message.thread_id == thread_id
-    ).order_by(Message.created_at.asc()).all()
-    
-    # チャット履歴を構築（最後のユーザーメッセージは除く）
-    chat_history = []
-    for msg in existing_messages[:-1]:  # 最後のユーザーメッセージは除く
-        # LLMには user/assistant のみ渡す（systemは除外）
-        if msg.role in ("user", "assistant"):
-            chat_history.append({
-                "role": msg.role,
-                "content": msg.content
-            })
+    # 2. 既存の会話履歴の件数（今回のユーザーメッセージは除く）
+    # 本文は全件読まず、LLMに渡すターン範囲だけを後で取得する（chat_history_module）
+    history_count = max(chat_history_module.count_chat_messages(db, thread_id) - 1, 0)
     
     # 3. LLMを呼び出し
     try:
@@ -3282,6 +3938,7 @@ async def create_message(
         request_id = None
         latency_ms = None
         current_turn = None  # 講評チャット時のみセット（要約タイミングの判定に使用）
+        review = None  # 講評チャット時のみセット
 
         if thread.type == "review_chat":
             # review は thread.review_id 優先、なければ Review.thread_id で逆引き
@@ -3291,8 +3948,8 @@ async def create_message(
             if review.user_id != current_user.id:
                 raise HTTPException(status_code=403, detail="Access denied")
 
-            # 現在ターン数（1-indexed）。chat_history は「今回の user 以外」なので、ターン数 = (件数/2) + 1
-            current_turn = (len(chat_history) // 2) + 1
+            # 現在ターン数（1-indexed）。history_count は「今回の user 以外」なので、ターン数 = (件数/2) + 1
+            current_turn = (history_count // 2) + 1
 
             # §N/第N段落: 今回の入力にあればその番号を使い、なければ「§N を含んだ発話」の次回・次々回なら保持値を利用
             from .llm_service import extract_paragraph_numbers_from_user_input as _extract_para
@@ -3309,19 +3966,19 @@ async def create_message(
                 para_nums_for_context = None  # 渡さない（従来どおり _build 内で user_input からだけ判定）
 
             # 毎回コンテキストを組み立て（ユーザー入力に応じて出題趣旨・採点実感・§N を条件付きで含める）
-            question_text, purpose_text, grading_text, review_json_obj, answer_text = _get_review_chat_context_by_review_id(
-                review_id=review.id,
-                current_user=current_user,
-                db=db,
-            )
-            context_text = _build_review_chat_context_text(
+            # 問題文・講評JSON・段落索引は講評ごとにキャッシュ（review_chat_context）
+            context_bundle = review_chat_context_module.get_context_bundle(db, review)
+            # 抜粋の検索（埋め込み計算）を含むため、イベントループを止めないようスレッドプールで実行
+            context_text = await run_in_threadpool(
+                _build_review_chat_context_text,
                 user_input=message_data.content or "",
-                question_text=question_text,
-                purpose_text=purpose_text,
-                grading_impression_text=grading_text,
-                review_json_obj=review_json_obj,
-                answer_text=answer_text,
+                question_text=context_bundle.question_text,
+                purpose_text=context_bundle.purpose_text,
+                grading_impression_text=context_bundle.grading_impression_text,
+                review_json_obj=context_bundle.review_json_obj,
+                answer_text=context_bundle.answer_text,
                 paragraph_numbers_override=para_nums_for_context if para_nums_for_context else None,
+                bundle=context_bundle,
             )
 
             # 今回のユーザー入力に §N/第N段落 が含まれていたら、次回・次々回用に保持
@@ -3338,17 +3995,25 @@ async def create_message(
             if conversation_summary.strip():
                 # 要約＋直前ラリー（要約した最後の1ラリー）＋それ以降を渡す
                 messages_for_llm.append({"role": "user", "content": "【これまでの会話の要約】\n" + conversation_summary.strip()})
-                last_exchange_start = 2 * (summary_up_to - 1)  # 0-indexed
-                last_exchange_end = 2 * summary_up_to
-                if last_exchange_start >= 0 and last_exchange_end <= len(chat_history):
-                    messages_for_llm.extend(chat_history[last_exchange_start:last_exchange_end])
-                if last_exchange_end < len(chat_history):
-                    messages_for_llm.extend(chat_history[last_exchange_end:])
-            else:
-                if chat_history:
-                    messages_for_llm.extend(chat_history)
+            messages_for_llm.extend(chat_history_module.build_history_for_llm(
+                db,
+                thread_id,
+                history_count=history_count,
+                summary_up_to_turn=summary_up_to,
+                has_summary=bool(conversation_summary.strip()),
+                token_budget=_chat_history_token_budget(system_prompt, messages_for_llm, user_prompt),
+            ))
             messages_for_llm.append({"role": "user", "content": user_prompt})
 
+            from config.llm_config import USE_CASE_REVIEW_CHAT
+            _check_chat_cost_preflight(
+                db,
+                current_user,
+                use_case=USE_CASE_REVIEW_CHAT,
+                system_prompt=system_prompt,
+                messages=messages_for_llm,
+            )
+
             from .llm_service import review_chat as llm_review_chat
             assistant_content, model_name, input_tokens, output_tokens, request_id, latency_ms = llm_review_chat(
                 system_prompt=system_prompt,
@@ -3366,25 +4031,43 @@ async def create_message(
             system_prompt = ""
             if prompt_file.exists():
                 system_prompt = prompt_file.read_text(encoding="utf-8").strip()
-            current_turn = (len(chat_history) // 2) + 1
-            # コンテキスト（フリーチャットは参照情報なし）
-            context_text = "【参照情報】\n（このスレッドに参照情報はありません。会話履歴とユーザーの発話に基づいて回答してください。）"
+            current_turn = (history_count // 2) + 1
+            # コンテキスト: 発話に近い公式問題・自分の過去の講評の抜粋（なければ参照情報なし）
+            # 検索（埋め込み計算・DB問い合わせ）はイベントループを止めないようスレッドプールで実行
+            hits = await run_in_threadpool(
+                semantic_index_module.retrieve,
+                db, current_user.id, message_data.content, FREE_CHAT_RETRIEVAL_TOKEN_BUDGET,
+            )
+            if hits:
+                context_text = (
+                    "【参照情報】\n（発話に関連する公式問題・過去の講評の抜粋です。関連する場合のみ参考にしてください。）\n\n"
+                    + semantic_index_module.format_passages(hits)
+                )
+            else:
+                context_text = "【参照情報】\n（このスレッドに参照情報はありません。会話履歴とユーザーの発話に基づいて回答してください。）"
             messages_for_llm = [{"role": "user", "content": context_text}]
             summary_up_to = getattr(thread, "summary_up_to_turn", None) or 0
             conversation_summary = getattr(thread, "conversation_summary", None) or ""
             if conversation_summary.strip():
                 messages_for_llm.append({"role": "user", "content": "【これまでの会話の要約】\n" + conversation_summary.strip()})
-                last_exchange_start = 2 * (summary_up_to - 1)
-                last_exchange_end = 2 * summary_up_to
-                if last_exchange_start >= 0 and last_exchange_end <= len(chat_history):
-                    messages_for_llm.extend(chat_history[last_exchange_start:last_exchange_end])
-                if last_exchange_end < len(chat_history):
-                    messages_for_llm.extend(chat_history[last_exchange_end:])
-            else:
-                if chat_history:
-                    messages_for_llm.extend(chat_history)
             user_prompt = _build_free_chat_user_prompt_text(message_data.content)
+            messages_for_llm.extend(chat_history_module.build_history_for_llm(
+                db,
+                thread_id,
+                history_count=history_count,
+                summary_up_to_turn=summary_up_to,
+                has_summary=bool(conversation_summary.strip()),
+                token_budget=_chat_history_token_budget(system_prompt, messages_for_llm, user_prompt),
+            ))
             messages_for_llm.append({"role": "user", "content": user_prompt})
+            from config.llm_config import USE_CASE_FREE_CHAT
+            _check_chat_cost_preflight(
+                db,
+                current_user,
+                use_case=USE_CASE_FREE_CHAT,
+                system_prompt=system_prompt,
+                messages=messages_for_llm,
+            )
             from .llm_service import free_chat as llm_free_chat
             assistant_content, model_name, input_tokens, output_tokens, request_id, latency_ms = llm_free_chat(
                 system_prompt=system_prompt,
@@ -3408,7 +4091,7 @@ async def create_message(
         thread.last_message_at = datetime.now(timezone.utc)
         
         # 6. 初回メッセージかつタイトルがない場合、タイトルを自動生成
-        is_first_message = len(chat_history) == 0
+        is_first_message = history_count == 0
         title_input_tokens = None
         title_output_tokens = None
         title_request_id = None
@@ -3441,11 +4124,7 @@ async def create_message(
         
         # LLM使用量を保存（共通ログ）
         if input_tokens is not None or output_tokens is not None or request_id:
-            review_id = None
-            if thread.type == "review_chat":
-                rev = _get_review_by_thread(db, thread_id, thread=thread)
-                if rev:
-                    review_id = rev.id
+            review_id = review.id if review is not None else None
             prompt_version = "review_chat_v1" if thread.type == "review_chat" else "free_chat_v1"
             llm_row = LlmRequest(
                 **build_llm_request_row(
@@ -3469,8 +4148,8 @@ async def create_message(
             seg_start = 2 * summary_up_to
             seg_end = 2 * (current_turn - 1)
             segment_list = []
-            if seg_end <= len(chat_history):
-                segment_list = [{"role": m["role"], "content": m["content"]} for m in chat_history[seg_start:seg_end]]
+            if seg_end <= history_count:
+                segment_list = chat_history_module.fetch_message_range(db, thread_id, seg_start, seg_end)
             segment_list.append({"role": "user", "content": message_data.content or ""})
             segment_list.append({"role": "assistant", "content": assistant_content or ""})
             try:
@@ -3509,6 +4188,13 @@ async def create_message(
         
         return MessageResponse.model_validate(assistant_message)
         
+    except HTTPException as e:
+        db.rollback()
+        if e.status_code == 429:
+            # 呼び出し前の見積もりで上限超過: LLMを呼んでいないので今回のユーザーメッセージは残さない
+            db.query(Message).filter(Message.id == user_message.id).delete(synchronize_session=False)
+            db.commit()
+        raise
     except SQLAlchemyOperationalError as e:
         db.rollback()
         msg = str(e).lower()
@@ -3635,11 +4321,143 @@ def recalculate_positions(db: Session, user_id: int, dashboard_date: str, entry_
         item.position = (idx + 1) * 10
     db.commit()
 
+
+# ---------------------------------------------------------------------------
+# 並び順キー（rank_key: 分数インデックス）
+# 並べ替えは移動した1行の rank_key だけを書き換える。キーが長くなりすぎたらグループを振り直す
+# ---------------------------------------------------------------------------
+
+def _dashboard_group_filters(user_id: int, dashboard_date: str, entry_type: int) -> list:
+    return [
+        DashboardItem.user_id == user_id,
+        DashboardItem.dashboard_date == dashboard_date,
+        DashboardItem.entry_type == entry_type,
+        DashboardItem.deleted_at.is_(None),
+    ]
+
+
+def _study_item_group_filters(user_id: int, subject_id: int, entry_type: int) -> list:
+    return [
+        StudyItemModel.user_id == user_id,
+        StudyItemModel.subject_id == subject_id,
+        StudyItemModel.entry_type == entry_type,
+        StudyItemModel.deleted_at.is_(None),
+    ]
+
+
+def _last_rank_key(db: Session, model, filters: list) -> Optional[str]:
+    return db.query(func.max(model.rank_key)).filter(*filters).scalar()
+
+
+def _next_rank_key(db: Session, model, filters: list) -> str:
+    """グループ末尾に追加するときのキー"""
+    return rank_keys_module.key_between(_last_rank_key(db, model, filters), None)
+
+
+def _apply_rank_order(items: list) -> None:
+    """items の並びどおりに rank_key と position（互換用）を振り直す"""
+    for idx, (it, key) in enumerate(zip(items, rank_keys_module.evenly_spaced_keys(len(items)))):
+        it.rank_key = key
+        it.position = (idx + 1) * 10
+
+
+def _rebalance_rank_keys(db: Session, model, filters: list) -> None:
+    items = db.query(model).filter(*filters).order_by(model.rank_key.asc(), model.position.asc(), model.id.asc()).all()
+    _apply_rank_order(items)
+    db.flush()
+
+
+def _neighbor_rank_keys(db: Session, model, filters: list, item, *, before_id: Optional[int], after_id: Optional[int]):
+    """移動先の前後のキーを返す（before_id の直前 / after_id の直後 / どちらもなければ末尾）"""
+    others = [*filters, model.id != item.id]
+    if after_id is not None:
+        anchor = db.query(model.rank_key).filter(*others, model.id == after_id).first()
+        if anchor is None:
+            raise HTTPException(status_code=404, detail="移動先の項目が見つかりません")
+        prev_key = anchor.rank_key
+        next_key = db.query(func.min(model.rank_key)).filter(*others, model.rank_key > prev_key).scalar()
+        return prev_key, next_key
+    if before_id is not None:
+        anchor = db.query(model.rank_key).filter(*others, model.id == before_id).first()
+        if anchor is None:
+            raise HTTPException(status_code=404, detail="移動先の項目が見つかりません")
+        next_key = anchor.rank_key
+        prev_key = db.query(func.max(model.rank_key)).filter(*others, model.rank_key < next_key).scalar()
+        return prev_key, next_key
+    return db.query(func.max(model.rank_key)).filter(*others).scalar(), None
+
+
+def _move_rank(db: Session, model, filters: list, item, *, before_id: Optional[int] = None, after_id: Optional[int] = None) -> None:
+    """item を移動する（通常は item の1行だけを更新）"""
+    # 未採番（NULL）の行があると前後のキーが決まらず重複キーを作りうるため、先にグループを振り直す
+    if db.query(model.id).filter(*filters, model.rank_key.is_(None)).first() is not None:
+        _rebalance_rank_keys(db, model, filters)
+    prev_key, next_key = _neighbor_rank_keys(db, model, filters, item, before_id=before_id, after_id=after_id)
+    key = None
+    if prev_key is None or next_key is None or prev_key < next_key:
+        key = rank_keys_module.key_between(prev_key, next_key)
+    if key is None or rank_keys_module.needs_rebalance(key):
+        # キーの重複・キーが長すぎる場合はグループを振り直してから再計算
+        _rebalance_rank_keys(db, model, filters)
+        prev_key, next_key = _neighbor_rank_keys(db, model, filters, item, before_id=before_id, after_id=after_id)
+        key = rank_keys_module.key_between(prev_key, next_key)
+    item.rank_key = key
+    _sync_position(db, model, filters, item)
+
+
+def _sync_position(db: Session, model, filters: list, item) -> None:
+    """
+    item.position を rank_key の並びで前後にある項目の position の間に置く。
+    position で並べ替えを送るクライアント（PUT の position）が前後の position から値を計算するため、
+    position も rank_key と同じ順に増えるように保つ。間が空いていなければグループを振り直す
+    """
+    others = [*filters, model.id != item.id]
+    prev = db.query(model.position).filter(*others, model.rank_key < item.rank_key).order_by(model.rank_key.desc()).first()
+    nxt = db.query(model.position).filter(*others, model.rank_key > item.rank_key).order_by(model.rank_key.asc()).first()
+    prev_pos = prev.position if prev else None
+    next_pos = nxt.position if nxt else None
+    if prev_pos is None and next_pos is None:
+        item.position = 10
+    elif next_pos is None:
+        item.position = prev_pos + 10
+    elif prev_pos is None:
+        item.position = next_pos - 10
+    elif next_pos - prev_pos > 1:
+        item.position = (prev_pos + next_pos) // 2
+    else:
+        db.flush()
+        _rebalance_rank_keys(db, model, filters)
+
+
+def _move_rank_to_position(db: Session, model, filters: list, item, new_position: int) -> None:
+    """
+    旧クライアントの position 指定（前後の項目の position から計算した値）を rank_key の移動に置き換える。
+    position が new_position 以下の最後の項目の直後へ。なければ先頭へ
+    """
+    others = [*filters, model.id != item.id]
+    anchor = db.query(model.id).filter(*others, model.position <= new_position).order_by(
+        model.position.desc(), model.rank_key.desc()
+    ).first()
+    if anchor is not None:
+        _move_rank(db, model, filters, item, after_id=anchor.id)
+        return
+    first = db.query(model.id).filter(*others).order_by(model.rank_key.asc(), model.position.asc()).first()
+    if first is not None:
+        _move_rank(db, model, filters, item, before_id=first.id)
+
 @app.get("/v1/subjects", response_model=List[dict])
-def get_subjects(db: Session = Depends(get_db)):
+def get_subjects(request: Request):
     """科目一覧を取得（IDと名前）"""
-    # SUBJECT_MAPから科目一覧を返す（1-18の順序）
-    return [{"id": id, "name": name} for id, name in SUBJECT_MAP.items()]
+    # SUBJECT_MAPから科目一覧を返す（1-18の順序）。固定データなのでDBセッションは不要
+    subjects = _reference_cache.get_or_load(
+        "subjects",
+        lambda: [{"id": id, "name": name} for id, name in SUBJECT_MAP.items()],
+    )
+    etag = http_cache.make_etag("subjects", subjects)
+    return (
+        http_cache.check_not_modified(request, etag)
+        or FastJSONResponse(subjects, headers=http_cache.cache_headers(etag))
+    )
 
 
 # ============================================================================
@@ -3751,7 +4569,7 @@ async def list_study_items(
         StudyItemModel.subject_id == subject_id,
         StudyItemModel.entry_type == entry_type,
         StudyItemModel.deleted_at.is_(None),
-    ).order_by(StudyItemModel.position.asc()).all()
+    ).order_by(StudyItemModel.rank_key.asc(), StudyItemModel.position.asc()).all()
 
     result: List[StudyItemResponse] = []
     for it in items:
@@ -3803,6 +4621,9 @@ async def create_study_item(
 
     tags_json = json.dumps(payload.tags or [], ensure_ascii=False)
     position = _next_study_item_position(db, current_user.id, payload.subject_id, payload.entry_type)
+    rank_key = _next_rank_key(
+        db, StudyItemModel, _study_item_group_filters(current_user.id, payload.subject_id, payload.entry_type)
+    )
 
     it = StudyItemModel(
         user_id=current_user.id,
@@ -3816,6 +4637,7 @@ async def create_study_item(
         tags=tags_json,
         created_date=created_date,
         position=position,
+        rank_key=rank_key,
     )
     db.add(it)
     db.commit()
@@ -3942,52 +4764,69 @@ async def reorder_study_items(
         raise HTTPException(status_code=400, detail="Invalid subject_id (must be 1-18)")
 
     items = db.query(StudyItemModel).filter(
-        StudyItemModel.user_id == current_user.id,
-        StudyItemModel.subject_id == payload.subject_id,
-        StudyItemModel.entry_type == payload.entry_type,
-        StudyItemModel.deleted_at.is_(None),
-    ).all()
+        *_study_item_group_filters(current_user.id, payload.subject_id, payload.entry_type)
+    ).order_by(StudyItemModel.rank_key.asc(), StudyItemModel.position.asc()).all()
     by_id = {it.id: it for it in items}
 
-    # 指定されたIDだけを順に採番（その他は末尾）
-    pos = 10
-    for id_ in payload.ordered_ids:
-        it = by_id.get(id_)
-        if it:
-            it.position = pos
-            pos += 10
-
-    # ordered_idsに含まれないものは後ろへ
-    remaining = [it for it in items if it.id not in set(payload.ordered_ids)]
-    remaining.sort(key=lambda x: x.position)
-    for it in remaining:
-        it.position = pos
-        pos += 10
+    # 指定されたIDを順に並べ、ordered_idsに含まれないものは後ろへ（1トランザクションで一括採番）
+    ordered_set = set(payload.ordered_ids)
+    ordered = [by_id[id_] for id_ in dict.fromkeys(payload.ordered_ids) if id_ in by_id]
+    ordered += [it for it in items if it.id not in ordered_set]
+    _apply_rank_order(ordered)
 
     db.commit()
     return {"message": "reordered"}
 
+
+@app.post("/v1/study-items/{item_id}/move")
+async def move_study_item(
+    item_id: int,
+    before_id: Optional[int] = Query(None, description="この項目の直前に移動"),
+    after_id: Optional[int] = Query(None, description="この項目の直後に移動"),
+    current_user: User = Depends(get_current_user_required),
+    db: Session = Depends(get_db),
+):
+    """1件の並び順を変更（更新するのは移動した項目のみ）。before_id/after_id を省略すると末尾へ"""
+    it = db.query(StudyItemModel).filter(
+        StudyItemModel.id == item_id,
+        StudyItemModel.user_id == current_user.id,
+        StudyItemModel.deleted_at.is_(None),
+    ).first()
+    if not it:
+        raise HTTPException(status_code=404, detail="Study item not found")
+
+    _move_rank(
+        db,
+        StudyItemModel,
+        _study_item_group_filters(current_user.id, it.subject_id, it.entry_type),
+        it,
+        before_id=before_id,
+        after_id=after_id,
+    )
+    db.commit()
+    return {"message": "reordered", "rank_key": it.rank_key}
+
 @app.get("/v1/dashboard/items", response_model=DashboardItemListResponse)
 async def get_dashboard_items(
     dashboard_date: str = Query(..., description="表示日（YYYY-MM-DD）"),
     entry_type: Optional[int] = Query(None, description="種別（1=Point, 2=Task）"),
     current_user: Optional[User] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """ダッシュボード項目を取得"""
     if not current_user:
         raise HTTPException(status_code=401, detail="認証が必要です")
     
-    query = db.query(DashboardItem).filter(
+    query = select(DashboardItem).where(
         DashboardItem.user_id == current_user.id,
         DashboardItem.dashboard_date == dashboard_date,
         DashboardItem.deleted_at.is_(None)
     )
     
     if entry_type:
-        query = query.filter(DashboardItem.entry_type == entry_type)
+        query = query.where(DashboardItem.entry_type == entry_type)
     
-    items = query.order_by(DashboardItem.position.asc()).all()
+    items = (await db.scalars(query.order_by(DashboardItem.rank_key.asc(), DashboardItem.position.asc()))).all()
     
     return DashboardItemListResponse(
         items=[DashboardItemResponse.model_validate(item) for item in items],
@@ -3998,21 +4837,21 @@ async def get_dashboard_items(
 async def get_all_dashboard_items(
     entry_type: Optional[int] = Query(None, description="種別（1=Point, 2=Task）"),
     current_user: Optional[User] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """ダッシュボード項目を全期間で取得（勉強管理ページ用）"""
     if not current_user:
         raise HTTPException(status_code=401, detail="認証が必要です")
     
-    query = db.query(DashboardItem).filter(
+    query = select(DashboardItem).where(
         DashboardItem.user_id == current_user.id,
         DashboardItem.deleted_at.is_(None)
     )
     
     if entry_type:
-        query = query.filter(DashboardItem.entry_type == entry_type)
+        query = query.where(DashboardItem.entry_type == entry_type)
     
-    items = query.order_by(DashboardItem.created_at.desc()).all()
+    items = (await db.scalars(query.order_by(DashboardItem.created_at.desc()))).all()
     
     return DashboardItemListResponse(
         items=[DashboardItemResponse.model_validate(item) for item in items],
@@ -4024,7 +4863,7 @@ async def get_dashboard_items_left(
     dashboard_date: str = Query(..., description="表示日（YYYY-MM-DD）"),
     period: str = Query("whole", description="期間（7days or whole）"),
     current_user: Optional[User] = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Left欄（持ち越しTask）を取得"""
     if not current_user:
@@ -4032,7 +4871,7 @@ async def get_dashboard_items_left(
     
     from datetime import datetime, timedelta
     
-    query = db.query(DashboardItem).filter(
+    query = select(DashboardItem).where(
         DashboardItem.user_id == current_user.id,
         DashboardItem.dashboard_date < dashboard_date,
         DashboardItem.entry_type == 2,  # Taskのみ
@@ -4044,9 +4883,11 @@ async def get_dashboard_items_left(
     if period == "7days":
         date_obj = datetime.strptime(dashboard_date, "%Y-%m-%d")
         seven_days_ago = (date_obj - timedelta(days=7)).strftime("%Y-%m-%d")
-        query = query.filter(DashboardItem.dashboard_date >= seven_days_ago)
+        query = query.where(DashboardItem.dashboard_date >= seven_days_ago)
     
-    items = query.order_by(DashboardItem.dashboard_date.asc(), DashboardItem.position.asc()).all()
+    items = (await db.scalars(
+        query.order_by(DashboardItem.dashboard_date.asc(), DashboardItem.rank_key.asc(), DashboardItem.position.asc())
+    )).all()
     
     return DashboardItemListResponse(
         items=[DashboardItemResponse.model_validate(item) for item in items],
@@ -4071,6 +4912,9 @@ async def create_dashboard_item(
     position = item.position
     if position is None:
         position = get_next_position(db, current_user.id, item.dashboard_date, item.entry_type)
+    rank_key = _next_rank_key(
+        db, DashboardItem, _dashboard_group_filters(current_user.id, item.dashboard_date, item.entry_type)
+    )
     
     db_item = DashboardItem(
         user_id=current_user.id,
@@ -4082,6 +4926,7 @@ async def create_dashboard_item(
         status=item.status,
         memo=item.memo,
         position=position,
+        rank_key=rank_key,
         favorite=item.favorite if item.favorite is not None else 0
     )
     
@@ -4118,9 +4963,20 @@ async def update_dashboard_item(
     
     # 更新
     update_data = item_update.model_dump(exclude_unset=True)
+    # 並び順は rank_key で決まるため、position（ドラッグ&ドロップの並べ替え）は rank_key の移動に置き換える
+    new_position = update_data.pop("position", None)
+    old_group = (db_item.dashboard_date, db_item.entry_type)
     for key, value in update_data.items():
         setattr(db_item, key, value)
     
+    group_filters = _dashboard_group_filters(current_user.id, db_item.dashboard_date, db_item.entry_type)
+    # 日付・種別が変わった場合は移動先グループの末尾へ
+    if (db_item.dashboard_date, db_item.entry_type) != old_group:
+        db_item.rank_key = _next_rank_key(db, DashboardItem, group_filters)
+        db_item.position = (db.query(func.max(DashboardItem.position)).filter(*group_filters).scalar() or 0) + 10
+    elif new_position is not None:
+        _move_rank_to_position(db, DashboardItem, group_filters, db_item, new_position)
+    
     # updated_atはトリガーで自動更新される
     db.commit()
     db.refresh(db_item)
@@ -4155,11 +5011,17 @@ async def delete_dashboard_item(
 @app.post("/v1/dashboard/items/{item_id}/reorder")
 async def reorder_dashboard_item(
     item_id: int,
-    new_position: int = Query(..., description="新しいposition"),
+    new_position: Optional[int] = Query(None, description="新しいposition（旧方式）"),
+    before_id: Optional[int] = Query(None, description="この項目の直前に移動"),
+    after_id: Optional[int] = Query(None, description="この項目の直後に移動"),
     current_user: Optional[User] = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """ダッシュボード項目の並び順を変更"""
+    """
+    ダッシュボード項目の並び順を変更（更新するのは移動した項目の rank_key のみ）
+    - before_id / after_id: 指定項目の直前／直後へ
+    - new_position（旧方式）: その position にある項目の位置へ
+    """
     if not current_user:
         raise HTTPException(status_code=401, detail="認証が必要です")
     
@@ -4172,34 +5034,47 @@ async def reorder_dashboard_item(
     if not db_item:
         raise HTTPException(status_code=404, detail="項目が見つかりません")
     
-    # 同じ日付・種別の他の項目を取得
-    other_items = db.query(DashboardItem).filter(
-        DashboardItem.user_id == current_user.id,
-        DashboardItem.dashboard_date == db_item.dashboard_date,
-        DashboardItem.entry_type == db_item.entry_type,
-        DashboardItem.id != item_id,
-        DashboardItem.deleted_at.is_(None)
-    ).order_by(DashboardItem.position.asc()).all()
+    filters = _dashboard_group_filters(current_user.id, db_item.dashboard_date, db_item.entry_type)
     
-    # 新しい位置に挿入
-    if new_position < db_item.position:
-        # 前に移動
-        for item in other_items:
-            if item.position >= new_position and item.position < db_item.position:
-                item.position += 10
-    else:
-        # 後ろに移動
-        for item in other_items:
-            if item.position > db_item.position and item.position <= new_position:
-                item.position -= 10
+    if before_id is None and after_id is None and new_position is not None:
+        # 旧方式: 前に移動するなら new_position 以上の最初の項目の直前、後ろなら new_position 以下の最後の項目の直後
+        if new_position < db_item.position:
+            target = db.query(DashboardItem.id).filter(
+                *filters, DashboardItem.id != item_id, DashboardItem.position >= new_position
+            ).order_by(DashboardItem.rank_key.asc(), DashboardItem.position.asc()).first()
+            before_id = target.id if target else None
+        else:
+            target = db.query(DashboardItem.id).filter(
+                *filters, DashboardItem.id != item_id, DashboardItem.position <= new_position
+            ).order_by(DashboardItem.rank_key.desc(), DashboardItem.position.desc()).first()
+            after_id = target.id if target else None
     
-    db_item.position = new_position
+    _move_rank(db, DashboardItem, filters, db_item, before_id=before_id, after_id=after_id)
     db.commit()
     
-    # positionが詰まった場合は再採番
-    all_positions = [db_item.position] + [item.position for item in other_items]
-    if max(all_positions) - min(all_positions) > len(all_positions) * 20:
-        recalculate_positions(db, current_user.id, db_item.dashboard_date, db_item.entry_type)
+    return {"message": "並び順を更新しました"}
+
+
+@app.post("/v1/dashboard/items/reorder")
+async def reorder_dashboard_items_batch(
+    payload: DashboardItemReorderRequest,
+    current_user: Optional[User] = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """ダッシュボード項目の並び順を一括で変更（1トランザクション）。ordered_ids に含まれない項目は後ろへ"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="認証が必要です")
+    
+    items = db.query(DashboardItem).filter(
+        *_dashboard_group_filters(current_user.id, payload.dashboard_date, payload.entry_type)
+    ).order_by(DashboardItem.rank_key.asc(), DashboardItem.position.asc()).all()
+    by_id = {it.id: it for it in items}
+    
+    ordered_set = set(payload.ordered_ids)
+    ordered = [by_id[id_] for id_ in dict.fromkeys(payload.ordered_ids) if id_ in by_id]
+    ordered += [it for it in items if it.id not in ordered_set]
+    _apply_rank_order(ordered)
+    db.commit()
     
     return {"message": "並び順を更新しました"}
 
@@ -4340,7 +5215,7 @@ def _fetch_dashboard_item_candidates(
             DashboardItem.dashboard_date.in_(ymds),
             ~((DashboardItem.entry_type == 2) & (DashboardItem.status.in_([1, 4])))  # Taskかつ未了/後でを除外
         )
-        .order_by(DashboardItem.dashboard_date.asc(), DashboardItem.position.asc())  # 古い順
+        .order_by(DashboardItem.dashboard_date.asc(), DashboardItem.rank_key.asc(), DashboardItem.position.asc())  # 古い順
         .limit(limit)
         .all()
     )
@@ -4370,8 +5245,10 @@ def _fetch_review_candidates(
     # 過去2週間（当日を含む）
     fourteen_days_ago = datetime.now(ZoneInfo("UTC")) - timedelta(days=14)
     
+    # 講評JSONは evaluation だけをDB側で取り出す（PostgreSQL: JSONB / SQLite: json_extract）
+    evaluation = json_path(Review.kouhyo_kekka, db.get_bind().dialect.name, "evaluation")
     reviews = (
-        db.query(Review)
+        db.query(Review.id, Review.created_at, evaluation.label("evaluation"))
         .filter(
             Review.user_id == user_id,
             Review.created_at >= fourteen_days_ago
@@ -4384,9 +5261,10 @@ def _fetch_review_candidates(
     candidates = []
     for review in reviews:
         try:
-            review_json_obj = json.loads(review.kouhyo_kekka) if isinstance(review.kouhyo_kekka, str) else (review.kouhyo_kekka or {})
+            ev = json.loads(review.evaluation) if isinstance(review.evaluation, str) else review.evaluation
         except Exception:
-            review_json_obj = {}
+            ev = None
+        review_json_obj = {"evaluation": ev if isinstance(ev, dict) else {}}
         
         hist = db.query(UserReviewHistory).filter(UserReviewHistory.review_id == review.id).first()
         subject_id = _normalize_subject_id(hist.subject if hist else None)
@@ -5418,11 +6296,129 @@ async def save_recent_review_problem(
         references=p.references,
     )
     db.add(row)
+    db.flush()
+    # 保存した問題は復習キューに入れる（すぐに出題対象）
+    spaced_repetition_module.enqueue(
+        db, current_user.id, spaced_repetition_module.ITEM_SAVED_REVIEW, row.id, subject_id=row.subject_id
+    )
     db.commit()
     db.refresh(row)
     return SaveReviewProblemResponse(saved_id=row.id)
 
 
+@app.get("/v1/review-queue/due", response_model=ReviewQueueDueResponse)
+def get_review_queue_due(
+    limit: int = Query(20, ge=1, le=100),
+    item_type: Optional[str] = Query(None, description="short_answer / saved_review"),
+    subject: Optional[int] = Query(None, ge=1, le=18, description="科目ID（1-18）でフィルタ"),
+    current_user: User = Depends(get_current_user_required),
+    db: Session = Depends(get_db),
+):
+    """
+    期限が来た復習対象を期限の古い順に取得（今日の復習セット）
+
+    復習キューは解答のたびに更新済みなので、インデックスの範囲検索1回 + 表示用データの取得だけで済む。
+    """
+    if item_type is not None and item_type not in spaced_repetition_module.ITEM_TYPES:
+        raise HTTPException(status_code=400, detail=f"無効な item_type: {item_type}")
+    now_utc = datetime.now(timezone.utc)
+    items = spaced_repetition_module.due_items(
+        db, current_user.id, limit=limit, item_type=item_type, subject_id=subject, now=now_utc
+    )
+
+    bank = short_answer_bank_module.get_bank(db)
+    saved_ids = [i.item_id for i in items if i.item_type == spaced_repetition_module.ITEM_SAVED_REVIEW]
+    saved_by_id = {
+        r.id: r
+        for r in db.query(SavedReviewProblem).filter(
+            SavedReviewProblem.id.in_(saved_ids), SavedReviewProblem.user_id == current_user.id
+        ).all()
+    } if saved_ids else {}
+
+    result = []
+    for i in items:
+        short_answer_problem = None
+        saved_problem = None
+        if i.item_type == spaced_repetition_module.ITEM_SHORT_ANSWER:
+            pos = bank.position(i.item_id)
+            if pos is None:
+                continue
+            short_answer_problem = bank.problem_dict(pos)
+        else:
+            saved = saved_by_id.get(i.item_id)
+            if saved is None:
+                continue
+            saved_problem = {
+                "id": saved.id,
+                "subject_id": saved.subject_id,
+                "question_text": saved.question_text,
+                "answer_example": saved.answer_example,
+                "references": saved.references,
+            }
+        result.append(ReviewQueueItemResponse(
+            item_type=i.item_type,
+            item_id=i.item_id,
+            subject_id=i.subject_id,
+            due_at=i.due_at,
+            interval_days=i.interval_days,
+            repetitions=i.repetitions,
+            lapses=i.lapses,
+            ease_factor=i.ease_factor,
+            short_answer_problem=short_answer_problem,
+            saved_problem=saved_problem,
+        ))
+    return ReviewQueueDueResponse(
+        items=result,
+        due_count=spaced_repetition_module.count_due(db, current_user.id, now=now_utc),
+    )
+
+
+@app.post("/v1/review-queue/{item_type}/{item_id}/grade", response_model=ReviewQueueItemResponse)
+def grade_review_queue_item(
+    item_type: str,
+    item_id: int,
+    req: ReviewQueueGradeRequest,
+    current_user: User = Depends(get_current_user_required),
+    db: Session = Depends(get_db),
+):
+    """復習の自己評価（0-5）を反映して次回の期限を決める（主に保存済みの復習問題用）"""
+    if item_type not in spaced_repetition_module.ITEM_TYPES:
+        raise HTTPException(status_code=400, detail=f"無効な item_type: {item_type}")
+    if not 0 <= req.quality <= 5:
+        raise HTTPException(status_code=400, detail="quality は0〜5で指定してください")
+
+    subject_id = None
+    if item_type == spaced_repetition_module.ITEM_SAVED_REVIEW:
+        saved = db.query(SavedReviewProblem).filter(
+            SavedReviewProblem.id == item_id, SavedReviewProblem.user_id == current_user.id
+        ).first()
+        if not saved:
+            raise HTTPException(status_code=404, detail="Problem not found")
+        subject_id = saved.subject_id
+    else:
+        bank = short_answer_bank_module.get_bank(db)
+        pos = bank.position(item_id)
+        if pos is None:
+            raise HTTPException(status_code=404, detail="ShortAnswerProblem not found")
+        subject_id = bank.subjects[pos] or None
+
+    item = spaced_repetition_module.record_reviews(
+        db, current_user.id, item_type, [(item_id, req.quality, subject_id)]
+    )[0]
+    db.commit()
+    db.refresh(item)
+    return ReviewQueueItemResponse(
+        item_type=item.item_type,
+        item_id=item.item_id,
+        subject_id=item.subject_id,
+        due_at=item.due_at,
+        interval_days=item.interval_days,
+        repetitions=item.repetitions,
+        lapses=item.lapses,
+        ease_factor=item.ease_factor,
+    )
+
+
 # ============================================================================
 # 管理者用APIエンドポイント
 # ============================================================================
@@ -5472,9 +6468,12 @@ def normalize_database_url(db_url: str) -> str:
 
 
 def is_valid_sqlite_db(file_path: str) -> bool:
-    """SQLiteデータベースファイルが有効かどうかをチェック"""
+    """
+    SQLiteデータベースファイルが有効かどうかをチェック
+
+    先頭16バイトのヘッダーだけを読む（接続しないためロックも取らず、DB一覧の表示で各DBを開かない）
+    """
     import os
-    import sqlite3
     
     if not os.path.exists(file_path):
         return False
@@ -5485,10 +6484,9 @@ def is_valid_sqlite_db(file_path: str) -> bool:
     
     # SQLiteヘッダーをチェック
     try:
-        with sqlite3.connect(file_path) as conn:
-            conn.execute("SELECT 1")
-        return True
-    except Exception:
+        with open(file_path, "rb") as f:
+            return f.read(16) == b"SQLite format 3\x00"
+    except OSError:
         return False
 
 
@@ -5568,6 +6566,16 @@ async def get_admin_databases(
                     "url": current_db_url,
                     "description": f"現在接続中 ({current_db_name})"
                 })
+
+        # 許可済みの PostgreSQL（DATABASE_URL / ADMIN_DATABASE_URLS）
+        for pg_url in admin_postgres_urls():
+            pg_name = pg_url.rsplit("/", 1)[-1].split("?", 1)[0] or "postgres"
+            is_current = pg_url == normalize_pg_url(current_db_url)
+            available_databases.insert(0 if is_current else len(available_databases), {
+                "name": pg_name,
+                "url": pg_url,
+                "description": f"現在接続中 ({pg_name})" if is_current else "PostgreSQL",
+            })
         
         return AdminDatabaseInfoResponse(
             current_database_url=current_db_url,
@@ -5589,11 +6597,11 @@ async def get_admin_subscription_plans(
 ):
     """管理者用: サブスクリプションプラン一覧を取得"""
     try:
-        if database_url and not database_url.startswith("sqlite:///"):
-            raise HTTPException(status_code=400, detail="現在はSQLiteデータベースのみサポートしています")
+        if database_url and not is_supported_database_url(database_url):
+            raise HTTPException(status_code=400, detail=UNSUPPORTED_DATABASE_URL_DETAIL)
         use_db = db
         if database_url:
-            db_gen = get_db_session_for_url(database_url)
+            db_gen = get_readonly_db_session_for_url(database_url)
             use_db = next(db_gen)
             try:
                 plans = use_db.query(SubscriptionPlan).filter(
@@ -5640,14 +6648,14 @@ async def get_admin_users(
     try:
         # データベースURLが指定されている場合は、そのDBを使用
         if database_url:
-            # セキュリティチェック: SQLiteファイルのみ許可（相対パスや危険なパスを防ぐ）
-            if not database_url.startswith("sqlite:///"):
+            # セキュリティチェック: SQLiteファイルと許可済みのPostgreSQLのみ（任意の接続先を防ぐ）
+            if not is_supported_database_url(database_url):
                 raise HTTPException(
                     status_code=400,
-                    detail="現在はSQLiteデータベースのみサポートしています"
+                    detail=UNSUPPORTED_DATABASE_URL_DETAIL
                 )
             # 一時的なセッションを作成
-            db_gen = get_db_session_for_url(database_url)
+            db_gen = get_readonly_db_session_for_url(database_url)
             db = next(db_gen)
             try:
                 return await _get_admin_users_internal(db, skip, limit, search, is_active)
@@ -5760,12 +6768,12 @@ async def get_admin_user_token_usage(
     """管理者用: ユーザー別トークン使用量一覧を取得（データベース切り替え対応）"""
     try:
         if database_url:
-            if not database_url.startswith("sqlite:///"):
+            if not is_supported_database_url(database_url):
                 raise HTTPException(
                     status_code=400,
-                    detail="現在はSQLiteデータベースのみサポートしています"
+                    detail=UNSUPPORTED_DATABASE_URL_DETAIL
                 )
-            db_gen = get_db_session_for_url(database_url)
+            db_gen = get_readonly_db_session_for_url(database_url)
             db = next(db_gen)
             try:
                 return await _get_admin_user_token_usage_internal(db, skip, limit, search, is_active)
@@ -5925,14 +6933,14 @@ async def get_admin_stats(
     try:
         # データベースURLが指定されている場合は、そのDBを使用
         if database_url:
-            # セキュリティチェック: SQLiteファイルのみ許可
-            if not database_url.startswith("sqlite:///"):
+            # セキュリティチェック: SQLiteファイルと許可済みのPostgreSQLのみ
+            if not is_supported_database_url(database_url):
                 raise HTTPException(
                     status_code=400,
-                    detail="現在はSQLiteデータベースのみサポートしています"
+                    detail=UNSUPPORTED_DATABASE_URL_DETAIL
                 )
             # 一時的なセッションを作成
-            db_gen = get_db_session_for_url(database_url)
+            db_gen = get_readonly_db_session_for_url(database_url)
             db = next(db_gen)
             try:
                 return await _get_admin_stats_internal(db)
@@ -6123,6 +7131,8 @@ async def update_admin_user(
             db.add(sub)
     
     db.commit()
+    invalidate_user_principal(target_user.id)
+    plan_limits_module.invalidate_user_plan(target_user.id)
     db.refresh(target_user)
     
     # 統計情報を取得して返す
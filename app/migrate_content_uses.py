@@ -39,11 +39,7 @@ from sqlalchemy import text, inspect
 
 def _table_exists(db, table_name: str) -> bool:
     """テーブルが存在するか確認"""
-    row = db.execute(
-        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"),
-        {"name": table_name},
-    ).fetchone()
-    return row is not None
+    return inspect(db.get_bind()).has_table(table_name)
 
 
 def _column_exists(db, table_name: str, column_name: str) -> bool:
@@ -28,15 +28,11 @@ except ImportError:
     from app.db import SessionLocal, engine
     from app.models import DashboardItem
 
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 
 def _table_exists(db, table_name: str) -> bool:
-    row = db.execute(
-        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"),
-        {"name": table_name},
-    ).fetchone()
-    return row is not None
+    return inspect(db.get_bind()).has_table(table_name)
 
 
 def _get_table_sql(db, table_name: str) -> str | None:
@@ -60,6 +56,11 @@ def migrate_dashboard_items_entry_type_target() -> None:
             logger.info("✓ dashboard_items table created")
             return
 
+        # 旧 SQLite スキーマの作り直しのみ（PostgreSQL は現在のモデルで作成される）
+        if db.get_bind().dialect.name != "sqlite":
+            logger.info("✓ Not SQLite, skipping")
+            return
+
         sql = _get_table_sql(db, "dashboard_items")
         if not sql:
             logger.warning("Could not read dashboard_items schema")
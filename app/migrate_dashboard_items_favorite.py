@@ -27,21 +27,15 @@ except ImportError:
     from app.db import SessionLocal, engine
     from app.models import DashboardItem
 
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 
 def _table_exists(db, table_name: str) -> bool:
-    row = db.execute(
-        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"),
-        {"name": table_name},
-    ).fetchone()
-    return row is not None
+    return inspect(db.get_bind()).has_table(table_name)
 
 
 def _get_columns(db, table_name: str) -> list[str]:
-    rows = db.execute(text(f"PRAGMA table_info({table_name})")).fetchall()
-    # PRAGMA table_info: (cid, name, type, notnull, dflt_value, pk)
-    return [r[1] for r in rows]
+    return [c["name"] for c in inspect(db.get_bind()).get_columns(table_name)]
 
 
 def migrate_dashboard_items_favorite() -> None:
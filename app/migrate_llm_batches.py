@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Message Batches 用テーブルを作成するマイグレーション
+
+- llm_batch_jobs
+- llm_batch_items
+
+既存DBを壊さない方針:
+- テーブルが無ければ作成
+- 既にあれば不足カラム（llm_batch_jobs.locked_at）のみ追加
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# プロジェクトルートをパスに追加（Docker/ローカル両対応）
+BASE_DIR = Path("/app") if Path("/app").exists() else Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+try:
+    from app.db import SessionLocal, engine
+    from app.models import LlmBatchJob, LlmBatchItem
+except ImportError:
+    import os
+    os.chdir(str(BASE_DIR))
+    from app.db import SessionLocal, engine
+    from app.models import LlmBatchJob, LlmBatchItem
+
+from sqlalchemy import inspect, text
+
+
+def _table_exists(db, table_name: str) -> bool:
+    return inspect(db.get_bind()).has_table(table_name)
+
+
+def _column_exists(db, table_name: str, column_name: str) -> bool:
+    return any(c["name"] == column_name for c in inspect(db.get_bind()).get_columns(table_name))
+
+
+def migrate_llm_batches() -> None:
+    """Message Batches 用テーブルを作成（存在しなければ）、不足カラムを追加"""
+    db = SessionLocal()
+    try:
+        logger.info("Starting llm_batches migration...")
+        for table_name, model in (("llm_batch_jobs", LlmBatchJob), ("llm_batch_items", LlmBatchItem)):
+            if not _table_exists(db, table_name):
+                logger.info(f"Creating {table_name} table...")
+                model.__table__.create(bind=engine, checkfirst=True)
+                db.commit()
+                logger.info(f"✓ {table_name} table created")
+            else:
+                logger.info(f"✓ {table_name} table already exists")
+        # 結果反映の取得（claim）用
+        if not _column_exists(db, "llm_batch_jobs", "locked_at"):
+            logger.info("Adding column llm_batch_jobs.locked_at...")
+            db.execute(text("ALTER TABLE llm_batch_jobs ADD COLUMN locked_at TIMESTAMP"))
+            db.commit()
+            logger.info("✓ llm_batch_jobs.locked_at added")
+        logger.info("✓ llm_batches migration completed successfully")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"llm_batches migration failed: {str(e)}", exc_info=True)
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    try:
+        migrate_llm_batches()
+    except Exception as e:
+        logger.error(f"Migration script failed: {str(e)}", exc_info=True)
+        sys.exit(1)
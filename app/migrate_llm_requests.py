@@ -33,15 +33,11 @@ except ImportError:
     from app.db import SessionLocal, engine
     from app.models import LlmRequest
 
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 
 def _table_exists(db, table_name: str) -> bool:
-    row = db.execute(
-        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"),
-        {"name": table_name},
-    ).fetchone()
-    return row is not None
+    return inspect(db.get_bind()).has_table(table_name)
 
 
 def migrate_llm_requests() -> None:
@@ -33,23 +33,16 @@ except ImportError:
     from app.db import SessionLocal, engine
     from app.models import UserMonthlyGoal
 
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 
 def _table_exists(db, table_name: str) -> bool:
-    row = db.execute(
-        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"),
-        {"name": table_name},
-    ).fetchone()
-    return row is not None
+    return inspect(db.get_bind()).has_table(table_name)
 
 
 def _column_exists(db, table_name: str, column_name: str) -> bool:
-    """SQLite: テーブルにカラムが存在するか"""
-    if table_name != "user_monthly_goals":
-        return False
-    rows = db.execute(text("PRAGMA table_info(user_monthly_goals)")).fetchall()
-    return any(r[1] == column_name for r in rows)
+    """テーブルにカラムが存在するか"""
+    return any(c["name"] == column_name for c in inspect(db.get_bind()).get_columns(table_name))
 
 
 def migrate_monthly_goals() -> None:
@@ -68,7 +61,7 @@ def migrate_monthly_goals() -> None:
             for col in ("target_study_updated_at", "target_short_answer_updated_at", "target_review_updated_at"):
                 if not _column_exists(db, "user_monthly_goals", col):
                     logger.info("Adding column user_monthly_goals.%s...", col)
-                    db.execute(text(f"ALTER TABLE user_monthly_goals ADD COLUMN {col} DATETIME"))
+                    db.execute(text(f"ALTER TABLE user_monthly_goals ADD COLUMN {col} TIMESTAMP"))
                     db.commit()
                     logger.info("✓ user_monthly_goals.%s added", col)
         logger.info("✓ user_monthly_goals migration completed successfully")
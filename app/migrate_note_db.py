@@ -31,20 +31,17 @@ except ImportError:
     os.chdir(str(BASE_DIR))
     from app.db import SessionLocal, engine
 
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 
 def _column_exists(db, table_name: str, column_name: str) -> bool:
-    rows = db.execute(text(f"PRAGMA table_info({table_name})")).fetchall()
-    # PRAGMA table_info: (cid, name, type, notnull, dflt_value, pk)
-    return any(r[1] == column_name for r in rows)
+    return any(c["name"] == column_name for c in inspect(db.get_bind()).get_columns(table_name))
 
 
 def _note_pages_title_is_notnull(db) -> bool:
-    rows = db.execute(text("PRAGMA table_info(note_pages)")).fetchall()
-    for r in rows:
-        if r[1] == "title":
-            return bool(r[3])  # notnull
+    for c in inspect(db.get_bind()).get_columns("note_pages"):
+        if c["name"] == "title":
+            return not c["nullable"]
     return False
 
 
@@ -78,11 +75,12 @@ def migrate_note_db(default_subject_id: int = 1):
         # 3) note_pages.title を nullable に変更（SQLiteは列制約の変更ができないため再作成）
         logger.info("Ensuring note_pages.title is nullable...")
         # note_pagesが存在しない環境もあるので、存在チェック
-        table_exists = db.execute(
-            text("SELECT name FROM sqlite_master WHERE type='table' AND name='note_pages'")
-        ).fetchone()
+        table_exists = inspect(db.get_bind()).has_table("note_pages")
 
-        if table_exists and _note_pages_title_is_notnull(db):
+        if table_exists and _note_pages_title_is_notnull(db) and db.get_bind().dialect.name != "sqlite":
+            db.execute(text("ALTER TABLE note_pages ALTER COLUMN title DROP NOT NULL"))
+            db.commit()
+        elif table_exists and _note_pages_title_is_notnull(db):
             logger.info("Recreating note_pages table to make title nullable...")
             db.execute(text("PRAGMA foreign_keys=OFF"))
 
@@ -29,7 +29,7 @@ except ImportError:
     os.chdir(str(BASE_DIR))
     from app.db import SessionLocal
 
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 
 def migrate_official_questions_indexes() -> None:
@@ -38,15 +38,13 @@ def migrate_official_questions_indexes() -> None:
         logger.info("Ensuring official_questions indexes...")
 
         # 公式問題テーブルが無い環境もあるため、存在チェック
-        table_exists = db.execute(
-            text("SELECT name FROM sqlite_master WHERE type='table' AND name='official_questions'")
-        ).fetchone()
+        table_exists = inspect(db.get_bind()).has_table("official_questions")
         if not table_exists:
             logger.info("official_questions table not found. Skipping index migration.")
             return
 
         # activeを1つに制限（oldは複数可）
-        # SQLite: 部分ユニークインデックスが使用可能
+        # SQLite / PostgreSQL とも部分ユニークインデックスが使用可能
         db.execute(text("""
             CREATE UNIQUE INDEX IF NOT EXISTS uq_one_active_per_question
             ON official_questions (shiken_type, nendo, subject_id)
@@ -32,15 +32,11 @@ except ImportError:
     os.chdir(str(BASE_DIR))
     from app.db import SessionLocal
 
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 
 def _table_exists(db, name: str) -> bool:
-    row = db.execute(
-        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"),
-        {"name": name},
-    ).fetchone()
-    return row is not None
+    return inspect(db.get_bind()).has_table(name)
 
 
 def _sqlite_integer_pk(db, table: str, col: str) -> bool:
@@ -58,6 +54,11 @@ def migrate_official_questions_table() -> None:
             logger.info("official_questions table not found. Skipping.")
             return
 
+        # SQLite の旧スキーマ（id が INTEGER PRIMARY KEY でない）の作り直しのみ
+        if db.get_bind().dialect.name != "sqlite":
+            logger.info("Not SQLite. Skipping.")
+            return
+
         if _sqlite_integer_pk(db, "official_questions", "id"):
             logger.info("official_questions.id is already INTEGER PRIMARY KEY. Skipping.")
             return
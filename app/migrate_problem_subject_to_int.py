@@ -28,16 +28,12 @@ except ImportError:
     os.chdir(str(BASE_DIR))
     from app.db import SessionLocal
 
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 from config.subjects import get_subject_id
 
 
 def _table_exists(db, table_name: str) -> bool:
-    row = db.execute(
-        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"),
-        {"name": table_name},
-    ).fetchone()
-    return bool(row)
+    return inspect(db.get_bind()).has_table(table_name)
 
 
 def _subject_column_is_integer(db) -> bool:
@@ -67,7 +63,8 @@ def migrate_problem_subject_to_int():
         if not _table_exists(db, "problems"):
             return
 
-        if _subject_column_is_integer(db):
+        # SQLite の旧スキーマ（subject が文字列）の作り直しのみ
+        if db.get_bind().dialect.name != "sqlite" or _subject_column_is_integer(db):
             return
 
         logger.info("Migrating problems.subject to INTEGER (1-18)...")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+dashboard_items / study_items に rank_key カラム（分数インデックスの並び順キー）を追加するマイグレーション
+- 既存行は position 順に rank_key を採番する
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# プロジェクトルートをパスに追加（Docker/ローカル両対応）
+BASE_DIR = Path("/app") if Path("/app").exists() else Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+try:
+    from app.db import SessionLocal
+    from app.rank_keys import evenly_spaced_keys
+except ImportError:
+    import os
+    os.chdir(str(BASE_DIR))
+    from app.db import SessionLocal
+    from app.rank_keys import evenly_spaced_keys
+
+from sqlalchemy import and_, bindparam, column, inspect, select, table, text
+
+# (テーブル名, グループ列, インデックス名)
+_TARGETS = [
+    ("dashboard_items", ("user_id", "dashboard_date", "entry_type"), "idx_dashboard_items_rank_key"),
+    ("study_items", ("user_id", "subject_id", "entry_type"), "idx_study_items_rank_key"),
+]
+
+
+def _table_exists(db, table_name: str) -> bool:
+    return inspect(db.get_bind()).has_table(table_name)
+
+
+def _get_columns(db, table_name: str) -> list[str]:
+    return [c["name"] for c in inspect(db.get_bind()).get_columns(table_name)]
+
+
+def _backfill(db, table_name: str, group_cols: tuple) -> int:
+    """rank_key が NULL の行を含むグループを position 順に採番し直す"""
+    cols = ", ".join(group_cols)
+    groups = db.execute(
+        text(f"SELECT DISTINCT {cols} FROM {table_name} WHERE rank_key IS NULL")
+    ).fetchall()
+    # NULL を含むグループ（subject_id 等）も引けるよう IS NOT DISTINCT FROM で比較する
+    # （SQLite では IS、PostgreSQL では IS NOT DISTINCT FROM に展開される）
+    t = table(table_name, column("id"), column("position"), *(column(c) for c in group_cols))
+    stmt = (
+        select(t.c.id)
+        .where(and_(*(t.c[c].is_not_distinct_from(bindparam(c)) for c in group_cols)))
+        .order_by(t.c.position.asc(), t.c.id.asc())
+    )
+    updated = 0
+    for g in groups:
+        ids = [r[0] for r in db.execute(stmt, dict(zip(group_cols, g))).fetchall()]
+        for id_, key in zip(ids, evenly_spaced_keys(len(ids))):
+            db.execute(text(f"UPDATE {table_name} SET rank_key = :k WHERE id = :id"), {"k": key, "id": id_})
+        updated += len(ids)
+    return updated
+
+
+def migrate_rank_keys() -> None:
+    """dashboard_items / study_items に rank_key を追加して採番"""
+    db = SessionLocal()
+    try:
+        logger.info("Starting rank_key migration...")
+
+        for table_name, group_cols, index_name in _TARGETS:
+            if not _table_exists(db, table_name):
+                logger.info(f"{table_name} table not found. Skipping (created by create_all)")
+                continue
+
+            cols = set(_get_columns(db, table_name))
+            if "rank_key" not in cols:
+                logger.info(f"Adding rank_key column to {table_name}...")
+                db.execute(text(f"ALTER TABLE {table_name} ADD COLUMN rank_key VARCHAR(64);"))
+                db.commit()
+                logger.info(f"✓ rank_key column added to {table_name}")
+
+            db.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({', '.join(group_cols)}, rank_key)"
+            ))
+            updated = _backfill(db, table_name, group_cols)
+            db.commit()
+            logger.info(f"✓ {table_name}: rank_key assigned to {updated} rows")
+
+        logger.info("✓ rank_key migration completed successfully")
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"rank_key migration failed: {str(e)}", exc_info=True)
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    try:
+        migrate_rank_keys()
+    except Exception as e:
+        logger.error(f"Migration script failed: {str(e)}", exc_info=True)
+        sys.exit(1)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+講評結果キャッシュ用テーブルを作成するマイグレーション
+
+- review_result_cache
+
+既存DBを壊さない方針:
+- テーブルが無ければ作成
+- 既にあれば何もしない
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# プロジェクトルートをパスに追加（Docker/ローカル両対応）
+BASE_DIR = Path("/app") if Path("/app").exists() else Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+try:
+    from app.db import SessionLocal, engine
+    from app.models import ReviewResultCache
+except ImportError:
+    import os
+    os.chdir(str(BASE_DIR))
+    from app.db import SessionLocal, engine
+    from app.models import ReviewResultCache
+
+from sqlalchemy import inspect, text
+
+
+def _table_exists(db, table_name: str) -> bool:
+    return inspect(db.get_bind()).has_table(table_name)
+
+
+def migrate_review_result_cache() -> None:
+    """講評結果キャッシュテーブルを作成（存在しなければ）"""
+    db = SessionLocal()
+    try:
+        logger.info("Starting review_result_cache migration...")
+        if not _table_exists(db, "review_result_cache"):
+            logger.info("Creating review_result_cache table...")
+            ReviewResultCache.__table__.create(bind=engine, checkfirst=True)
+            db.commit()
+            logger.info("✓ review_result_cache table created")
+        else:
+            logger.info("✓ review_result_cache table already exists")
+        logger.info("✓ review_result_cache migration completed successfully")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"review_result_cache migration failed: {str(e)}", exc_info=True)
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    try:
+        migrate_review_result_cache()
+    except Exception as e:
+        logger.error(f"Migration script failed: {str(e)}", exc_info=True)
+        sys.exit(1)
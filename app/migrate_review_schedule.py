@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+復習スケジュール（review_schedule_items）を作成し、既存データから初期化するマイグレーション
+- テーブルが空のときだけ実行
+- 短答: 解答履歴を解答日時順に SM-2 で再生して現在の間隔・期限を求める
+- 保存済みの復習問題: 保存日時を期限としてキューに入れる
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# プロジェクトルートをパスに追加（Docker/ローカル両対応）
+BASE_DIR = Path("/app") if Path("/app").exists() else Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+try:
+    from app.db import SessionLocal, engine
+    from app.models import ReviewScheduleItem, SavedReviewProblem, ShortAnswerAnswer, ShortAnswerSession
+    from app import spaced_repetition
+except ImportError:
+    import os
+    os.chdir(str(BASE_DIR))
+    from app.db import SessionLocal, engine
+    from app.models import ReviewScheduleItem, SavedReviewProblem, ShortAnswerAnswer, ShortAnswerSession
+    from app import spaced_repetition
+
+
+def migrate_review_schedule() -> None:
+    """review_schedule_items を作成し、空なら既存の解答・保存済み問題から初期化"""
+    ReviewScheduleItem.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        logger.info("Starting review schedule migration...")
+
+        if db.query(ReviewScheduleItem.id).first() is not None:
+            logger.info("review_schedule_items already populated. Skipping backfill")
+            return
+
+        items = {}
+        rows = (
+            db.query(
+                ShortAnswerSession.user_id,
+                ShortAnswerAnswer.problem_id,
+                ShortAnswerSession.subject,
+                ShortAnswerAnswer.is_correct,
+                ShortAnswerAnswer.answered_at,
+            )
+            .join(ShortAnswerSession, ShortAnswerAnswer.session_id == ShortAnswerSession.id)
+            .filter(ShortAnswerSession.user_id.isnot(None), ShortAnswerAnswer.answered_at.isnot(None))
+            .order_by(ShortAnswerAnswer.answered_at, ShortAnswerAnswer.id)
+            .yield_per(1000)
+        )
+        for user_id, problem_id, subject, is_correct, answered_at in rows:
+            key = (user_id, spaced_repetition.ITEM_SHORT_ANSWER, problem_id)
+            item = items.get(key)
+            if item is None:
+                item = items[key] = spaced_repetition._new_item(user_id, key[1], problem_id, subject, answered_at)
+            quality = spaced_repetition.QUALITY_CORRECT if is_correct else spaced_repetition.QUALITY_INCORRECT
+            spaced_repetition.apply_sm2(item, quality, answered_at)
+
+        for saved in db.query(SavedReviewProblem).yield_per(1000):
+            key = (saved.user_id, spaced_repetition.ITEM_SAVED_REVIEW, saved.id)
+            if key not in items:
+                items[key] = spaced_repetition._new_item(saved.user_id, key[1], saved.id, saved.subject_id, saved.created_at)
+
+        db.add_all(items.values())
+        db.commit()
+        logger.info(f"✓ review_schedule_items initialized: {len(items)} rows")
+
+        logger.info("✓ review schedule migration completed successfully")
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"review schedule migration failed: {str(e)}", exc_info=True)
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    try:
+        migrate_review_schedule()
+    except Exception as e:
+        logger.error(f"Migration script failed: {str(e)}", exc_info=True)
+        sys.exit(1)
@@ -40,21 +40,15 @@ except ImportError:
     from app.db import SessionLocal, engine
     from app.models import Review, UserReviewHistory
 
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 
 def _table_exists(db, table_name: str) -> bool:
-    row = db.execute(
-        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"),
-        {"name": table_name},
-    ).fetchone()
-    return row is not None
+    return inspect(db.get_bind()).has_table(table_name)
 
 
 def _get_columns(db, table_name: str) -> list[str]:
-    rows = db.execute(text(f"PRAGMA table_info({table_name})")).fetchall()
-    # PRAGMA table_info: (cid, name, type, notnull, dflt_value, pk)
-    return [r[1] for r in rows]
+    return [c["name"] for c in inspect(db.get_bind()).get_columns(table_name)]
 
 def _get_table_info(db, table_name: str):
     return db.execute(text(f"PRAGMA table_info({table_name})")).fetchall()
@@ -198,6 +192,13 @@ def migrate_reviews_tables(migrate_old_data: bool = True) -> None:
     try:
         logger.info("Starting reviews/user_review_history migration...")
 
+        # 旧スキーマ（SQLite 時代のもの）の移行のみ。PostgreSQL は現在のモデルで作成する
+        if db.get_bind().dialect.name != "sqlite":
+            Review.__table__.create(bind=engine, checkfirst=True)
+            UserReviewHistory.__table__.create(bind=engine, checkfirst=True)
+            logger.info("✓ Not SQLite. reviews/user_review_history ensured with current model")
+            return
+
         # user_review_history: 列追加（先にやってもOK）
         _ensure_user_review_history_columns(db)
         db.commit()
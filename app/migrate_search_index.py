@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+全文検索用の FTS5 テーブル（search_fts）と同期トリガーを作成するマイグレーション
+- SQLite 以外・FTS5（trigram）が使えない環境ではスキップ
+- テーブルを新しく作ったとき（または --rebuild 指定時）は既存データから索引を作る
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# プロジェクトルートをパスに追加（Docker/ローカル両対応）
+BASE_DIR = Path("/app") if Path("/app").exists() else Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+try:
+    from app.db import SessionLocal
+    from app import search_index
+except ImportError:
+    import os
+    os.chdir(str(BASE_DIR))
+    from app.db import SessionLocal
+    from app import search_index
+
+from sqlalchemy import text
+
+
+def _table_exists(db, table_name: str) -> bool:
+    row = db.execute(
+        text("SELECT name FROM sqlite_master WHERE name=:name"),
+        {"name": table_name},
+    ).fetchone()
+    return row is not None
+
+
+def migrate_search_index(rebuild: bool = False) -> None:
+    """search_fts とトリガーを作成し、新規作成時は索引を構築"""
+    db = SessionLocal()
+    try:
+        if db.get_bind().dialect.name != "sqlite":
+            logger.info("Full-text search requires SQLite FTS5. Skipping")
+            return
+
+        logger.info("Starting search index migration...")
+
+        missing = [t for t in search_index.source_tables() if not _table_exists(db, t)]
+        if missing:
+            logger.info(f"Source tables not found: {missing}. Skipping (created by create_all)")
+            return
+
+        created = not _table_exists(db, search_index.FTS_TABLE)
+        search_index.create_index(db)
+        if created or rebuild:
+            logger.info("Building search index from existing rows...")
+            search_index.rebuild_index(db)
+        db.commit()
+
+        logger.info("✓ search index migration completed successfully")
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"search index migration failed: {str(e)}", exc_info=True)
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    try:
+        migrate_search_index(rebuild="--rebuild" in sys.argv)
+    except Exception as e:
+        logger.error(f"Migration script failed: {str(e)}", exc_info=True)
+        sys.exit(1)
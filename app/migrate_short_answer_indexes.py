@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+short_answer_answers のインデックスマイグレーション
+
+- (session_id, problem_id): セッション単位の集計（GROUP BY session_id）と解答の重複確認用
+
+既存DBには create_all が適用されないので、IF NOT EXISTS で作成する。
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path("/app") if Path("/app").exists() else Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+try:
+    from app.db import SessionLocal
+except ImportError:
+    import os
+    os.chdir(str(BASE_DIR))
+    from app.db import SessionLocal
+
+from sqlalchemy import inspect, text
+
+
+def migrate_short_answer_indexes() -> None:
+    db = SessionLocal()
+    try:
+        logger.info("Ensuring short_answer_answers indexes...")
+
+        table_exists = inspect(db.get_bind()).has_table("short_answer_answers")
+        if not table_exists:
+            logger.info("short_answer_answers table not found. Skipping index migration.")
+            return
+
+        db.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_short_answer_answers_session_problem
+            ON short_answer_answers (session_id, problem_id);
+        """))
+
+        db.commit()
+        logger.info("✓ short_answer_answers index migration completed")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"short_answer_answers index migration failed: {str(e)}", exc_info=True)
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    migrate_short_answer_indexes()
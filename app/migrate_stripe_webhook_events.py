@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Stripe Webhook の受信箱テーブルを作成するマイグレーション
+
+- stripe_webhook_events
+
+既存DBを壊さない方針:
+- テーブルが無ければ作成
+- 既にあれば不足カラム（ordering_key）を追加し、未完了のイベントは payload から埋める
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# プロジェクトルートをパスに追加（Docker/ローカル両対応）
+BASE_DIR = Path("/app") if Path("/app").exists() else Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+try:
+    from app.db import SessionLocal, engine
+    from app.models import StripeWebhookEvent
+except ImportError:
+    import os
+    os.chdir(str(BASE_DIR))
+    from app.db import SessionLocal, engine
+    from app.models import StripeWebhookEvent
+
+from sqlalchemy import inspect, text
+
+
+def _table_exists(db, table_name: str) -> bool:
+    return inspect(db.get_bind()).has_table(table_name)
+
+
+def _column_exists(db, table_name: str, column_name: str) -> bool:
+    return any(c["name"] == column_name for c in inspect(db.get_bind()).get_columns(table_name))
+
+
+def _backfill_ordering_key(db) -> int:
+    """未完了（pending / processing）のイベントの ordering_key を payload から埋める"""
+    import json
+    from app.stripe_webhooks import ordering_key
+
+    rows = db.execute(text(
+        "SELECT id, payload FROM stripe_webhook_events "
+        "WHERE ordering_key IS NULL AND status IN ('pending', 'processing')"
+    )).fetchall()
+    for row_id, payload in rows:
+        try:
+            key = ordering_key(json.loads(payload))
+        except ValueError:
+            continue
+        db.execute(
+            text("UPDATE stripe_webhook_events SET ordering_key = :key WHERE id = :id"),
+            {"key": key, "id": row_id},
+        )
+    return len(rows)
+
+
+def migrate_stripe_webhook_events() -> None:
+    """stripe_webhook_events テーブルを作成（存在しなければ）、不足カラムを追加"""
+    db = SessionLocal()
+    try:
+        logger.info("Starting stripe_webhook_events migration...")
+        for table_name, model in (("stripe_webhook_events", StripeWebhookEvent),):
+            if not _table_exists(db, table_name):
+                logger.info(f"Creating {table_name} table...")
+                model.__table__.create(bind=engine, checkfirst=True)
+                db.commit()
+                logger.info(f"✓ {table_name} table created")
+            else:
+                logger.info(f"✓ {table_name} table already exists")
+        # 顧客ごとの反映順（claim_next）用
+        if not _column_exists(db, "stripe_webhook_events", "ordering_key"):
+            logger.info("Adding column stripe_webhook_events.ordering_key...")
+            db.execute(text("ALTER TABLE stripe_webhook_events ADD COLUMN ordering_key VARCHAR(255)"))
+            db.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_stripe_webhook_events_ordering_key "
+                "ON stripe_webhook_events (ordering_key, id)"
+            ))
+            n = _backfill_ordering_key(db)
+            db.commit()
+            logger.info(f"✓ stripe_webhook_events.ordering_key added (backfilled {n} rows)")
+        logger.info("✓ stripe_webhook_events migration completed successfully")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"stripe_webhook_events migration failed: {str(e)}", exc_info=True)
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    try:
+        migrate_stripe_webhook_events()
+    except Exception as e:
+        logger.error(f"Migration script failed: {str(e)}", exc_info=True)
+        sys.exit(1)
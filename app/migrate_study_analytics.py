@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+学習分析の週次集計テーブル（user_weekly_stats）を作成し、既存データから集計するマイグレーション
+- テーブルが空のときだけ講評履歴・短答の解答・タイマーの日次統計から作り直す
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# プロジェクトルートをパスに追加（Docker/ローカル両対応）
+BASE_DIR = Path("/app") if Path("/app").exists() else Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+try:
+    from app.db import SessionLocal, engine
+    from app.models import UserWeeklyStats
+    from app.study_analytics import rebuild_user_stats
+except ImportError:
+    import os
+    os.chdir(str(BASE_DIR))
+    from app.db import SessionLocal, engine
+    from app.models import UserWeeklyStats
+    from app.study_analytics import rebuild_user_stats
+
+
+def migrate_study_analytics() -> None:
+    """user_weekly_stats を作成し、空なら既存データから集計"""
+    UserWeeklyStats.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        logger.info("Starting study analytics migration...")
+
+        if db.query(UserWeeklyStats.user_id).first() is not None:
+            logger.info("user_weekly_stats already populated. Skipping backfill")
+            return
+
+        created = rebuild_user_stats(db)
+        db.commit()
+        logger.info(f"✓ user_weekly_stats backfilled: {created} rows")
+
+        logger.info("✓ study analytics migration completed successfully")
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"study analytics migration failed: {str(e)}", exc_info=True)
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    try:
+        migrate_study_analytics()
+    except Exception as e:
+        logger.error(f"Migration script failed: {str(e)}", exc_info=True)
+        sys.exit(1)
@@ -7,7 +7,8 @@ study_items テーブル追加（既存DB向けの軽量マイグレーション
 import logging
 from sqlalchemy import text
 
-from app.db import SessionLocal
+from app.db import SessionLocal, engine
+from app.models import StudyItem
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,6 +17,12 @@ logger = logging.getLogger(__name__)
 def main() -> None:
     db = SessionLocal()
     try:
+        # PostgreSQL はモデル定義から作成（以下の DDL は SQLite 向け）
+        if db.get_bind().dialect.name != "sqlite":
+            StudyItem.__table__.create(bind=engine, checkfirst=True)
+            logger.info("✓ study_items migration completed")
+            return
+
         # SQLite向けに IF NOT EXISTS で作成（本番/ローカル両対応）
         db.execute(text("""
         CREATE TABLE IF NOT EXISTS study_items (
@@ -26,20 +26,15 @@ except ImportError:
     os.chdir(str(BASE_DIR))
     from app.db import SessionLocal
 
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 
 def _table_exists(db, table_name: str) -> bool:
-    row = db.execute(
-        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"),
-        {"name": table_name},
-    ).fetchone()
-    return row is not None
+    return inspect(db.get_bind()).has_table(table_name)
 
 
 def _get_columns(db, table_name: str) -> list:
-    rows = db.execute(text(f"PRAGMA table_info({table_name})")).fetchall()
-    return [r[1] for r in rows]
+    return [c["name"] for c in inspect(db.get_bind()).get_columns(table_name)]
 
 
 def migrate_threads_conversation_summary() -> None:
@@ -27,21 +27,15 @@ except ImportError:
     from app.db import SessionLocal, engine
     from app.models import Thread
 
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 
 def _table_exists(db, table_name: str) -> bool:
-    row = db.execute(
-        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"),
-        {"name": table_name},
-    ).fetchone()
-    return row is not None
+    return inspect(db.get_bind()).has_table(table_name)
 
 
 def _get_columns(db, table_name: str) -> list[str]:
-    rows = db.execute(text(f"PRAGMA table_info({table_name})")).fetchall()
-    # PRAGMA table_info: (cid, name, type, notnull, dflt_value, pk)
-    return [r[1] for r in rows]
+    return [c["name"] for c in inspect(db.get_bind()).get_columns(table_name)]
 
 
 def migrate_threads_favorite() -> None:
@@ -70,7 +64,12 @@ def migrate_threads_favorite() -> None:
             logger.info("✓ favorite column already exists in threads")
 
         # is_archivedカラムが存在する場合は削除（SQLiteでは直接削除できないため、テーブル再作成）
-        if "is_archived" in cols:
+        if "is_archived" in cols and db.get_bind().dialect.name != "sqlite":
+            logger.info("Removing is_archived column from threads...")
+            db.execute(text("ALTER TABLE threads DROP COLUMN is_archived"))
+            db.commit()
+            logger.info("✓ is_archived column removed from threads")
+        elif "is_archived" in cols:
             logger.info("Removing is_archived column from threads...")
             # SQLiteではALTER TABLE DROP COLUMNが使えないため、テーブル再作成が必要
             # ただし、データを保持する必要があるため、バックアップ→再作成→データ移行
@@ -41,7 +41,9 @@ def migrate_threads_tables():
         logger.info("Starting threads/messages tables migration...")
         
         # 外部キー制約を無効化（SQLite用）
-        db.execute(text("PRAGMA foreign_keys=OFF"))
+        is_sqlite = db.get_bind().dialect.name == "sqlite"
+        if is_sqlite:
+            db.execute(text("PRAGMA foreign_keys=OFF"))
         
         # messagesテーブルを削除（threadsより先に削除する必要がある）
         try:
@@ -61,7 +63,8 @@ def migrate_threads_tables():
         db.commit()
         
         # 外部キー制約を再有効化
-        db.execute(text("PRAGMA foreign_keys=ON"))
+        if is_sqlite:
+            db.execute(text("PRAGMA foreign_keys=ON"))
         
         # テーブルを再作成
         logger.info("Recreating threads and messages tables...")
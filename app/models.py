@@ -1,14 +1,74 @@
-import os
-from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Boolean, Index, UniqueConstraint, CheckConstraint, Numeric
-from sqlalchemy.sql import func, text as sql_text
+import json
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Boolean, Index, UniqueConstraint, CheckConstraint, Numeric, Float
+from sqlalchemy.sql import func, literal, text as sql_text
 try:
-    # PostgreSQL用（SQLiteではコンパイルできないため、使用はURL判定で制御する）
+    # PostgreSQL用（SQLiteではコンパイルできないため、使用は接続先の方言で制御する）
     from sqlalchemy.dialects.postgresql import JSONB  # type: ignore
 except Exception:  # pragma: no cover
     JSONB = None  # type: ignore
 from sqlalchemy.orm import relationship
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.types import TypeDecorator
 from .db import Base
 
+
+class JsonText(TypeDecorator):
+    """
+    JSON 列（PostgreSQL: JSONB / SQLite: Text）
+
+    - 書き込みは dict・JSON文字列のどちらでもよい（JSONB には JSON の値として、Text には JSON 文字列として保存）
+    - 読み出しは PostgreSQL では dict、SQLite では JSON 文字列（呼び出し側は両方を受け付けている）
+    - 方言は接続先で決まるため、管理者用に別のDBへ接続した場合も正しく扱える
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql" and JSONB is not None:
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(Text())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if dialect.name == "postgresql":
+            return json.loads(value) if isinstance(value, str) else value
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+class now_text(FunctionElement):
+    """
+    現在日時（UTC）の文字列 'YYYY-MM-DD HH:MM:SS'（日時を文字列で持つ列の server_default 用）
+
+    SQLite: datetime('now') / PostgreSQL: to_char(now() AT TIME ZONE 'utc', ...)
+    """
+
+    type = String()
+    inherit_cache = True
+
+
+@compiles(now_text)
+def _compile_now_text(element, compiler, **kw):
+    return "datetime('now')"
+
+
+@compiles(now_text, "postgresql")
+def _compile_now_text_postgresql(element, compiler, **kw):
+    return "to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')"
+
+
+def json_path(column, dialect_name: str, *path: str):
+    """
+    JSON 列の一部を取り出す式（PostgreSQL: #> で JSONB のまま / SQLite: json_extract で JSON 文字列）
+
+    例: json_path(Review.kouhyo_kekka, "postgresql", "evaluation")
+    """
+    if dialect_name == "postgresql":
+        return column.op("#>", return_type=JSONB())(literal("{" + ",".join(path) + "}"))
+    return func.json_extract(column, "$." + ".".join(path))
+
 # ============================================================================
 # 新しいDB設計: 科目管理
 # ============================================================================
@@ -147,10 +207,8 @@ class Review(Base):
     
     # LLMの出力結果
     # - SQLite: Text（JSON文字列として保存）
-    # - PostgreSQL: JSONB（DB URL 判定）
-    _db_url = (os.getenv("DATABASE_URL") or "").lower()
-    _use_jsonb = bool(JSONB) and (_db_url.startswith("postgresql://") or _db_url.startswith("postgres://"))
-    kouhyo_kekka = Column(JSONB, nullable=False) if _use_jsonb else Column(Text, nullable=False)
+    # - PostgreSQL: JSONB（接続先の方言で切り替え。JsonText を参照）
+    kouhyo_kekka = Column(JsonText, nullable=False)
     
     # チャット機能
     thread_id = Column(
@@ -352,6 +410,169 @@ class LlmRequest(Base):
     )
 
 
+class ReviewResultCache(Base):
+    """
+    講評結果キャッシュ（同一内容の再提出でLLMを再実行しないため）
+
+    設計のポイント:
+    - cache_key = sha256(モデル・評価プロンプト・科目別留意事項・問題文・出題趣旨・採点実感・区切り付き答案)
+    - ユーザー単位で参照（他ユーザーの講評は返さない）
+    - idempotency_key: POST /v1/review の Idempotency-Key ヘッダ（再送時に同じ講評を返す）
+    - 講評本体は reviews を参照（JSONの複製は持たない）
+    """
+    __tablename__ = "review_result_cache"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(
+        BigInteger().with_variant(Integer, "sqlite"),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    cache_key = Column(String(64), nullable=False)
+    idempotency_key = Column(String(255), nullable=True)
+    review_id = Column(
+        BigInteger().with_variant(Integer, "sqlite"),
+        ForeignKey("reviews.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    submission_id = Column(Integer, nullable=True)
+    model = Column(String(100), nullable=True)
+    hit_count = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_hit_at = Column(DateTime(timezone=True), nullable=True)
+
+    review = relationship("Review", foreign_keys=[review_id])
+
+    __table_args__ = (
+        Index("idx_review_result_cache_user_key", "user_id", "cache_key", "created_at"),
+        Index("idx_review_result_cache_user_idem", "user_id", "idempotency_key"),
+    )
+
+
+class LlmBatchJob(Base):
+    """
+    Message Batches のジョブ（1回の送信 = 1レコード）
+
+    設計のポイント:
+    - batch_id は Anthropic 側のID（msgbatch_...）
+    - status: submitted / ended / processed / failed
+    - 結果の反映は LlmBatchItem 単位（custom_id で対応付け）
+    - locked_at: 結果を反映中のワーカーが条件付き UPDATE で取得する（複数ワーカーでの二重反映を防ぐ）
+    """
+    __tablename__ = "llm_batch_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    batch_id = Column(String(100), nullable=True, unique=True)
+    status = Column(String(20), nullable=False, default="submitted", index=True)
+    request_count = Column(Integer, nullable=False, default=0)
+    succeeded_count = Column(Integer, nullable=False, default=0)
+    errored_count = Column(Integer, nullable=False, default=0)
+    error_message = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    ended_at = Column(DateTime(timezone=True), nullable=True)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+
+    items = relationship("LlmBatchItem", back_populates="job", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        CheckConstraint("status IN ('submitted', 'ended', 'processed', 'failed')", name="ck_llm_batch_job_status"),
+    )
+
+
+class LlmBatchItem(Base):
+    """
+    Message Batches の各リクエスト
+
+    設計のポイント:
+    - custom_id: "{target_type}-{target_id}-{連番}"（Anthropicの制約: 英数字/_/- 64文字以内）
+    - target_type: recent_review（RecentReviewProblemSession）/ thread_summary（Thread）/ review（Review）
+    - meta_json: 結果反映に必要な付加情報（要約の対象ターン範囲など）
+    - status: pending / applied / errored / skipped
+    """
+    __tablename__ = "llm_batch_items"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(Integer, ForeignKey("llm_batch_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    custom_id = Column(String(64), nullable=False, unique=True)
+    target_type = Column(String(30), nullable=False)
+    target_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    meta_json = Column(Text, nullable=True)
+    status = Column(String(20), nullable=False, default="pending")
+    error_message = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    applied_at = Column(DateTime(timezone=True), nullable=True)
+
+    job = relationship("LlmBatchJob", back_populates="items")
+
+    __table_args__ = (
+        CheckConstraint("status IN ('pending', 'applied', 'errored', 'skipped')", name="ck_llm_batch_item_status"),
+        Index("idx_llm_batch_items_target", "target_type", "target_id"),
+    )
+
+
+class OfficialQuestionImportManifest(Base):
+    """
+    公式問題JSONの取り込み記録（1ファイル = 1レコード）
+
+    設計のポイント:
+    - path は JSON ディレクトリからの相対パス
+    - size / mtime_ns が前回と同じファイルは読まない。違う場合も sha256 が同じなら取り込まない
+    - DBごとに持つ（dev / beta / 本番で取り込み状況が異なってよい）
+    """
+    __tablename__ = "official_question_import_manifest"
+
+    path = Column(String(500), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    mtime_ns = Column(BigInteger, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    imported_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class StripeWebhookEvent(Base):
+    """
+    Stripe Webhook の受信箱（1イベント = 1レコード）
+
+    設計のポイント:
+    - event_id は Stripe 側のID（evt_...）。一意制約で再送を無視する
+    - Webhook は署名検証・保存・応答だけを行い、反映は worker が受信順に行う
+    - status: pending / processing / processed / dead（再試行上限に達したもの）
+    - 失敗時は attempts を増やし、next_attempt_at まで待って再試行する
+    - ordering_key（顧客ID。無ければオブジェクトID）が同じイベントは受信順に1件ずつ反映する
+    """
+    __tablename__ = "stripe_webhook_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event_id = Column(String(255), nullable=False, unique=True)
+    event_type = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)  # 署名検証済みのイベントJSON
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    stripe_created = Column(BigInteger, nullable=True)  # イベントの created（UNIX秒）
+    ordering_key = Column(String(255), nullable=True)  # 反映順を守る単位（cus_... / オブジェクトID）
+
+    received_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        CheckConstraint(
+            "status IN ('pending', 'processing', 'processed', 'dead')",
+            name="ck_stripe_webhook_event_status",
+        ),
+        Index("idx_stripe_webhook_events_status_next", "status", "next_attempt_at", "id"),
+        Index("idx_stripe_webhook_events_ordering_key", "ordering_key", "id"),
+    )
+
+
 # ============================================================================
 # 既存のモデル（後方互換性のため保持）
 # ============================================================================
@@ -464,6 +685,10 @@ class ShortAnswerAnswer(Base):
     
     session = relationship("ShortAnswerSession", back_populates="answers")
     problem = relationship("ShortAnswerProblem", back_populates="answers")
+    
+    __table_args__ = (
+        Index('idx_short_answer_answers_session_problem', 'session_id', 'problem_id'),
+    )
 
 # ユーザー管理関連のモデル
 class User(Base):
@@ -866,7 +1091,7 @@ class DashboardItem(Base):
     - Left（Topics to Revisit）は表示条件で生成（DB上の種別ではない）
     - entry_type: 1=Point, 2=Task, 3=Target
     - status: 1=未了, 2=作業中, 3=完了, 4=後で
-    - positionは間隔方式（10,20,30...）で管理
+    - positionは間隔方式（10,20,30...）で管理（互換用）。並び順は rank_key（分数インデックス）で決める
     - ソフト削除対応（deleted_at）
     """
     __tablename__ = "dashboard_items"
@@ -882,11 +1107,12 @@ class DashboardItem(Base):
     due_date = Column(String(10), nullable=True)  # 'YYYY-MM-DD'、PointはNULL強制
     status = Column(Integer, nullable=False)  # 1=未了, 2=作業中, 3=完了, 4=後で
     memo = Column(Text, nullable=True)  # メモ（自由記述）
-    position = Column(Integer, nullable=False)  # 並び順（間隔方式：10,20,30...）
+    position = Column(Integer, nullable=False)  # 並び順（間隔方式：10,20,30...）。互換用、並びは rank_key 優先
+    rank_key = Column(String(64), nullable=True)  # 並び順キー（分数インデックス、app.rank_keys）
     favorite = Column(Integer, nullable=False, default=0)  # お気に入りフラグ（0=OFF, 1=ON）
     
-    created_at = Column(String(30), nullable=False, server_default=sql_text("datetime('now')"))
-    updated_at = Column(String(30), nullable=False, server_default=sql_text("datetime('now')"))
+    created_at = Column(String(30), nullable=False, server_default=now_text())
+    updated_at = Column(String(30), nullable=False, server_default=now_text())
     deleted_at = Column(String(30), nullable=True)  # ソフト削除日時
     
     # リレーションシップ
@@ -903,6 +1129,7 @@ class DashboardItem(Base):
         Index('idx_dashboard_items_user_date_status', 'user_id', 'dashboard_date', 'status'),
         Index('idx_dashboard_items_user_date_deleted', 'user_id', 'dashboard_date', 'deleted_at'),
         Index('idx_dashboard_items_position', 'user_id', 'dashboard_date', 'entry_type', 'position'),
+        Index('idx_dashboard_items_rank_key', 'user_id', 'dashboard_date', 'entry_type', 'rank_key'),
     )
 
 
@@ -1030,6 +1257,41 @@ class SavedReviewProblem(Base):
     )
 
 
+class ReviewScheduleItem(Base):
+    """
+    復習スケジュール（間隔反復の復習キュー）
+
+    設計のポイント:
+    - 1行 = ユーザー × 復習対象（短答の問題 / 保存済みの復習問題）
+    - 解答のたびに SM-2 で ease_factor / interval_days / due_at を更新（spaced_repetition.record_reviews）
+    - 「今日の復習」は (user_id, due_at) の範囲検索で先頭N件を取るだけ
+    """
+    __tablename__ = "review_schedule_items"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    item_type = Column(String(20), nullable=False)  # short_answer / saved_review
+    item_id = Column(Integer, nullable=False)  # short_answer_problems.id / saved_review_problems.id
+    subject_id = Column(Integer, nullable=True)  # 1-18 or NULL（科目で絞り込む用）
+
+    ease_factor = Column(Float, nullable=False, default=2.5)
+    interval_days = Column(Integer, nullable=False, default=0)
+    repetitions = Column(Integer, nullable=False, default=0)  # 連続正解数
+    lapses = Column(Integer, nullable=False, default=0)  # 忘れた回数
+    last_quality = Column(Integer, nullable=True)  # 直近の評価（0-5）
+    last_reviewed_at = Column(DateTime(timezone=True), nullable=True)
+    due_at = Column(DateTime(timezone=True), nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "item_type", "item_id", name="uq_review_schedule_user_item"),
+        Index("idx_review_schedule_user_due", "user_id", "due_at"),
+        Index("idx_review_schedule_user_type_due", "user_id", "item_type", "due_at"),
+    )
+
+
 class ContentUse(Base):
     """
     復習問題生成で使用したコンテンツの履歴
@@ -1159,6 +1421,37 @@ class TimerDailyStats(Base):
     )
 
 
+class UserWeeklyStats(Base):
+    """
+    学習分析の週次集計（ユーザー × 科目 × 週）
+    
+    設計のポイント:
+    - 講評・短答・タイマーの書き込み時に増分で更新する（study_analytics.AnalyticsDeltas）
+    - week_startは学習日（4:00区切り）の週の月曜日 'YYYY-MM-DD'
+    - subjectは科目ID（1-18）。科目のない記録（タイマーなど）は0
+    - 平均点は score_sum / scored_review_count で求める（点数のない講評は平均に含めない）
+    """
+    __tablename__ = "user_weekly_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, primary_key=True)
+    week_start = Column(String(10), nullable=False, primary_key=True)  # 'YYYY-MM-DD'（月曜日）
+    subject = Column(Integer, nullable=False, primary_key=True, default=0)  # 科目ID（1-18）、0=科目なし
+    
+    review_count = Column(Integer, nullable=False, default=0)  # 講評数
+    scored_review_count = Column(Integer, nullable=False, default=0)  # 点数のある講評数
+    score_sum = Column(Numeric(10, 2), nullable=False, default=0)  # 点数の合計
+    best_score = Column(Numeric(5, 2), nullable=True)  # 最高点
+    short_answer_total = Column(Integer, nullable=False, default=0)  # 短答の解答数
+    short_answer_correct = Column(Integer, nullable=False, default=0)  # 短答の正答数
+    study_seconds = Column(Integer, nullable=False, default=0)  # タイマーの学習秒数
+    
+    updated_at_utc = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    
+    __table_args__ = (
+        Index('idx_user_weekly_stats_user_week', 'user_id', 'week_start'),
+    )
+
+
 # ============================================================================
 # My規範・My論点管理
 # ============================================================================
@@ -1173,7 +1466,7 @@ class StudyItem(Base):
     - subject_id: 科目ID（1-18、NULL可）
     - importance: 重要度（1=High, 2=Middle, 3=Low）
     - mastery_level: 理解度（1=未習得, 2=初級, 3=中級, 4=上級, 5=完全習得）
-    - position: 並び順（間隔方式：10,20,30...）
+    - position: 並び順（間隔方式：10,20,30...、互換用）。並び順は rank_key（分数インデックス）で決める
     - created_date: 作成日（Date型、mm/dd表示はフロントエンドで変換）
     - tags: タグ（JSON配列形式で保存、マルチセレクト対応）
     - ソフト削除対応（deleted_at）
@@ -1208,7 +1501,8 @@ class StudyItem(Base):
     
     # 日付と並び順
     created_date = Column(DateTime(timezone=True), nullable=False)  # 作成日（Date型）
-    position = Column(Integer, nullable=False)  # 並び順（間隔方式：10,20,30...）
+    position = Column(Integer, nullable=False)  # 並び順（間隔方式：10,20,30...）。互換用、並びは rank_key 優先
+    rank_key = Column(String(64), nullable=True)  # 並び順キー（分数インデックス、app.rank_keys）
     
     # タイムスタンプ
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -1228,6 +1522,7 @@ class StudyItem(Base):
         
         # インデックス
         Index('idx_study_items_user_subject_type', 'user_id', 'subject_id', 'entry_type', 'deleted_at'),
+        Index('idx_study_items_rank_key', 'user_id', 'subject_id', 'entry_type', 'rank_key'),
         Index('idx_study_items_user_type_deleted', 'user_id', 'entry_type', 'deleted_at'),
         Index('idx_study_items_position', 'user_id', 'subject_id', 'entry_type', 'position'),
         Index('idx_study_items_favorite', 'user_id', 'is_favorite', 'deleted_at'),
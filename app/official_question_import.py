@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+公式問題JSON（data/json）→ official_questions の差分取り込み
+
+- official_question_import_manifest にファイルごとの (size, mtime_ns, sha256) を記録し、
+  変わっていないファイルは読まない（起動時の処理はファイル数ぶんの stat と1回の SELECT だけ）
+- 変わったファイルだけを読み、1トランザクションでまとめて反映する
+  - active が無い (試験種別, 年度, 科目) は version 1（または過去の最大 version + 1）として追加
+  - active と内容（問題文・出題趣旨・採点実感）が違う場合は、既存を status='old' にして version + 1 を追加
+    （既存の講評は古い version を参照したまま残る）
+  - 内容が同じ場合（記録が無いだけの既存DB等）は記録のみ更新
+- 同じキーのJSONが複数ある場合はパス順で最後のものを使う
+- 短答式問題（ファイル名に「短答」を含む）は対象外
+- 反映後に公式問題のキャッシュ（OFFICIAL_QUESTION_CACHE_NAMESPACE）を名前空間ごと無効化する
+
+CLI:
+    python -m app.official_question_import [--dry-run] [--years H30 R6] [--database-url URL ...]
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, insert, tuple_, update
+from sqlalchemy.orm import Session
+
+from .cache import invalidate_namespace
+from .models import OfficialQuestion, OfficialQuestionImportManifest
+from config.subjects import get_subject_id
+
+logger = logging.getLogger(__name__)
+
+QuestionKey = Tuple[str, int, int]  # (shiken_type, nendo, subject_id)
+
+SHIKEN_TYPES = {"予備": "yobi", "司法": "shihou"}
+
+# 公開中の公式問題・年度一覧のキャッシュ（main.py の _official_question_cache）
+OFFICIAL_QUESTION_CACHE_NAMESPACE = "official_question_active"
+
+
+def default_json_dir() -> Path:
+    # Docker: /data/json（volume mount）、ローカル: <repo>/data/json
+    if Path("/data/json").exists():
+        return Path("/data/json")
+    return Path(__file__).parent.parent / "data" / "json"
+
+
+def year_to_int(year_str: str) -> int:
+    """年度文字列を整数に変換（例: "R7" -> 2025, "H30" -> 2018）"""
+    if year_str.startswith("R"):
+        return 2018 + int(year_str[1:])
+    if year_str.startswith("H"):
+        return 1988 + int(year_str[1:])
+    try:
+        return int(year_str)
+    except ValueError:
+        raise ValueError(f"年度の形式が不正です: {year_str}")
+
+
+@dataclass
+class QuestionFile:
+    path: str
+    size: int
+    mtime_ns: int
+    sha256: str
+    key: QuestionKey
+    text: str
+    syutudaisyusi: Optional[str]
+    grading_impression_text: Optional[str]
+
+    def content(self) -> Tuple[str, Optional[str], Optional[str]]:
+        return self.text, self.syutudaisyusi, self.grading_impression_text
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    versioned: int = 0
+    unchanged: int = 0  # 記録と同じ（読まなかった）ファイル
+    adopted: int = 0  # 内容がDBと同じで記録だけ追加・更新したファイル
+    errors: List[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return (
+            f"created={self.created}, versioned={self.versioned}, adopted={self.adopted}, "
+            f"unchanged={self.unchanged}, errors={len(self.errors)}"
+        )
+
+
+def parse_question_json(data: dict) -> Tuple[QuestionKey, str, Optional[str], Optional[str]]:
+    """JSON の内容を (キー, 問題文, 出題趣旨, 採点実感) にする（不正なら ValueError）"""
+    shiken_type = SHIKEN_TYPES.get(data.get("exam_type", ""))
+    if shiken_type is None:
+        raise ValueError(f"試験種別が不正です: {data.get('exam_type')!r}")
+    nendo = year_to_int(str(data.get("year", "")))
+
+    subject_id = None
+    for raw in (data.get("subject"), data.get("subject_name")):
+        if isinstance(raw, int):
+            subject_id = raw
+        elif isinstance(raw, str) and raw.strip():
+            s = "".join(raw.split())
+            subject_id = int(s) if s.isdigit() else get_subject_id(s)
+        if subject_id is not None:
+            break
+    if subject_id is None or not (1 <= int(subject_id) <= 18):
+        raise ValueError(f"科目の形式が不正です: subject={data.get('subject')!r}, subject_name={data.get('subject_name')!r}")
+
+    text = data.get("text") or ""
+    if not text.strip():
+        raise ValueError("問題文が空です")
+    purpose = data.get("purpose") or None
+    scoring_notes = (data.get("scoring_notes") or None) if shiken_type == "shihou" else None
+    return (shiken_type, nendo, int(subject_id)), text, purpose, scoring_notes
+
+
+def _iter_json_files(json_dir: Path) -> Iterable[Path]:
+    for path in sorted(json_dir.rglob("*.json")):
+        if "短答" not in path.name:
+            yield path
+
+
+def scan(
+    json_dir: Path,
+    manifest: Dict[str, OfficialQuestionImportManifest],
+    years: Optional[Set[int]] = None,
+) -> Tuple[List[QuestionFile], List[Tuple[str, int, int, str]], int, List[str], Set[str]]:
+    """
+    変わったファイルを探す
+
+    Returns:
+        (読み込んだファイル, 内容が同じで stat だけ変わったファイル[(path, size, mtime_ns, sha256)],
+         記録と同じファイル数, エラー, 存在するファイルのパス)
+    """
+    changed: List[QuestionFile] = []
+    touched: List[Tuple[str, int, int, str]] = []
+    unchanged = 0
+    errors: List[str] = []
+    seen: Set[str] = set()
+    for path in _iter_json_files(json_dir):
+        rel = path.relative_to(json_dir).as_posix()
+        seen.add(rel)
+        st = path.stat()
+        rec = manifest.get(rel)
+        if rec is not None and rec.size == st.st_size and rec.mtime_ns == st.st_mtime_ns:
+            unchanged += 1
+            continue
+        raw = path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        if rec is not None and rec.sha256 == digest:
+            touched.append((rel, st.st_size, st.st_mtime_ns, digest))
+            continue
+        try:
+            key, text, purpose, scoring_notes = parse_question_json(json.loads(raw.decode("utf-8-sig")))
+        except Exception as e:
+            errors.append(f"{rel}: {e}")
+            continue
+        if years is not None and key[1] not in years:
+            continue
+        changed.append(QuestionFile(rel, st.st_size, st.st_mtime_ns, digest, key, text, purpose, scoring_notes))
+    return changed, touched, unchanged, errors, seen
+
+
+def _dialect_insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert
+
+
+def _upsert_manifest(db: Session, rows: List[Tuple[str, int, int, str]]) -> None:
+    if not rows:
+        return
+    t = OfficialQuestionImportManifest.__table__
+    stmt = _dialect_insert(db)(t).values(
+        [{"path": p, "size": size, "mtime_ns": mtime_ns, "sha256": digest} for p, size, mtime_ns, digest in rows]
+    )
+    ex = stmt.excluded
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[t.c.path],
+        set_={"size": ex.size, "mtime_ns": ex.mtime_ns, "sha256": ex.sha256, "imported_at": func.now()},
+    ))
+
+
+def import_official_questions(
+    db: Session,
+    json_dir: Optional[Path] = None,
+    *,
+    years: Optional[Set[int]] = None,
+    dry_run: bool = False,
+) -> ImportResult:
+    """data/json の変更分を official_questions に反映する（dry_run 以外はコミットする）"""
+    json_dir = json_dir or default_json_dir()
+    result = ImportResult()
+    if not json_dir.exists():
+        logger.warning(f"JSON directory not found: {json_dir}")
+        return result
+
+    OfficialQuestionImportManifest.__table__.create(bind=db.get_bind(), checkfirst=True)
+    manifest = {r.path: r for r in db.query(OfficialQuestionImportManifest).all()}
+    changed, touched, result.unchanged, result.errors, seen = scan(json_dir, manifest, years)
+    for err in result.errors:
+        logger.error(f"Official question JSON skipped: {err}")
+
+    # 同じキーは最後のファイルを使う
+    by_key: Dict[QuestionKey, QuestionFile] = {}
+    for qf in changed:
+        if qf.key in by_key:
+            logger.warning(f"Duplicate official question JSON for {qf.key}: {by_key[qf.key].path} -> {qf.path}")
+        by_key[qf.key] = qf
+
+    active: Dict[QuestionKey, OfficialQuestion] = {}
+    max_version: Dict[QuestionKey, int] = {}
+    if by_key:
+        key_cols = (OfficialQuestion.shiken_type, OfficialQuestion.nendo, OfficialQuestion.subject_id)
+        keys = list(by_key)
+        for oq in db.query(OfficialQuestion).filter(
+            OfficialQuestion.status == "active", tuple_(*key_cols).in_(keys)
+        ).all():
+            active[(oq.shiken_type, oq.nendo, oq.subject_id)] = oq
+        for shiken_type, nendo, subject_id, version in db.query(
+            *key_cols, func.max(OfficialQuestion.version)
+        ).filter(tuple_(*key_cols).in_(keys)).group_by(*key_cols).all():
+            max_version[(shiken_type, nendo, subject_id)] = int(version or 0)
+
+    old_ids: List[int] = []
+    new_rows: List[dict] = []
+    for key, qf in by_key.items():
+        current = active.get(key)
+        if current is not None and (current.text, current.syutudaisyusi, current.grading_impression_text) == qf.content():
+            result.adopted += 1
+            continue
+        if current is not None:
+            old_ids.append(current.id)
+            result.versioned += 1
+        else:
+            result.created += 1
+        shiken_type, nendo, subject_id = key
+        new_rows.append({
+            "shiken_type": shiken_type,
+            "nendo": nendo,
+            "subject_id": subject_id,
+            "version": max_version.get(key, 0) + 1,
+            "status": "active",
+            "text": qf.text,
+            "syutudaisyusi": qf.syutudaisyusi,
+            "grading_impression_text": qf.grading_impression_text,
+        })
+
+    if dry_run:
+        db.rollback()
+        return result
+
+    try:
+        # 部分ユニークインデックス（active は1つ）のため、old にしてから追加する
+        if old_ids:
+            db.execute(
+                update(OfficialQuestion)
+                .where(OfficialQuestion.id.in_(old_ids))
+                .values(status="old", updated_at=func.now())
+            )
+        if new_rows:
+            db.execute(insert(OfficialQuestion), new_rows)
+        _upsert_manifest(db, touched + [(qf.path, qf.size, qf.mtime_ns, qf.sha256) for qf in changed])
+        gone = [p for p in manifest if p not in seen]
+        if gone and years is None:
+            db.query(OfficialQuestionImportManifest).filter(
+                OfficialQuestionImportManifest.path.in_(gone)
+            ).delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    if old_ids or new_rows:
+        # active が変わったため、キャッシュ済みの問題・年度一覧を捨てる
+        # （CACHE_BACKEND=sqlite なら共有層経由で他プロセスにも伝わる）
+        invalidate_namespace(OFFICIAL_QUESTION_CACHE_NAMESPACE)
+    return result
+
+
+def _main(argv: Sequence[str]) -> int:
+    import argparse
+    from .db import SessionLocal, get_db_session_for_url
+
+    parser = argparse.ArgumentParser(description="公式問題JSONの差分取り込み")
+    parser.add_argument("--json-dir", default=None, help="JSONディレクトリ（デフォルト: data/json）")
+    parser.add_argument("--years", nargs="+", default=None, help="対象年度（例: H30 R6）")
+    parser.add_argument("--dry-run", action="store_true", help="反映せず件数だけ表示")
+    parser.add_argument(
+        "--database-url", action="append", default=None,
+        help="反映先DB（複数指定可。省略時は DATABASE_URL）",
+    )
+    args = parser.parse_args(argv)
+
+    json_dir = Path(args.json_dir) if args.json_dir else default_json_dir()
+    years = {year_to_int(y) for y in args.years} if args.years else None
+
+    failed = False
+    for url in args.database_url or [None]:
+        label = url or os.getenv("DATABASE_URL", "(default)")
+        sessions = get_db_session_for_url(url) if url else None
+        db = next(sessions) if sessions else SessionLocal()
+        try:
+            result = import_official_questions(db, json_dir, years=years, dry_run=args.dry_run)
+            print(f"{label}: {result.summary()}" + ("（dry-run）" if args.dry_run else ""))
+            for err in result.errors:
+                print(f"  ✗ {err}")
+        except Exception as e:
+            failed = True
+            print(f"{label}: 失敗: {e}")
+        finally:
+            if sessions:
+                sessions.close()
+            else:
+                db.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    sys.exit(_main(sys.argv[1:]))
@@ -8,6 +8,7 @@
 import json
 import logging
 import os
+from dataclasses import dataclass
 from decimal import Decimal
 from typing import Optional, Any
 
@@ -25,10 +26,11 @@ from .models import (
     Message,
     LlmRequest,
 )
+from .cache import MISSING, get_cache
 from .timer_utils import get_study_date as get_study_date_4am
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from config.settings import PLAN_LIMITS_ENABLED
+from config.settings import PLAN_CACHE_TTL_SECONDS, PLAN_LIMITS_ENABLED
 
 logger = logging.getLogger(__name__)
 
@@ -76,11 +78,22 @@ def get_default_plan(db: Session) -> Optional[SubscriptionPlan]:
     ).first()
 
 
-def get_user_plan(db: Session, user: User) -> Optional[SubscriptionPlan]:
+@dataclass(frozen=True)
+class PlanSnapshot:
+    """キャッシュ用のプラン情報（SubscriptionPlan のうち参照される列のみ）"""
+    id: int
+    plan_code: str
+    name: str
+    limits: Optional[str]
+
+
+# ユーザーID -> {"plan": PlanSnapshot の dict または None}
+_user_plan_cache = get_cache("user_plan", max_size=10000, ttl=PLAN_CACHE_TTL_SECONDS)
+
+
+def _load_user_plan(db: Session, user: User) -> tuple[Optional[SubscriptionPlan], Optional[datetime]]:
     """
-    ユーザーに適用されるプランを返す。
-    - 有効な UserSubscription があればそのプラン
-    - なければデフォルトプラン(全ユーザー対象の beta 想定)
+    ユーザーに適用されるプランと、その判定が変わり得る時刻（契約の期限など）を返す。
     """
     now_utc = datetime.now(UTC)
     subs = (
@@ -120,13 +133,46 @@ def get_user_plan(db: Session, user: User) -> Optional[SubscriptionPlan]:
             if started_at is not None and started_at <= now_utc - timedelta(days=30):
                 logger.info(f"Subscription {sub.id} (PlanB) started more than 30 days ago without expires_at")
                 continue
+            if started_at is not None:
+                expires_at = started_at + timedelta(days=30)
         
         logger.info(f"Using subscription {sub.id} with plan {sub.plan.plan_code} for user {user.id}")
-        return sub.plan
+        return sub.plan, expires_at
     
     default_plan = get_default_plan(db)
     logger.info(f"No active subscription found for user {user.id}, using default plan: {default_plan.plan_code if default_plan else 'None'}")
-    return default_plan
+    return default_plan, None
+
+
+def get_user_plan(db: Session, user: User) -> Optional[PlanSnapshot]:
+    """
+    ユーザーに適用されるプランを返す。
+    - 有効な UserSubscription があればそのプラン
+    - なければデフォルトプラン(全ユーザー対象の beta 想定)
+    結果は PLAN_CACHE_TTL_SECONDS（契約の期限がそれより早ければ期限まで）キャッシュする。
+    契約を変更したら invalidate_user_plan を呼ぶこと。
+    """
+    cached = _user_plan_cache.get(user.id)
+    if cached is MISSING:
+        plan, valid_until = _load_user_plan(db, user)
+        cached = {
+            "plan": {"id": plan.id, "plan_code": plan.plan_code, "name": plan.name, "limits": plan.limits} if plan else None,
+        }
+        ttl = PLAN_CACHE_TTL_SECONDS
+        if valid_until is not None:
+            ttl = min(ttl, (valid_until - datetime.now(UTC)).total_seconds())
+        _user_plan_cache.set(user.id, cached, ttl=ttl)
+    return PlanSnapshot(**cached["plan"]) if cached.get("plan") else None
+
+
+def invalidate_user_plan(user_id: int) -> None:
+    """契約の作成・変更・解約時に呼ぶ"""
+    _user_plan_cache.delete(user_id)
+
+
+def invalidate_all_user_plans() -> None:
+    """プラン定義（SubscriptionPlan）の変更時に呼ぶ"""
+    _user_plan_cache.clear()
 
 
 def has_active_subscription(db: Session, user: User) -> bool:
@@ -134,7 +180,7 @@ def has_active_subscription(db: Session, user: User) -> bool:
     return get_user_plan(db, user) is not None
 
 
-def get_plan_limits(plan: Optional[SubscriptionPlan]) -> dict[str, Any]:
+def get_plan_limits(plan: Optional[PlanSnapshot]) -> dict[str, Any]:
     """プランの limits 辞書を返す。プランがなければ空辞書（制限なし扱い）。"""
     if not plan or not plan.limits:
         return {}
@@ -316,9 +362,10 @@ def check_free_chat_message_limit(db: Session, user: User, *, after_add: int = 0
         )
 
 
-def check_non_review_cost_limit(db: Session, user: User) -> None:
+def check_non_review_cost_limit(db: Session, user: User, estimated_cost_yen: Optional[Decimal] = None) -> None:
     """総利用額（Review含む）が上限以内か。超過時は講評チャット・フリーチャット・復習問題をブロック。
-    講評作成は回数が残っていれば可能（本関数は講評作成時には呼ばれない）。"""
+    講評作成は回数が残っていれば可能（本関数は講評作成時には呼ばれない）。
+    estimated_cost_yen を渡した場合は、今回の呼び出し（見積もり）を加えても上限以内かを判定する。"""
     if not is_plan_limits_enabled():
         return
     _raise_if_no_subscription(db, user)
@@ -333,6 +380,11 @@ def check_non_review_cost_limit(db: Session, user: User) -> None:
             status_code=429,
             detail=f"LLM利用額が上限（{max_yen}円）に達しています。講評は回数が残っていれば利用可能です。",
         )
+    if estimated_cost_yen is not None and total + estimated_cost_yen > Decimal(str(max_yen)):
+        raise HTTPException(
+            status_code=429,
+            detail=f"この操作を行うとLLM利用額が上限（{max_yen}円）を超える見込みです。入力を短くするか、講評をご利用ください。",
+        )
 
 
 def get_recent_review_daily_limit(db: Session, user: User) -> Optional[int]:
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+並び順の分数インデックス（辞書順で比較する文字列キー）
+
+- キーは 0-9a-z（36進）の小数部とみなした文字列。末尾は '0' にしない
+- 2つのキーの間には常に新しいキーを作れるため、並べ替えは移動した1行の更新だけで済む
+- 同じ場所への挿入を繰り返すとキーが伸びるので、MAX_RANK_KEY_LENGTH を超えたら
+  呼び出し側でグループ全体を evenly_spaced_keys で振り直す
+
+文字は数字と英小文字のみ（照合順序の違うDBでも並びが変わらないように）。
+"""
+from typing import List, Optional
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+_INDEX = {c: i for i, c in enumerate(DIGITS)}
+
+# これを超える長さのキーができたら振り直す
+MAX_RANK_KEY_LENGTH = 24
+
+
+def _midpoint(a: str, b: Optional[str]) -> str:
+    """a < b となる2つの小数部の中間（b=None は上限なし）"""
+    if b is not None:
+        # 共通の先頭部分はそのまま残す（a が短い場合は '0' で埋めて比較）
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else "0") == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    digit_a = _INDEX[a[0]] if a else 0
+    digit_b = _INDEX[b[0]] if b is not None else BASE
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b) // 2]
+    # 先頭の桁が隣り合っている
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def key_between(before: Optional[str], after: Optional[str]) -> str:
+    """
+    before と after の間に並ぶキーを返す（None は端）。
+    before < after でない場合は ValueError。
+    """
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f"rank keys out of order: {before!r} >= {after!r}")
+    return _midpoint(before or "", after)
+
+
+def evenly_spaced_keys(n: int) -> List[str]:
+    """n 個のキーを等間隔に作る（一括並べ替え・振り直し用）"""
+    if n <= 0:
+        return []
+    width = 1
+    while BASE ** width <= n + 1:
+        width += 1
+    span = BASE ** width
+    keys = []
+    for i in range(n):
+        value = (i + 1) * span // (n + 1)
+        digits = []
+        for _ in range(width):
+            value, r = divmod(value, BASE)
+            digits.append(DIGITS[r])
+        keys.append("".join(reversed(digits)).rstrip("0"))
+    return keys
+
+
+def needs_rebalance(key: str) -> bool:
+    return len(key) > MAX_RANK_KEY_LENGTH
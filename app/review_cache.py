@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+講評結果キャッシュ
+
+- 同一ユーザーが同一内容（モデル・プロンプト・問題・答案）を再提出した場合、LLMを再実行せず既存の講評を返す
+- POST /v1/review の Idempotency-Key ヘッダで再送を識別し、同じ講評を返す
+- 同時に届いた重複リクエストは1回の生成にまとめる（プロセス内の in-flight 管理）
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from .models import Review, ReviewResultCache
+from config.settings import (
+    REVIEW_CACHE_ENABLED,
+    REVIEW_CACHE_TTL_SECONDS,
+    REVIEW_CACHE_HIT_POLICY,
+    REVIEW_IDEMPOTENCY_TTL_SECONDS,
+    REVIEW_INFLIGHT_WAIT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# キャッシュヒット時の方針
+HIT_POLICY_REUSE = "reuse"
+HIT_POLICY_COUNT = "count"
+
+# 評価プロンプトのバージョン（LlmRequest.prompt_version と揃える）
+REVIEW_PROMPT_VERSION = "evaluation_v1"
+
+# プロンプトファイルのハッシュ（path -> (mtime, sha256)）
+_file_digest_cache: Dict[str, Tuple[float, str]] = {}
+
+# 生成中のリクエスト（coalesce_key -> Future[(review_id, submission_id)]）
+_inflight: Dict[str, "asyncio.Future[Tuple[int, Optional[int]]]"] = {}
+
+
+def is_review_cache_enabled() -> bool:
+    return REVIEW_CACHE_ENABLED and REVIEW_CACHE_TTL_SECONDS > 0
+
+
+def get_hit_policy() -> str:
+    """キャッシュヒット時の方針（不正値は reuse 扱い）"""
+    if REVIEW_CACHE_HIT_POLICY == HIT_POLICY_COUNT:
+        return HIT_POLICY_COUNT
+    return HIT_POLICY_REUSE
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _file_digest(path) -> str:
+    """ファイル内容のsha256（mtimeが変わらない限り再計算しない）。無ければ空文字。"""
+    key = str(path)
+    try:
+        mtime = os.path.getmtime(key)
+    except OSError:
+        return ""
+    cached = _file_digest_cache.get(key)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(key, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return ""
+    _file_digest_cache[key] = (mtime, digest)
+    return digest
+
+
+def _subject_guidelines_digest(subject_name: str) -> str:
+    # llm_service._load_subject_guidelines と同じ内容をハッシュする（ファイル解決の差異を避ける）
+    from .llm_service import _load_subject_guidelines
+
+    return _sha256(_load_subject_guidelines(subject_name) or "")
+
+
+def get_review_model_for_cache() -> Optional[str]:
+    """講評に使うモデル名。LLM未設定（ダミー講評）の場合は None（キャッシュしない）。"""
+    from .llm_service import get_llm_config, USE_CASE_REVIEW
+
+    llm_config = get_llm_config()
+    if not llm_config.is_available():
+        return None
+    return llm_config.get_model(USE_CASE_REVIEW)
+
+
+def build_review_cache_key(
+    *,
+    model: str,
+    subject_name: str,
+    question_text: Optional[str],
+    purpose_text: Optional[str],
+    grading_impression_text: Optional[str],
+    marked_answer: str,
+) -> str:
+    """
+    講評キャッシュのキーを生成する。
+
+    プロンプトテンプレート・科目別留意事項はファイル内容のハッシュを含めるため、
+    プロンプトを更新すると自動的に別キーになる。
+    """
+    from .llm_service import PROMPTS_DIR
+
+    template_digest = _file_digest(PROMPTS_DIR / "main" / "evaluation.txt")
+    parts = [
+        REVIEW_PROMPT_VERSION,
+        model or "",
+        template_digest,
+        _subject_guidelines_digest(subject_name),
+        question_text or "",
+        purpose_text or "",
+        grading_impression_text or "",
+        marked_answer or "",
+    ]
+    # 各要素をハッシュしてから連結（区切り文字の衝突を避ける）
+    return _sha256("\n".join(_sha256(p) for p in parts))
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def find_cached_review(db: Session, *, user_id: int, cache_key: str) -> Optional[ReviewResultCache]:
+    """再利用期間内のキャッシュエントリを返す（講評が削除済みなら None）"""
+    if not is_review_cache_enabled():
+        return None
+    since = _utcnow() - timedelta(seconds=REVIEW_CACHE_TTL_SECONDS)
+    return (
+        db.query(ReviewResultCache)
+        .join(Review, ReviewResultCache.review_id == Review.id)
+        .filter(
+            ReviewResultCache.user_id == user_id,
+            ReviewResultCache.cache_key == cache_key,
+            ReviewResultCache.created_at >= since,
+            Review.user_id == user_id,
+        )
+        .order_by(ReviewResultCache.created_at.desc())
+        .first()
+    )
+
+
+def find_idempotent_review(
+    db: Session, *, user_id: int, idempotency_key: str, cache_key: Optional[str]
+) -> Optional[ReviewResultCache]:
+    """
+    Idempotency-Key に対応する既存エントリを返す。
+    同じキーが別内容のリクエストで使われた場合は 422。
+    """
+    if not idempotency_key:
+        return None
+    since = _utcnow() - timedelta(seconds=REVIEW_IDEMPOTENCY_TTL_SECONDS)
+    entry = (
+        db.query(ReviewResultCache)
+        .join(Review, ReviewResultCache.review_id == Review.id)
+        .filter(
+            ReviewResultCache.user_id == user_id,
+            ReviewResultCache.idempotency_key == idempotency_key,
+            ReviewResultCache.created_at >= since,
+        )
+        .order_by(ReviewResultCache.created_at.desc())
+        .first()
+    )
+    if entry and cache_key and entry.cache_key != cache_key:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key が別の内容の講評リクエストで使用されています。",
+        )
+    return entry
+
+
+def mark_hit(db: Session, entry: ReviewResultCache) -> None:
+    """ヒット回数を記録（失敗しても講評の返却は止めない）"""
+    try:
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_hit_at = _utcnow()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"review cache hit update failed: {e}")
+
+
+def store_review_cache(
+    db: Session,
+    *,
+    user_id: int,
+    cache_key: str,
+    review_id: int,
+    submission_id: Optional[int],
+    model: Optional[str],
+    idempotency_key: Optional[str] = None,
+) -> None:
+    """講評の保存後にキャッシュエントリを作成する（失敗しても講評の返却は止めない）"""
+    try:
+        db.add(
+            ReviewResultCache(
+                user_id=user_id,
+                cache_key=cache_key,
+                idempotency_key=idempotency_key or None,
+                review_id=review_id,
+                submission_id=submission_id,
+                model=model,
+                hit_count=0,
+            )
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"review cache store failed: {e}")
+
+
+def load_cached_review_json(review: Review) -> Dict[str, Any]:
+    import json
+
+    if isinstance(review.kouhyo_kekka, str):
+        return json.loads(review.kouhyo_kekka)
+    return review.kouhyo_kekka
+
+
+# ---------- 同時重複リクエストのまとめ（プロセス内） ----------
+
+
+def build_coalesce_key(user_id: int, *, idempotency_key: Optional[str], cache_key: Optional[str]) -> Optional[str]:
+    if idempotency_key:
+        return f"{user_id}:idem:{idempotency_key}"
+    if cache_key:
+        return f"{user_id}:key:{cache_key}"
+    return None
+
+
+def begin_inflight(coalesce_key: Optional[str]) -> Tuple[bool, Optional["asyncio.Future"]]:
+    """
+    生成の開始を登録する。
+
+    Returns:
+        (is_leader, future)
+        - is_leader=True: 自分が生成する（完了時に finish_inflight を呼ぶ）
+        - is_leader=False: 先行リクエストの future を待つ
+    """
+    if not coalesce_key:
+        return True, None
+    fut = _inflight.get(coalesce_key)
+    if fut is not None and not fut.done():
+        return False, fut
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[coalesce_key] = fut
+    return True, fut
+
+
+def finish_inflight(
+    coalesce_key: Optional[str],
+    *,
+    review_id: Optional[int] = None,
+    submission_id: Optional[int] = None,
+    error: Optional[BaseException] = None,
+) -> None:
+    if not coalesce_key:
+        return
+    fut = _inflight.pop(coalesce_key, None)
+    if fut is None or fut.done():
+        return
+    if error is not None or review_id is None:
+        fut.set_exception(
+            error
+            or HTTPException(status_code=500, detail="同じ内容の先行リクエストで講評の生成に失敗しました。再度お試しください。")
+        )
+        # 待機者がいない場合の "Future exception was never retrieved" 警告を抑止
+        fut.exception()
+    else:
+        fut.set_result((review_id, submission_id))
+
+
+async def wait_inflight(fut: "asyncio.Future") -> Tuple[int, Optional[int]]:
+    """先行リクエストの完了を待つ（先行側の失敗はそのまま伝播）"""
+    try:
+        return await asyncio.wait_for(asyncio.shield(fut), timeout=REVIEW_INFLIGHT_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=409,
+            detail="同じ内容の講評を生成中です。しばらく待ってから再度お試しください。",
+        )
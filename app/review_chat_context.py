@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+講評チャット用コンテキストのキャッシュ（プロセス内LRU）
+
+講評チャットの毎ターンで必要になる以下を、講評ごとに1回だけ組み立てて保持する:
+- 問題文・出題趣旨（参考文章）・採点実感・答案（OfficialQuestion / UserReviewHistory の参照）
+- デコード済みの講評JSON
+- 区切り付き答案の段落インデックス（段落番号 → 本文）
+- 段落番号 → 関連する講評項目（strengths / weaknesses / important_points / future_considerations）
+
+§N の参照は辞書引きになり、各ターンの OfficialQuestion / UserReviewHistory の問い合わせが不要になる。
+
+無効化:
+- Review.updated_at をキーの一部にする（講評の更新で自動的に別エントリ）
+- 問題文の更新などは invalidate_review / invalidate_official_question を呼ぶ
+- 念のため REVIEW_CHAT_CONTEXT_CACHE_TTL_SECONDS で期限切れ
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .models import OfficialQuestion, Review, UserReviewHistory
+from config.settings import REVIEW_CHAT_CONTEXT_CACHE_SIZE, REVIEW_CHAT_CONTEXT_CACHE_TTL_SECONDS
+
+# 関連講評の対象キー（get_related_review_json_items と同じ順序）
+RELATED_KEYS = ("strengths", "weaknesses", "important_points", "future_considerations")
+
+
+@dataclass
+class ReviewChatContextBundle:
+    review_id: int
+    official_question_id: Optional[int]
+    question_text: str
+    purpose_text: str
+    grading_impression_text: str
+    review_json_obj: Dict[str, Any]
+    answer_text: str
+    overall_review_json: str
+    # 段落番号 → 本文
+    paragraphs: Dict[int, str] = field(default_factory=dict)
+    # 段落番号 → [(並び順, 講評項目)]
+    related_index: Dict[int, List[Tuple[Tuple[int, int], Dict[str, Any]]]] = field(default_factory=dict)
+
+    def specified_text(self, paragraph_numbers: List[int], window: int = 5, gap_marker: str = "……") -> str:
+        """llm_service.extract_specified_text_from_answer と同じ出力を段落インデックスから作る"""
+        if not paragraph_numbers or not self.paragraphs:
+            return ""
+        max_para = max(self.paragraphs)
+        need = set()
+        for n in paragraph_numbers:
+            need.update(range(max(1, n - window), min(max_para, n + window) + 1))
+        if not need:
+            return ""
+        ordered = sorted(need)
+        parts = []
+        for i, num in enumerate(ordered):
+            if i > 0 and ordered[i - 1] != num - 1:
+                parts.append(gap_marker)
+            if num in self.paragraphs:
+                parts.append(f"§{num}\n{self.paragraphs[num]}")
+        return "\n\n".join(parts)
+
+    def related_items(self, paragraph_numbers: List[int]) -> List[Dict[str, Any]]:
+        """llm_service.get_related_review_json_items と同じ出力を索引から作る"""
+        if not paragraph_numbers:
+            return []
+        found: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        for n in paragraph_numbers:
+            for order, item in self.related_index.get(n, ()):
+                found[order] = item
+        return [found[k] for k in sorted(found)]
+
+
+def _build_related_index(review_json_obj: Dict[str, Any]) -> Dict[int, List[Tuple[Tuple[int, int], Dict[str, Any]]]]:
+    index: Dict[int, List[Tuple[Tuple[int, int], Dict[str, Any]]]] = {}
+    for key_order, key in enumerate(RELATED_KEYS):
+        arr = review_json_obj.get(key) or review_json_obj.get(key.replace("_", "")) or []
+        if not isinstance(arr, list):
+            continue
+        for i, item in enumerate(arr):
+            if not isinstance(item, dict):
+                continue
+            nums = set()
+            listed = item.get("paragraph_numbers") or item.get("paragraphNumbers") or []
+            if isinstance(listed, list):
+                nums.update(x for x in listed if isinstance(x, int))
+            p = item.get("paragraph_number")
+            if isinstance(p, int):
+                nums.add(p)
+            for n in nums:
+                index.setdefault(n, []).append(((key_order, i), item))
+    return index
+
+
+def _load_bundle(db: Session, review: Review) -> ReviewChatContextBundle:
+    from .llm_service import _parse_marked_answer_paragraphs
+
+    try:
+        review_json_obj = json.loads(review.kouhyo_kekka) if isinstance(review.kouhyo_kekka, str) else (review.kouhyo_kekka or {})
+    except Exception:
+        review_json_obj = {}
+    if not isinstance(review_json_obj, dict):
+        review_json_obj = {}
+
+    question_text = review.custom_question_text or ""
+    purpose_text = ""
+    grading_impression_text = ""
+    answer_text = review.answer_text or ""
+
+    if review.official_question_id:
+        official_q = db.query(OfficialQuestion).filter(OfficialQuestion.id == review.official_question_id).first()
+        if official_q:
+            question_text = official_q.text or ""
+            purpose_text = official_q.syutudaisyusi or ""
+            if official_q.shiken_type == "shihou":
+                grading_impression_text = official_q.grading_impression_text or ""
+    else:
+        # custom: UserReviewHistory.reference_text を「参考文章」として使う
+        history = db.query(UserReviewHistory).filter(UserReviewHistory.review_id == review.id).first()
+        if history and history.reference_text:
+            purpose_text = history.reference_text
+
+    overall = review_json_obj.get("overall_review") or {}
+    try:
+        overall_str = json.dumps(overall, ensure_ascii=False, indent=2)
+    except Exception:
+        overall_str = "{}"
+
+    return ReviewChatContextBundle(
+        review_id=review.id,
+        official_question_id=review.official_question_id,
+        question_text=question_text,
+        purpose_text=purpose_text,
+        grading_impression_text=grading_impression_text,
+        review_json_obj=review_json_obj,
+        answer_text=answer_text,
+        overall_review_json=overall_str,
+        paragraphs={n: text for n, text in _parse_marked_answer_paragraphs(answer_text)},
+        related_index=_build_related_index(review_json_obj),
+    )
+
+
+# review_id -> (updated_at, 作成時刻, bundle)
+_cache: "OrderedDict[int, Tuple[Any, float, ReviewChatContextBundle]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_context_bundle(db: Session, review: Review) -> ReviewChatContextBundle:
+    """講評のコンテキストを返す（キャッシュにあればDB問い合わせなし）"""
+    stamp = review.updated_at
+    now = time.time()
+    with _lock:
+        entry = _cache.get(review.id)
+        if entry and entry[0] == stamp and now - entry[1] < REVIEW_CHAT_CONTEXT_CACHE_TTL_SECONDS:
+            _cache.move_to_end(review.id)
+            return entry[2]
+
+    bundle = _load_bundle(db, review)
+    with _lock:
+        _cache[review.id] = (stamp, now, bundle)
+        _cache.move_to_end(review.id)
+        while len(_cache) > REVIEW_CHAT_CONTEXT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return bundle
+
+
+def invalidate_review(review_id: int) -> None:
+    with _lock:
+        _cache.pop(review_id, None)
+
+
+def invalidate_official_question(official_question_id: int) -> None:
+    with _lock:
+        for rid in [rid for rid, (_, _, b) in _cache.items() if b.official_question_id == official_question_id]:
+            _cache.pop(rid, None)
+
+
+def clear() -> None:
+    with _lock:
+        _cache.clear()
@@ -199,6 +199,22 @@ class ShortAnswerAnswerResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class ShortAnswerBulkAnswerItem(BaseModel):
+    problem_id: int
+    selected_answer: str  # "1", "2", "1,2"など
+
+class ShortAnswerBulkAnswerRequest(BaseModel):
+    answers: List[ShortAnswerBulkAnswerItem]
+    complete: bool = False  # Trueならセッションを完了にする
+
+class ShortAnswerBulkAnswerResponse(BaseModel):
+    session_id: int
+    answers: List[ShortAnswerAnswerResponse]  # 今回送信した解答の採点結果
+    total_problems: int  # セッション全体の解答数
+    correct_count: int
+    accuracy: float
+    completed_at: Optional[datetime] = None
+
 # ノート機能関連のスキーマ
 class NotebookCreate(BaseModel):
     subject_id: int  # 科目ID（1-18）
@@ -313,6 +329,42 @@ class UserReviewHistoryResponse(BaseModel):
         from_attributes = True
 
 
+class SearchResultItem(BaseModel):
+    """全文検索の1件"""
+    doc_type: str  # note_page / message / review / official_question
+    doc_id: int
+    parent_id: Optional[int] = None  # note_page: section_id, message: thread_id, review: official_question_id, official_question: subject_id
+    title: Optional[str] = None
+    snippet: str  # 一致箇所を [ ] で囲んだ抜粋
+    score: float  # 関連度（大きいほど関連が高い）
+
+
+class SearchResponse(BaseModel):
+    results: List[SearchResultItem]
+    has_more: bool
+    next_offset: Optional[int] = None
+
+
+class WeeklyStudyStatsItem(BaseModel):
+    """学習分析の週次集計1件（ユーザー × 科目 × 週）"""
+    week_start: str  # 'YYYY-MM-DD'（学習日の週の月曜日）
+    subject: Optional[int] = None  # 科目ID（1-18）。Noneは科目なし（タイマーなど）
+    subject_name: Optional[str] = None
+    review_count: int
+    mean_score: Optional[float] = None
+    best_score: Optional[float] = None
+    short_answer_total: int
+    short_answer_correct: int
+    short_answer_accuracy: Optional[float] = None  # 正答率（%）
+    study_seconds: int
+
+
+class StudyAnalyticsResponse(BaseModel):
+    """学習分析レスポンス"""
+    from_week: str
+    items: List[WeeklyStudyStatsItem]
+
+
 class AdminReviewHistoryItemResponse(BaseModel):
     """管理者用：全ユーザー講評履歴1件（user_id, user_email 付き）"""
     id: int
@@ -469,6 +521,12 @@ class DashboardItemUpdate(BaseModel):
     favorite: Optional[int] = None  # お気に入りフラグ（0=OFF, 1=ON）
     created_at: Optional[str] = None  # 作成日（YYYY-MM-DD）の手動変更用
 
+class DashboardItemReorderRequest(BaseModel):
+    """ダッシュボード項目の一括並べ替え"""
+    dashboard_date: str  # 'YYYY-MM-DD'
+    entry_type: int  # 1=Point, 2=Task, 3=Target
+    ordered_ids: List[int]
+
 class DashboardItemResponse(BaseModel):
     """ダッシュボード項目レスポンス"""
     id: int
@@ -544,6 +602,29 @@ class SaveReviewProblemResponse(BaseModel):
     saved_id: int
 
 
+class ReviewQueueItemResponse(BaseModel):
+    """復習キューの1件（SM-2 の状態 + 表示用の問題）"""
+    item_type: str  # short_answer / saved_review
+    item_id: int
+    subject_id: Optional[int] = None
+    due_at: datetime
+    interval_days: int
+    repetitions: int
+    lapses: int
+    ease_factor: float
+    short_answer_problem: Optional[ShortAnswerProblemResponse] = None  # item_type=short_answer のとき
+    saved_problem: Optional[Dict[str, Any]] = None  # item_type=saved_review のとき（問題文・解答例・参照）
+
+
+class ReviewQueueDueResponse(BaseModel):
+    items: List[ReviewQueueItemResponse]
+    due_count: int  # 期限が来ている件数（今回返していない分も含む）
+
+
+class ReviewQueueGradeRequest(BaseModel):
+    quality: int  # SM-2 の評価（0-5）。3未満は「忘れた」
+
+
 # ============================================================================
 # タイマー関連スキーマ
 # ============================================================================
@@ -594,6 +675,27 @@ class TimerStopResponse(BaseModel):
     sessions: List[TimerSessionResponse]
 
 
+class TimerSyncSessionItem(BaseModel):
+    """オフライン同期するセッション（停止済み）"""
+    id: Optional[str] = None  # クライアントで採番したUUID（再送時の重複防止）。省略時はサーバで採番
+    started_at_utc: datetime
+    ended_at_utc: datetime
+    device_id: Optional[str] = None  # 省略時はリクエストのdevice_id
+
+
+class TimerSyncRequest(BaseModel):
+    """タイマーのオフライン同期リクエスト"""
+    device_id: Optional[str] = None
+    sessions: List[TimerSyncSessionItem]
+
+
+class TimerSyncResponse(BaseModel):
+    """タイマーのオフライン同期レスポンス"""
+    accepted_session_ids: List[str]
+    skipped_session_ids: List[str]  # 登録済みのためスキップしたID
+    daily_stats: List[TimerDailyStatsResponse]  # 影響を受けた学習日の統計
+
+
 # ============================================================================
 # My規範・My論点: 科目別タグマスタ
 # ============================================================================
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+全文検索（SQLite FTS5）
+
+ノート・チャットメッセージ・講評（答案 + 講評結果）・公式問題（問題文 + 出題趣旨 + 採点実感）を
+1つの FTS5 テーブル search_fts にまとめ、元テーブルのトリガーで同期する。
+
+- トークナイザは trigram（日本語は単語区切りがないため、3文字単位の部分一致で引く）
+- rowid = 元テーブルのID * 8 + 種別コード。トリガーからの削除・更新は rowid 指定で O(1)
+- user_id で利用者ごとに絞り込む（公式問題は全員に表示）
+- 3文字未満の語は trigram の索引に載らないため、LIKE の部分一致で絞り込む
+
+FTS5 は SQLite 専用。他のDBでは is_available() が False になり、/v1/search は 503 を返す。
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+FTS_TABLE = "search_fts"
+
+# 種別 -> rowid の下位3ビット
+DOC_TYPES = {
+    "note_page": 1,
+    "message": 2,
+    "review": 3,
+    "official_question": 4,
+}
+
+SNIPPET_TOKENS = 24
+SNIPPET_CHARS = 80
+
+_CREATE_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    title,
+    body,
+    doc_type UNINDEXED,
+    doc_id UNINDEXED,
+    parent_id UNINDEXED,
+    user_id UNINDEXED,
+    tokenize = 'trigram'
+)
+"""
+
+# 種別ごとの (元テーブル, 索引に入れる SELECT 句（NEW./OLD. は {row}）, 更新を監視する列, 対象条件)
+_SOURCES = {
+    "note_page": (
+        "note_pages",
+        "COALESCE({row}.title, ''), COALESCE({row}.content, ''), {row}.section_id, "
+        "(SELECT n.user_id FROM note_sections s JOIN notebooks n ON n.id = s.notebook_id WHERE s.id = {row}.section_id)",
+        "title, content, section_id",
+        "1",
+    ),
+    "message": (
+        "messages",
+        "'', {row}.content, {row}.thread_id, (SELECT t.user_id FROM threads t WHERE t.id = {row}.thread_id)",
+        "content",
+        "{row}.role IN ('user', 'assistant')",
+    ),
+    "review": (
+        "reviews",
+        "COALESCE(substr({row}.custom_question_text, 1, 100), ''), "
+        "COALESCE({row}.answer_text, '') || char(10) || COALESCE({row}.kouhyo_kekka, ''), "
+        "{row}.official_question_id, {row}.user_id",
+        "answer_text, kouhyo_kekka, custom_question_text, user_id",
+        "1",
+    ),
+    "official_question": (
+        "official_questions",
+        "{row}.nendo || ' ' || {row}.shiken_type, "
+        "COALESCE({row}.text, '') || char(10) || COALESCE({row}.syutudaisyusi, '') || char(10) || "
+        "COALESCE({row}.grading_impression_text, ''), {row}.subject_id, NULL",
+        "text, syutudaisyusi, grading_impression_text, status",
+        "{row}.status = 'active'",
+    ),
+}
+
+
+def _insert_sql(doc_type: str, row: str) -> str:
+    table, select, _, cond = _SOURCES[doc_type]
+    code = DOC_TYPES[doc_type]
+    return (
+        f"INSERT INTO {FTS_TABLE} (rowid, title, body, parent_id, user_id, doc_type, doc_id) "
+        f"SELECT {row}.id * 8 + {code}, {select.format(row=row)}, '{doc_type}', {row}.id "
+        f"WHERE {cond.format(row=row)};"
+    )
+
+
+def _delete_sql(doc_type: str, row: str) -> str:
+    return f"DELETE FROM {FTS_TABLE} WHERE rowid = {row}.id * 8 + {DOC_TYPES[doc_type]};"
+
+
+def trigger_ddl() -> List[str]:
+    """元テーブルごとの INSERT / UPDATE / DELETE トリガー"""
+    ddl = []
+    for doc_type, (table, _, watch, _) in _SOURCES.items():
+        ddl.append(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{table}_ai AFTER INSERT ON {table} BEGIN "
+            f"{_insert_sql(doc_type, 'NEW')} END"
+        )
+        ddl.append(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{table}_au AFTER UPDATE OF {watch} ON {table} BEGIN "
+            f"{_delete_sql(doc_type, 'OLD')} {_insert_sql(doc_type, 'NEW')} END"
+        )
+        ddl.append(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{table}_ad AFTER DELETE ON {table} BEGIN "
+            f"{_delete_sql(doc_type, 'OLD')} END"
+        )
+    return ddl
+
+
+def source_tables() -> List[str]:
+    return [table for table, _, _, _ in _SOURCES.values()]
+
+
+def create_index(db: Session) -> None:
+    """FTS5 テーブルとトリガーを作成（冪等。コミットしない）"""
+    db.execute(text(_CREATE_TABLE))
+    for ddl in trigger_ddl():
+        db.execute(text(ddl))
+
+
+def rebuild_index(db: Session, doc_types: Optional[Sequence[str]] = None) -> None:
+    """元テーブルから索引を作り直す（コミットしない）"""
+    for doc_type in doc_types or DOC_TYPES:
+        table, select, _, cond = _SOURCES[doc_type]
+        code = DOC_TYPES[doc_type]
+        db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid % 8 = {code}"))
+        db.execute(text(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, body, parent_id, user_id, doc_type, doc_id) "
+            f"SELECT t.id * 8 + {code}, {select.format(row='t')}, '{doc_type}', t.id "
+            f"FROM {table} t WHERE {cond.format(row='t')}"
+        ))
+
+
+def is_available(db: Session) -> bool:
+    if db.get_bind().dialect.name != "sqlite":
+        return False
+    row = db.execute(
+        text("SELECT name FROM sqlite_master WHERE type='table' AND name=:name"), {"name": FTS_TABLE}
+    ).fetchone()
+    return row is not None
+
+
+def _split_terms(query: str) -> Tuple[List[str], List[str]]:
+    """検索語を (trigram で引ける語, 3文字未満の語) に分ける"""
+    long_terms, short_terms = [], []
+    for term in query.replace("　", " ").split():
+        (long_terms if len(term) >= 3 else short_terms).append(term)
+    return long_terms, short_terms
+
+
+def _like_escape(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _python_snippet(body: str, terms: Sequence[str]) -> str:
+    """MATCH を使わない検索（短い語のみ）のときのスニペット"""
+    pos = -1
+    for term in terms:
+        pos = body.find(term)
+        if pos >= 0:
+            break
+    if pos < 0:
+        return body[:SNIPPET_CHARS]
+    start = max(pos - SNIPPET_CHARS // 2, 0)
+    s = body[start:start + SNIPPET_CHARS]
+    for term in terms:
+        s = s.replace(term, f"[{term}]")
+    return ("…" if start > 0 else "") + s + ("…" if start + SNIPPET_CHARS < len(body) else "")
+
+
+def search(
+    db: Session,
+    user_id: int,
+    query: str,
+    *,
+    doc_types: Optional[Sequence[str]] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    利用者の文書と公式問題を検索し、関連度順に返す
+
+    Returns:
+        (結果, 次のページがあるか)
+    """
+    long_terms, short_terms = _split_terms(query)
+    if not long_terms and not short_terms:
+        return [], False
+
+    params: Dict[str, Any] = {"user_id": user_id, "limit": limit + 1, "offset": offset}
+    where = ["(user_id = :user_id OR doc_type = 'official_question')"]
+    if long_terms:
+        # 各語をフレーズとして AND 検索（" は2つ重ねてエスケープ）
+        params["match"] = " AND ".join('"' + t.replace('"', '""') + '"' for t in long_terms)
+        where.append(f"{FTS_TABLE} MATCH :match")
+    for i, term in enumerate(short_terms):
+        params[f"like{i}"] = f"%{_like_escape(term)}%"
+        where.append(f"(body LIKE :like{i} ESCAPE '\\' OR title LIKE :like{i} ESCAPE '\\')")
+    if doc_types:
+        names = [t for t in doc_types if t in DOC_TYPES]
+        if not names:
+            return [], False
+        where.append("doc_type IN (" + ", ".join(f"'{t}'" for t in names) + ")")
+
+    if long_terms:
+        select = (
+            f"snippet({FTS_TABLE}, 1, '[', ']', '…', {SNIPPET_TOKENS}) AS snippet, bm25({FTS_TABLE}) AS score"
+        )
+        order = "score"
+    else:
+        select = "body AS snippet, 0.0 AS score"
+        order = "rowid DESC"
+    sql = (
+        f"SELECT doc_type, doc_id, parent_id, title, {select} "
+        f"FROM {FTS_TABLE} WHERE {' AND '.join(where)} "
+        f"ORDER BY {order} LIMIT :limit OFFSET :offset"
+    )
+    rows = db.execute(text(sql), params).fetchall()
+
+    results = []
+    for doc_type, doc_id, parent_id, title, snippet, score in rows[:limit]:
+        if not long_terms:
+            snippet = _python_snippet(snippet or "", short_terms)
+        results.append({
+            "doc_type": doc_type,
+            "doc_id": int(doc_id),
+            "parent_id": int(parent_id) if parent_id is not None else None,
+            "title": title or None,
+            "snippet": snippet,
+            "score": -float(score) if score else 0.0,
+        })
+    return results, len(rows) > limit
@@ -16,6 +16,7 @@ sys.path.insert(0, str(BASE_DIR))
 
 from app.db import SessionLocal, engine
 from app.models import Base, SubscriptionPlan
+from app.plan_limits import invalidate_all_user_plans
 
 PLAN_DEFINITIONS = [
     {
@@ -106,6 +107,8 @@ def seed_subscription_plans():
                 db.add(plan)
                 logger.info(f"Created SubscriptionPlan: plan_code={p['plan_code']}, name={p['name']}")
         db.commit()
+        # プラン定義が変わったので、キャッシュ済みの適用プランを捨てる（共有キャッシュ利用時は稼働中のワーカーにも反映）
+        invalidate_all_user_plans()
     finally:
         db.close()
 
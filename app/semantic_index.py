@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+関連箇所の検索（チャットのコンテキスト用）
+
+公式問題（問題文・出題趣旨・採点実感）と、ユーザー自身の過去の講評を数百文字の抜粋に分け、
+ハッシュ化した文字 n-gram（2-gram・3-gram）のベクトルで表す。チャットの発話に近い抜粋だけを
+トークン予算内で渡し、12,000文字のブロックを丸ごと送らずに済ませる。
+
+- 埋め込みモデルは使わない（CPUのみ・追加のモデルファイル不要）。日本語は文字 n-gram で十分に近さが取れる
+- ベクトルは L2 正規化済みなので、内積 = コサイン類似度。上位k件は argpartition で取る
+- 公式問題の行列は SEMANTIC_INDEX_DIR にメモリマップで保存し、ワーカー間でページキャッシュを共有する
+  （active な公式問題の件数・最終更新日時が変わったら作り直す）
+- 過去の講評はユーザーごとに小さいので、プロセス内の LRU に行列を持つ
+
+numpy がない環境では is_available() が False になり、検索結果は常に空になる。
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+from config.settings import (
+    SEMANTIC_INDEX_CHECK_SECONDS,
+    SEMANTIC_INDEX_DIM,
+    SEMANTIC_INDEX_DIR,
+    SEMANTIC_MIN_SCORE,
+)
+from config.subjects import get_subject_name
+from .models import OfficialQuestion, Review
+from .token_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+PASSAGE_CHARS = 500
+PASSAGE_OVERLAP = 100
+USER_INDEX_CACHE_SIZE = 128
+
+_SPACE_RE = re.compile(r"\s+")
+
+FIELD_LABELS = {
+    "text": "問題文",
+    "syutudaisyusi": "出題趣旨",
+    "grading_impression_text": "採点実感",
+    "review": "講評",
+}
+
+
+def is_available() -> bool:
+    return np is not None
+
+
+# ----------------------------------------------------------------------------
+# ベクトル化
+# ----------------------------------------------------------------------------
+
+def _normalize(text: str) -> str:
+    return _SPACE_RE.sub(" ", unicodedata.normalize("NFKC", text or "").lower()).strip()
+
+
+def embed(texts: Sequence[str], dim: int = SEMANTIC_INDEX_DIM) -> "np.ndarray":
+    """文字 2-gram / 3-gram を符号付きハッシュで dim 次元に写し、L2 正規化した行列（float32）"""
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, raw in enumerate(texts):
+        text = _normalize(raw)
+        counts: Dict[int, float] = {}
+        for n in (2, 3):
+            for i in range(len(text) - n + 1):
+                gram = text[i:i + n]
+                if " " in gram:
+                    continue
+                h = zlib.crc32(gram.encode("utf-8"))
+                idx = h % dim
+                counts[idx] = counts.get(idx, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+        if not counts:
+            continue
+        idxs = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        vals = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        # 長い抜粋で頻出語が支配しないよう、出現回数は対数で効かせる
+        out[row, idxs] = np.sign(vals) * np.log1p(np.abs(vals))
+        norm = float(np.linalg.norm(out[row]))
+        if norm > 0:
+            out[row] /= norm
+    return out
+
+
+def split_passages(text: str, max_chars: int = PASSAGE_CHARS, overlap: int = PASSAGE_OVERLAP) -> List[str]:
+    """段落（空行・改行）を詰めて max_chars 以下の抜粋に分ける。長い段落は overlap 文字重ねて切る"""
+    passages: List[str] = []
+    buf = ""
+    for para in re.split(r"\n\s*\n|\n", text or ""):
+        para = para.strip()
+        if not para:
+            continue
+        if len(para) > max_chars:
+            if buf:
+                passages.append(buf)
+                buf = ""
+            step = max_chars - overlap
+            for start in range(0, len(para), step):
+                passages.append(para[start:start + max_chars])
+                if start + max_chars >= len(para):
+                    break
+            continue
+        if buf and len(buf) + 1 + len(para) > max_chars:
+            passages.append(buf)
+            buf = para
+        else:
+            buf = f"{buf}\n{para}" if buf else para
+    if buf:
+        passages.append(buf)
+    return passages
+
+
+# ----------------------------------------------------------------------------
+# 索引
+# ----------------------------------------------------------------------------
+
+@dataclass
+class Passage:
+    source: str  # official_question / review
+    source_id: int
+    field: str  # text / syutudaisyusi / grading_impression_text / review
+    label: str  # 表示用の出典
+    subject_id: Optional[int]
+    text: str
+
+
+class VectorIndex:
+    """抜粋と、その行列（行 = 抜粋）"""
+
+    def __init__(self, passages: List[Passage], matrix: "np.ndarray"):
+        self.passages = passages
+        self.matrix = matrix
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def search(self, qvec: "np.ndarray", k: int, mask: Optional["np.ndarray"] = None) -> List[Tuple[float, int]]:
+        """コサイン類似度の上位 k 件 [(score, 行番号)]"""
+        if not self.passages or k <= 0:
+            return []
+        scores = self.matrix @ qvec
+        if mask is not None:
+            scores = np.where(mask, scores, -1.0)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top if scores[i] > -1.0]
+
+    @classmethod
+    def build(cls, passages: List[Passage]) -> "VectorIndex":
+        return cls(passages, embed([p.text for p in passages]))
+
+    def save(self, directory: str, signature: List[str]) -> None:
+        """行列は生の float32、抜粋は JSON Lines で保存（書き込み後に置き換え）"""
+        os.makedirs(directory, exist_ok=True)
+        tmp = f".tmp{os.getpid()}"
+        vec_path = os.path.join(directory, "vectors.f32")
+        meta_path = os.path.join(directory, "meta.json")
+        passages_path = os.path.join(directory, "passages.jsonl")
+        np.ascontiguousarray(self.matrix, dtype=np.float32).tofile(vec_path + tmp)
+        with open(passages_path + tmp, "w", encoding="utf-8") as f:
+            for p in self.passages:
+                f.write(json.dumps(asdict(p), ensure_ascii=False) + "\n")
+        with open(meta_path + tmp, "w", encoding="utf-8") as f:
+            json.dump({"signature": signature, "dim": self.matrix.shape[1], "count": len(self.passages)}, f)
+        os.replace(vec_path + tmp, vec_path)
+        os.replace(passages_path + tmp, passages_path)
+        os.replace(meta_path + tmp, meta_path)
+
+    @classmethod
+    def load(cls, directory: str, signature: List[str]) -> Optional["VectorIndex"]:
+        """保存済みの索引をメモリマップで開く（署名・次元が違えば None）"""
+        try:
+            with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("signature") != signature or meta.get("dim") != SEMANTIC_INDEX_DIM:
+                return None
+            with open(os.path.join(directory, "passages.jsonl"), encoding="utf-8") as f:
+                passages = [Passage(**json.loads(line)) for line in f if line.strip()]
+            if len(passages) != meta.get("count"):
+                return None
+            if not passages:
+                return cls([], np.zeros((0, SEMANTIC_INDEX_DIM), dtype=np.float32))
+            matrix = np.memmap(
+                os.path.join(directory, "vectors.f32"), dtype=np.float32, mode="r",
+                shape=(len(passages), SEMANTIC_INDEX_DIM),
+            )
+            return cls(passages, matrix)
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+
+
+# ----------------------------------------------------------------------------
+# 公式問題の索引（共有・メモリマップ）
+# ----------------------------------------------------------------------------
+
+_official_index: Optional[VectorIndex] = None
+_official_signature: Optional[List[str]] = None
+_official_checked_at = 0.0
+_official_lock = threading.Lock()
+
+
+def _official_label(q: OfficialQuestion, field: str) -> str:
+    exam = "司法試験" if q.shiken_type == "shihou" else "予備試験"
+    return f"{q.nendo}年 {exam} {get_subject_name(q.subject_id)} {FIELD_LABELS[field]}"
+
+
+def _official_signature_of(db: Session) -> List[str]:
+    row = db.query(
+        func.count(OfficialQuestion.id), func.max(OfficialQuestion.id), func.max(OfficialQuestion.updated_at)
+    ).filter(OfficialQuestion.status == "active").one()
+    return [str(v) for v in row]
+
+
+def _build_official(db: Session) -> VectorIndex:
+    passages: List[Passage] = []
+    for q in db.query(OfficialQuestion).filter(OfficialQuestion.status == "active").order_by(OfficialQuestion.id).yield_per(200):
+        for field in ("text", "syutudaisyusi", "grading_impression_text"):
+            for chunk in split_passages(getattr(q, field) or ""):
+                passages.append(Passage("official_question", q.id, field, _official_label(q, field), q.subject_id, chunk))
+    return VectorIndex.build(passages)
+
+
+def get_official_index(db: Session) -> Optional[VectorIndex]:
+    """公式問題の索引（保存済みならメモリマップで開き、更新があれば作り直す）"""
+    global _official_index, _official_signature, _official_checked_at
+    if np is None:
+        return None
+    now = time.time()
+    if _official_index is not None and now - _official_checked_at < SEMANTIC_INDEX_CHECK_SECONDS:
+        return _official_index
+    with _official_lock:
+        if _official_index is not None and now - _official_checked_at < SEMANTIC_INDEX_CHECK_SECONDS:
+            return _official_index
+        signature = _official_signature_of(db)
+        if _official_index is None or signature != _official_signature:
+            index = VectorIndex.load(SEMANTIC_INDEX_DIR, signature)
+            if index is None:
+                started = time.time()
+                index = _build_official(db)
+                try:
+                    index.save(SEMANTIC_INDEX_DIR, signature)
+                    # 保存したファイルを開き直してメモリマップにする
+                    index = VectorIndex.load(SEMANTIC_INDEX_DIR, signature) or index
+                except OSError as e:
+                    logger.warning(f"Semantic index save failed: {e}")
+                logger.info(f"Semantic index built: {len(index)} passages in {time.time() - started:.1f}s")
+            _official_index = index
+            _official_signature = signature
+        _official_checked_at = now
+        return _official_index
+
+
+# ----------------------------------------------------------------------------
+# ユーザーの過去の講評（プロセス内 LRU）
+# ----------------------------------------------------------------------------
+
+_user_indexes: "OrderedDict[int, Tuple[List[str], VectorIndex]]" = OrderedDict()
+_user_lock = threading.Lock()
+
+
+def _review_strings(value: Any) -> Iterable[str]:
+    """講評JSONから文章だけを取り出す"""
+    if isinstance(value, str):
+        if len(value) >= 10:
+            yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _review_strings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _review_strings(v)
+
+
+def _build_user_reviews(db: Session, user_id: int) -> VectorIndex:
+    from .models import UserReviewHistory
+
+    subjects = dict(
+        db.query(UserReviewHistory.review_id, UserReviewHistory.subject).filter(UserReviewHistory.user_id == user_id).all()
+    )
+    passages: List[Passage] = []
+    rows = db.query(Review.id, Review.created_at, Review.kouhyo_kekka).filter(Review.user_id == user_id).order_by(Review.id)
+    for review_id, created_at, kouhyo_kekka in rows.yield_per(200):
+        try:
+            obj = json.loads(kouhyo_kekka) if isinstance(kouhyo_kekka, str) else (kouhyo_kekka or {})
+        except Exception:
+            continue
+        subject_id = subjects.get(review_id)
+        parts = [created_at.strftime("%Y-%m-%d") if created_at else "", get_subject_name(subject_id) if subject_id else ""]
+        label = f"過去の講評（{' '.join(p for p in parts if p)}）"
+        for chunk in split_passages("\n".join(_review_strings(obj))):
+            passages.append(Passage("review", review_id, "review", label, subject_id, chunk))
+    return VectorIndex.build(passages)
+
+
+def get_user_review_index(db: Session, user_id: int) -> Optional[VectorIndex]:
+    """ユーザーの過去の講評の索引（講評の件数・最終更新日時が変わったら作り直す）"""
+    if np is None:
+        return None
+    row = db.query(func.count(Review.id), func.max(Review.updated_at)).filter(Review.user_id == user_id).one()
+    signature = [str(v) for v in row]
+    with _user_lock:
+        entry = _user_indexes.get(user_id)
+        if entry and entry[0] == signature:
+            _user_indexes.move_to_end(user_id)
+            return entry[1]
+    index = _build_user_reviews(db, user_id)
+    with _user_lock:
+        _user_indexes[user_id] = (signature, index)
+        _user_indexes.move_to_end(user_id)
+        while len(_user_indexes) > USER_INDEX_CACHE_SIZE:
+            _user_indexes.popitem(last=False)
+    return index
+
+
+# ----------------------------------------------------------------------------
+# 検索
+# ----------------------------------------------------------------------------
+
+def _take_within_budget(scored: List[Tuple[float, Passage]], token_budget: int) -> List[Tuple[float, Passage]]:
+    """類似度順に、重複を除いてトークン予算に収まるだけ取る"""
+    picked: List[Tuple[float, Passage]] = []
+    seen = set()
+    used = 0
+    for score, p in sorted(scored, key=lambda x: -x[0]):
+        if score < SEMANTIC_MIN_SCORE:
+            break
+        key = (p.source, p.source_id, p.text)
+        if key in seen:
+            continue
+        cost = count_tokens(p.label) + count_tokens(p.text) + 8
+        if used + cost > token_budget:
+            continue
+        seen.add(key)
+        picked.append((score, p))
+        used += cost
+    return picked
+
+
+def retrieve(
+    db: Session,
+    user_id: int,
+    query: str,
+    token_budget: int,
+    *,
+    k: int = 12,
+    subject_id: Optional[int] = None,
+    include_official: bool = True,
+    include_reviews: bool = True,
+) -> List[Tuple[float, Passage]]:
+    """公式問題と自分の過去の講評から、query に近い抜粋をトークン予算内で返す"""
+    if np is None or not (query or "").strip() or token_budget <= 0:
+        return []
+    qvec = embed([query])[0]
+    if not qvec.any():
+        return []
+    scored: List[Tuple[float, Passage]] = []
+    indexes = []
+    if include_official:
+        indexes.append(get_official_index(db))
+    if include_reviews:
+        indexes.append(get_user_review_index(db, user_id))
+    for index in indexes:
+        if index is None or not len(index):
+            continue
+        mask = None
+        if subject_id:
+            mask = np.fromiter((p.subject_id == subject_id for p in index.passages), dtype=bool, count=len(index))
+        scored.extend((score, index.passages[i]) for score, i in index.search(qvec, k, mask))
+    return _take_within_budget(scored, token_budget)
+
+
+def rank_texts(query: str, sources: Sequence[Tuple[str, str]], token_budget: int, k: int = 8) -> List[Tuple[float, Passage]]:
+    """索引を使わず、渡された文章（(見出し, 本文)）の抜粋を query に近い順にトークン予算内で返す"""
+    if np is None or not (query or "").strip() or token_budget <= 0:
+        return []
+    passages = [
+        Passage("text", 0, label, label, None, chunk)
+        for label, text in sources
+        for chunk in split_passages(text)
+    ]
+    if not passages:
+        return []
+    index = VectorIndex.build(passages)
+    hits = index.search(embed([query])[0], k)
+    return _take_within_budget([(score, index.passages[i]) for score, i in hits], token_budget)
+
+
+def format_passages(hits: List[Tuple[float, Passage]]) -> str:
+    return "\n\n".join(f"〔{p.label}〕\n{p.text}" for _, p in hits)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+短答式問題バンク（プロセス内に1回だけ読み込む参照データ）
+
+short_answer_problems は取り込みスクリプトでしか変わらないため、全件をフィールドごとの配列で保持し、
+一覧・ランダム出題・採点をDB問い合わせなしで行う。
+
+- 行は DB と同じ並び（year 降順, question_number 昇順）で配列に入れ、位置（pos）で参照する
+- (exam_type, year, subject) -> 位置の配列 の索引で絞り込む（位置は昇順 = 表示順）
+- 正解は選択肢番号のビットマスク（"1,3" -> 0b101）で持ち、採点は整数比較だけ
+- 応答用の dict は初回参照時に作って保持する
+
+再読み込み:
+- SHORT_ANSWER_BANK_CHECK_SECONDS ごとに (件数, 最大ID, 最終更新日時) を確認し、変わっていれば読み直す
+  （取り込みスクリプトは別プロセスなので、テーブルの変化で検知する）
+- 同一プロセス内で問題を更新した場合は invalidate() を呼ぶ
+"""
+import random
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config.settings import SHORT_ANSWER_BANK_CHECK_SECONDS
+from config.subjects import get_subject_name
+from .models import ShortAnswerProblem
+
+# 選択肢として解釈できない解答のマスク（どの正解とも一致しない）
+INVALID_MASK = -1
+
+
+def answer_mask(answer: Optional[str]) -> int:
+    """'1,3' のような解答を選択肢番号のビットマスクにする（順序・空白・重複は無視）"""
+    mask = 0
+    for token in (answer or "").split(","):
+        token = token.strip()
+        if not token:
+            continue
+        if not token.isdigit() or not (1 <= int(token) <= 30):
+            return INVALID_MASK
+        mask |= 1 << (int(token) - 1)
+    return mask if mask else INVALID_MASK
+
+
+class ShortAnswerBank:
+    """短答式問題の全件（フィールドごとの配列）"""
+
+    def __init__(self, problems: Sequence[ShortAnswerProblem], signature: Tuple[Any, ...]):
+        self.signature = signature
+        n = len(problems)
+        self.ids = array("l", (p.id for p in problems))
+        self.question_numbers = array("l", (p.question_number for p in problems))
+        self.subjects = array("b", (p.subject or 0 for p in problems))
+        self.correct_masks = array("l", (answer_mask(p.correct_answer) for p in problems))
+        # 文字列は種類が少ないので同じオブジェクトを共有する
+        exam_types: Dict[str, str] = {}
+        years: Dict[str, str] = {}
+        self.exam_types = [exam_types.setdefault(p.exam_type, p.exam_type) for p in problems]
+        self.years = [years.setdefault(p.year, p.year) for p in problems]
+        self.question_texts = [p.question_text for p in problems]
+        self.choices = [(p.choice_1, p.choice_2, p.choice_3, p.choice_4) for p in problems]
+        self.correct_answers = [p.correct_answer for p in problems]
+        self.correctness_patterns = [p.correctness_pattern for p in problems]
+        self.source_pdfs = [p.source_pdf for p in problems]
+        self.created_ats = [p.created_at for p in problems]
+        self.updated_ats = [p.updated_at for p in problems]
+
+        self.pos_by_id: Dict[int, int] = {pid: i for i, pid in enumerate(self.ids)}
+        self._index: Dict[Tuple[str, str, int], array] = {}
+        for i in range(n):
+            key = (self.exam_types[i], self.years[i], self.subjects[i])
+            self._index.setdefault(key, array("l")).append(i)
+        self._dicts: List[Optional[Dict[str, Any]]] = [None] * n
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def filter(self, exam_type: Optional[str] = None, year: Optional[str] = None, subject: Optional[int] = None) -> List[int]:
+        """条件に合う問題の位置（表示順）。None の条件は絞り込まない"""
+        matched: List[int] = []
+        groups = 0
+        for (e, y, s), positions in self._index.items():
+            if (exam_type is None or e == exam_type) and (year is None or y == year) and (subject is None or s == subject):
+                matched.extend(positions)
+                groups += 1
+        if groups > 1:
+            matched.sort()
+        return matched
+
+    def random_positions(self, count: int, rng: Optional[random.Random] = None, **filters: Any) -> List[int]:
+        """条件に合う問題から count 件を重複なしで選ぶ（出題順はランダム）"""
+        candidates = self.filter(**filters)
+        return (rng or random).sample(candidates, min(count, len(candidates)))
+
+    def position(self, problem_id: int) -> Optional[int]:
+        return self.pos_by_id.get(problem_id)
+
+    def grade(self, pos: int, selected_answer: str) -> bool:
+        mask = answer_mask(selected_answer)
+        return mask != INVALID_MASK and mask == self.correct_masks[pos]
+
+    def grade_many(self, items: Iterable[Tuple[int, str]]) -> List[Optional[bool]]:
+        """[(problem_id, selected_answer)] を採点（存在しない問題は None）"""
+        result: List[Optional[bool]] = []
+        for problem_id, selected_answer in items:
+            pos = self.pos_by_id.get(problem_id)
+            result.append(None if pos is None else self.grade(pos, selected_answer))
+        return result
+
+    def problem_dict(self, pos: int) -> Dict[str, Any]:
+        """ShortAnswerProblemResponse と同じ形の dict（作成後は使い回す）"""
+        d = self._dicts[pos]
+        if d is None:
+            subject = self.subjects[pos] or None
+            choice_1, choice_2, choice_3, choice_4 = self.choices[pos]
+            d = {
+                "id": self.ids[pos],
+                "exam_type": self.exam_types[pos],
+                "year": self.years[pos],
+                "subject": subject,  # 科目ID（1-18）
+                "subject_name": get_subject_name(subject),  # 科目名（表示用）
+                "question_number": self.question_numbers[pos],
+                "question_text": self.question_texts[pos],
+                "choice_1": choice_1,
+                "choice_2": choice_2,
+                "choice_3": choice_3,
+                "choice_4": choice_4,
+                "correct_answer": self.correct_answers[pos],
+                "correctness_pattern": self.correctness_patterns[pos],
+                "source_pdf": self.source_pdfs[pos],
+                "created_at": self.created_ats[pos],
+                "updated_at": self.updated_ats[pos],
+            }
+            self._dicts[pos] = d
+        return d
+
+
+def _signature(db: Session) -> Tuple[Any, ...]:
+    row = db.query(
+        func.count(ShortAnswerProblem.id),
+        func.max(ShortAnswerProblem.id),
+        func.max(ShortAnswerProblem.updated_at),
+    ).one()
+    return tuple(str(v) for v in row)
+
+
+def _load(db: Session, signature: Tuple[Any, ...]) -> ShortAnswerBank:
+    problems = (
+        db.query(ShortAnswerProblem)
+        .order_by(ShortAnswerProblem.year.desc(), ShortAnswerProblem.question_number, ShortAnswerProblem.id)
+        .all()
+    )
+    bank = ShortAnswerBank(problems, signature)
+    # 読み込んだ行はバンクに写したので、セッションに残さない
+    for p in problems:
+        db.expunge(p)
+    return bank
+
+
+_bank: Optional[ShortAnswerBank] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_bank(db: Session) -> ShortAnswerBank:
+    """問題バンクを返す（未読み込み・テーブル変更時は読み込む）"""
+    global _bank, _checked_at
+    now = time.time()
+    bank = _bank
+    if bank is not None and now - _checked_at < SHORT_ANSWER_BANK_CHECK_SECONDS:
+        return bank
+    with _lock:
+        if _bank is not None and now - _checked_at < SHORT_ANSWER_BANK_CHECK_SECONDS:
+            return _bank
+        signature = _signature(db)
+        if _bank is None or _bank.signature != signature:
+            _bank = _load(db, signature)
+        _checked_at = now
+        return _bank
+
+
+def invalidate() -> None:
+    """次回の get_bank で読み直す"""
+    global _bank
+    with _lock:
+        _bank = None
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+間隔反復（SM-2）による復習スケジュール
+
+- 復習対象: 短答の問題（short_answer）と保存済みの復習問題（saved_review）
+- 解答のたびに review_schedule_items の1行を SM-2 で更新する（履歴全体は読まない）
+- 「次に復習するN問」は (user_id, due_at) インデックスの範囲検索1回で取る
+
+評価（quality）は SM-2 の 0-5:
+- 短答は自動採点の結果から QUALITY_CORRECT / QUALITY_INCORRECT を使う
+- 保存済みの復習問題はユーザーの自己評価
+- 3未満は「忘れた」扱いで連続正解数をリセットし、翌日に再出題
+
+復習対象の削除（保存元の復習セッション削除による CASCADE、短答の再取り込み等）は
+キューの行に伝わらないため、due_items / count_due は対象が存在する行だけを SQL で数える。
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import Session
+
+from .models import ReviewScheduleItem, SavedReviewProblem, ShortAnswerProblem
+
+UTC = ZoneInfo("UTC")
+
+ITEM_SHORT_ANSWER = "short_answer"
+ITEM_SAVED_REVIEW = "saved_review"
+ITEM_TYPES = (ITEM_SHORT_ANSWER, ITEM_SAVED_REVIEW)
+
+QUALITY_CORRECT = 4
+QUALITY_INCORRECT = 1
+
+MIN_EASE_FACTOR = 1.3
+DEFAULT_EASE_FACTOR = 2.5
+MAX_INTERVAL_DAYS = 365
+
+
+def apply_sm2(item: ReviewScheduleItem, quality: int, now: datetime) -> None:
+    """SM-2 で1回分の復習結果を反映"""
+    quality = max(0, min(5, int(quality)))
+    ease = item.ease_factor or DEFAULT_EASE_FACTOR
+    repetitions = item.repetitions or 0
+    interval = item.interval_days or 0
+
+    if quality < 3:
+        repetitions = 0
+        interval = 1
+        item.lapses = (item.lapses or 0) + 1
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = max(int(round(interval * ease)), interval + 1)
+    ease += 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+
+    item.ease_factor = max(MIN_EASE_FACTOR, round(ease, 4))
+    item.repetitions = repetitions
+    item.interval_days = min(interval, MAX_INTERVAL_DAYS)
+    item.last_quality = quality
+    item.last_reviewed_at = now
+    item.due_at = now + timedelta(days=item.interval_days)
+
+
+def _new_item(user_id: int, item_type: str, item_id: int, subject_id: Optional[int], now: datetime) -> ReviewScheduleItem:
+    return ReviewScheduleItem(
+        user_id=user_id,
+        item_type=item_type,
+        item_id=item_id,
+        subject_id=subject_id,
+        ease_factor=DEFAULT_EASE_FACTOR,
+        interval_days=0,
+        repetitions=0,
+        lapses=0,
+        due_at=now,
+    )
+
+
+def _load_items(db: Session, user_id: int, item_type: str, item_ids: List[int]) -> Dict[int, ReviewScheduleItem]:
+    if not item_ids:
+        return {}
+    rows = db.query(ReviewScheduleItem).filter(
+        ReviewScheduleItem.user_id == user_id,
+        ReviewScheduleItem.item_type == item_type,
+        ReviewScheduleItem.item_id.in_(item_ids),
+    ).all()
+    return {r.item_id: r for r in rows}
+
+
+def record_reviews(
+    db: Session,
+    user_id: int,
+    item_type: str,
+    results: Iterable[Tuple[int, int, Optional[int]]],
+    now: Optional[datetime] = None,
+) -> List[ReviewScheduleItem]:
+    """
+    復習結果をまとめて反映（既存行は1回の問い合わせで取得。コミットしない）
+
+    Args:
+        results: [(item_id, quality, subject_id)]
+    """
+    now = now or datetime.now(UTC)
+    results = list(results)
+    items = _load_items(db, user_id, item_type, [item_id for item_id, _, _ in results])
+    updated = []
+    for item_id, quality, subject_id in results:
+        item = items.get(item_id)
+        if item is None:
+            item = items[item_id] = _new_item(user_id, item_type, item_id, subject_id, now)
+            db.add(item)
+        elif subject_id is not None:
+            item.subject_id = subject_id
+        apply_sm2(item, quality, now)
+        updated.append(item)
+    return updated
+
+
+def enqueue(
+    db: Session,
+    user_id: int,
+    item_type: str,
+    item_id: int,
+    subject_id: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> ReviewScheduleItem:
+    """未学習の対象をキューに入れる（すぐに出題対象。登録済みなら何もしない。コミットしない）"""
+    now = now or datetime.now(UTC)
+    item = _load_items(db, user_id, item_type, [item_id]).get(item_id)
+    if item is None:
+        item = _new_item(user_id, item_type, item_id, subject_id, now)
+        db.add(item)
+    return item
+
+
+def _target_exists():
+    """復習対象（短答の問題 / 本人の保存済み復習問題）がまだ存在する行の条件"""
+    return or_(
+        and_(
+            ReviewScheduleItem.item_type == ITEM_SHORT_ANSWER,
+            exists().where(ShortAnswerProblem.id == ReviewScheduleItem.item_id),
+        ),
+        and_(
+            ReviewScheduleItem.item_type == ITEM_SAVED_REVIEW,
+            exists().where(
+                SavedReviewProblem.id == ReviewScheduleItem.item_id,
+                SavedReviewProblem.user_id == ReviewScheduleItem.user_id,
+            ),
+        ),
+    )
+
+
+def due_items(
+    db: Session,
+    user_id: int,
+    *,
+    limit: int = 20,
+    item_type: Optional[str] = None,
+    subject_id: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> List[ReviewScheduleItem]:
+    """期限が来た復習対象を期限の古い順に最大 limit 件（インデックスの範囲検索1回。削除済みの対象は除く）"""
+    now = now or datetime.now(UTC)
+    q = db.query(ReviewScheduleItem).filter(
+        ReviewScheduleItem.user_id == user_id,
+        ReviewScheduleItem.due_at <= now,
+        _target_exists(),
+    )
+    if item_type:
+        q = q.filter(ReviewScheduleItem.item_type == item_type)
+    if subject_id:
+        q = q.filter(ReviewScheduleItem.subject_id == subject_id)
+    return q.order_by(ReviewScheduleItem.due_at, ReviewScheduleItem.id).limit(limit).all()
+
+
+def count_due(db: Session, user_id: int, now: Optional[datetime] = None) -> int:
+    now = now or datetime.now(UTC)
+    return db.query(ReviewScheduleItem.id).filter(
+        ReviewScheduleItem.user_id == user_id,
+        ReviewScheduleItem.due_at <= now,
+        _target_exists(),
+    ).count()
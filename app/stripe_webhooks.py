@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Stripe Webhook の受信箱（stripe_webhook_events）と反映 worker
+
+流れ:
+1. Webhook は署名検証後に store_event でイベントを保存して即応答する（Stripe API は呼ばない）
+   - event_id の一意制約で、再送されたイベントは保存されない（2回目以降は何もしない）
+2. worker（process_pending）が受信順に1件ずつ取り出し、handler(db, event) で反映する
+   - handler は同期関数（Stripe SDK はブロッキング）。API 側ではスレッドプールで実行し、イベントループを止めない
+   - 失敗したら STRIPE_WEBHOOK_RETRY_BASE_SECONDS から倍々（最大1時間）で再試行
+   - STRIPE_WEBHOOK_MAX_ATTEMPTS 回失敗したら dead にして残す（CLI の retry で再投入）
+3. 取り出しは status を条件にした UPDATE で行うため、複数プロセスで worker が動いても二重に処理しない
+   - processing のまま LOCK_TIMEOUT_SECONDS 経過した行（処理中にプロセスが落ちた等）は取り直す
+4. 同じ顧客（ordering_key）のイベントは受信順を守る
+   - より古いイベントが pending（再試行待ちを含む）/ processing の間は、後のイベントを取り出さない
+   - dead になった古いイベントは待たない（retry で再投入すると、それより後のイベントとは順序が前後する）
+
+ローカルの代替サーバー（stripe-mock 等）で検証する場合は STRIPE_API_BASE を指定する（config/settings.py）。
+
+CLI:
+    python -m app.stripe_webhooks list [--status dead]
+    python -m app.stripe_webhooks retry evt_xxx [evt_yyy ...]
+"""
+import asyncio
+import json
+import logging
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import Session, aliased
+
+from .models import StripeWebhookEvent
+from config.settings import (
+    STRIPE_WEBHOOK_MAX_ATTEMPTS,
+    STRIPE_WEBHOOK_POLL_INTERVAL_SECONDS,
+    STRIPE_WEBHOOK_RETRY_BASE_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_PROCESSED = "processed"
+STATUS_DEAD = "dead"
+
+LOCK_TIMEOUT_SECONDS = 600
+MAX_RETRY_DELAY_SECONDS = 3600
+
+EventHandler = Callable[[Session, Dict[str, Any]], None]
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _dialect_insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def ordering_key(event: Dict[str, Any]) -> Optional[str]:
+    """反映順を守る単位。data.object の customer（無ければ object 自身の id）"""
+    obj = (event.get("data") or {}).get("object") or {}
+    customer = obj.get("customer")
+    if isinstance(customer, dict):
+        customer = customer.get("id")
+    key = customer or obj.get("id")
+    return str(key)[:255] if key else None
+
+
+def store_event(db: Session, event: Dict[str, Any], payload: str) -> bool:
+    """
+    署名検証済みのイベントを保存してコミットする
+
+    Returns:
+        新規に保存した場合 True（再送で既に保存済みなら False）
+    """
+    created = event.get("created")
+    stmt = _dialect_insert(db)(StripeWebhookEvent.__table__).values(
+        event_id=str(event["id"]),
+        event_type=str(event.get("type") or ""),
+        payload=payload,
+        status=STATUS_PENDING,
+        attempts=0,
+        stripe_created=int(created) if created is not None else None,
+        ordering_key=ordering_key(event),
+        received_at=_utcnow(),
+    ).on_conflict_do_nothing(index_elements=["event_id"])
+    result = db.execute(stmt)
+    db.commit()
+    return bool(result.rowcount)
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(STRIPE_WEBHOOK_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY_SECONDS))
+
+
+def claim_next(db: Session, now: Optional[datetime] = None) -> Optional[StripeWebhookEvent]:
+    """
+    処理可能な最も古いイベントを processing にして返す（無ければ None）
+
+    同じ ordering_key のより古いイベントが未完了（pending / processing）なら、そのイベントは飛ばす。
+    古いイベントが再試行待ちの間も、後のイベントが先に反映されることはない。
+    """
+    now = now or _utcnow()
+    stale = now - timedelta(seconds=LOCK_TIMEOUT_SECONDS)
+    older = aliased(StripeWebhookEvent)
+    blocked = exists().where(
+        older.ordering_key == StripeWebhookEvent.ordering_key,
+        older.id < StripeWebhookEvent.id,
+        older.status.in_((STATUS_PENDING, STATUS_PROCESSING)),
+    )
+    ready = and_(
+        or_(
+            and_(
+                StripeWebhookEvent.status == STATUS_PENDING,
+                or_(StripeWebhookEvent.next_attempt_at.is_(None), StripeWebhookEvent.next_attempt_at <= now),
+            ),
+            and_(StripeWebhookEvent.status == STATUS_PROCESSING, StripeWebhookEvent.locked_at <= stale),
+        ),
+        or_(StripeWebhookEvent.ordering_key.is_(None), ~blocked),
+    )
+    while True:
+        row = (
+            db.query(StripeWebhookEvent.id, StripeWebhookEvent.status)
+            .filter(ready)
+            .order_by(StripeWebhookEvent.id.asc())
+            .first()
+        )
+        if row is None:
+            return None
+        claimed = db.query(StripeWebhookEvent).filter(
+            StripeWebhookEvent.id == row.id,
+            StripeWebhookEvent.status == row.status,
+            ready,
+        ).update({"status": STATUS_PROCESSING, "locked_at": now}, synchronize_session=False)
+        db.commit()
+        if claimed:
+            return db.get(StripeWebhookEvent, row.id)
+        # 他の worker が先に取った
+        continue
+
+
+def _mark_failed(db: Session, event_row_id: int, error: Exception) -> None:
+    row = db.get(StripeWebhookEvent, event_row_id)
+    if row is None:
+        return
+    row.attempts = (row.attempts or 0) + 1
+    row.last_error = f"{type(error).__name__}: {error}"[:4000]
+    row.locked_at = None
+    if row.attempts >= STRIPE_WEBHOOK_MAX_ATTEMPTS:
+        row.status = STATUS_DEAD
+        row.next_attempt_at = None
+        logger.error(
+            f"Stripe event dead-lettered: event_id={row.event_id} type={row.event_type} "
+            f"attempts={row.attempts} error={row.last_error}"
+        )
+    else:
+        row.status = STATUS_PENDING
+        row.next_attempt_at = _utcnow() + _retry_delay(row.attempts)
+        logger.warning(
+            f"Stripe event failed (will retry): event_id={row.event_id} type={row.event_type} "
+            f"attempts={row.attempts} error={row.last_error}"
+        )
+    db.commit()
+
+
+def process_event(db: Session, row: StripeWebhookEvent, handler: EventHandler) -> bool:
+    """取り出した1イベントを反映する。成功したら True"""
+    row_id = row.id
+    try:
+        handler(db, json.loads(row.payload))
+    except Exception as e:
+        db.rollback()
+        _mark_failed(db, row_id, e)
+        return False
+    row = db.get(StripeWebhookEvent, row_id)
+    row.status = STATUS_PROCESSED
+    row.processed_at = _utcnow()
+    row.locked_at = None
+    row.last_error = None
+    db.commit()
+    return True
+
+
+def process_pending(db: Session, handler: EventHandler, limit: int = 100) -> int:
+    """処理可能なイベントを受信順に最大 limit 件反映する。戻り値は成功件数"""
+    done = 0
+    for _ in range(limit):
+        row = claim_next(db)
+        if row is None:
+            break
+        if process_event(db, row, handler):
+            done += 1
+    return done
+
+
+def requeue(db: Session, event_ids: Sequence[str]) -> int:
+    """dead のイベントを再投入する（attempts はリセット）。戻り値は件数"""
+    n = db.query(StripeWebhookEvent).filter(
+        StripeWebhookEvent.event_id.in_(list(event_ids)),
+        StripeWebhookEvent.status == STATUS_DEAD,
+    ).update(
+        {"status": STATUS_PENDING, "attempts": 0, "next_attempt_at": None, "locked_at": None},
+        synchronize_session=False,
+    )
+    db.commit()
+    return n
+
+
+# ---------- API プロセス内の worker ----------
+
+_wakeup: Optional[asyncio.Event] = None
+
+
+def notify() -> None:
+    """新しいイベントを保存したことを worker に知らせる（次のポーリングを待たずに処理）"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def run_worker_loop(process_once: Callable[[], Any]) -> None:
+    """
+    process_once（スレッドプールで実行する同期関数）を、通知または
+    STRIPE_WEBHOOK_POLL_INTERVAL_SECONDS ごとに呼び出す
+    """
+    global _wakeup
+    from starlette.concurrency import run_in_threadpool
+
+    _wakeup = asyncio.Event()
+    while True:
+        _wakeup.clear()
+        try:
+            await run_in_threadpool(process_once)
+        except Exception as e:
+            logger.warning(f"Stripe webhook worker error: {e}")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=STRIPE_WEBHOOK_POLL_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _main(argv: List[str]) -> int:
+    import argparse
+    from .db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Stripe Webhook 受信箱の確認・再投入")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_list = sub.add_parser("list", help="イベントを新しい順に表示")
+    p_list.add_argument("--status", default=STATUS_DEAD)
+    p_list.add_argument("--limit", type=int, default=50)
+    p_retry = sub.add_parser("retry", help="dead のイベントを再投入（API の worker が処理する）")
+    p_retry.add_argument("event_ids", nargs="+")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == "list":
+            rows = (
+                db.query(StripeWebhookEvent)
+                .filter(StripeWebhookEvent.status == args.status)
+                .order_by(StripeWebhookEvent.id.desc())
+                .limit(args.limit)
+                .all()
+            )
+            for r in rows:
+                print(f"{r.event_id}\t{r.event_type}\tattempts={r.attempts}\t{r.received_at}\t{r.last_error or ''}")
+        elif args.command == "retry":
+            print(f"requeued: {requeue(db, args.event_ids)}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
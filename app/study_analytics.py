@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+学習分析の週次集計（user_weekly_stats）
+
+講評履歴・短答の解答・タイマーの日次統計を、ユーザー × 科目 × 週の行に増分で積み上げる。
+グラフ表示は user_weekly_stats を1回読むだけで済み、履歴全体を走査しない。
+
+- 書き込み側は AnalyticsDeltas に増分を積み、apply(db) で INSERT ... ON CONFLICT DO UPDATE の1文にまとめる
+  （コミットは呼び出し側のトランザクションに任せる）
+- 週は学習日（4:00区切り、timer_utils.get_study_date）の月曜日始まり
+- 科目のない記録は subject=0 に入れる
+- 集計がずれた場合・既存データの取り込みは rebuild_user_stats で生データから作り直す
+"""
+import hashlib
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import case
+from sqlalchemy.orm import Session
+
+from .models import ShortAnswerAnswer, ShortAnswerSession, TimerDailyStats, UserReviewHistory, UserWeeklyStats
+from .timer_utils import get_study_date
+
+UTC = ZoneInfo("UTC")
+
+# 科目のない記録の subject
+NO_SUBJECT = 0
+
+_COUNTER_FIELDS = (
+    "review_count",
+    "scored_review_count",
+    "score_sum",
+    "short_answer_total",
+    "short_answer_correct",
+    "study_seconds",
+)
+
+
+def week_start_of(study_date: str) -> str:
+    """学習日（YYYY-MM-DD）の週の月曜日"""
+    d = date.fromisoformat(study_date)
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+
+def week_start_for(dt: Optional[datetime] = None) -> str:
+    """日時（UTC）の学習日の週の月曜日"""
+    return week_start_of(get_study_date(dt))
+
+
+def _subject_key(subject: Any) -> int:
+    try:
+        s = int(subject)
+    except (TypeError, ValueError):
+        return NO_SUBJECT
+    return s if 1 <= s <= 18 else NO_SUBJECT
+
+
+def _empty_row() -> Dict[str, Any]:
+    row: Dict[str, Any] = {f: 0 for f in _COUNTER_FIELDS}
+    row["best_score"] = None
+    return row
+
+
+def _dialect_insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+class AnalyticsDeltas:
+    """1ユーザー分の週次集計の増分"""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self._rows: Dict[Tuple[str, int], Dict[str, Any]] = {}
+
+    def _row(self, week_start: str, subject: Any) -> Dict[str, Any]:
+        key = (week_start, _subject_key(subject))
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = _empty_row()
+        return row
+
+    def add_review(self, subject: Any, at: Optional[datetime], score: Any = None) -> None:
+        """講評1件（点数が未確定なら score=None。確定後に change_score で反映）"""
+        row = self._row(week_start_for(at), subject)
+        row["review_count"] += 1
+        self._add_score(row, None, score)
+
+    def change_score(self, subject: Any, at: Optional[datetime], old_score: Any, new_score: Any) -> None:
+        """
+        講評の点数の変更（バッチ講評の確定など）
+
+        最高点は増える方向にだけ反映する。下がった場合の補正は rebuild_user_stats で行う。
+        """
+        self._add_score(self._row(week_start_for(at), subject), old_score, new_score)
+
+    @staticmethod
+    def _add_score(row: Dict[str, Any], old_score: Any, new_score: Any) -> None:
+        if old_score is not None:
+            row["scored_review_count"] -= 1
+            row["score_sum"] -= Decimal(str(old_score))
+        if new_score is not None:
+            new_score = Decimal(str(new_score))
+            row["scored_review_count"] += 1
+            row["score_sum"] += new_score
+            if row["best_score"] is None or new_score > row["best_score"]:
+                row["best_score"] = new_score
+
+    def add_short_answer(self, subject: Any, at: Optional[datetime], total: int, correct: int) -> None:
+        """短答の解答数・正答数の増分（解答の更新では total=0、correct=±1）"""
+        row = self._row(week_start_for(at), subject)
+        row["short_answer_total"] += total
+        row["short_answer_correct"] += correct
+
+    def add_study_seconds(self, study_date: str, seconds: int) -> None:
+        self._row(week_start_of(study_date), NO_SUBJECT)["study_seconds"] += seconds
+
+    def apply(self, db: Session) -> None:
+        """増分をまとめて upsert（コミットしない）"""
+        rows = [
+            {"user_id": self.user_id, "week_start": week, "subject": subject, **row}
+            for (week, subject), row in sorted(self._rows.items())
+            if row["best_score"] is not None or any(row[f] for f in _COUNTER_FIELDS)
+        ]
+        self._rows = {}
+        if not rows:
+            return
+        t = UserWeeklyStats
+        stmt = _dialect_insert(db)(t).values(rows)
+        ex = stmt.excluded
+        set_ = {f: getattr(t, f) + getattr(ex, f) for f in _COUNTER_FIELDS}
+        set_["best_score"] = case(
+            (t.best_score.is_(None), ex.best_score),
+            (ex.best_score > t.best_score, ex.best_score),
+            else_=t.best_score,
+        )
+        set_["updated_at_utc"] = datetime.now(UTC)
+        stmt = stmt.on_conflict_do_update(index_elements=[t.user_id, t.week_start, t.subject], set_=set_)
+        db.execute(stmt)
+
+
+def rebuild_user_stats(db: Session, user_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    生データから週次集計を作り直す（コミットしない）
+
+    Args:
+        user_ids: 対象ユーザー（None なら全ユーザー）
+
+    Returns:
+        作成した行数
+    """
+    ids = None if user_ids is None else list(user_ids)
+    deltas: Dict[int, AnalyticsDeltas] = {}
+
+    def _for(user_id: int) -> AnalyticsDeltas:
+        d = deltas.get(user_id)
+        if d is None:
+            d = deltas[user_id] = AnalyticsDeltas(user_id)
+        return d
+
+    q = db.query(UserReviewHistory.user_id, UserReviewHistory.subject, UserReviewHistory.created_at, UserReviewHistory.score)
+    if ids is not None:
+        q = q.filter(UserReviewHistory.user_id.in_(ids))
+    for user_id, subject, created_at, score in q.yield_per(1000):
+        _for(user_id).add_review(subject, created_at, score)
+
+    q = db.query(
+        ShortAnswerSession.user_id, ShortAnswerSession.subject, ShortAnswerAnswer.answered_at, ShortAnswerAnswer.is_correct
+    ).join(ShortAnswerSession, ShortAnswerAnswer.session_id == ShortAnswerSession.id).filter(
+        ShortAnswerSession.user_id.isnot(None)
+    )
+    if ids is not None:
+        q = q.filter(ShortAnswerSession.user_id.in_(ids))
+    for user_id, subject, answered_at, is_correct in q.yield_per(1000):
+        _for(user_id).add_short_answer(subject, answered_at, 1, 1 if is_correct else 0)
+
+    q = db.query(TimerDailyStats.user_id, TimerDailyStats.study_date, TimerDailyStats.total_seconds)
+    if ids is not None:
+        q = q.filter(TimerDailyStats.user_id.in_(ids))
+    for user_id, study_date, total_seconds in q.yield_per(1000):
+        if total_seconds:
+            _for(user_id).add_study_seconds(study_date, total_seconds)
+
+    delete_q = db.query(UserWeeklyStats)
+    if ids is not None:
+        delete_q = delete_q.filter(UserWeeklyStats.user_id.in_(ids))
+    delete_q.delete(synchronize_session=False)
+
+    created = 0
+    for d in deltas.values():
+        created += len(d._rows)
+        d.apply(db)
+    return created
+
+
+def _to_number(value: Any) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def get_weekly_stats(
+    db: Session,
+    user_id: int,
+    *,
+    since_week: Optional[str] = None,
+    subject: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """週次集計を週・科目順に返す（1クエリ）"""
+    q = db.query(UserWeeklyStats).filter(UserWeeklyStats.user_id == user_id)
+    if since_week:
+        q = q.filter(UserWeeklyStats.week_start >= since_week)
+    if subject is not None:
+        q = q.filter(UserWeeklyStats.subject == subject)
+    result = []
+    for r in q.order_by(UserWeeklyStats.week_start, UserWeeklyStats.subject).all():
+        mean = (float(r.score_sum) / r.scored_review_count) if r.scored_review_count else None
+        accuracy = (r.short_answer_correct / r.short_answer_total * 100) if r.short_answer_total else None
+        result.append({
+            "week_start": r.week_start,
+            "subject": r.subject or None,
+            "review_count": r.review_count,
+            "mean_score": round(mean, 2) if mean is not None else None,
+            "best_score": _to_number(r.best_score),
+            "short_answer_total": r.short_answer_total,
+            "short_answer_correct": r.short_answer_correct,
+            "short_answer_accuracy": round(accuracy, 1) if accuracy is not None else None,
+            "study_seconds": r.study_seconds,
+        })
+    return result
+
+
+def compute_etag(payload: Any) -> str:
+    """レスポンス本体から弱いETagを作る"""
+    body = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return f'W/"{hashlib.sha1(body.encode("utf-8")).hexdigest()}"'
@@ -3,18 +3,106 @@
 """
 from fastapi import Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime, timedelta
 import uuid
 from zoneinfo import ZoneInfo
 
 from .db import get_db
 from .models import TimerSession, TimerDailyChunk, TimerDailyStats, User
-from .schemas import TimerSessionResponse, TimerDailyStatsResponse, TimerStartResponse, TimerStopResponse
+from .schemas import (
+    TimerSessionResponse,
+    TimerDailyStatsResponse,
+    TimerStartResponse,
+    TimerStopResponse,
+    TimerSyncRequest,
+    TimerSyncResponse,
+)
 from .timer_utils import get_study_date, split_session_by_date_boundary
+from .study_analytics import AnalyticsDeltas
 from .auth import get_current_user_required
 
 
+# オフライン同期で1回に受け付けるセッション数の上限
+MAX_SYNC_SESSIONS = 500
+
+UTC = ZoneInfo("UTC")
+
+
+def _ensure_utc(dt: datetime) -> datetime:
+    """タイムゾーン情報を保証（DBから取得したdatetimeがタイムゾーン情報を持たない場合がある）"""
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=UTC)
+    if dt.tzinfo != UTC:
+        return dt.astimezone(UTC)
+    return dt
+
+
+def add_session_chunks(
+    db: Session,
+    session: TimerSession,
+    ended_at_utc: datetime,
+    deltas: Dict[str, List[int]],
+) -> None:
+    """
+    セッションを4:00区切りで分割してchunksを追加し、日次統計の増分を deltas に積む（コミットしない）
+
+    Args:
+        db: データベースセッション
+        session: 停止するセッション
+        ended_at_utc: 終了時刻（UTC）
+        deltas: study_date -> [追加秒数, 追加セッション数]
+    """
+    chunks = split_session_by_date_boundary(_ensure_utc(session.started_at_utc), ended_at_utc)
+    for chunk_study_date, chunk_start, chunk_end, chunk_seconds in chunks:
+        db.add(TimerDailyChunk(
+            id=str(uuid.uuid4()),
+            user_id=session.user_id,
+            session_id=session.id,
+            study_date=chunk_study_date,
+            seconds=chunk_seconds
+        ))
+        deltas.setdefault(chunk_study_date, [0, 0])[0] += chunk_seconds
+
+
+def apply_daily_stats_deltas(db: Session, user_id: int, deltas: Dict[str, List[int]]) -> None:
+    """
+    日次統計に増分をまとめて加算（INSERT ... ON CONFLICT DO UPDATE の1文。コミットしない）
+
+    Args:
+        db: データベースセッション
+        user_id: ユーザーID
+        deltas: study_date -> [追加秒数, 追加セッション数]
+    """
+    rows = [
+        {"user_id": user_id, "study_date": d, "total_seconds": sec, "sessions_count": cnt}
+        for d, (sec, cnt) in sorted(deltas.items())
+        if sec or cnt
+    ]
+    if not rows:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(TimerDailyStats).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TimerDailyStats.user_id, TimerDailyStats.study_date],
+        set_={
+            "total_seconds": TimerDailyStats.total_seconds + stmt.excluded.total_seconds,
+            "sessions_count": TimerDailyStats.sessions_count + stmt.excluded.sessions_count,
+            "updated_at_utc": datetime.now(UTC),
+        },
+    )
+    db.execute(stmt)
+
+    # 学習分析の週次集計にも同じトランザクションで反映
+    analytics = AnalyticsDeltas(user_id)
+    for row in rows:
+        analytics.add_study_seconds(row["study_date"], row["total_seconds"])
+    analytics.apply(db)
+
+
 def update_daily_stats(db: Session, user_id: int, study_date: str, additional_seconds: int, additional_sessions: int = 0):
     """
     日次統計を更新（増分）
@@ -26,25 +114,27 @@ def update_daily_stats(db: Session, user_id: int, study_date: str, additional_se
         additional_seconds: 追加する秒数
         additional_sessions: 追加するセッション数（デフォルト0）
     """
+    apply_daily_stats_deltas(db, user_id, {study_date: [additional_seconds, additional_sessions]})
+    db.commit()
+
+
+def _get_or_empty_daily_stats(db: Session, user_id: int, study_date: str) -> TimerDailyStats:
+    """日次統計を取得（なければ0件の行を作成）"""
     stats = db.query(TimerDailyStats).filter(
         TimerDailyStats.user_id == user_id,
         TimerDailyStats.study_date == study_date
     ).first()
-    
-    if stats:
-        stats.total_seconds += additional_seconds
-        stats.sessions_count += additional_sessions
-        stats.updated_at_utc = datetime.now(ZoneInfo("UTC"))
-    else:
+    if not stats:
         stats = TimerDailyStats(
             user_id=user_id,
             study_date=study_date,
-            total_seconds=additional_seconds,
-            sessions_count=additional_sessions
+            total_seconds=0,
+            sessions_count=0
         )
         db.add(stats)
-    
-    db.commit()
+        db.commit()
+        db.refresh(stats)
+    return stats
 
 
 def register_timer_routes(app):
@@ -81,31 +171,10 @@ def register_timer_routes(app):
             existing_running.stop_reason = "auto_replaced_by_new_start"
             existing_running.updated_at_utc = now_utc
             
-            # セッション開始時刻のタイムゾーン情報を保証（DBから取得したdatetimeがタイムゾーン情報を持たない場合がある）
-            UTC = ZoneInfo("UTC")
-            existing_started_at_utc = existing_running.started_at_utc
-            if existing_started_at_utc.tzinfo is None:
-                existing_started_at_utc = existing_started_at_utc.replace(tzinfo=UTC)
-            elif existing_started_at_utc.tzinfo != UTC:
-                existing_started_at_utc = existing_started_at_utc.astimezone(UTC)
-            
-            # 停止したセッションを4:00区切りで分割してchunksを作成
-            chunks = split_session_by_date_boundary(existing_started_at_utc, now_utc)
-            for chunk_study_date, chunk_start, chunk_end, chunk_seconds in chunks:
-                chunk_id = str(uuid.uuid4())
-                chunk = TimerDailyChunk(
-                    id=chunk_id,
-                    user_id=current_user.id,
-                    session_id=existing_running.id,
-                    study_date=chunk_study_date,
-                    seconds=chunk_seconds
-                )
-                db.add(chunk)
-                
-                # 日次統計を更新
-                update_daily_stats(db, current_user.id, chunk_study_date, chunk_seconds, 0)
-            
-            db.commit()
+            # 停止したセッションを4:00区切りで分割してchunksを作成（新しいセッションと同じトランザクション）
+            deltas: Dict[str, List[int]] = {}
+            add_session_chunks(db, existing_running, now_utc, deltas)
+            apply_daily_stats_deltas(db, current_user.id, deltas)
         
         # 新しいセッションを作成
         session_id = str(uuid.uuid4())
@@ -121,21 +190,7 @@ def register_timer_routes(app):
         db.refresh(new_session)
         
         # 今日の統計とセッション一覧を取得
-        stats = db.query(TimerDailyStats).filter(
-            TimerDailyStats.user_id == current_user.id,
-            TimerDailyStats.study_date == study_date
-        ).first()
-        
-        if not stats:
-            stats = TimerDailyStats(
-                user_id=current_user.id,
-                study_date=study_date,
-                total_seconds=0,
-                sessions_count=0
-            )
-            db.add(stats)
-            db.commit()
-            db.refresh(stats)
+        stats = _get_or_empty_daily_stats(db, current_user.id, study_date)
         
         # 今日のセッション一覧を取得（最大5件）
         today_sessions = db.query(TimerSession).filter(
@@ -202,57 +257,22 @@ def register_timer_routes(app):
         session.stop_reason = "user_stop"
         session.updated_at_utc = now_utc
         
-        # セッション開始時刻のタイムゾーン情報を保証（DBから取得したdatetimeがタイムゾーン情報を持たない場合がある）
-        UTC = ZoneInfo("UTC")
-        started_at_utc = session.started_at_utc
-        if started_at_utc.tzinfo is None:
-            started_at_utc = started_at_utc.replace(tzinfo=UTC)
-        elif started_at_utc.tzinfo != UTC:
-            started_at_utc = started_at_utc.astimezone(UTC)
-        
         # セッション開始時刻からstudy_dateを計算（セッションがどの日に属するか）
-        session_study_date = get_study_date(started_at_utc)
+        session_study_date = get_study_date(_ensure_utc(session.started_at_utc))
         
-        # セッションを4:00区切りで分割してchunksを作成
-        chunks = split_session_by_date_boundary(started_at_utc, now_utc)
+        # chunksとsessions_count・秒数の増分を1トランザクションで書き込む
+        deltas: Dict[str, List[int]] = {}
         
         # セッション全体のsessions_countを更新（セッション開始日のstudy_dateが今日の場合のみ）
         if session_study_date == study_date:
-            update_daily_stats(db, current_user.id, study_date, 0, additional_sessions=1)
-        
-        # 各chunkの秒数を更新
-        for chunk_study_date, chunk_start, chunk_end, chunk_seconds in chunks:
-            chunk_id = str(uuid.uuid4())
-            chunk = TimerDailyChunk(
-                id=chunk_id,
-                user_id=current_user.id,
-                session_id=session.id,
-                study_date=chunk_study_date,
-                seconds=chunk_seconds
-            )
-            db.add(chunk)
-            
-            # 日次統計を更新（秒数のみ、sessions_countは既に更新済み）
-            update_daily_stats(db, current_user.id, chunk_study_date, chunk_seconds, 0)
+            deltas[study_date] = [0, 1]
         
+        add_session_chunks(db, session, now_utc, deltas)
+        apply_daily_stats_deltas(db, current_user.id, deltas)
         db.commit()
         
         # 今日の統計を取得
-        stats = db.query(TimerDailyStats).filter(
-            TimerDailyStats.user_id == current_user.id,
-            TimerDailyStats.study_date == study_date
-        ).first()
-        
-        if not stats:
-            stats = TimerDailyStats(
-                user_id=current_user.id,
-                study_date=study_date,
-                total_seconds=0,
-                sessions_count=0
-            )
-            db.add(stats)
-            db.commit()
-            db.refresh(stats)
+        stats = _get_or_empty_daily_stats(db, current_user.id, study_date)
         
         # 今日のセッション一覧を取得（最大5件）
         today_sessions = db.query(TimerSession).filter(
@@ -272,6 +292,89 @@ def register_timer_routes(app):
         )
 
 
+    @app.post("/api/timer/sync", response_model=TimerSyncResponse)
+    async def sync_timer_sessions(
+        req: TimerSyncRequest,
+        current_user: User = Depends(get_current_user_required),
+        db: Session = Depends(get_db)
+    ):
+        """
+        オフライン中に記録したセッションをまとめて登録
+        
+        仕様:
+        - 送られたセッションはすべてstopped（stop_reason=offline_sync）として登録
+        - セッションIDで冪等（登録済みのIDはスキップ。再送しても二重計上しない）
+        - sessions_countはセッション開始日のstudy_dateに1件計上
+        - セッション・chunks・日次統計の増分はすべて1トランザクションで書き込む
+        """
+        if len(req.sessions) > MAX_SYNC_SESSIONS:
+            raise HTTPException(status_code=400, detail=f"一度に同期できるセッションは{MAX_SYNC_SESSIONS}件までです")
+        
+        now_utc = datetime.now(UTC)
+        items = []
+        for item in req.sessions:
+            started_at_utc = _ensure_utc(item.started_at_utc)
+            ended_at_utc = _ensure_utc(item.ended_at_utc)
+            if item.id is not None and not (0 < len(item.id) <= 36):
+                raise HTTPException(status_code=400, detail="セッションIDは36文字以内で指定してください")
+            if ended_at_utc <= started_at_utc:
+                raise HTTPException(status_code=400, detail=f"終了時刻が開始時刻以前のセッションがあります: {item.id}")
+            if ended_at_utc > now_utc + timedelta(minutes=5):
+                raise HTTPException(status_code=400, detail=f"終了時刻が未来のセッションがあります: {item.id}")
+            items.append((item.id or str(uuid.uuid4()), started_at_utc, ended_at_utc, item.device_id or req.device_id))
+        
+        # 登録済みのセッションID（他ユーザーのIDと衝突した場合もスキップ）
+        ids = [session_id for session_id, _, _, _ in items]
+        existing_ids = set()
+        for i in range(0, len(ids), 500):
+            existing_ids.update(
+                row[0] for row in db.query(TimerSession.id).filter(TimerSession.id.in_(ids[i:i + 500])).all()
+            )
+        
+        deltas: Dict[str, List[int]] = {}
+        accepted_ids: List[str] = []
+        skipped_ids: List[str] = []
+        for session_id, started_at_utc, ended_at_utc, device_id in items:
+            if session_id in existing_ids:
+                skipped_ids.append(session_id)
+                continue
+            existing_ids.add(session_id)
+            session = TimerSession(
+                id=session_id,
+                user_id=current_user.id,
+                device_id=device_id,
+                started_at_utc=started_at_utc,
+                ended_at_utc=ended_at_utc,
+                status="stopped",
+                stop_reason="offline_sync"
+            )
+            db.add(session)
+            deltas.setdefault(get_study_date(started_at_utc), [0, 0])[1] += 1
+            add_session_chunks(db, session, ended_at_utc, deltas)
+            accepted_ids.append(session_id)
+        
+        try:
+            apply_daily_stats_deltas(db, current_user.id, deltas)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        
+        # 影響を受けた日の統計を返す
+        stats_rows = []
+        if deltas:
+            stats_rows = db.query(TimerDailyStats).filter(
+                TimerDailyStats.user_id == current_user.id,
+                TimerDailyStats.study_date.in_(list(deltas.keys()))
+            ).order_by(TimerDailyStats.study_date).all()
+        
+        return TimerSyncResponse(
+            accepted_session_ids=accepted_ids,
+            skipped_session_ids=skipped_ids,
+            daily_stats=[TimerDailyStatsResponse.model_validate(s) for s in stats_rows]
+        )
+
+
     @app.get("/api/timer/daily-stats", response_model=TimerDailyStatsResponse)
     async def get_daily_stats(
         study_date: Optional[str] = Query(None, description="学習日（YYYY-MM-DD）。指定しない場合は今日"),
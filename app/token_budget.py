@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+トークン数の見積もり
+
+- 文字数ではなくトークン数でプロンプトの大きさを管理するためのローカル近似
+- 日本語（かな・漢字）は1文字あたりおおむね1トークン前後、英数字は4文字前後で1トークン
+- 予算判定に使うため、実測よりやや多め（安全側）に見積もる
+- セクションごとの予算配分（allocate_sections）と、呼び出し前のコスト予測（predict_cost_yen）
+"""
+import re
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 1メッセージあたりの構造オーバーヘッド（role等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# CJK（かな・カナ・漢字・全角記号）
+_CJK_RE = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+# 英数字の連続（単語）
+_ASCII_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+
+
+def count_tokens(text: str) -> int:
+    """テキストのトークン数をローカルで近似する"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    ascii_tokens = 0
+    ascii_chars = 0
+    for m in _ASCII_WORD_RE.finditer(text):
+        n = m.end() - m.start()
+        ascii_chars += n
+        ascii_tokens += (n + 3) // 4
+    # 残り（空白・記号・その他の文字）は2文字で1トークン
+    other = max(len(text) - cjk - ascii_chars, 0)
+    return int(cjk * 1.1) + ascii_tokens + (other + 1) // 2
+
+
+def count_message_tokens(messages: Iterable[Dict[str, str]]) -> int:
+    """Anthropic messages 形式の配列のトークン数を近似する"""
+    return sum(count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def take_tail_within_budget(messages: List[Dict[str, str]], token_budget: int) -> List[Dict[str, str]]:
+    """
+    末尾（新しい側）から予算内に収まるメッセージを残す。
+    user/assistant の組を崩さないよう、先頭が assistant になった場合はそれも落とす。
+    """
+    if token_budget <= 0:
+        return []
+    kept: List[Dict[str, str]] = []
+    used = 0
+    for m in reversed(messages):
+        cost = count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > token_budget:
+            break
+        kept.append(m)
+        used += cost
+    kept.reverse()
+    while kept and kept[0].get("role") == "assistant":
+        kept.pop(0)
+    return kept
+
+
+# ---------------------------------------------------------------------------
+# セクション単位の予算配分
+# ---------------------------------------------------------------------------
+
+TRUNCATION_MARKER = "\n...\n（中略）\n...\n"
+
+# テンプレート（システムプロンプト等）のトークン数メモ: (name, len, hash) -> tokens
+_template_token_cache: Dict[Tuple[str, int, int], int] = {}
+
+
+def count_template_tokens(name: str, text: str) -> int:
+    """固定テンプレートのトークン数（内容が変わらない限り再計算しない）"""
+    key = (name, len(text or ""), hash(text or ""))
+    cached = _template_token_cache.get(key)
+    if cached is None:
+        cached = count_tokens(text or "")
+        _template_token_cache[key] = cached
+    return cached
+
+
+def _prefix_within(text: str, max_tokens: int) -> int:
+    """先頭から max_tokens に収まる最大の文字数（二分探索）"""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _suffix_within(text: str, max_tokens: int) -> int:
+    """末尾から max_tokens に収まる最大の文字数（二分探索）"""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[len(text) - mid:]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    テキストを max_tokens 以内に切り詰める。
+    _truncate_text（文字数版）と同じく先頭7割・末尾2.5割を残し、間を（中略）でつなぐ。
+    """
+    if not text:
+        return ""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    body = max_tokens - count_tokens(TRUNCATION_MARKER)
+    if body <= 0:
+        return text[:_prefix_within(text, max_tokens)]
+    head = text[:_prefix_within(text, int(body * 0.7))]
+    tail_len = _suffix_within(text, int(body * 0.25))
+    tail = text[len(text) - tail_len:] if tail_len else ""
+    return head + TRUNCATION_MARKER + tail
+
+
+@dataclass
+class PromptSection:
+    """
+    予算配分の対象となるプロンプトの1セクション。
+    priority が小さいほど優先（削るのは priority の大きい順）。
+    """
+    name: str
+    text: str
+    priority: int
+    max_tokens: Optional[int] = None  # セクション単体の上限
+    min_tokens: int = 0  # 予算が足りなくてもここまでは残す
+
+
+def allocate_sections(sections: List[PromptSection], token_budget: int) -> Dict[str, str]:
+    """
+    セクション群を合計 token_budget に収まるよう配分して切り詰める。
+
+    1. 各セクションを max_tokens までに収める
+    2. 合計が予算を超える場合、priority の大きい（優先度の低い）セクションから min_tokens まで削る
+    戻り: name -> 切り詰め後のテキスト
+    """
+    sizes: Dict[str, int] = {}
+    for s in sections:
+        n = count_tokens(s.text)
+        if s.max_tokens is not None:
+            n = min(n, s.max_tokens)
+        sizes[s.name] = n
+
+    over = sum(sizes.values()) - token_budget
+    if over > 0:
+        for s in sorted(sections, key=lambda x: -x.priority):
+            cut = min(over, max(sizes[s.name] - s.min_tokens, 0))
+            sizes[s.name] -= cut
+            over -= cut
+            if over <= 0:
+                break
+
+    return {s.name: truncate_to_tokens(s.text, sizes[s.name]) for s in sections}
+
+
+def remaining_budget(token_budget: int, *texts: str) -> int:
+    """token_budget から texts の分を差し引いた残り（0未満にはしない）"""
+    return max(token_budget - sum(count_tokens(t or "") for t in texts), 0)
+
+
+# ---------------------------------------------------------------------------
+# 呼び出し前のコスト予測
+# ---------------------------------------------------------------------------
+
+def estimate_request_tokens(system_prompt: str, messages: Iterable[Dict[str, str]]) -> int:
+    """system + messages の入力トークン数の見積もり"""
+    return count_template_tokens("system", system_prompt or "") + count_message_tokens(messages)
+
+
+def predict_cost_yen(
+    model: Optional[str],
+    system_prompt: str,
+    messages: Iterable[Dict[str, str]],
+    max_output_tokens: int,
+) -> Optional[Decimal]:
+    """
+    LLM呼び出し前のコスト見積もり（円）。出力は max_output_tokens を上限として見積もる（安全側）。
+    料金が不明なモデルは None。
+    """
+    from .llm_usage import calculate_cost_yen
+
+    input_tokens = estimate_request_tokens(system_prompt, messages)
+    return calculate_cost_yen(model, input_tokens, max_output_tokens)
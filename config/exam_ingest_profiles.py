@@ -0,0 +1,141 @@
+"""
+論文式試験PDF → JSON 取り込みのプロファイル定義（scripts/ingest_exam_pdfs.py が使用）
+
+年度ごとの取り込みスクリプトに散らばっていた「科目見出し」「出題趣旨・採点実感の区切り」を宣言的にまとめる。
+
+区切り（Marker）の解釈:
+- PDF全体のテキストに対して、並び順に pattern を探す
+  - subject を指定した Marker: 前の Marker の後で最初に一致した位置を、その科目の開始とする
+  - subject が None の Marker: 前の Marker の後の全ての一致を見出しとし、group(1) を科目名として扱う
+- 科目の本文は、開始位置から次の開始位置まで
+- strip=True の場合は見出し（一致部分）を本文から除く
+
+年度による違いは ExamProfile.year_overrides に差分だけを書く。
+"""
+from dataclasses import dataclass, field, replace
+from typing import Dict, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Marker:
+    pattern: str
+    subject: Optional[str] = None  # None の場合は group(1) の見出しを科目名として使う
+    strip: bool = False
+
+
+@dataclass(frozen=True)
+class ExamProfile:
+    exam_dir: str  # data/pdfs/<exam_dir>, data/json/<exam_dir>
+    exam_type: str  # JSON の exam_type（"司法" / "予備"）
+    years: Tuple[str, ...]
+    # 試験問題PDF（論述/ からの glob）。ファイル名（拡張子なし）ごとに区切りを変えられる
+    question_globs: Tuple[str, ...] = ("論述/試験問題/*.pdf",)
+    question_markers: Dict[str, Tuple[Marker, ...]] = field(default_factory=dict)
+    default_question_markers: Tuple[Marker, ...] = ()
+    # 出題趣旨PDF（論述/ からの glob。複数一致した場合は内容が同じものを1つにまとめる）
+    purpose_globs: Tuple[str, ...] = ("論述/出題趣旨.pdf",)
+    purpose_markers: Tuple[Marker, ...] = ()
+    purpose_start_pattern: Optional[str] = None  # 科目ごとの本文のうち、これ以降を出題趣旨とする
+    # 採点実感PDF（司法試験のみ）
+    scoring_globs: Tuple[str, ...] = ()
+    scoring_markers: Tuple[Marker, ...] = ()
+    # 問題文がこれより短い科目は見出しだけと見なして出力しない
+    min_text_chars: int = 100
+    # 年度ごとの差分（ExamProfile のフィールド名 -> 値）
+    year_overrides: Dict[str, Dict[str, object]] = field(default_factory=dict)
+
+    def for_year(self, year: str) -> "ExamProfile":
+        return replace(self, **self.year_overrides.get(year, {}))
+
+
+# ［憲 法］［倒産法］のような見出し
+BRACKET_HEADING = Marker(r"［([^］]+)］", strip=True)
+
+# 司法試験の系別PDFは〔第Ｎ問〕で科目を分ける
+_JUDICIAL_QUESTION_MARKERS = {
+    "公法系": (Marker(r"〔第[１1]問〕", "憲法"), Marker(r"〔第[２2]問〕", "行政法")),
+    "民事系": (
+        Marker(r"〔第[１1]問〕", "民法"),
+        Marker(r"〔第[２2]問〕", "商法"),
+        Marker(r"〔第[３3]問〕", "民事訴訟法"),
+    ),
+    "刑事系": (Marker(r"〔第[１1]問〕", "刑法"), Marker(r"〔第[２2]問〕", "刑事訴訟法")),
+    "選択": (BRACKET_HEADING,),
+}
+
+# 出題趣旨PDFは【公法系科目】〔第１問〕… の順に並び、選択科目は［倒産法］のような見出し
+_JUDICIAL_PURPOSE_MARKERS = (
+    Marker(r"【公法系科目】[\s\S]*?〔第[１1]問〕", "憲法", strip=True),
+    Marker(r"〔第[２2]問〕", "行政法", strip=True),
+    Marker(r"【民事系科目】[\s\S]*?〔第[１1]問〕", "民法", strip=True),
+    Marker(r"〔第[２2]問〕", "商法", strip=True),
+    Marker(r"〔第[３3]問〕", "民事訴訟法", strip=True),
+    Marker(r"【刑事系科目】[\s\S]*?〔第[１1]問〕", "刑法", strip=True),
+    Marker(r"〔第[２2]問〕", "刑事訴訟法", strip=True),
+    BRACKET_HEADING,
+)
+
+# 採点実感は「（令和X年）司法試験の採点実感（等に関する意見）（公法系科目第１問）」の見出しで分ける
+_JUDICIAL_SCORING_MARKERS = (
+    Marker(
+        r"(?:(?:平成|令和)[０-９0-9一二三四五六七八九十元]+年)?\s*司法試験の採点実感(?:等に関する意見)?\s*[（(]\s*([^）)\n]+)[）)]",
+        strip=True,
+    ),
+)
+
+JUDICIAL_EXAM = ExamProfile(
+    exam_dir="judicial_exam",
+    exam_type="司法",
+    years=(
+        "H18", "H19", "H20", "H21", "H22", "H23", "H24", "H25", "H26", "H27", "H28", "H29", "H30",
+        "R1", "R2", "R3", "R4", "R5", "R6", "R7",
+    ),
+    question_markers=_JUDICIAL_QUESTION_MARKERS,
+    purpose_markers=_JUDICIAL_PURPOSE_MARKERS,
+    scoring_globs=("論述/採点実感.pdf", "論述/採点実感/*.pdf"),
+    scoring_markers=_JUDICIAL_SCORING_MARKERS,
+    year_overrides={
+        # H26 以前の採点実感は「採点実感等に関する意見（…）」の見出しのみ（年・試験名なし）の箇所がある
+        year: {
+            "scoring_markers": (
+                Marker(r"採点実感等に関する意見\s*[（(]\s*([^）)\n]+)[）)]", strip=True),
+            ),
+        }
+        for year in ("H22", "H23", "H24", "H25", "H26")
+    },
+)
+
+PRELIMINARY_EXAM = ExamProfile(
+    exam_dir="preliminary_exam",
+    exam_type="予備",
+    years=(
+        "H23", "H24", "H25", "H26", "H27", "H28", "H29", "H30",
+        "R1", "R2", "R3", "R4", "R5", "R6", "R7",
+    ),
+    default_question_markers=(BRACKET_HEADING,),
+    # 年度により 論述/出題趣旨.pdf・論述/R6_予備_論文_出題趣旨.pdf・試験問題/ 内のいずれか
+    purpose_globs=("論述/*出題趣旨*.pdf", "論述/試験問題/*出題趣旨*.pdf"),
+    purpose_markers=(BRACKET_HEADING,),
+    purpose_start_pattern=r"[（(]出題の趣旨[）)]|出題の趣旨",
+)
+
+PROFILES: Dict[str, ExamProfile] = {
+    "judicial": JUDICIAL_EXAM,
+    "preliminary": PRELIMINARY_EXAM,
+}
+
+# 見出し → 科目名（config.subjects の名称）。ここに無い見出しは get_subject_id で解釈する
+HEADER_TO_SUBJECT = {
+    "公法系科目第１問": "憲法",
+    "公法系科目第２問": "行政法",
+    "民事系科目第１問": "民法",
+    "民事系科目第２問": "商法",
+    "民事系科目第３問": "民事訴訟法",
+    "刑事系科目第１問": "刑法",
+    "刑事系科目第２問": "刑事訴訟法",
+    "民事": "実務基礎（民事）",
+    "刑事": "実務基礎（刑事）",
+    # 括弧のネストで見出しが最初の）で切れた場合の表記
+    "国際関係法（公法系": "国際関係法（公法系）",
+    "国際関係法（私法系": "国際関係法（私法系）",
+}
@@ -53,6 +53,9 @@ class LLMConfig:
         # API Keyを取得
         self.api_key = os.getenv("ANTHROPIC_API_KEY")
         
+        # APIのベースURL（未設定なら公式エンドポイント。ローカルの代替サーバーで検証する場合に指定）
+        self.base_url = os.getenv("ANTHROPIC_BASE_URL") or None
+        
         # デフォルトモデル
         self.default_model = os.getenv("ANTHROPIC_MODEL", "claude-haiku-4-5-20251001")
         
@@ -82,7 +85,10 @@ class LLMConfig:
             return None
         
         if self._client is None:
-            self._client = Anthropic(api_key=self.api_key)
+            if self.base_url:
+                self._client = Anthropic(api_key=self.api_key, base_url=self.base_url)
+            else:
+                self._client = Anthropic(api_key=self.api_key)
         
         return self._client
 
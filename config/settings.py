@@ -33,9 +33,100 @@ GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 SECRET_KEY = os.getenv("SECRET_KEY", "change-this-secret-key-in-production")
 ALGORITHM = "HS256"
 
+# Google IDトークン検証用の公開鍵（JWKS）設定
+GOOGLE_JWKS_URL = os.getenv("GOOGLE_JWKS_URL", "https://www.googleapis.com/oauth2/v3/certs")
+GOOGLE_JWKS_DEFAULT_TTL_SECONDS = int(os.getenv("GOOGLE_JWKS_DEFAULT_TTL_SECONDS", "3600"))  # Cache-Control がない場合
+GOOGLE_JWKS_MIN_REFRESH_SECONDS = int(os.getenv("GOOGLE_JWKS_MIN_REFRESH_SECONDS", "60"))  # 再取得の最小間隔（秒）
+GOOGLE_JWKS_TIMEOUT_SECONDS = float(os.getenv("GOOGLE_JWKS_TIMEOUT_SECONDS", "5"))
+
 # トークン検証キャッシュ設定
 TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", "300"))  # デフォルト5分（秒）
 TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "1000"))  # デフォルト1000エントリ
+AUTH_PRINCIPAL_CACHE_TTL = int(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", "60"))  # JWT認証時のユーザー情報（id/email/有効/管理者）のキャッシュ（秒）
+
+# データベース接続プール設定（PostgreSQL のみ。SQLite はファイルロックのため既定のまま）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))  # 常時保持する接続数（ワーカーごと）
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))  # 混雑時に一時的に追加できる接続数
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))  # 接続の空き待ちの上限（秒）
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))  # この秒数を超えた接続は張り直す
+# 管理画面で切り替えられる PostgreSQL（カンマ区切りのURL。DATABASE_URL は常に許可）
+# パスワードは URL に書かず PGPASSWORD / ~/.pgpass で渡すことを推奨（URL は管理画面に表示される）
+ADMIN_DATABASE_URLS = [u.strip() for u in os.getenv("ADMIN_DATABASE_URLS", "").split(",") if u.strip()]
+# 管理画面で他のDBを参照するときの読み取り専用エンジン（URLごとにキャッシュ。上限を超えたら古いものから閉じる）
+ADMIN_ENGINE_CACHE_SIZE = int(os.getenv("ADMIN_ENGINE_CACHE_SIZE", "8"))
+ADMIN_ENGINE_POOL_SIZE = int(os.getenv("ADMIN_ENGINE_POOL_SIZE", "2"))  # エンジンごとの常時保持接続数
+# 非同期セッション（app/db_async.py）。ドライバ（aiosqlite / asyncpg）が無い・false のときは
+# 同期セッションをスレッドプールで動かす互換レイヤにフォールバックする
+ASYNC_DB_ENABLED = os.getenv("ASYNC_DB_ENABLED", "true").lower() == "true"
+
+# 共有キャッシュ設定（認証・プラン・参照データ）
+# - memory: プロセス内のみ（デフォルト）
+# - sqlite: CACHE_SHARED_SQLITE_PATH を複数ワーカーで共有
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_SHARED_SQLITE_PATH = os.getenv("CACHE_SHARED_SQLITE_PATH", "./data/cache.db")
+CACHE_LOCAL_TTL_SECONDS = int(os.getenv("CACHE_LOCAL_TTL_SECONDS", "5"))  # 共有層があるときのプロセス内の保持期間（秒）
+CACHE_NAMESPACE_CHECK_SECONDS = float(os.getenv("CACHE_NAMESPACE_CHECK_SECONDS", "1"))  # 名前空間の無効化を確認する間隔（秒）
+PLAN_CACHE_TTL_SECONDS = int(os.getenv("PLAN_CACHE_TTL_SECONDS", "60"))  # ユーザーの適用プラン
+REFERENCE_CACHE_TTL_SECONDS = int(os.getenv("REFERENCE_CACHE_TTL_SECONDS", "600"))  # 公式問題・科目一覧
+SHORT_ANSWER_BANK_CHECK_SECONDS = float(os.getenv("SHORT_ANSWER_BANK_CHECK_SECONDS", "30"))  # 短答問題バンクの変更（インポート）を確認する間隔（秒）
+
+# レスポンスのJSON・圧縮設定
+# - JSON は orjson があれば orjson で直列化（無ければ標準の json）
+# - 完了済みの講評・公開中の公式問題は直列化済みのバイト列をプロセス内にキャッシュ
+# - Accept-Encoding に応じて br（brotli がある場合）/ gzip で圧縮（ストリーミング応答は対象外）
+RESPONSE_PAYLOAD_CACHE_MAX_ITEMS = int(os.getenv("RESPONSE_PAYLOAD_CACHE_MAX_ITEMS", "500"))
+RESPONSE_PAYLOAD_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_PAYLOAD_CACHE_TTL_SECONDS", "3600"))  # 0で無効
+RESPONSE_COMPRESSION_ENABLED = os.getenv("RESPONSE_COMPRESSION_ENABLED", "true").lower() == "true"
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))  # これ未満は圧縮しない
+RESPONSE_COMPRESSION_GZIP_LEVEL = int(os.getenv("RESPONSE_COMPRESSION_GZIP_LEVEL", "6"))
+RESPONSE_COMPRESSION_BROTLI_QUALITY = int(os.getenv("RESPONSE_COMPRESSION_BROTLI_QUALITY", "4"))
+
+# HTTP キャッシュ設定（ETag / Cache-Control。公開の参照データに付ける max-age）
+HTTP_CACHE_MAX_AGE_SECONDS = int(os.getenv("HTTP_CACHE_MAX_AGE_SECONDS", "300"))
+HTTP_CACHE_STALE_WHILE_REVALIDATE_SECONDS = int(os.getenv("HTTP_CACHE_STALE_WHILE_REVALIDATE_SECONDS", "3600"))
+
+# 講評結果キャッシュ設定（同一内容の再提出ではLLMを再実行しない）
+REVIEW_CACHE_ENABLED = os.getenv("REVIEW_CACHE_ENABLED", "true").lower() == "true"
+REVIEW_CACHE_TTL_SECONDS = int(os.getenv("REVIEW_CACHE_TTL_SECONDS", "86400"))  # 再利用期間（秒）。0で無効
+# キャッシュヒット時の回数カウント方針
+# - reuse: 既存の講評をそのまま返す（講評回数を消費しない）
+# - count: 講評を複製して新しい講評として保存する（講評回数を消費、LLM費用は発生しない）
+REVIEW_CACHE_HIT_POLICY = os.getenv("REVIEW_CACHE_HIT_POLICY", "reuse").lower()
+REVIEW_IDEMPOTENCY_TTL_SECONDS = int(os.getenv("REVIEW_IDEMPOTENCY_TTL_SECONDS", "86400"))  # Idempotency-Key の有効期間（秒）
+REVIEW_INFLIGHT_WAIT_SECONDS = int(os.getenv("REVIEW_INFLIGHT_WAIT_SECONDS", "600"))  # 同時重複リクエストの待機上限（秒）
+
+# チャット履歴のトークン予算（LLMに渡す過去の会話の上限。要約は別枠）
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "24000"))
+# チャット入力全体のトークン予算（system + コンテキスト + 要約 + 履歴 + 今回の発話）。履歴は残りの範囲で割り当てる
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", "60000"))
+# 講評チャットのコンテキスト（問題文・趣旨・採点実感・講評・指定段落）の合計トークン予算
+REVIEW_CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("REVIEW_CHAT_CONTEXT_TOKEN_BUDGET", "30000"))
+
+# 講評チャット用コンテキストのキャッシュ（問題文・講評JSON・段落索引を講評ごとに保持）
+REVIEW_CHAT_CONTEXT_CACHE_SIZE = int(os.getenv("REVIEW_CHAT_CONTEXT_CACHE_SIZE", "256"))  # 最大エントリ数（LRU）
+REVIEW_CHAT_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("REVIEW_CHAT_CONTEXT_CACHE_TTL_SECONDS", "3600"))  # 問題文の外部更新に備えた期限（秒）
+
+# 関連箇所の検索（公式問題・過去の講評をハッシュ化した文字n-gramのベクトルで検索し、チャットに抜粋だけ渡す）
+SEMANTIC_INDEX_DIR = os.getenv("SEMANTIC_INDEX_DIR", "./data/semantic_index")  # 公式問題のベクトル（メモリマップ）の保存先
+SEMANTIC_INDEX_DIM = int(os.getenv("SEMANTIC_INDEX_DIM", "1024"))  # ベクトルの次元数
+SEMANTIC_INDEX_CHECK_SECONDS = int(os.getenv("SEMANTIC_INDEX_CHECK_SECONDS", "300"))  # 公式問題の更新を確認する間隔（秒）
+SEMANTIC_MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", "0.1"))  # これ未満のコサイン類似度の抜粋は使わない
+FREE_CHAT_RETRIEVAL_TOKEN_BUDGET = int(os.getenv("FREE_CHAT_RETRIEVAL_TOKEN_BUDGET", "4000"))  # フリーチャットの参照情報
+REVIEW_CHAT_RETRIEVAL_TOKEN_BUDGET = int(os.getenv("REVIEW_CHAT_RETRIEVAL_TOKEN_BUDGET", "3000"))  # 講評チャットの出題趣旨・採点実感の抜粋
+
+# DBバックアップ（SQLite のオンラインバックアップ + ページ単位の差分スナップショット）
+DB_BACKUP_DIR = os.getenv("DB_BACKUP_DIR", "./backups")
+DB_BACKUP_ENABLED = os.getenv("DB_BACKUP_ENABLED", "false").lower() == "true"  # API起動時に定期バックアップを開始
+DB_BACKUP_INTERVAL_HOURS = float(os.getenv("DB_BACKUP_INTERVAL_HOURS", "24"))
+DB_BACKUP_KEEP_DAILY = int(os.getenv("DB_BACKUP_KEEP_DAILY", "7"))  # 直近N日は1日1世代を保持
+DB_BACKUP_KEEP_WEEKLY = int(os.getenv("DB_BACKUP_KEEP_WEEKLY", "8"))  # それ以前はN週まで1週1世代を保持
+DB_BACKUP_STEP_PAGES = int(os.getenv("DB_BACKUP_STEP_PAGES", "1024"))  # オンラインバックアップ1回あたりのページ数（書き込みを止めない）
+DB_BACKUP_CHUNK_PAGES = int(os.getenv("DB_BACKUP_CHUNK_PAGES", "64"))  # 差分判定の単位（ページ数）
+
+# Message Batches（非対話のLLM一括処理: 復習問題生成・会話要約・講評の再生成）
+LLM_BATCH_POLL_ENABLED = os.getenv("LLM_BATCH_POLL_ENABLED", "false").lower() == "true"  # API起動時に結果ポーリングを開始
+LLM_BATCH_POLL_INTERVAL_SECONDS = int(os.getenv("LLM_BATCH_POLL_INTERVAL_SECONDS", "60"))
+LLM_BATCH_MAX_REQUESTS = int(os.getenv("LLM_BATCH_MAX_REQUESTS", "10000"))  # 1バッチあたりの最大リクエスト数
 
 # JWTトークン設定
 JWT_ACCESS_TOKEN_EXPIRE_DAYS = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_DAYS", "30"))  # デフォルト30日
@@ -69,6 +160,12 @@ STRIPE_FIRST_MONTH_FM_DM_PRICE_YEN = int(os.getenv("STRIPE_FIRST_MONTH_FM_DM_PRI
 STRIPE_BASIC_PLAN_PRICE_ID = os.getenv("STRIPE_BASIC_PLAN_PRICE_ID", "")
 STRIPE_HIGH_PLAN_PRICE_ID = os.getenv("STRIPE_HIGH_PLAN_PRICE_ID", "")
 STRIPE_FIRST_MONTH_FM_DM_PRICE_ID = os.getenv("STRIPE_FIRST_MONTH_FM_DM_PRICE_ID", "")
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "")  # ローカルの代替サーバー（stripe-mock 等）で検証する場合に指定
+# Stripe Webhook の受信箱（Webhook は保存して即応答し、反映は worker が受信順に行う）
+STRIPE_WEBHOOK_WORKER_ENABLED = os.getenv("STRIPE_WEBHOOK_WORKER_ENABLED", "true").lower() == "true"
+STRIPE_WEBHOOK_POLL_INTERVAL_SECONDS = int(os.getenv("STRIPE_WEBHOOK_POLL_INTERVAL_SECONDS", "30"))
+STRIPE_WEBHOOK_MAX_ATTEMPTS = int(os.getenv("STRIPE_WEBHOOK_MAX_ATTEMPTS", "8"))  # これを超えたら dead（手動で再投入）
+STRIPE_WEBHOOK_RETRY_BASE_SECONDS = int(os.getenv("STRIPE_WEBHOOK_RETRY_BASE_SECONDS", "30"))  # 再試行間隔（失敗ごとに倍、最大1時間）
 FM_DM_SIGNUP_LINK = os.getenv("FM_DM_SIGNUP_LINK", "https://juristutor-ai.com/signup/fm-dm-first-month")
 
 # β環境メール制限設定
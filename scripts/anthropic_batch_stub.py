@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Message Batches API のローカル代替サーバー（app/llm_batch.py の検証用）
+
+anthropic SDK の messages.batches.create / retrieve / results が呼ぶエンドポイントだけを実装する。
+実際の LLM は呼ばず、custom_id の種類（target_type）ごとに決まった応答を返す。
+
+- thread_summary: 要約テキスト
+- review: 講評JSON（evaluation。overall_review.score 付き）
+- それ以外: 固定テキスト
+
+使用例:
+    python scripts/anthropic_batch_stub.py --port 8765 --delay 2 --error-every 5
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=stub python -m app.llm_batch summaries
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=stub python -m app.llm_batch poll
+
+--delay: 送信からこの秒数が経つまで processing_status=in_progress を返す
+--error-every: N件ごとに1件を errored にする（0 なら全件成功）
+"""
+
+import argparse
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+STUB_MODEL = "stub-model"
+
+_REVIEW_EVALUATION = {
+    "overall_review": {"score": 72, "comment": "（stub）論点は押さえられている。"},
+    "strengths": [{"category": "構成", "description": "（stub）結論が明確。"}],
+    "weaknesses": [{"category": "論証", "description": "（stub）あてはめが薄い。"}],
+    "important_points": [],
+    "future_considerations": [],
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+def _response_text(custom_id: str) -> str:
+    target_type = custom_id.split("-", 1)[0]
+    if target_type == "thread_summary":
+        return "（stub）これまでの会話の要約です。"
+    if target_type == "review":
+        return json.dumps(_REVIEW_EVALUATION, ensure_ascii=False)
+    return "（stub）応答です。"
+
+
+class _Store:
+    def __init__(self, delay: float, error_every: int):
+        self.delay = delay
+        self.error_every = error_every
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def create(self, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        batch_id = f"msgbatch_stub_{uuid.uuid4().hex[:16]}"
+        with self.lock:
+            self.batches[batch_id] = {"created_at": _now(), "requests": requests}
+        return batch_id
+
+    def ended(self, batch_id: str) -> bool:
+        return _now() - self.batches[batch_id]["created_at"] >= timedelta(seconds=self.delay)
+
+    def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        out = []
+        for seq, req in enumerate(self.batches[batch_id]["requests"], start=1):
+            custom_id = req["custom_id"]
+            if self.error_every and seq % self.error_every == 0:
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": "stub error"}}}
+            else:
+                result = {
+                    "type": "succeeded",
+                    "message": {
+                        "id": f"msg_stub_{uuid.uuid4().hex[:16]}",
+                        "type": "message",
+                        "role": "assistant",
+                        "model": req.get("params", {}).get("model") or STUB_MODEL,
+                        "content": [{"type": "text", "text": _response_text(custom_id)}],
+                        "stop_reason": "end_turn",
+                        "stop_sequence": None,
+                        "usage": {"input_tokens": 100, "output_tokens": 50},
+                    },
+                }
+            out.append({"custom_id": custom_id, "result": result})
+        return out
+
+
+def _make_handler(store: _Store):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, body: Any, content_type: str = "application/json") -> None:
+            data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _batch_json(self, batch_id: str) -> Dict[str, Any]:
+            b = store.batches[batch_id]
+            ended = store.ended(batch_id)
+            n = len(b["requests"])
+            errored = sum(1 for r in store.results(batch_id) if r["result"]["type"] == "errored") if ended else 0
+            host = self.headers.get("Host") or f"127.0.0.1:{self.server.server_address[1]}"
+            return {
+                "id": batch_id,
+                "type": "message_batch",
+                "processing_status": "ended" if ended else "in_progress",
+                "request_counts": {
+                    "processing": 0 if ended else n,
+                    "succeeded": n - errored if ended else 0,
+                    "errored": errored,
+                    "canceled": 0,
+                    "expired": 0,
+                },
+                "created_at": _iso(b["created_at"]),
+                "expires_at": _iso(b["created_at"] + timedelta(hours=24)),
+                "ended_at": _iso(b["created_at"] + timedelta(seconds=store.delay)) if ended else None,
+                "archived_at": None,
+                "cancel_initiated_at": None,
+                "results_url": f"http://{host}/v1/messages/batches/{batch_id}/results" if ended else None,
+            }
+
+        def do_POST(self):
+            if self.path.split("?", 1)[0].rstrip("/") != "/v1/messages/batches":
+                return self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            batch_id = store.create(body.get("requests") or [])
+            return self._send_json(200, self._batch_json(batch_id))
+
+        def do_GET(self):
+            parts = self.path.split("?", 1)[0].strip("/").split("/")
+            # v1/messages/batches/{id}[/results]
+            if len(parts) >= 4 and parts[:3] == ["v1", "messages", "batches"] and parts[3] in store.batches:
+                batch_id = parts[3]
+                if len(parts) == 4:
+                    return self._send_json(200, self._batch_json(batch_id))
+                if len(parts) == 5 and parts[4] == "results" and store.ended(batch_id):
+                    lines = "\n".join(json.dumps(r, ensure_ascii=False) for r in store.results(batch_id)) + "\n"
+                    return self._send_json(200, lines.encode("utf-8"), content_type="application/binary")
+            return self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+        def log_message(self, fmt, *args):
+            print(f"[stub] {self.command} {self.path} -> {args[1] if len(args) > 1 else ''}")
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, delay: float = 0.0, error_every: int = 0) -> ThreadingHTTPServer:
+    """サーバーを作って返す（serve_forever は呼び出し側で）"""
+    return ThreadingHTTPServer((host, port), _make_handler(_Store(delay, error_every)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Message Batches API のローカル代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="ended になるまでの秒数")
+    parser.add_argument("--error-every", type=int, default=0, help="N件ごとに1件を errored にする")
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.delay, args.error_every)
+    print(f"Message Batches stub listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
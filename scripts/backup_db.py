@@ -2,8 +2,9 @@
 """
 DB自動バックアップスクリプト（日次・週次、OneDrive保存）
 
-- 毎日: daily/ に日次バックアップを保存し、直近 N 日分のみ保持（古いものは削除）
-- 日曜のみ: 同じ内容を weekly/ に週次スナップショットとして保存
+- app/db_backup.py でオンラインバックアップし、ページ単位の差分を圧縮して
+  <保存先>/<DB名>/ に保存する（復元・検証は python -m app.db_backup restore / verify）
+- 直近 N 日は1日1世代、それ以前は M 週まで1週1世代を保持（古いものは削除）
 
 使用方法:
     cd law-review && python scripts/backup_db.py
@@ -15,6 +16,7 @@ DB自動バックアップスクリプト（日次・週次、OneDrive保存）
     DATABASE_URL                  - 対象DB（例: sqlite:///./data/dev.db）
     BACKUP_ONEDRIVE_ROOT          - 保存先ルート（必須）
     DAILY_BACKUP_RETENTION_DAYS   - 日次保持日数（省略時 7）
+    WEEKLY_BACKUP_RETENTION_WEEKS - 週次保持週数（省略時 8）
 
 タスクスケジューラ: 毎日 4:00 に実行するタスクを登録する。
     scripts/setup_backup_task.ps1 を参照。
@@ -23,10 +25,7 @@ from __future__ import annotations
 
 import logging
 import os
-import re
-import shutil
 import sys
-from datetime import datetime
 from pathlib import Path
 
 # プロジェクトルートを基準に .env を読み込む
@@ -75,10 +74,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 日次ファイル名のパターン（同一DB名のものだけローテーション対象にする）
-DAILY_FILENAME_PATTERN = re.compile(r"^(.+)_(\d{4}-\d{2}-\d{2})_0400\.db$")
-BACKUP_HOUR_LABEL = "0400"  # 28:00 = 4:00
-
 
 def get_db_path_from_url(database_url: str, project_root: Path) -> Path | None:
     """
@@ -104,20 +99,12 @@ def get_db_path_from_url(database_url: str, project_root: Path) -> Path | None:
     return None
 
 
-def get_db_basename_without_ext(db_path: Path) -> str:
-    """例: dev.db -> dev"""
-    return db_path.stem
-
-
-def ensure_dir(path: Path) -> None:
-    path.mkdir(parents=True, exist_ok=True)
-
-
 def run_backup() -> None:
     project_root = _PROJECT_ROOT
     database_url = os.getenv("DATABASE_URL", "sqlite:///./data/dev.db")
     backup_root = os.getenv("BACKUP_ONEDRIVE_ROOT", "").strip()
     retention_days = int(os.getenv("DAILY_BACKUP_RETENTION_DAYS", "7"))
+    retention_weeks = int(os.getenv("WEEKLY_BACKUP_RETENTION_WEEKS", "8"))
 
     if not backup_root:
         logger.error("BACKUP_ONEDRIVE_ROOT が未設定です。.env または環境変数を設定してください。")
@@ -129,64 +116,23 @@ def run_backup() -> None:
         logger.error("対象DBファイルが見つかりません: %s", db_path or database_url)
         sys.exit(1)
 
-    db_name = get_db_basename_without_ext(db_path)
-    now = datetime.now()
-    date_str = now.strftime("%Y-%m-%d")
-    is_sunday = now.weekday() == 6  # Monday=0, Sunday=6
+    # app/db_backup.py のオンライン・差分・圧縮バックアップ（前回と同じページ範囲は保存しない）
+    from app import db_backup
 
-    daily_dir = backup_root_path / "daily"
-    weekly_dir = backup_root_path / "weekly"
-    ensure_dir(daily_dir)
-    ensure_dir(weekly_dir)
-
-    # 日次バックアップ
-    daily_filename = f"{db_name}_{date_str}_{BACKUP_HOUR_LABEL}.db"
-    daily_dest = daily_dir / daily_filename
-    try:
-        shutil.copy2(db_path, daily_dest)
-        logger.info("日次バックアップ作成: %s", daily_dest)
-    except OSError as e:
-        logger.exception("日次バックアップの作成に失敗しました: %s", e)
-        sys.exit(1)
+    # アプリの定期バックアップ（run_scheduled_backup）と同じロックを取り、取得中に prune が走らないようにする
+    with db_backup.backup_lock(db_path, backup_root_path):
+        try:
+            snapshot = db_backup.backup(db_path, backup_root_path)
+            logger.info("バックアップ作成: %s", snapshot)
+        except Exception as e:
+            logger.exception("バックアップの作成に失敗しました: %s", e)
+            sys.exit(1)
 
-    # 日次ローテーション: 同一 db_name の日次ファイルを古い順に並べ、保持数を超えた分を削除
-    try:
-        to_remove = []
-        same_db_dailies: list[tuple[Path, str]] = []
-        for f in daily_dir.iterdir():
-            if not f.is_file():
-                continue
-            m = DAILY_FILENAME_PATTERN.match(f.name)
-            if not m:
-                continue
-            name_part, date_part = m.group(1), m.group(2)
-            if name_part != db_name:
-                continue
-            same_db_dailies.append((f, date_part))
-
-        same_db_dailies.sort(key=lambda x: x[1])
-        if len(same_db_dailies) > retention_days:
-            for f, _ in same_db_dailies[: len(same_db_dailies) - retention_days]:
-                to_remove.append(f)
-        for f in to_remove:
-            try:
-                f.unlink()
-                logger.info("古い日次バックアップを削除: %s", f.name)
-            except OSError as e:
-                logger.warning("削除に失敗しました %s: %s", f, e)
-    except OSError as e:
-        logger.warning("日次ローテーション中のエラー（処理は続行）: %s", e)
-
-    # 週次: 日曜のみ weekly/ にコピー
-    if is_sunday:
-        weekly_filename = f"{db_name}_{date_str}_weekly.db"
-        weekly_dest = weekly_dir / weekly_filename
+        # 保持: 直近 N 日は1日1世代、それ以前は M 週まで1週1世代（参照されなくなったチャンクも削除）
         try:
-            shutil.copy2(daily_dest, weekly_dest)
-            logger.info("週次スナップショット作成: %s", weekly_dest)
-        except OSError as e:
-            logger.exception("週次バックアップの作成に失敗しました: %s", e)
-            # 日次は成功しているので exit はしない
+            db_backup.prune(db_path, backup_root_path, keep_daily=retention_days, keep_weekly=retention_weeks)
+        except Exception as e:
+            logger.warning("保持期間外の削除中のエラー（処理は続行）: %s", e)
 
     logger.info("バックアップ処理を完了しました。")
 
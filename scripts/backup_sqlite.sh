@@ -2,6 +2,12 @@
 # SQLiteデータベースのバックアップスクリプト
 # 使用方法: ./scripts/backup_sqlite.sh
 # cronで実行する場合: 0 2 * * * cd /opt/law-review && ./scripts/backup_sqlite.sh >> /var/log/law-review-backup.log 2>&1
+#
+# app/db_backup.py のオンラインバックアップを使う（書き込み中でも整合した状態を取得し、
+# 前回と同じページ範囲は保存しないため、2回目以降は変更分だけが増える）。
+# 保持は DB_BACKUP_KEEP_DAILY 日（1日1世代）と DB_BACKUP_KEEP_WEEKLY 週（1週1世代）。
+# 検証: python3 -m app.db_backup verify --deep
+# 復元: python3 -m app.db_backup restore <スナップショット> <復元先> （アプリ停止中に実行）
 
 set -e
 
@@ -12,12 +18,7 @@ cd "$PROJECT_ROOT"
 
 # 設定
 SOURCE_DB="${DATA_DIR:-./data}/dev.db"
-BACKUP_DIR="./backups"
-TIMESTAMP=$(date +%Y%m%d_%H%M%S)
-BACKUP_FILE="${BACKUP_DIR}/dev_${TIMESTAMP}.db"
-
-# バックアップディレクトリが存在しない場合は作成
-mkdir -p "${BACKUP_DIR}"
+BACKUP_DIR="${DB_BACKUP_DIR:-./backups}"
 
 # ソースファイルが存在しない場合はエラー
 if [ ! -f "${SOURCE_DB}" ]; then
@@ -25,25 +26,9 @@ if [ ! -f "${SOURCE_DB}" ]; then
     exit 1
 fi
 
-# SQLiteのバックアップ（コピーではなくsqlite3の.dumpを使用して整合性を保証）
-# より安全な方法: sqlite3のバックアップコマンドを使用
-if command -v sqlite3 &> /dev/null; then
-    # sqlite3が利用可能な場合
-    sqlite3 "${SOURCE_DB}" ".backup '${BACKUP_FILE}'"
-    echo "バックアップ完了: ${BACKUP_FILE}"
-else
-    # sqlite3が利用できない場合は単純コピー（非推奨）
-    cp "${SOURCE_DB}" "${BACKUP_FILE}"
-    echo "警告: sqlite3コマンドが利用できないため、単純コピーでバックアップしました: ${BACKUP_FILE}"
-fi
-
-# 古いバックアップを削除（30日以上前のファイル）
-find "${BACKUP_DIR}" -name "dev_*.db" -type f -mtime +30 -delete
-
-# バックアップファイルの圧縮（オプション、gzipが利用可能な場合）
-if command -v gzip &> /dev/null; then
-    gzip -f "${BACKUP_FILE}"
-    echo "圧縮完了: ${BACKUP_FILE}.gz"
-fi
+python3 -m app.db_backup \
+    --database-url "sqlite:///${SOURCE_DB}" \
+    --backup-dir "${BACKUP_DIR}" \
+    backup --prune
 
 echo "バックアップ処理が完了しました"
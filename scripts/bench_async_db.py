@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+非同期DBセッションのベンチマーク（イベントループの応答性）
+
+読み取りの多いエンドポイント（メッセージ一覧）と同じクエリを複数並行で流しながら、
+10ms ごとに起きるだけのプローブ（= 軽いリクエスト）がどれだけ遅れるかを測る。
+
+- sync:     async def の中で同期 Session を使う（移行前のエンドポイントと同じ）
+- threaded: ThreadedSession（非同期ドライバが無い環境の互換レイヤ）
+- async:    AsyncSession（aiosqlite / asyncpg。ドライバが無ければスキップ）
+
+遅延（lag）はプローブの予定時刻からのずれ。sync はクエリの間ループが止まるため大きくなる。
+DBは一時ディレクトリの SQLite に作る（既存のDBには触らない）。
+
+使用例:
+    python scripts/bench_async_db.py
+    python scripts/bench_async_db.py --messages 20000 --concurrency 16 --seconds 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.db import Base, engine_options
+from app.db_async import ThreadedSession, async_database_url, create_async_engine
+from app.models import Message, Thread, User
+
+PROBE_INTERVAL_SECONDS = 0.01
+THREADS = 20
+
+
+def _seed(database_url: str, messages: int) -> None:
+    engine = create_engine(database_url, **engine_options(database_url))
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    now = datetime.now(timezone.utc)
+    with Session() as s:
+        user = User(email="bench@example.com", name="bench")
+        s.add(user)
+        s.flush()
+        threads = [Thread(user_id=user.id, type="free_chat", title=f"thread {i}") for i in range(THREADS)]
+        s.add_all(threads)
+        s.flush()
+        s.add_all(
+            Message(
+                thread_id=threads[i % THREADS].id,
+                role="user" if i % 2 == 0 else "assistant",
+                content="本文" * 200,
+                created_at=now + timedelta(seconds=i),
+            )
+            for i in range(messages)
+        )
+        s.commit()
+    engine.dispose()
+
+
+def _query(thread_id: int, limit: int):
+    return (
+        select(func.count(Message.id)).where(Message.thread_id == thread_id),
+        select(Message).where(Message.thread_id == thread_id).order_by(Message.created_at.asc()).limit(limit),
+    )
+
+
+async def _probe(stop: asyncio.Event, lags: List[float]) -> None:
+    """軽いリクエストの代わり: 10ms ごとに起きて予定からの遅れを記録する"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + PROBE_INTERVAL_SECONDS
+        await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def _run(mode: str, session_factory, seconds: float, concurrency: int, limit: int) -> Dict[str, float]:
+    stop = asyncio.Event()
+    lags: List[float] = []
+    done = [0]
+
+    async def worker(n: int) -> None:
+        i = n
+        while not stop.is_set():
+            count_stmt, list_stmt = _query(i % THREADS + 1, limit)
+            if mode == "sync":
+                with session_factory() as s:
+                    s.scalar(count_stmt)
+                    s.scalars(list_stmt).all()
+                await asyncio.sleep(0)  # 他のタスクに順番を譲る（同期 Session はそれ以外で譲らない）
+            else:
+                s = session_factory()
+                try:
+                    await s.scalar(count_stmt)
+                    (await s.scalars(list_stmt)).all()
+                finally:
+                    await s.close()
+            done[0] += 1
+            i += concurrency
+
+    probe = asyncio.create_task(_probe(stop, lags))
+    workers = [asyncio.create_task(worker(n)) for n in range(concurrency)]
+    started = time.monotonic()
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(probe, *workers)
+    elapsed = time.monotonic() - started
+
+    lags.sort()
+    return {
+        "queries_per_sec": done[0] / elapsed,
+        "lag_p50_ms": statistics.median(lags) * 1000 if lags else 0.0,
+        "lag_p99_ms": lags[int(len(lags) * 0.99) - 1] * 1000 if lags else 0.0,
+        "lag_max_ms": lags[-1] * 1000 if lags else 0.0,
+        "probes": len(lags),
+    }
+
+
+async def _bench(database_url: str, args) -> None:
+    engine = create_engine(database_url, **engine_options(database_url))
+    Session = sessionmaker(bind=engine, autoflush=False)
+    modes = [
+        ("sync", Session),
+        ("threaded", lambda: ThreadedSession(Session)),
+    ]
+    async_url = async_database_url(database_url)
+    async_engine = None
+    if async_url and create_async_engine is not None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        async_engine = create_async_engine(async_url, **engine_options(database_url))
+        modes.append(("async", async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)))
+    else:
+        print("async: aiosqlite が無いためスキップ（pip install aiosqlite）")
+
+    print(f"{'mode':<10}{'q/s':>10}{'lag p50':>12}{'lag p99':>12}{'lag max':>12}{'probes':>10}")
+    for mode, factory in modes:
+        r = await _run(mode, factory, args.seconds, args.concurrency, args.limit)
+        print(
+            f"{mode:<10}{r['queries_per_sec']:>10.1f}{r['lag_p50_ms']:>10.1f}ms"
+            f"{r['lag_p99_ms']:>10.1f}ms{r['lag_max_ms']:>10.1f}ms{r['probes']:>10d}"
+        )
+
+    engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="同期/互換レイヤ/非同期セッションのイベントループ遅延を比較する")
+    parser.add_argument("--messages", type=int, default=5000, help="投入するメッセージ数")
+    parser.add_argument("--concurrency", type=int, default=8, help="並行して流すクエリの数")
+    parser.add_argument("--seconds", type=float, default=5.0, help="モードごとの計測時間（秒）")
+    parser.add_argument("--limit", type=int, default=200, help="1回に読むメッセージ数（一覧APIの既定と同じ）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        _seed(database_url, args.messages)
+        asyncio.run(_bench(database_url, args))
+
+
+if __name__ == "__main__":
+    main()
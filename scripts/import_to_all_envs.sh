@@ -1,39 +1,22 @@
 #!/bin/bash
-# dev / beta / 本番 の各DBにJSONをインポート（--update で既存を更新）
-# 使用方法: ./scripts/import_to_all_envs.sh
+# dev / beta / 本番 の各DBにJSONの変更分を取り込む（1回のコンテナ実行でまとめて反映）
+# 使用方法: ./scripts/import_to_all_envs.sh [--dry-run] [--years H30 R6]
 # サーバー上で /opt/law-review から実行すること
+#
+# 各DBの取り込み記録（official_question_import_manifest）と比べ、変わったJSONだけを反映する。
+# 3環境とも同じ data ボリューム（/data）を使うため、backend のイメージで一度だけ実行すればよい。
 
 set -e
 cd "$(dirname "$0")/.."
 
-echo "=== dev ==="
-docker compose --profile dev run --rm \
-  -v "$(pwd)/scripts:/app/scripts" \
-  -v "$(pwd)/data:/app/data" \
-  -e PYTHONPATH=/app \
-  -e DATABASE_URL=sqlite:////data/dev.db \
-  backend-dev \
-  python3 /app/scripts/import_all_json_to_db.py --update
-
-echo ""
-echo "=== beta ==="
-docker compose --profile beta run --rm \
-  -v "$(pwd)/scripts:/app/scripts" \
-  -v "$(pwd)/data:/app/data" \
-  -e PYTHONPATH=/app \
-  -e DATABASE_URL=sqlite:////data/beta.db \
-  backend-beta \
-  python3 /app/scripts/import_all_json_to_db.py --update
-
-echo ""
-echo "=== 本番 ==="
 docker compose --profile production run --rm \
-  -v "$(pwd)/scripts:/app/scripts" \
-  -v "$(pwd)/data:/app/data" \
   -e PYTHONPATH=/app \
-  -e DATABASE_URL=sqlite:////data/prod.db \
   backend \
-  python3 /app/scripts/import_all_json_to_db.py --update
+  python3 -m app.official_question_import \
+    --database-url sqlite:////data/dev.db \
+    --database-url sqlite:////data/beta.db \
+    --database-url sqlite:////data/prod.db \
+    "$@"
 
 echo ""
 echo "=== 完了 ==="
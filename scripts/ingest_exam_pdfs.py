@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+論文式試験PDF（試験問題・出題趣旨・採点実感）→ 科目別JSON の取り込み
+
+年度ごとの process_*_paper_pdfs.py / add_*_scoring_notes.py / fix_*_json.py をまとめたもの。
+科目の区切り方は config/exam_ingest_profiles.py のプロファイルに宣言的に書く。
+
+- PDFのページ抽出はプロセスプールで並列に行う（PDFを PAGES_PER_TASK ページずつに分けて投入）
+- 抽出したテキストは PDF の内容ハッシュ（SHA-256）をキーに data/cache/pdf_text/ に保存し、
+  次回以降は変更のないPDFを開かない（キャッシュが温まっていれば全件でも数秒）
+- 出力は data/json/<exam_dir>/<年度>/<年度>_<司法|予備>_<科目>.json（既存と同じ配置・キー）
+- 既存のJSON（手で修正したものを含む）は --overwrite を付けない限り上書きしない。
+  内容が同じファイルは書き換えない（更新日時を変えない）
+
+JSON構造:
+{
+    "year": "R6",
+    "exam_type": "司法",
+    "subject": 1,
+    "subject_name": "憲法",
+    "text": "問題文",
+    "source_pdf": "data/pdfs/...",
+    "purpose": "出題趣旨",
+    "scoring_notes": "採点実感（司法試験のみ）"
+}
+
+使用例:
+    python scripts/ingest_exam_pdfs.py                         # 全試験・全年度
+    python scripts/ingest_exam_pdfs.py --exam judicial --years R6 R7 --overwrite
+    python scripts/ingest_exam_pdfs.py --dry-run               # 書き込まずに差分だけ表示
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from config.exam_ingest_profiles import HEADER_TO_SUBJECT, PROFILES, ExamProfile, Marker
+from config.subjects import get_subject_id, get_subject_name
+
+PDF_BASE = BASE_DIR / "data" / "pdfs"
+JSON_BASE = BASE_DIR / "data" / "json"
+CACHE_DIR = BASE_DIR / "data" / "cache" / "pdf_text"
+
+# 抽出方法を変えたら上げる（古いキャッシュを使わない）
+EXTRACTOR_VERSION = 1
+PAGES_PER_TASK = 8
+
+
+# ---------- PDF → ページテキスト（キャッシュ + 並列抽出） ----------
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cache_path(digest: str) -> Path:
+    return CACHE_DIR / f"{digest}.json"
+
+
+def _load_cached_pages(digest: str) -> Optional[List[str]]:
+    path = _cache_path(digest)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("extractor_version") != EXTRACTOR_VERSION:
+        return None
+    return data.get("pages")
+
+
+def _save_cached_pages(digest: str, source: str, pages: List[str]) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = _cache_path(digest).with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"extractor_version": EXTRACTOR_VERSION, "source": source, "pages": pages}, f, ensure_ascii=False)
+    os.replace(tmp, _cache_path(digest))
+
+
+def _page_count(path: str) -> int:
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def _extract_pages(path: str, start: int, end: int) -> Tuple[str, int, List[str]]:
+    """プロセスプールで実行: PDF の [start, end) ページのテキスト"""
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        return path, start, [(page.extract_text() or "") for page in pdf.pages[start:end]]
+
+
+def extract_all(paths: Sequence[Path], workers: Optional[int] = None, use_cache: bool = True) -> Dict[Path, List[str]]:
+    """PDFごとのページテキスト（キャッシュに無いものだけ並列に抽出）"""
+    result: Dict[Path, List[str]] = {}
+    digests: Dict[Path, str] = {}
+    missing: List[Path] = []
+    for path in paths:
+        digest = digests[path] = file_sha256(path)
+        pages = _load_cached_pages(digest) if use_cache else None
+        if pages is None:
+            missing.append(path)
+        else:
+            result[path] = pages
+    if not missing:
+        return result
+
+    print(f"抽出: {len(missing)}件のPDF（キャッシュ済み {len(result)}件）")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        counts = dict(zip(missing, pool.map(_page_count, [str(p) for p in missing])))
+        tasks = [
+            (str(path), start, min(start + PAGES_PER_TASK, counts[path]))
+            for path in missing
+            for start in range(0, counts[path], PAGES_PER_TASK)
+        ]
+        pages_by_path: Dict[str, List[str]] = {str(p): [""] * counts[p] for p in missing}
+        if tasks:
+            for path, start, pages in pool.map(_extract_pages, *zip(*tasks)):
+                pages_by_path[path][start:start + len(pages)] = pages
+
+    for path in missing:
+        pages = pages_by_path[str(path)]
+        _save_cached_pages(digests[path], relative(path), pages)
+        result[path] = pages
+    return result
+
+
+# ---------- テキスト整形・科目分割 ----------
+
+
+def clean_text(text: str) -> str:
+    """PDF由来のページ番号・数値途中の改行・過剰な空行を除く"""
+    if not text:
+        return ""
+    result = re.sub(r"\n\s*[-－]\s*\d+\s*[-－]\s*(?=\n)", "", text)
+    for pattern, repl in (
+        (r"([０-９0-9]+)\n年", r"\1年"),
+        (r"([０-９0-9]+)\n％", r"\1％"),
+        (r"([０-９0-9]+)\n円", r"\1円"),
+        (r"([兆億万])\n([０-９0-9])", r"\1\2"),
+    ):
+        result = re.sub(pattern, repl, result)
+    result = re.sub(r"\n{3,}", "\n\n", result)
+    return result.strip()
+
+
+def normalize_subject(header: str) -> Optional[Tuple[int, str]]:
+    """見出しを (科目ID, 科目名) にする（複合科目・解釈できない見出しは None）"""
+    s = "".join((header or "").split()).replace("(", "（").replace(")", "）")
+    if s.startswith("法律実務基礎科目"):
+        s = s.replace("法律実務基礎科目", "実務基礎")
+    s = HEADER_TO_SUBJECT.get(s, s)
+    if "・" in s:
+        return None
+    subject_id = get_subject_id(s)
+    if subject_id is None or not (1 <= subject_id <= 18):
+        return None
+    return subject_id, get_subject_name(subject_id)
+
+
+def split_sections(text: str, markers: Sequence[Marker]) -> List[Tuple[str, str]]:
+    """
+    プロファイルの区切りで [(見出し/科目名, 本文)] に分ける
+
+    subject 指定の Marker は前の区切りの後で最初の一致だけ、subject=None の Marker は残り全ての一致を見出しとする。
+    """
+    starts: List[Tuple[int, int, str]] = []  # (開始位置, 本文開始位置, 見出し)
+    pos = 0
+    for marker in markers:
+        pattern = re.compile(marker.pattern)
+        if marker.subject is not None:
+            m = pattern.search(text, pos)
+            if m is None:
+                continue
+            starts.append((m.start(), m.end() if marker.strip else m.start(), marker.subject))
+            pos = m.end()
+        else:
+            for m in pattern.finditer(text, pos):
+                starts.append((m.start(), m.end() if marker.strip else m.start(), m.group(1).strip()))
+                pos = m.end()
+    sections = []
+    for i, (_, body_start, label) in enumerate(starts):
+        end = starts[i + 1][0] if i + 1 < len(starts) else len(text)
+        sections.append((label, text[body_start:end]))
+    return sections
+
+
+def sections_by_subject(text: str, markers: Sequence[Marker]) -> Dict[int, str]:
+    """科目ID -> 本文（同じ科目が複数回出た場合は最初のもの）"""
+    result: Dict[int, str] = {}
+    for label, body in split_sections(text, markers):
+        subject = normalize_subject(label)
+        if subject is not None and subject[0] not in result:
+            result[subject[0]] = body
+    return result
+
+
+# ---------- 年度ごとの組み立て ----------
+
+
+def relative(path: Path) -> str:
+    return str(path.relative_to(BASE_DIR)).replace("\\", "/")
+
+
+def _glob_all(base: Path, patterns: Iterable[str]) -> List[Path]:
+    seen = set()
+    paths = []
+    for pattern in patterns:
+        for p in sorted(base.glob(pattern)):
+            if p not in seen:
+                seen.add(p)
+                paths.append(p)
+    return paths
+
+
+def year_sources(profile: ExamProfile, year: str) -> Dict[str, List[Path]]:
+    base = PDF_BASE / profile.exam_dir / year
+    purposes = _glob_all(base, profile.purpose_globs)
+    questions = [p for p in _glob_all(base, profile.question_globs) if p not in purposes and "出題趣旨" not in p.name]
+    return {
+        "questions": questions,
+        "purposes": purposes,
+        "scoring": _glob_all(base, profile.scoring_globs),
+    }
+
+
+def _question_markers(profile: ExamProfile, path: Path) -> Sequence[Marker]:
+    for key, markers in profile.question_markers.items():
+        if key in path.stem:
+            return markers
+    return profile.default_question_markers
+
+
+def _purpose_only(body: str, start_pattern: Optional[str]) -> str:
+    if start_pattern:
+        m = re.search(start_pattern, body)
+        if m:
+            return body[m.end():]
+    return body
+
+
+def build_year(profile: ExamProfile, year: str, texts: Dict[Path, List[str]]) -> List[dict]:
+    """1年度分の科目別JSON（dict）を組み立てる"""
+    profile = profile.for_year(year)
+    sources = year_sources(profile, year)
+
+    purposes: Dict[int, str] = {}
+    seen_texts = set()
+    for path in sources["purposes"]:
+        # 同じ内容のPDFが複数の場所に置かれている年度がある
+        full = "\n".join(texts[path])
+        if full in seen_texts:
+            continue
+        seen_texts.add(full)
+        for subject_id, body in sections_by_subject(full, profile.purpose_markers).items():
+            purposes.setdefault(subject_id, clean_text(_purpose_only(body, profile.purpose_start_pattern)))
+
+    scoring: Dict[int, str] = {}
+    for path in sources["scoring"]:
+        full = "\n".join(texts[path])
+        found = sections_by_subject(full, profile.scoring_markers)
+        if not found:
+            # 見出しが無い年度は、試験問題と同じ〔第Ｎ問〕等の区切りで分ける
+            found = sections_by_subject(full, _question_markers(profile, path))
+        for subject_id, body in found.items():
+            scoring.setdefault(subject_id, clean_text(body))
+
+    items: List[dict] = []
+    done = set()
+    for path in sources["questions"]:
+        full = "\n".join(texts[path])
+        for subject_id, body in sections_by_subject(full, _question_markers(profile, path)).items():
+            body = clean_text(body)
+            if subject_id in done or len(body) < profile.min_text_chars:
+                continue
+            done.add(subject_id)
+            item = {
+                "year": year,
+                "exam_type": profile.exam_type,
+                "subject": subject_id,
+                "subject_name": get_subject_name(subject_id),
+                "text": body,
+                "source_pdf": relative(path),
+            }
+            if purposes.get(subject_id):
+                item["purpose"] = purposes[subject_id]
+            if scoring.get(subject_id):
+                item["scoring_notes"] = scoring[subject_id]
+            items.append(item)
+    return items
+
+
+def sanitize_filename(text: str) -> str:
+    for char in ['/', '\\', ':', '*', '?', '"', '<', '>', '|', '・', '（', '）']:
+        text = text.replace(char, '_')
+    return text
+
+
+def output_path(profile: ExamProfile, item: dict) -> Path:
+    name = f"{item['year']}_{profile.exam_type}_{sanitize_filename(item['subject_name'])}.json"
+    return JSON_BASE / profile.exam_dir / item["year"] / name
+
+
+def write_items(profile: ExamProfile, items: Sequence[dict], overwrite: bool, dry_run: bool) -> Dict[str, int]:
+    stats = {"created": 0, "updated": 0, "unchanged": 0, "kept": 0}
+    for item in items:
+        path = output_path(profile, item)
+        content = json.dumps(item, ensure_ascii=False, indent=2) + "\n"
+        if path.exists():
+            current = path.read_text(encoding="utf-8-sig")
+            if current.strip() == content.strip():
+                stats["unchanged"] += 1
+                continue
+            if not overwrite:
+                stats["kept"] += 1
+                continue
+            action = "updated"
+        else:
+            action = "created"
+        stats[action] += 1
+        print(f"  {action}: {relative(path)}")
+        if not dry_run:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content, encoding="utf-8")
+    return stats
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="論文式試験PDFを科目別JSONに取り込む")
+    parser.add_argument("--exam", choices=sorted(PROFILES), nargs="*", help="対象の試験（省略時は全て）")
+    parser.add_argument("--years", nargs="*", help="対象の年度（例: H30 R6。省略時はプロファイルの全年度）")
+    parser.add_argument("--workers", type=int, default=None, help="抽出プロセス数（省略時はCPU数）")
+    parser.add_argument("--overwrite", action="store_true", help="内容の異なる既存JSONを上書きする")
+    parser.add_argument("--dry-run", action="store_true", help="書き込まずに作成・更新されるファイルを表示")
+    parser.add_argument("--no-cache", action="store_true", help="抽出キャッシュを使わずにPDFを読み直す")
+    args = parser.parse_args(argv)
+
+    started = time.time()
+    targets: List[Tuple[ExamProfile, str]] = []
+    for key in args.exam or sorted(PROFILES):
+        profile = PROFILES[key]
+        for year in args.years or profile.years:
+            if year in profile.years and (PDF_BASE / profile.exam_dir / year).exists():
+                targets.append((profile, year))
+
+    paths: List[Path] = []
+    for profile, year in targets:
+        for group in year_sources(profile.for_year(year), year).values():
+            paths.extend(p for p in group if p not in paths)
+    texts = extract_all(paths, workers=args.workers, use_cache=not args.no_cache)
+    print(f"PDF {len(paths)}件のテキストを取得（{time.time() - started:.1f}秒）")
+
+    totals = {"created": 0, "updated": 0, "unchanged": 0, "kept": 0}
+    for profile, year in targets:
+        items = build_year(profile, year, texts)
+        if not items:
+            print(f"警告: {profile.exam_dir}/{year}: 科目を抽出できませんでした")
+            continue
+        for k, v in write_items(profile, items, args.overwrite, args.dry_run).items():
+            totals[k] += v
+
+    print(
+        f"完了（{time.time() - started:.1f}秒）: 作成 {totals['created']} / 更新 {totals['updated']} / "
+        f"変更なし {totals['unchanged']} / 既存を保持 {totals['kept']}"
+        + ("（dry-run）" if args.dry_run else "")
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
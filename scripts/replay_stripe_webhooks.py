@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stripe Webhook 受信箱のリプレイ検証（反映順・二重反映）
+
+顧客ごとに連番を付けたイベントを受信箱に保存し（再送も混ぜる）、
+一定の確率で失敗する handler を複数の worker（スレッド）で並行に反映する。
+最後に次を確認する:
+- 顧客ごとに連番の順で反映されたか（再試行待ちのイベントを後のイベントが追い越していないか）
+- 各イベントが1回だけ反映されたか（再送・並行 worker で二重にならないか）
+
+Stripe API は呼ばない。DBは一時ディレクトリの SQLite に作る（既存のDBには触らない）。
+再試行の待ち時間は STRIPE_WEBHOOK_RETRY_BASE_SECONDS=1 にして短くする。
+
+使用例:
+    python scripts/replay_stripe_webhooks.py
+    python scripts/replay_stripe_webhooks.py --customers 20 --events 400 --workers 4 --fail-rate 0.3
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+os.environ["STRIPE_WEBHOOK_RETRY_BASE_SECONDS"] = "1"
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import engine_options
+from app import stripe_webhooks
+from app.models import StripeWebhookEvent
+
+
+def _events(customers: int, events: int, seed: int) -> List[Dict]:
+    rng = random.Random(seed)
+    seq: Dict[int, int] = defaultdict(int)
+    out = []
+    for i in range(events):
+        c = rng.randrange(customers)
+        seq[c] += 1
+        out.append({
+            "id": f"evt_{i:06d}",
+            "type": "customer.subscription.updated",
+            "data": {"object": {"id": f"sub_{c}", "customer": f"cus_{c}", "seq": seq[c]}},
+        })
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stripe Webhook 受信箱の反映順・二重反映を検証する")
+    parser.add_argument("--customers", type=int, default=10)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4, help="並行して動かす worker の数")
+    parser.add_argument("--fail-rate", type=float, default=0.2, help="handler が失敗する確率（1イベント2回まで）")
+    parser.add_argument("--resend-rate", type=float, default=0.1, help="同じイベントを再送する確率")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120.0, help="全件反映を待つ最大秒数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'replay.db'}"
+        engine = create_engine(url, **engine_options(url))
+        StripeWebhookEvent.__table__.create(bind=engine)
+        Session = sessionmaker(bind=engine)
+
+        rng = random.Random(args.seed)
+        events = _events(args.customers, args.events, args.seed)
+        with Session() as db:
+            for ev in events:
+                stripe_webhooks.store_event(db, ev, json.dumps(ev))
+                if rng.random() < args.resend_rate:
+                    stripe_webhooks.store_event(db, ev, json.dumps(ev))  # 再送（保存されない）
+
+        applied: List[Tuple[str, int]] = []
+        failures: Dict[str, int] = defaultdict(int)
+        lock = threading.Lock()
+
+        def handler(db, event) -> None:
+            obj = event["data"]["object"]
+            with lock:
+                if failures[event["id"]] < 2 and rng.random() < args.fail_rate:
+                    failures[event["id"]] += 1
+                    raise RuntimeError("injected failure")
+                applied.append((obj["customer"], obj["seq"]))
+
+        stop = threading.Event()
+
+        def worker() -> None:
+            while not stop.is_set():
+                with Session() as db:
+                    if not stripe_webhooks.process_pending(db, handler, limit=20):
+                        time.sleep(0.05)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker) for _ in range(args.workers)]
+        for t in threads:
+            t.start()
+        while time.monotonic() - started < args.timeout:
+            with Session() as db:
+                left = db.query(StripeWebhookEvent).filter(
+                    StripeWebhookEvent.status != stripe_webhooks.STATUS_PROCESSED
+                ).count()
+            if not left:
+                break
+            time.sleep(0.2)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+
+        by_customer: Dict[str, List[int]] = defaultdict(list)
+        for customer, seq in applied:
+            by_customer[customer].append(seq)
+        out_of_order = [c for c, seqs in by_customer.items() if seqs != sorted(seqs)]
+        duplicated = len(applied) - len(set(applied))
+        expected = defaultdict(int)
+        for ev in events:
+            expected[ev["data"]["object"]["customer"]] += 1
+        missing = sum(expected[c] - len(set(by_customer[c])) for c in expected)
+
+        print(f"events={len(events)} applied={len(applied)} injected_failures={sum(failures.values())} "
+              f"workers={args.workers} elapsed={elapsed:.1f}s")
+        print(f"out_of_order_customers={len(out_of_order)} duplicated={duplicated} missing={missing}")
+        engine.dispose()
+        sys.exit(0 if not out_of_order and not duplicated and not missing else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import { NextRequest, NextResponse } from "next/server"
+import { cachedJsonResponse, conditionalHeaders, notModifiedResponse } from "@/lib/http-cache"
 
 // ローカル開発（npm run dev）では backend ホスト名が解決できないため localhost をデフォルトにする。
 // Docker Compose（web-dev/web）では BACKEND_INTERNAL_URL が設定される想定。
@@ -25,14 +26,16 @@ export async function GET(request: NextRequest) {
     url.searchParams.set("nendo", nendo)
     url.searchParams.set("subject_id", subject_id)
 
-    const res = await fetch(url.toString(), { cache: "no-store" })
+    const res = await fetch(url.toString(), { cache: "no-store", headers: conditionalHeaders(request) })
+    const notModified = notModifiedResponse(res)
+    if (notModified) return notModified
     if (!res.ok) {
       const errorData = await res.json().catch(() => ({ detail: "Unknown error" }))
       return NextResponse.json({ error: errorData.detail || "公式問題の取得に失敗しました" }, { status: res.status })
     }
 
     const data = await res.json()
-    return NextResponse.json(data)
+    return cachedJsonResponse(data, res)
   } catch (e: any) {
     return NextResponse.json({ error: e?.message || "予期しないエラーが発生しました" }, { status: 500 })
   }
@@ -1,5 +1,6 @@
 import { NextRequest, NextResponse } from "next/server"
 import { cookies } from "next/headers"
+import { cachedJsonResponse, conditionalHeaders, notModifiedResponse } from "@/lib/http-cache"
 
 const BACKEND_URL = process.env.BACKEND_INTERNAL_URL || process.env.BACKEND_URL || "http://localhost:8000"
 
@@ -39,9 +40,13 @@ export async function GET(
       headers: {
         "Authorization": `Bearer ${token}`,
         "Content-Type": "application/json",
+        ...conditionalHeaders(request),
       },
     })
 
+    const notModified = notModifiedResponse(response)
+    if (notModified) return notModified
+
     if (!response.ok) {
       const errorData = await response.json().catch(() => ({}))
       const message =
@@ -57,7 +62,7 @@ export async function GET(
     }
 
     const data = await response.json()
-    return NextResponse.json(data)
+    return cachedJsonResponse(data, response)
   } catch (error) {
     console.error("Review fetch error:", error)
     return NextResponse.json(
@@ -0,0 +1,36 @@
+/**
+ * バックエンドの ETag / Cache-Control を BFF（API Route）で中継するためのヘルパー
+ *
+ * - ブラウザの If-None-Match をバックエンドに転送し、304 はそのまま返す
+ * - 200 の場合は ETag / Cache-Control をレスポンスに引き継ぐ
+ */
+
+import { NextRequest, NextResponse } from 'next/server'
+
+const FORWARDED_HEADERS = ['etag', 'cache-control']
+
+/** バックエンドへ転送する条件付きリクエストのヘッダー */
+export function conditionalHeaders(request: NextRequest): Record<string, string> {
+  const ifNoneMatch = request.headers.get('if-none-match')
+  return ifNoneMatch ? { 'If-None-Match': ifNoneMatch } : {}
+}
+
+function cacheHeaders(backendResponse: Response): Headers {
+  const headers = new Headers()
+  for (const name of FORWARDED_HEADERS) {
+    const value = backendResponse.headers.get(name)
+    if (value) headers.set(name, value)
+  }
+  return headers
+}
+
+/** バックエンドが 304 を返した場合の応答（それ以外は null） */
+export function notModifiedResponse(backendResponse: Response): NextResponse | null {
+  if (backendResponse.status !== 304) return null
+  return new NextResponse(null, { status: 304, headers: cacheHeaders(backendResponse) })
+}
+
+/** JSON を ETag / Cache-Control 付きで返す */
+export function cachedJsonResponse(data: unknown, backendResponse: Response): NextResponse {
+  return NextResponse.json(data, { headers: cacheHeaders(backendResponse) })
+}